@@ -259,8 +259,9 @@ class DiscoveriesHandler(OperationsHandler):
         networks.
 
         This command causes each connected rack controller to execute the
-        'maas-rack scan-network' command, which will scan all CIDRs configured
-        on the rack controller using 'nmap' (if it is installed) or 'ping'.
+        'maas-rack scan-network' command, which will sweep all CIDRs
+        configured on the rack controller with ARP requests sent from raw
+        sockets, falling back to 'nmap' (if it is installed) or 'ping'.
 
         Network discovery must not be set to 'disabled' for this command to be
         useful.
@@ -304,14 +305,15 @@ class DiscoveriesHandler(OperationsHandler):
         @param (string) "always_use_ping" [required=false] If True, will force
         the scan to use 'ping' even if 'nmap' is installed. Default: False.
 
-        @param (string) "slow" [required=false] If True, and 'nmap' is being
-        used, will limit the scan to nine packets per second. If the scanner is
-        'ping', this option has no effect. Default: False.
+        @param (string) "slow" [required=false] If True, and a sweep or 'nmap'
+        is being used, will limit the scan to nine packets per second. If the
+        scanner is 'ping', this option has no effect. Default: False.
 
         @param (string) "threads" [required=false] The number of threads to use
         during scanning. If 'nmap' is the scanner, the default is one thread
         per 'nmap' process. If 'ping' is the scanner, the default is four
-        threads per CPU.
+        threads per CPU. Rack controllers able to sweep their networks from a
+        raw socket do so from a single thread, and ignore this option.
 
         @success (http-status-code) "server-success" 200
         @success (json) "success-json" A JSON object containing a dictionary of
@@ -440,7 +442,7 @@ def scan_all_rack_networks(
         attached networks.
     :param ping: If True, forces the use of 'ping' rather than 'nmap'.
     :param threads: If specified, overrides the default number of concurrent
-        scanning threads.
+        scanning threads. Ignored by racks that sweep from a raw socket.
     :param slow: If True, forces 'nmap' to scan slower (if it is being used).
     :return: dict
     """
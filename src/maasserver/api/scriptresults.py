@@ -22,6 +22,7 @@ from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from formencode.validators import (
     Bool,
+    Int,
     String,
 )
 from maasserver.api.support import (
@@ -35,6 +36,7 @@ from maasserver.models import Node
 from maasserver.permissions import NodePermission
 from metadataserver.models import ScriptSet
 from metadataserver.models.script import translate_hardware_type
+from metadataserver.models.scriptresult import OUTPUT_FIELDS
 from metadataserver.models.scriptset import translate_result_type
 from piston3.utils import rc
 
@@ -373,6 +375,12 @@ class NodeScriptResultHandler(OperationsHandler):
         @param (string) "filetype" [required=false] Filetype to output, can be
         ``txt`` or ``tar.xz``.
 
+        @param (string) "offset" [required=false] Only return each output from
+        this byte onwards.
+
+        @param (string) "length" [required=false] Only return up to this many
+        bytes of each output.
+
         @success (http-status-code) "server-success" 200
         @success (content) "success-text" Plain-text output containing the
         requested results.
@@ -389,6 +397,8 @@ class NodeScriptResultHandler(OperationsHandler):
         filters = get_optional_param(request.GET, 'filters', None, String)
         output = get_optional_param(request.GET, 'output', 'combined', String)
         filetype = get_optional_param(request.GET, 'filetype', 'txt', String)
+        offset = get_optional_param(request.GET, 'offset', 0, Int)
+        length = get_optional_param(request.GET, 'length', None, Int)
         files = OrderedDict()
         times = {}
         if filters is not None:
@@ -401,57 +411,63 @@ class NodeScriptResultHandler(OperationsHandler):
                 raise MAASAPIValidationError(e)
 
         bin_regex = re.compile('.+\.tar(\..+)?')
+        # Output is only read, a file at a time, once it is being written.
+        script_results = script_set.scriptresult_set.defer(*OUTPUT_FIELDS)
         for script_result in filter_script_results(
-                script_set, filters, hardware_type):
+                script_results, filters, hardware_type):
             mtime = time.mktime(script_result.updated.timetuple())
             if bin_regex.search(script_result.name) is not None:
                 # Binary files only have one output
-                files[script_result.name] = script_result.output
+                files[script_result.name] = (script_result, 'output')
                 times[script_result.name] = mtime
             elif output == 'combined':
                 title = self.__make_file_title(script_result, filetype)
-                files[title] = script_result.output
+                files[title] = (script_result, 'output')
                 times[title] = mtime
             elif output == 'stdout':
                 title = self.__make_file_title(script_result, filetype, 'out')
-                files[title] = script_result.stdout
+                files[title] = (script_result, 'stdout')
                 times[title] = mtime
             elif output == 'stderr':
                 title = self.__make_file_title(script_result, filetype, 'err')
-                files[title] = script_result.stderr
+                files[title] = (script_result, 'stderr')
                 times[title] = mtime
             elif output == 'result':
                 title = self.__make_file_title(script_result, filetype, 'yaml')
-                files[title] = script_result.result
+                files[title] = (script_result, 'result')
                 times[title] = mtime
             elif output == 'all':
                 title = self.__make_file_title(script_result, filetype)
-                files[title] = script_result.output
+                files[title] = (script_result, 'output')
                 times[title] = mtime
                 title = self.__make_file_title(script_result, filetype, 'out')
-                files[title] = script_result.stdout
+                files[title] = (script_result, 'stdout')
                 times[title] = mtime
                 title = self.__make_file_title(script_result, filetype, 'err')
-                files[title] = script_result.stderr
+                files[title] = (script_result, 'stderr')
                 times[title] = mtime
                 title = self.__make_file_title(script_result, filetype, 'yaml')
-                files[title] = script_result.result
+                files[title] = (script_result, 'result')
                 times[title] = mtime
 
+        def read(script_result, name):
+            return script_result.read_data(name, offset, length)
+
         if filetype == 'txt' and len(files) == 1:
             # Just output the result with no break to allow for piping.
             return HttpResponse(
-                list(files.values())[0], content_type='application/binary')
+                read(*list(files.values())[0]),
+                content_type='application/binary')
         elif filetype == 'txt':
             binary = BytesIO()
-            for filename, content in files.items():
+            for filename, (script_result, name) in files.items():
                 dashes = '-' * int((80.0 - (2 + len(filename))) / 2)
                 binary.write(
                     ('%s %s %s\n' % (dashes, filename, dashes)).encode())
                 if bin_regex.search(filename) is not None:
                     binary.write(b'Binary file')
                 else:
-                    binary.write(content)
+                    binary.write(read(script_result, name))
                 binary.write(b'\n')
             return HttpResponse(
                 binary.getvalue(), content_type='application/binary')
@@ -461,7 +477,8 @@ class NodeScriptResultHandler(OperationsHandler):
                 script_set.node.hostname, script_set.result_type_name.lower(),
                 script_set.id)
             with tarfile.open(mode='w:xz', fileobj=binary) as tar:
-                for filename, content in files.items():
+                for filename, (script_result, name) in files.items():
+                    content = read(script_result, name)
                     tarinfo = tarfile.TarInfo(name=os.path.join(
                         root_dir, os.path.basename(filename)))
                     tarinfo.size = len(content)
@@ -1192,16 +1192,24 @@ class TestMachinesAPI(APITestCase.ForUser):
         machine = Machine.objects.get(system_id=machine.system_id)
         self.assertEqual(self.user, machine.owner)
 
-    def test_POST_allocate_uses_machine_acquire_lock(self):
-        # The "allocate" operation allocates the machine it returns.
+    def test_POST_allocate_claims_machine_without_machine_acquire_lock(self):
         available_status = NODE_STATUS.READY
-        factory.make_Node(
+        machine = factory.make_Node(
             status=available_status, owner=None, with_boot_disk=True)
         machine_acquire = self.patch(machines_module.locks, 'node_acquire')
         self.client.post(reverse('machines_handler'), {'op': 'allocate'})
-        self.assertThat(machine_acquire.__enter__, MockCalledOnceWith())
-        self.assertThat(
-            machine_acquire.__exit__, MockCalledOnceWith(None, None, None))
+        self.assertEqual(self.user, reload_object(machine).owner)
+        self.assertThat(machine_acquire.__enter__, MockNotCalled())
+
+    def test_POST_allocate_dry_run_does_not_claim_machine(self):
+        available_status = NODE_STATUS.READY
+        factory.make_Node(
+            status=available_status, owner=None, with_boot_disk=True)
+        claim_available_machine = self.patch(
+            Machine.objects, 'claim_available_machine')
+        self.client.post(
+            reverse('machines_handler'), {'op': 'allocate', 'dry_run': True})
+        self.assertThat(claim_available_machine, MockNotCalled())
 
     def test_POST_allocate_sets_agent_name(self):
         available_status = NODE_STATUS.READY
@@ -473,6 +473,22 @@ class TestNodeScriptResultAPI(APITestCase.ForUser):
         self.assertThat(response, HasStatusCode(http.client.OK))
         self.assertEquals(script_result.output, response.content)
 
+    def test_download_range(self):
+        script_set = self.make_scriptset()
+        script_result = factory.make_ScriptResult(
+            script_set=script_set, output=factory.make_bytes(100))
+
+        response = self.client.get(
+            self.get_script_result_uri(script_set),
+            {
+                'op': 'download',
+                'filters': script_result.id,
+                'offset': 10,
+                'length': 20,
+            })
+        self.assertThat(response, HasStatusCode(http.client.OK))
+        self.assertEquals(script_result.output[10:30], response.content)
+
     def test_download_filetype_txt(self):
         script_set = self.make_scriptset()
         script_result = factory.make_ScriptResult(script_set=script_set)
@@ -15,12 +15,12 @@ __all__ = [
 ]
 
 from datetime import timedelta
+import http.client
 from operator import itemgetter
 import os
 from subprocess import CalledProcessError
 from textwrap import dedent
 import threading
-import time
 
 from django.db import (
     connection,
@@ -53,6 +53,7 @@ from maasserver.enum import (
 )
 from maasserver.eventloop import services
 from maasserver.fields import LargeObjectFile
+from maasserver.largefile_cache import get_largefile_cache
 from maasserver.models import (
     BootResource,
     BootResourceFile,
@@ -198,6 +199,42 @@ class ConnectionWrapper:
             self._connection = None
 
 
+def get_byte_range(range_header, size):
+    """Return the range of bytes requested by an HTTP Range header.
+
+    Only a single range of bytes is supported. Anything else is ignored,
+    and the whole content should be sent.
+
+    :param range_header: The value of the Range header, or `None`.
+    :param size: The size of the content.
+    :return: A tuple of (offset, length), or `None`.
+    :raise ValueError: If the range cannot be satisfied.
+    """
+    if range_header is None:
+        return None
+    unit, _, byte_range = range_header.partition("=")
+    first, dash, last = byte_range.strip().partition("-")
+    if (unit.strip() != "bytes" or dash != "-" or
+            not (first.isdigit() or first == "") or
+            not (last.isdigit() or last == "") or
+            first == last == ""):
+        return None
+    elif first == "":
+        # The last `last` bytes of the content.
+        if size == 0 or int(last) == 0:
+            raise ValueError("Range cannot be satisfied.")
+        offset = max(size - int(last), 0)
+        return offset, size - offset
+    elif last != "" and int(last) < int(first):
+        return None
+    elif int(first) >= size:
+        raise ValueError("Range cannot be satisfied.")
+    else:
+        offset = int(first)
+        end = size if last == "" else min(int(last) + 1, size)
+        return offset, end - offset
+
+
 class SimpleStreamsHandler:
     """Simplestreams endpoint, that the racks talk to.
 
@@ -365,10 +402,42 @@ class SimpleStreamsHandler:
             rfile = resource_set.files.get(filename=filename)
         except BootResourceFile.DoesNotExist:
             raise Http404()
+        largefile = rfile.largefile
+        content = ConnectionWrapper(largefile.content)
+        cache = get_largefile_cache()
+        if cache is None or not largefile.complete:
+            response = StreamingHttpResponse(
+                content, content_type='application/octet-stream')
+            response['Content-Length'] = largefile.total_size
+            return response
+
+        try:
+            byte_range = get_byte_range(
+                request.META.get('HTTP_RANGE'), largefile.total_size)
+        except ValueError:
+            response = HttpResponse(
+                status=http.client.REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = 'bytes */%d' % largefile.total_size
+            return response
+        if byte_range is not None:
+            # Ranges are only served once the file is cached; until then
+            # the whole file is sent.
+            offset, length = byte_range
+            stream = cache.read(largefile, offset, length)
+            if stream is not None:
+                response = StreamingHttpResponse(
+                    stream, status=http.client.PARTIAL_CONTENT,
+                    content_type='application/octet-stream')
+                response['Content-Range'] = 'bytes %d-%d/%d' % (
+                    offset, offset + length - 1, largefile.total_size)
+                response['Content-Length'] = length
+                response['Accept-Ranges'] = 'bytes'
+                return response
         response = StreamingHttpResponse(
-            ConnectionWrapper(rfile.largefile.content),
+            cache.fetch(largefile, content),
             content_type='application/octet-stream')
-        response['Content-Length'] = rfile.largefile.total_size
+        response['Content-Length'] = largefile.total_size
+        response['Accept-Ranges'] = 'bytes'
         return response
 
 
@@ -419,10 +488,16 @@ class BootResourceStore(ObjectStore):
     # Read at 10MiB per chunk.
     read_size = 1024 * 1024 * 10
 
+    # Commit the written content and its progress into the database every
+    # 200MiB. Each commit reopens the large object, so a larger interval
+    # writes faster but progress is reported less often.
+    commit_size = 1024 * 1024 * 200
+
     def __init__(self):
         """Initialize store."""
         self.cache_current_resources()
         self._content_to_finalize = {}
+        self._content_to_finalize_lock = threading.Lock()
         self._finalizing = False
         self._cancel_finalize = False
 
@@ -761,28 +836,34 @@ class BootResourceStore(ObjectStore):
         transactional(rfile.largefile.save)(update_fields=['size'])
 
         @transactional
-        def write_chunk():
-            """Write a chunk into the database with a transaction per trunk.
+        def write_chunks():
+            """Write chunks into the database until `commit_size` bytes have
+            been written or the reader is exhausted.
 
-            This ensures that the content and the size is committed into the
-            database per chunk. This makes the process be reported correctly.
+            The large object is kept open while writing and the size is only
+            saved once, so the content and its progress are committed into
+            the database per `commit_size` instead of per chunk.
             """
+            done = False
+            written = 0
             with rfile.largefile.content.open('wb') as stream:
-                buf = reader.read(self.read_size)
                 stream.seek(0, 2)
-                stream.write(buf)
-                cksummer.update(buf)
-                buf_len = len(buf)
-                rfile.largefile.size += buf_len
-                rfile.largefile.save(update_fields=['size'])
-                if buf_len != self.read_size:
-                    return True
-                else:
-                    return False
+                while (written < self.commit_size and
+                        not self._cancel_finalize):
+                    buf = reader.read(self.read_size)
+                    stream.write(buf)
+                    cksummer.update(buf)
+                    written += len(buf)
+                    if len(buf) != self.read_size:
+                        done = True
+                        break
+            rfile.largefile.size += written
+            rfile.largefile.save(update_fields=['size'])
+            return done
 
         # Write chunks until it says its done.
         while not self._cancel_finalize:
-            if write_chunk():
+            if write_chunks():
                 break
 
         # Don't check the checksum if finalization was cancelled.
@@ -809,35 +890,27 @@ class BootResourceStore(ObjectStore):
     def perform_write(self):
         """Performs all writing of content into the object storage.
 
-        This method will spawn threads to perform the writing. Maximum of
-        `write_threads` will be running at once."""
-        threads = []
-        while True:
-            # Update list to only those that are still running.
-            threads = [thread for thread in threads if thread.isAlive()]
-            if len(threads) >= self.write_threads:
-                # Cannot start any more threads as the maximum is already
-                # running. Lets wait a second and try again.
-                time.sleep(1)
-                continue
-
-            if self._cancel_finalize or len(self._content_to_finalize) == 0:
-                # No more threads to spawn because the finalization has been
-                # cancelled or all of the content has been de-queued. Wait for
-                # all the remaining running threads to finish.
-                for thread in threads:
-                    thread.join()
-                break
-
-            # Spawn a writer thread with a resource file and reader from
-            # the queue of content to be saved.
-            rid, reader = self._content_to_finalize.popitem()
-            # FIXME: Use deferToDatabase and the coiterator if possible.
-            thread = threading.Thread(
-                target=self.write_content_thread,
-                args=(rid, reader))
+        This method will start a pool of `write_threads` threads to perform
+        the writing. Each takes content from the queue of content to be saved
+        until the queue is empty or the finalization is cancelled."""
+        threads = [
+            threading.Thread(target=self._write_worker)
+            for _ in range(
+                min(self.write_threads, len(self._content_to_finalize)))
+        ]
+        for thread in threads:
             thread.start()
-            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+    def _write_worker(self):
+        """Write content from the queue until it is empty or cancelled."""
+        while not self._cancel_finalize:
+            with self._content_to_finalize_lock:
+                if len(self._content_to_finalize) == 0:
+                    break
+                rid, reader = self._content_to_finalize.popitem()
+            self.write_content_thread(rid, reader)
 
     def _other_resources_exists(self, os, arch, subarch, series):
         """Return `True` when simplestreams provided an image with the same
@@ -64,6 +64,14 @@ class RegionConfiguration(Configuration, metaclass=RegionConfigurationMeta):
         "num_workers", "The number of regiond worker process to run.",
         Int(if_missing=4, accept_python=False, min=1))
 
+    # Boot resource options.
+    boot_resources_cache_size = ConfigurationOption(
+        "boot_resources_cache_size",
+        "The maximum size, in MiB, of the boot resource files kept on disk "
+        "for rack controllers to download. Set to 0 to read every download "
+        "from the database.",
+        Int(if_missing=(20 * 1024), accept_python=False, min=0))
+
     # Debug options.
     debug = ConfigurationOption(
         "debug", "Enable debug mode for detailed error and log reporting.",
@@ -44,6 +44,7 @@ from maasserver.models import (
     StaticIPAddress,
     Subnet,
 )
+from maasserver.prometheus.metrics import PROMETHEUS_METRICS
 from maasserver.rpc import (
     getAllClients,
     getClientFor,
@@ -62,13 +63,18 @@ from provisioningserver.rpc.cluster import (
     ConfigureDHCPv4_V2,
     ConfigureDHCPv6,
     ConfigureDHCPv6_V2,
+    UpdateDHCPv4Hosts,
+    UpdateDHCPv6Hosts,
     ValidateDHCPv4Config,
     ValidateDHCPv4Config_V2,
     ValidateDHCPv6Config,
     ValidateDHCPv6Config_V2,
 )
 from provisioningserver.rpc.clusterservice import DHCP_TIMEOUT
-from provisioningserver.rpc.dhcp import downgrade_shared_networks
+from provisioningserver.rpc.dhcp import (
+    DHCPState,
+    downgrade_shared_networks,
+)
 from provisioningserver.rpc.exceptions import NoConnectionsAvailable
 from provisioningserver.utils import typed
 from provisioningserver.utils.network import get_source_address
@@ -84,6 +90,11 @@ from twisted.protocols import amp
 log = LegacyLogger()
 
 
+# The DHCP state last applied to each rack controller by this process, keyed
+# by the rack controller's system_id and the IP version.
+_dhcp_states = {}
+
+
 def get_omapi_key():
     """Return the OMAPI key for all DHCP servers that are ran by MAAS."""
     key = Config.objects.get_config("omapi_key")
@@ -607,6 +618,8 @@ def get_dhcp_configure_for(
         hosts, None if interface is None else interface.name)
 
 
+@PROMETHEUS_METRICS.record_call_latency(
+    'maas_dhcp_config_generation_latency')
 @synchronous
 @transactional
 def get_dhcp_configuration(rack_controller, test_dhcp_snippet=None):
@@ -765,8 +778,8 @@ def configure_dhcp(rack_controller):
     ipv4_status, ipv6_status = SERVICE_STATUS.UNKNOWN, SERVICE_STATUS.UNKNOWN
 
     try:
-        yield _perform_dhcp_config(
-            client, ConfigureDHCPv4_V2, ConfigureDHCPv4,
+        yield _perform_dhcp_update(
+            client, 4, UpdateDHCPv4Hosts, ConfigureDHCPv4_V2, ConfigureDHCPv4,
             failover_peers=config.failover_peers_v4, interfaces=interfaces_v4,
             shared_networks=config.shared_networks_v4, hosts=config.hosts_v4,
             global_dhcp_snippets=config.global_dhcp_snippets,
@@ -788,8 +801,8 @@ def configure_dhcp(rack_controller):
                 rack_controller.hostname, rack_controller.system_id))
 
     try:
-        yield _perform_dhcp_config(
-            client, ConfigureDHCPv6_V2, ConfigureDHCPv6,
+        yield _perform_dhcp_update(
+            client, 6, UpdateDHCPv6Hosts, ConfigureDHCPv6_V2, ConfigureDHCPv6,
             failover_peers=config.failover_peers_v6, interfaces=interfaces_v6,
             shared_networks=config.shared_networks_v6, hosts=config.hosts_v6,
             global_dhcp_snippets=config.global_dhcp_snippets,
@@ -952,6 +965,64 @@ def _validate_dhcp_config_v6(client, **args):
         client, ValidateDHCPv6Config_V2, ValidateDHCPv6Config, **args)
 
 
+@asynchronous
+@inlineCallbacks
+def _perform_dhcp_update(
+        client, ip_version, hosts_command, v2_command, v1_command, *,
+        omapi_key, failover_peers, shared_networks, hosts, interfaces,
+        global_dhcp_snippets):
+    """Call `hosts_command` with only the changed hosts when that is all that
+    changed since this process last configured the rack controller...
+
+    ... otherwise, or if the rack controller refuses it, send the full
+    configuration with `_perform_dhcp_config`.
+
+    :param client: An RPC client.
+    :param ip_version: The IP version of the DHCP server, 4 or 6.
+    :param hosts_command: The RPC command to update only the hosts.
+    :param v2_command: The RPC command to configure the DHCP server.
+    :param v1_command: The RPC command to configure the DHCP server when
+        `v2_command` is not handled by the remote side.
+    """
+    key = client.ident, ip_version
+    family = "ipv%d" % ip_version
+    new_state = DHCPState(
+        omapi_key, failover_peers, shared_networks, hosts, interfaces,
+        global_dhcp_snippets)
+    old_state = _dhcp_states.pop(key, None)
+    if (old_state is not None and len(shared_networks) > 0 and
+            not new_state.requires_restart(old_state)):
+        remove, add, modify = new_state.host_diff(old_state)
+        try:
+            yield client(
+                hosts_command, _timeout=DHCP_TIMEOUT + 5,
+                omapi_key=omapi_key, fingerprint=old_state.fingerprint(),
+                remove=[{"mac": host["mac"]} for host in remove],
+                add=add, modify=modify)
+        except Exception as exc:
+            log.msg(
+                "Sending full DHCPv%d configuration to rack controller "
+                "'%s'; updating only the hosts failed: %s" % (
+                    ip_version, client.ident, exc))
+        else:
+            PROMETHEUS_METRICS.update(
+                'maas_dhcp_config_updates', 'inc',
+                labels={'family': family, 'method': 'hosts'})
+            _dhcp_states[key] = new_state
+            return
+
+    yield _perform_dhcp_config(
+        client, v2_command, v1_command, omapi_key=omapi_key,
+        failover_peers=failover_peers, shared_networks=shared_networks,
+        hosts=hosts, interfaces=interfaces,
+        global_dhcp_snippets=global_dhcp_snippets)
+    PROMETHEUS_METRICS.update(
+        'maas_dhcp_config_updates', 'inc',
+        labels={'family': family, 'method': 'full'})
+    if len(shared_networks) > 0:
+        _dhcp_states[key] = new_state
+
+
 @asynchronous
 def _perform_dhcp_config(
         client, v2_command, v1_command, *, shared_networks, **args):
@@ -6,6 +6,7 @@
 __all__ = [
     'dns_force_reload',
     'dns_update_all_zones',
+    'dns_update_zones',
     ]
 
 from collections import defaultdict
@@ -26,10 +27,14 @@ from maasserver.models.dnspublication import DNSPublication
 from maasserver.models.domain import Domain
 from maasserver.models.node import RackController
 from maasserver.models.subnet import Subnet
-from netaddr import IPAddress
+from netaddr import (
+    IPAddress,
+    IPNetwork,
+)
 from provisioningserver.dns.actions import (
     bind_reload,
     bind_reload_with_retries,
+    bind_reload_zones,
     bind_write_configuration,
     bind_write_options,
     bind_write_zones,
@@ -107,6 +112,87 @@ def dns_update_all_zones(reload_retry=False):
     ]
 
 
+def dns_update_zones(domain_ids, subnet_ids):
+    """Update the zone files for only the given domains and subnets.
+
+    Only the forward zones of the authoritative domains in `domain_ids` and
+    the reverse zones of the subnets in `subnet_ids` (along with any subnets
+    that share a reverse zone with them) are regenerated, and only those
+    zones are reloaded by BIND. The internal domain is always regenerated.
+
+    This must only be used for changes that do not add, remove, or rename
+    zones; BIND's configuration is not rewritten. Use `dns_update_all_zones`
+    for everything else, and as a fallback to bring all zones back in line
+    with the database.
+
+    :param domain_ids: IDs of the domains whose forward zones have changed.
+    :param subnet_ids: IDs of the subnets whose reverse zones have changed.
+    """
+    if not is_dns_enabled():
+        return
+
+    domains = Domain.objects.filter(authoritative=True, id__in=domain_ids)
+    subnets = get_reverse_zone_subnets(subnet_ids)
+    default_ttl = Config.objects.get_config('default_dns_ttl')
+    serial = current_zone_serial()
+    zones = ZoneGenerator(
+        domains, subnets, default_ttl,
+        serial, internal_domains=[get_internal_domain()]).as_list()
+    bind_write_zones(zones)
+    reloaded = bind_reload_zones([
+        zone_info.zone_name
+        for zone in zones
+        for zone_info in zone.zone_info
+    ])
+    if not reloaded:
+        # Reload everything rather than leave a zone out of date.
+        bind_reload()
+
+    # Return the current serial and the list of domain names that were
+    # updated; the other domains keep their previous serial.
+    return serial, [
+        domain.name
+        for domain in domains
+    ]
+
+
+def get_reverse_zone_subnets(subnet_ids):
+    """Return the subnets whose reverse zones must be regenerated when the
+    reverse zones of the subnets in `subnet_ids` change.
+
+    Subnets that overlap share reverse zones, and small subnets using RFC2317
+    delegation share the glue in the zone of their parent network, so all of
+    those are included.
+    """
+    subnet_ids = set(subnet_ids)
+    subnets = {
+        subnet: _get_reverse_zone_network(IPNetwork(subnet.cidr))
+        for subnet in Subnet.objects.exclude(rdns_mode=RDNS_MODE.DISABLED)
+    }
+    changed = [
+        network
+        for subnet, network in subnets.items()
+        if subnet.id in subnet_ids
+    ]
+    return [
+        subnet
+        for subnet, network in subnets.items()
+        if any(
+            network in other or other in network
+            for other in changed)
+    ]
+
+
+def _get_reverse_zone_network(network):
+    """Return the network covering the reverse zones of `network`."""
+    if network.version == 4 and network.prefixlen > 24:
+        return network.supernet(24)[0]
+    elif network.version == 6 and network.prefixlen > 124:
+        return network.supernet(124)[0]
+    else:
+        return network
+
+
 def get_upstream_dns():
     """Return the IP addresses of configured upstream DNS servers.
 
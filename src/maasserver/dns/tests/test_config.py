@@ -17,7 +17,9 @@ from maasserver.dns.config import (
     current_zone_serial,
     dns_force_reload,
     dns_update_all_zones,
+    dns_update_zones,
     get_internal_domain,
+    get_reverse_zone_subnets,
     get_resource_name_for_subnet,
     get_trusted_acls,
     get_trusted_networks,
@@ -27,6 +29,7 @@ from maasserver.dns.zonegenerator import InternalDomainResourseRecord
 from maasserver.enum import (
     IPADDRESS_TYPE,
     NODE_STATUS,
+    RDNS_MODE,
 )
 from maasserver.listener import PostgresListenerService
 from maasserver.models import (
@@ -37,7 +40,10 @@ from maasserver.models.dnspublication import DNSPublication
 from maasserver.testing.config import RegionConfigurationFixture
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
-from maastesting.matchers import MockCalledOnceWith
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockNotCalled,
+)
 from netaddr import IPAddress
 from provisioningserver.dns.commands import (
     get_named_conf,
@@ -385,6 +391,85 @@ class TestDNSConfigModifications(TestDNSServer):
         ]))
 
 
+class TestDNSUpdateZones(TestDNSServer):
+
+    def test_dns_update_zones_loads_changed_zones(self):
+        self.patch(settings, 'DNS_CONNECT', True)
+        dns_update_all_zones()
+        node, static = self.create_node_with_static_ip()
+        dns_update_zones([node.domain.id], [static.subnet.id])
+        self.assertDNSMatches(node.hostname, node.domain.name, static.ip)
+
+    def test_dns_update_zones_reloads_only_changed_zones(self):
+        self.patch(settings, 'DNS_CONNECT', True)
+        domain = factory.make_Domain()
+        factory.make_Domain()
+        subnet = factory.make_Subnet(cidr="10.1.0.0/24")
+        factory.make_Subnet(cidr="10.2.0.0/24")
+        bind_reload = self.patch_autospec(dns_config_module, "bind_reload")
+        bind_reload_zones = self.patch_autospec(
+            dns_config_module, "bind_reload_zones")
+        dns_update_zones([domain.id], [subnet.id])
+        self.assertThat(bind_reload, MockNotCalled())
+        self.assertThat(bind_reload_zones, MockCalledOnceWith([
+            domain.name,
+            Config.objects.get_config('maas_internal_domain'),
+            "0.1.10.in-addr.arpa",
+        ]))
+
+    def test_dns_update_zones_reloads_all_zones_on_failure(self):
+        self.patch(settings, 'DNS_CONNECT', True)
+        domain = factory.make_Domain()
+        bind_reload = self.patch_autospec(dns_config_module, "bind_reload")
+        bind_reload_zones = self.patch_autospec(
+            dns_config_module, "bind_reload_zones")
+        bind_reload_zones.return_value = False
+        dns_update_zones([domain.id], [])
+        self.assertThat(bind_reload, MockCalledOnceWith())
+
+    def test_dns_update_zones_returns_serial_and_changed_domains(self):
+        self.patch(settings, 'DNS_CONNECT', True)
+        domain = factory.make_Domain()
+        factory.make_Domain()
+        fake_serial = random.randint(1, 1000)
+        self.patch(
+            dns_config_module,
+            "current_zone_serial").return_value = fake_serial
+        serial, domains = dns_update_zones([domain.id], [])
+        self.assertThat(serial, Equals(fake_serial))
+        self.assertThat(domains, Equals([domain.name]))
+
+
+class TestGetReverseZoneSubnets(MAASServerTestCase):
+
+    def test__returns_only_changed_subnet(self):
+        subnet = factory.make_Subnet(cidr="10.1.0.0/24")
+        factory.make_Subnet(cidr="10.2.0.0/24")
+        self.assertItemsEqual(
+            [subnet], get_reverse_zone_subnets([subnet.id]))
+
+    def test__includes_overlapping_subnets(self):
+        subnet = factory.make_Subnet(cidr="10.1.1.0/24")
+        parent = factory.make_Subnet(cidr="10.1.0.0/16")
+        factory.make_Subnet(cidr="10.2.0.0/24")
+        self.assertItemsEqual(
+            [subnet, parent], get_reverse_zone_subnets([subnet.id]))
+
+    def test__includes_rfc2317_siblings(self):
+        subnet = factory.make_Subnet(
+            cidr="10.1.1.0/29", rdns_mode=RDNS_MODE.RFC2317)
+        sibling = factory.make_Subnet(
+            cidr="10.1.1.8/29", rdns_mode=RDNS_MODE.RFC2317)
+        factory.make_Subnet(cidr="10.1.2.0/29", rdns_mode=RDNS_MODE.RFC2317)
+        self.assertItemsEqual(
+            [subnet, sibling], get_reverse_zone_subnets([subnet.id]))
+
+    def test__excludes_disabled_subnets(self):
+        subnet = factory.make_Subnet(
+            cidr="10.1.0.0/24", rdns_mode=RDNS_MODE.DISABLED)
+        self.assertItemsEqual([], get_reverse_zone_subnets([subnet.id]))
+
+
 class TestDNSDynamicIPAddresses(TestDNSServer):
     """Allocated nodes with IP addresses in the dynamic range get a DNS
     record.
@@ -57,6 +57,7 @@ from twisted.internet.defer import (
     inlineCallbacks,
     maybeDeferred,
 )
+from twisted.internet.threads import deferToThread
 
 # Default port for regiond.
 DEFAULT_PORT = 5240
@@ -123,7 +124,22 @@ def make_ImportResourcesProgressService():
 
 def make_PostgresListenerService():
     from maasserver.listener import PostgresListenerService
-    return PostgresListenerService()
+    from maasserver.preseed_cache import rendered_config_cache
+    from maasserver.subnet_index import subnet_index_cache
+    listener = PostgresListenerService()
+    subnet_index_cache.listen(listener)
+    rendered_config_cache.listen(listener)
+    return listener
+
+
+def make_PostgresListenerWorkerService(ipcWorker):
+    from maasserver.listener import PostgresListenerWorkerService
+    from maasserver.preseed_cache import rendered_config_cache
+    from maasserver.subnet_index import subnet_index_cache
+    listener = PostgresListenerWorkerService(ipcWorker)
+    subnet_index_cache.listen(listener)
+    rendered_config_cache.listen(listener)
+    return listener
 
 
 def make_RackControllerService(ipcWorker, postgresListener):
@@ -172,6 +188,11 @@ def make_SyslogService():
     return syslog.RegionSyslogService(reactor)
 
 
+def make_EventLogMaintenanceService():
+    from maasserver.regiondservices import event_log
+    return event_log.EventLogMaintenanceService(reactor)
+
+
 def make_WebApplicationService(postgresListener, statusWorker):
     from maasserver.webapp import WebApplicationService
     site_port = DEFAULT_PORT  # config["port"]
@@ -185,9 +206,9 @@ def make_WorkersService():
     return WorkersService(reactor)
 
 
-def make_IPCMasterService(workers=None):
+def make_IPCMasterService(postgresListener, workers=None):
     from maasserver.ipc import IPCMasterService
-    return IPCMasterService(reactor, workers)
+    return IPCMasterService(reactor, workers, listener=postgresListener)
 
 
 def make_IPCWorkerService():
@@ -219,6 +240,14 @@ class MAASServices(MultiService):
             for service in self
         ])
 
+    @asynchronous
+    @inlineCallbacks
+    def stopService(self):
+        yield MultiService.stopService(self)
+        # Stop the tag evaluation processes once nothing can use them.
+        from maasserver.populate_tags import tag_evaluator
+        yield deferToThread(tag_evaluator.close)
+
 
 class RegionEventLoop:
     """An event loop running in a region controller process.
@@ -298,8 +327,8 @@ class RegionEventLoop:
         },
         "postgres-listener-worker": {
             "only_on_master": False,
-            "factory": make_PostgresListenerService,
-            "requires": [],
+            "factory": make_PostgresListenerWorkerService,
+            "requires": ["ipc-worker"],
         },
         "web": {
             "only_on_master": False,
@@ -351,6 +380,11 @@ class RegionEventLoop:
             "factory": make_SyslogService,
             "requires": [],
         },
+        "event-log-maintenance": {
+            "only_on_master": True,
+            "factory": make_EventLogMaintenanceService,
+            "requires": [],
+        },
         "workers": {
             "only_on_master": True,
             "not_all_in_one": True,
@@ -360,7 +394,7 @@ class RegionEventLoop:
         "ipc-master": {
             "only_on_master": True,
             "factory": make_IPCMasterService,
-            "requires": [],
+            "requires": ["postgres-listener-master"],
             "optional": ["workers"],
         },
         "ipc-worker": {
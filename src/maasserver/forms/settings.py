@@ -699,6 +699,28 @@ CONFIG_ITEMS = {
             'min_value': 1,
         },
     },
+    'max_script_result_size': {
+        'default': 0,
+        'form': forms.IntegerField,
+        'form_kwargs': {
+            'required': False,
+            'label': (
+                "The maximum number of bytes of each script output which "
+                "are stored; 0 stores all of it"),
+            'min_value': 0,
+        },
+    },
+    'event_log_retention_days': {
+        'default': 0,
+        'form': forms.IntegerField,
+        'form_kwargs': {
+            'required': False,
+            'label': (
+                "The number of days to keep events for; 0 keeps them "
+                "forever"),
+            'min_value': 0,
+        },
+    },
     'subnet_ip_exhaustion_threshold_count': {
         'default': 16,
         'form': forms.IntegerField,
@@ -13,6 +13,7 @@ from datetime import timedelta
 from functools import partial
 import os
 from socket import gethostname
+import time
 
 from maasserver import (
     eventloop,
@@ -117,6 +118,45 @@ class RPCUnregisterConnection(amp.Command):
     errors = []
 
 
+class ListenerRegisterChannel(amp.Command):
+    """Register worker wants database notifications from a channel."""
+
+    arguments = [
+        (b"pid", amp.Integer()),
+        (b"channel", amp.Unicode()),
+    ]
+    response = []
+    errors = []
+
+
+class ListenerUnregisterChannel(amp.Command):
+    """Unregister worker no longer wants notifications from a channel."""
+
+    arguments = [
+        (b"pid", amp.Integer()),
+        (b"channel", amp.Unicode()),
+    ]
+    response = []
+    errors = []
+
+
+class ListenerNotify(amp.Command):
+    """Relay a database notification from the master to a worker.
+
+    A `channel` and `payload` of `None` means the master has reconnected to
+    the database.
+    """
+
+    arguments = [
+        (b"channel", amp.Unicode(optional=True)),
+        (b"payload", amp.Unicode(optional=True)),
+        (b"timestamp", amp.Float()),
+    ]
+    response = []
+    errors = []
+    requiresAnswer = False
+
+
 class IPCMaster(RPCProtocol):
     """The IPC master side of the protocol."""
 
@@ -148,6 +188,18 @@ class IPCMaster(RPCProtocol):
         self.factory.service.unregisterWorkerRPCConnection(pid, connid)
         return {}
 
+    @ListenerRegisterChannel.responder
+    def listener_register_channel(self, pid, channel):
+        """Worker wants database notifications from `channel`."""
+        self.factory.service.registerWorkerChannel(pid, channel)
+        return {}
+
+    @ListenerUnregisterChannel.responder
+    def listener_unregister_channel(self, pid, channel):
+        """Worker no longer wants database notifications from `channel`."""
+        self.factory.service.unregisterWorkerChannel(pid, channel)
+        return {}
+
 
 class IPCMasterService(service.Service, object):
     """
@@ -163,10 +215,11 @@ class IPCMasterService(service.Service, object):
     connections = None
 
     def __init__(
-            self, reactor, workers=None, socket_path=None):
+            self, reactor, workers=None, socket_path=None, listener=None):
         super(IPCMasterService, self).__init__()
         self.reactor = reactor
         self.workers = workers
+        self.listener = listener
         self.socket_path = socket_path
         if self.socket_path is None:
             self.socket_path = get_ipc_socket_path()
@@ -265,7 +318,11 @@ class IPCMasterService(service.Service, object):
                 'rpc': {
                     'port': None,
                     'connections': set(),
-                }
+                },
+                'listener': {
+                    'channels': set(),
+                    'relay': partial(self._relayNotify, conn),
+                },
             }
             return process_id
 
@@ -306,6 +363,7 @@ class IPCMasterService(service.Service, object):
                 return pid
 
             def remove_conn_kill_worker(pid):
+                self._unregisterWorkerChannels(pid)
                 del self.connections[pid]
                 if self.workers:
                     self.workers.killWorker(pid)
@@ -319,6 +377,36 @@ class IPCMasterService(service.Service, object):
             d.addCallback(log_disconnected)
             return d
 
+    def _relayNotify(self, conn, channel, payload):
+        """Relay a database notification to the worker on `conn`."""
+        try:
+            conn.callRemote(
+                ListenerNotify, channel=channel, payload=payload,
+                timestamp=time.time())
+        except:
+            log.err(None, "Failed to relay notification to worker.")
+
+    def registerWorkerChannel(self, pid, channel):
+        """Relay database notifications from `channel` to worker `pid`."""
+        if pid in self.connections and self.listener is not None:
+            listener = self.connections[pid]['listener']
+            if channel not in listener['channels']:
+                listener['channels'].add(channel)
+                self.listener.registerRelay(channel, listener['relay'])
+
+    def unregisterWorkerChannel(self, pid, channel):
+        """Stop relaying database notifications from `channel` to `pid`."""
+        if pid in self.connections and self.listener is not None:
+            listener = self.connections[pid]['listener']
+            if channel in listener['channels']:
+                listener['channels'].discard(channel)
+                self.listener.unregisterRelay(channel, listener['relay'])
+
+    def _unregisterWorkerChannels(self, pid):
+        """Stop relaying all database notifications to worker `pid`."""
+        for channel in list(self.connections[pid]['listener']['channels']):
+            self.unregisterWorkerChannel(pid, channel)
+
     def _getListenAddresses(self, port):
         """Return list of tuple (address, port) for the addresses the worker
         is listening on."""
@@ -619,14 +707,26 @@ class IPCWorker(RPCProtocol):
         d.addCallback(set_defers)
         return d
 
+    @ListenerNotify.responder
+    def listener_notify(self, channel, payload, timestamp):
+        """Master relayed a database notification."""
+        if self.service.listener is not None:
+            self.service.listener.notify(channel, payload, timestamp)
+        return {}
+
 
 class IPCWorkerService(service.Service, object):
     """
     IPC worker service.
 
     Provides the worker side of the IPC communication to the master.
+
+    :ivar listener: The `PostgresListenerWorkerService` that relayed database
+        notifications are passed to, if any.
     """
 
+    listener = None
+
     def __init__(self, reactor, socket_path=None):
         super(IPCWorkerService, self).__init__()
         self.reactor = reactor
@@ -703,3 +803,21 @@ class IPCWorkerService(service.Service, object):
             lambda protocol: protocol.callRemote(
                 RPCUnregisterConnection, pid=os.getpid(), connid=connid))
         return d
+
+    @asynchronous
+    def listenerRegisterChannel(self, channel):
+        """Ask the master to relay database notifications from `channel`."""
+        d = self.protocol.get()
+        d.addCallback(
+            lambda protocol: protocol.callRemote(
+                ListenerRegisterChannel, pid=os.getpid(), channel=channel))
+        return d
+
+    @asynchronous
+    def listenerUnregisterChannel(self, channel):
+        """Ask the master to stop relaying notifications from `channel`."""
+        d = self.protocol.get()
+        d.addCallback(
+            lambda protocol: protocol.callRemote(
+                ListenerUnregisterChannel, pid=os.getpid(), channel=channel))
+        return d
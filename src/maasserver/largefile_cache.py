@@ -0,0 +1,331 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""On-disk cache of the content of `LargeFile`s.
+
+Rack controllers download boot resources from the region. Rather than
+stream each download out of a PostgreSQL large object, on a database
+connection of its own, each region controller keeps a copy of each file on
+disk, named by its SHA256.
+"""
+
+__all__ = [
+    "get_largefile_cache",
+    "LargeFileCache",
+    "LargeFileCacheError",
+]
+
+from datetime import timedelta
+import fcntl
+from functools import lru_cache
+import hashlib
+import os
+import time
+
+from maasserver.config import RegionConfiguration
+from provisioningserver.logger import LegacyLogger
+from provisioningserver.path import get_data_path
+
+
+log = LegacyLogger()
+
+
+class LargeFileCacheError(Exception):
+    """The content of a file could not be read from the cache."""
+
+
+class LargeFileCache:
+    """The content of `LargeFile`s, kept on disk and named by SHA256.
+
+    The first request for a file copies it from its large object, sending
+    the content to its client as it goes, and renames the copy into place
+    once its size and SHA256 have been checked. Meanwhile, requests for the
+    same file, from this or any other region process, follow the copy as
+    it's written. Files are evicted, least recently used first, to keep
+    the cache within `max_size` bytes.
+    """
+
+    # Read and write this many bytes at a time.
+    block_size = 1024 * 1024
+
+    # How often to look for more content while following a copy, and for
+    # how long to wait for any before giving up.
+    poll_interval = 0.1
+    stall_timeout = 60
+
+    # Copies left behind by a region process that died while copying are
+    # removed once they are this old.
+    abandoned_after = timedelta(days=1).total_seconds()
+
+    def __init__(self, path, max_size):
+        """Initialise the cache.
+
+        :param path: The directory to keep files in.
+        :param max_size: The maximum size, in bytes, of the files kept.
+        """
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(self.path, exist_ok=True)
+
+    def get_path(self, sha256, suffix=""):
+        """Return the path of the file for `sha256`."""
+        return os.path.join(self.path, sha256 + suffix)
+
+    def read(self, largefile, offset=0, length=None):
+        """Return an iterator over the cached content of `largefile`.
+
+        :param offset: Start reading from this byte.
+        :param length: Read at most this many bytes, or read to the end.
+        :return: An iterator of bytes, or `None` if `largefile` is not
+            cached.
+        """
+        path = self.get_path(largefile.sha256)
+        try:
+            stream = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        size = os.fstat(stream.fileno()).st_size
+        if size != largefile.total_size:
+            stream.close()
+            log.msg(
+                "Discarding cached %s; it has %d bytes, not %d." % (
+                    largefile.sha256, size, largefile.total_size))
+            self._discard(path)
+            return None
+        try:
+            # Mark the file as recently used.
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # Evicted already; it can still be read.
+        if length is None:
+            length = size - offset
+        # Only a read of the whole file can be checked against its SHA256.
+        verify = offset == 0 and length == size
+        return self._read(
+            stream, path, largefile.sha256, offset, length, verify)
+
+    def fetch(self, largefile, content):
+        """Return an iterator over the content of `largefile`.
+
+        The content is read from the cache if possible. Otherwise it is
+        copied into the cache from `content`, or read from the copy being
+        made by another request.
+
+        :param content: An iterable over the content of `largefile` from
+            its large object, such as a `ConnectionWrapper`. It is closed
+            if it is not used.
+        """
+        stream = self.read(largefile)
+        if stream is not None:
+            content.close()
+            return stream
+        lock = self._lock(largefile.sha256)
+        if lock is None:
+            content.close()
+            return self._follow(largefile)
+        # Another request may have finished copying just before the lock
+        # was taken.
+        stream = self.read(largefile)
+        if stream is not None:
+            os.close(lock)
+            content.close()
+            return stream
+        return self._copy(largefile, content, lock)
+
+    def evict(self):
+        """Remove the least recently used files to fit within `max_size`.
+
+        Copies abandoned by region processes that have since died are
+        removed too, as are the lock files of files no longer cached.
+        """
+        files, copying, locks, total_size = [], set(), set(), 0
+        now = time.time()
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                sha256, _, suffix = entry.name.partition(".")
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if suffix == "":
+                    files.append((stat.st_mtime, stat.st_size, sha256))
+                    total_size += stat.st_size
+                elif suffix == "partial":
+                    if now - stat.st_mtime > self.abandoned_after:
+                        lock = self._lock(sha256)
+                        if lock is not None:
+                            self._discard(entry.path)
+                            os.close(lock)
+                            continue
+                    copying.add(sha256)
+                elif suffix == "lock":
+                    locks.add(sha256)
+        files.sort()
+        cached = {sha256 for _, _, sha256 in files}
+        for _, size, sha256 in files:
+            if total_size <= self.max_size:
+                break
+            self._discard(self.get_path(sha256))
+            cached.discard(sha256)
+            total_size -= size
+        for sha256 in locks - cached - copying:
+            self._remove_lock(sha256)
+
+    def _read(self, stream, path, sha256, offset, length, verify):
+        checksum = hashlib.sha256() if verify else None
+        with stream:
+            stream.seek(offset)
+            while length > 0:
+                data = stream.read(min(self.block_size, length))
+                if len(data) == 0:
+                    raise LargeFileCacheError(
+                        "Cached %s ended early." % sha256)
+                if checksum is not None:
+                    checksum.update(data)
+                length -= len(data)
+                yield data
+        if checksum is not None and checksum.hexdigest() != sha256:
+            log.msg("Discarding cached %s; it is corrupt." % sha256)
+            self._discard(path)
+            raise LargeFileCacheError("Cached %s is corrupt." % sha256)
+
+    def _copy(self, largefile, content, lock):
+        sha256 = largefile.sha256
+        partial = self.get_path(sha256, ".partial")
+        checksum = hashlib.sha256()
+        size = 0
+        try:
+            try:
+                with open(partial, "wb") as stream:
+                    for data in content:
+                        stream.write(data)
+                        # Let requests following the copy read this too.
+                        stream.flush()
+                        checksum.update(data)
+                        size += len(data)
+                        yield data
+            finally:
+                content.close()
+            if size != largefile.total_size:
+                raise LargeFileCacheError(
+                    "Copied %d bytes of %s, not %d." % (
+                        size, sha256, largefile.total_size))
+            elif checksum.hexdigest() != sha256:
+                raise LargeFileCacheError(
+                    "Copy of %s has SHA256 %s." % (
+                        sha256, checksum.hexdigest()))
+            os.rename(partial, self.get_path(sha256))
+        except BaseException:
+            self._discard(partial)
+            raise
+        finally:
+            os.close(lock)
+        self.evict()
+
+    def _follow(self, largefile):
+        sha256 = largefile.sha256
+        stream = self._open_copy(sha256)
+        checksum = hashlib.sha256()
+        size, idle = 0, 0
+        with stream:
+            while size < largefile.total_size:
+                data = stream.read(
+                    min(self.block_size, largefile.total_size - size))
+                if len(data) != 0:
+                    checksum.update(data)
+                    size += len(data)
+                    idle = 0
+                    yield data
+                elif self._isCopying(sha256):
+                    if idle >= self.stall_timeout:
+                        raise LargeFileCacheError(
+                            "Copy of %s has stalled." % sha256)
+                    time.sleep(self.poll_interval)
+                    idle += self.poll_interval
+                elif len(stream.read(1)) == 0:
+                    # The copy has finished, yet there's nothing left to
+                    # read, so it must have failed.
+                    raise LargeFileCacheError(
+                        "Copy of %s was abandoned." % sha256)
+                else:
+                    stream.seek(size)
+        if checksum.hexdigest() != sha256:
+            raise LargeFileCacheError("Copy of %s is corrupt." % sha256)
+
+    def _open_copy(self, sha256):
+        """Open the copy of `sha256` being made, or that has been made."""
+        waited = 0
+        while True:
+            for suffix in ".partial", "":
+                try:
+                    return open(self.get_path(sha256, suffix), "rb")
+                except FileNotFoundError:
+                    pass
+            if waited >= self.stall_timeout:
+                raise LargeFileCacheError(
+                    "Copy of %s has not started." % sha256)
+            time.sleep(self.poll_interval)
+            waited += self.poll_interval
+
+    def _lock(self, sha256):
+        """Take the lock for copying `sha256`, if it's free.
+
+        :return: A file descriptor to close to release the lock, or `None`
+            if it's held elsewhere.
+        """
+        path = self.get_path(sha256, ".lock")
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return None
+            try:
+                current = os.stat(path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current == os.fstat(fd).st_ino:
+                return fd
+            # `evict` removed the lock file after it was opened here, so
+            # this lock guards nothing; take the lock on its replacement.
+            os.close(fd)
+
+    def _remove_lock(self, sha256):
+        """Remove the lock file for `sha256`, unless the lock is held."""
+        lock = self._lock(sha256)
+        if lock is not None:
+            try:
+                self._discard(self.get_path(sha256, ".lock"))
+            finally:
+                os.close(lock)
+
+    def _isCopying(self, sha256):
+        lock = self._lock(sha256)
+        if lock is None:
+            return True
+        else:
+            os.close(lock)
+            return False
+
+    def _discard(self, path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+@lru_cache(1)
+def get_largefile_cache():
+    """Return this region's `LargeFileCache`, or `None` if it's disabled.
+
+    The cache is created on first use, once per process.
+    """
+    with RegionConfiguration.open() as config:
+        max_size = config.boot_resources_cache_size
+    if max_size == 0:
+        return None
+    else:
+        return LargeFileCache(
+            get_data_path("/var/lib/maas/boot-resources-cache"),
+            max_size * 1024 * 1024)
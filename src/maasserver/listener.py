@@ -6,14 +6,17 @@
 __all__ = [
     "PostgresListenerNotifyError",
     "PostgresListenerService",
+    "PostgresListenerWorkerService",
     ]
 
 from collections import defaultdict
 from contextlib import closing
 from errno import ENOENT
+import time
 
 from django.db import connections
 from django.db.utils import load_backend
+from maasserver.prometheus.metrics import PROMETHEUS_METRICS
 from provisioningserver.utils.enum import map_enum
 from provisioningserver.utils.twisted import (
     callOut,
@@ -88,6 +91,7 @@ class PostgresListenerService(Service, object):
     def __init__(self, alias="default"):
         self.alias = alias
         self.listeners = defaultdict(list)
+        self.relays = defaultdict(set)
         self.autoReconnect = False
         self.connection = None
         self.connectionFileno = None
@@ -158,32 +162,47 @@ class PostgresListenerService(Service, object):
             notifies = self.connection.connection.notifies
             if len(notifies) != 0:
                 for notify in notifies:
-                    if self.isSystemChannel(notify.channel):
-                        # System level message; pass it to the registered
-                        # handler immediately.
-                        if notify.channel in self.listeners:
-                            # Be defensive in that if a handler does not exist
-                            # for this channel then the channel should be
-                            # unregisted and removed from listeners.
-                            if len(self.listeners[notify.channel]) > 0:
-                                handler = self.listeners[notify.channel][0]
-                                handler(notify.channel, notify.payload)
-                            else:
-                                self.unregisterChannel(notify.channel)
-                                del self.listeners[notify.channel]
-                        else:
-                            # Unregister the channel since no listener is
-                            # registered for this channel.
-                            self.unregisterChannel(notify.channel)
-                    else:
-                        # Place non-system messages into the queue to be
-                        # processed.
-                        self.notifications.add(
-                            (notify.channel, notify.payload))
+                    self.processNotify(notify.channel, notify.payload)
                 # Delete the contents of the connection's notifies list so
                 # that we don't process them a second time.
                 del notifies[:]
 
+    def getRegisteredChannel(self, channel):
+        """Return the registered channel for the postgres `channel`."""
+        if self.isSystemChannel(channel):
+            return channel
+        else:
+            return channel.split('_', 1)[0]
+
+    def processNotify(self, channel, payload):
+        """Relay and process a notification from the postgres `channel`."""
+        registered = self.getRegisteredChannel(channel)
+        relays = self.relays.get(registered)
+        if relays:
+            for relay in list(relays):
+                relay(channel, payload)
+        if self.isSystemChannel(channel):
+            # System level message; pass it to the registered handler
+            # immediately.
+            if channel in self.listeners:
+                # Be defensive in that if a handler does not exist for this
+                # channel then the channel should be unregisted and removed
+                # from listeners.
+                if len(self.listeners[channel]) > 0:
+                    handler = self.listeners[channel][0]
+                    handler(channel, payload)
+                else:
+                    del self.listeners[channel]
+                    if not relays:
+                        self.unregisterChannel(channel)
+            elif not relays:
+                # Unregister the channel since no listener is registered for
+                # this channel.
+                self.unregisterChannel(channel)
+        elif registered in self.listeners or not relays:
+            # Place non-system messages into the queue to be processed.
+            self.notifications.add((channel, payload))
+
     def fileno(self):
         """Return the fileno of the connection."""
         return self.connectionFileno
@@ -242,10 +261,50 @@ class PostgresListenerService(Service, object):
         else:
             raise PostgresListenerUnregistrationError(
                 "Handler is not registered on that channel '%s'." % channel)
-        if self.registeredChannels and self.connection and len(handlers) == 0:
+        if (self.registeredChannels and self.connection and
+                len(handlers) == 0 and not self.relays.get(channel)):
             # Channels have already been registered. Unregister the channel.
             self.unregisterChannel(channel)
 
+    def registerRelay(self, channel, relay):
+        """Relay all notifications from a channel to `relay`.
+
+        Unlike a handler, `relay` is called for each notification as soon as
+        it arrives, with the postgres channel it arrived on -- e.g.
+        "node_update" rather than "node" -- and its payload. Any number of
+        relays can be registered for a system channel. After each connection
+        to the database is made every relay is called with `None` for both,
+        since notifications may have been missed in the meantime.
+        """
+        self.relays[channel].add(relay)
+        if self.registeredChannels and self.connection:
+            # Channels have already been registered. Register the
+            # new channel on the already existing connection.
+            self.registerChannel(channel)
+
+    def unregisterRelay(self, channel, relay):
+        """Stop relaying notifications from a channel to `relay`."""
+        relays = self.relays.get(channel)
+        if not relays or relay not in relays:
+            raise PostgresListenerUnregistrationError(
+                "Relay is not registered on that channel '%s'." % channel)
+        relays.remove(relay)
+        if len(relays) == 0:
+            del self.relays[channel]
+            if (self.registeredChannels and self.connection and
+                    len(self.listeners.get(channel, [])) == 0):
+                # Channels have already been registered. Unregister the
+                # channel.
+                self.unregisterChannel(channel)
+
+    def relayConnected(self):
+        """Tell every relay that a new connection has been made."""
+        relays = set()
+        for channel_relays in self.relays.values():
+            relays.update(channel_relays)
+        for relay in relays:
+            relay(None, None)
+
     @synchronous
     def createConnection(self):
         """Create new database connection."""
@@ -285,6 +344,7 @@ class PostgresListenerService(Service, object):
 
             def cb_connect(_):
                 self.log.info("Listening for database notifications.")
+                self.relayConnected()
 
             def eb_connect(failure):
                 self.log.error(
@@ -375,7 +435,7 @@ class PostgresListenerService(Service, object):
 
     def registerChannels(self):
         """Register the all the channels."""
-        for channel in self.listeners.keys():
+        for channel in set(self.listeners) | set(self.relays):
             self.registerChannel(channel)
         self.registeredChannels = True
 
@@ -438,3 +498,110 @@ class PostgresListenerService(Service, object):
                     "{payload!r}", failure, channel=channel, payload=payload))
                 defers.append(d)
             return defer.DeferredList(defers)
+
+
+class RelayedConnection:
+    """Stands in for the master process's connection to the database.
+
+    A new instance is made each time the master process (re)connects to the
+    database, so that anything holding on to an earlier instance can tell
+    that notifications may have been missed.
+
+    :ivar protocol: The IPC protocol connected to the master process.
+    """
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+
+
+class PostgresListenerWorkerService(PostgresListenerService):
+    """Receives NOTIFY messages from postgres relayed by the master process.
+
+    Rather than keeping its own connection to postgres, a worker process
+    asks the master process, over IPC, to relay notifications for the
+    channels it has handlers for. Notifications are then processed exactly as
+    in `PostgresListenerService`.
+
+    :ivar connection: A `RelayedConnection` while subscribed to the master
+        process, `None` at all other times.
+    """
+
+    def __init__(self, ipcWorker, alias="default"):
+        super(PostgresListenerWorkerService, self).__init__(alias)
+        self.ipcWorker = ipcWorker
+        self.ipcWorker.listener = self
+
+    def connected(self):
+        """Return True if subscribed to the master process."""
+        return self.connection is not None
+
+    def tryConnection(self):
+        """Subscribe to the master process once connected to it."""
+        if self.connecting is None:
+
+            def cb_connect(protocol):
+                self.connection = RelayedConnection(protocol)
+                self.registerChannels()
+                self.runHandleNotify(self.HANDLE_NOTIFY_DELAY)
+                self.log.info(
+                    "Listening for database notifications from the master "
+                    "process.")
+
+            def done():
+                self.connecting = None
+
+            self.connecting = self.ipcWorker.protocol.get()
+            self.connecting.addCallback(cb_connect)
+            self.connecting.addErrback(suppress, CancelledError)
+            self.connecting.addBoth(callOut, done)
+
+        return self.connecting
+
+    def loseConnection(self, reason=Failure(error.ConnectionDone())):
+        """Stop processing notifications from the master process."""
+        if self.connecting is not None:
+            self.connecting.cancel()
+        self.connection = None
+        self.registeredChannels = False
+        return self.cancelHandleNotify()
+
+    def registerChannel(self, channel):
+        """Ask the master process to relay the channel."""
+        d = self.ipcWorker.listenerRegisterChannel(channel)
+        d.addErrback(lambda failure: self.log.failure(
+            "Failed to register channel {channel!r}.", failure,
+            channel=channel))
+        return d
+
+    def unregisterChannel(self, channel):
+        """Ask the master process to stop relaying the channel."""
+        d = self.ipcWorker.listenerUnregisterChannel(channel)
+        d.addErrback(lambda failure: self.log.failure(
+            "Failed to unregister channel {channel!r}.", failure,
+            channel=channel))
+        return d
+
+    def registerChannels(self):
+        """Register all the channels with the master process."""
+        # Mark the channels as registered first; handlers registered while
+        # the requests are in flight must be registered on their own.
+        self.registeredChannels = True
+        for channel in list(self.listeners):
+            self.registerChannel(channel)
+
+    def notify(self, channel, payload, timestamp):
+        """Process a notification relayed by the master process.
+
+        :param timestamp: When the master process received the notification,
+            in seconds since the epoch. A `channel` of `None` means that the
+            master process has reconnected to the database.
+        """
+        if self.connection is None:
+            return
+        if channel is None:
+            self.connection = RelayedConnection(self.connection.protocol)
+        else:
+            PROMETHEUS_METRICS.update(
+                'maas_listener_notify_relay_latency', 'observe',
+                value=time.time() - timestamp)
+            self.processNotify(channel, payload)
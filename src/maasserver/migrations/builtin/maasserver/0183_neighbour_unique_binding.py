@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+from django.db import migrations
+
+# The `unique_together` constraint on (interface, vid, mac_address, ip) does
+# not apply to untagged bindings, since NULL values are never equal. Remove
+# any duplicates of those, then index the bindings such that they can be
+# upserted with INSERT ... ON CONFLICT.
+index_create = ("""\
+DELETE FROM maasserver_neighbour AS neighbour
+USING maasserver_neighbour AS duplicate
+WHERE neighbour.vid IS NULL
+  AND duplicate.vid IS NULL
+  AND neighbour.interface_id = duplicate.interface_id
+  AND neighbour.mac_address = duplicate.mac_address
+  AND neighbour.ip = duplicate.ip
+  AND neighbour.id < duplicate.id;
+CREATE UNIQUE INDEX maasserver_neighbour_binding_uniq
+ON maasserver_neighbour (interface_id, (COALESCE(vid, -1)), mac_address, ip);
+""")
+
+index_drop = (
+    "DROP INDEX IF EXISTS maasserver_neighbour_binding_uniq"
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maasserver', '0182_node-uuid'),
+    ]
+
+    operations = [
+        migrations.RunSQL(index_create, index_drop),
+    ]
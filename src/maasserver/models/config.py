@@ -115,6 +115,9 @@ def get_default_config():
         'max_node_commissioning_results': 10,
         'max_node_testing_results': 10,
         'max_node_installation_results': 3,
+        'max_script_result_size': 0,
+        # Events.
+        'event_log_retention_days': 0,
         # Notifications.
         'subnet_ip_exhaustion_threshold_count': 16,
         # Authentication.
@@ -7,8 +7,15 @@ __all__ = [
     'Event',
     ]
 
+from contextlib import closing
+from datetime import (
+    datetime,
+    time,
+    timedelta,
+)
 import logging
 
+from django.db import connection
 from django.db.models import (
     CharField,
     ForeignKey,
@@ -36,6 +43,14 @@ from provisioningserver.utils.env import get_maas_id
 
 maaslog = get_maas_logger('models.event')
 
+# Events are written to `maasserver_event`, then periodically moved in bulk
+# into archive tables that inherit from it, one for each day the events were
+# created on. Queries on the events table include the archives, while
+# expiring events is a matter of dropping whole archive tables instead of
+# deleting rows one by one.
+EVENT_ARCHIVE_PREFIX = 'maasserver_event_archive_'
+EVENT_ARCHIVE_DATE_FORMAT = '%Y%m%d'
+
 
 class EventManager(Manager):
     """A utility to manage the collection of Events."""
@@ -90,6 +105,90 @@ class EventManager(Manager):
             system_id=get_maas_id(), event_type=event_type,
             event_description=event_description, user=user)
 
+    def archive_events(self, cutoff, limit=1000):
+        """Move up to `limit` events created before `cutoff` into an archive.
+
+        Events are archived in the table for the day they were created on,
+        which is created if it does not yet exist. Each call only moves
+        events of a single day, so call this repeatedly, each time in a new
+        transaction, until it returns 0.
+
+        :return: The number of events archived.
+        """
+        with closing(connection.cursor()) as cursor:
+            cursor.execute(
+                "SELECT created FROM ONLY maasserver_event "
+                "WHERE created < %s ORDER BY id LIMIT 1", [cutoff])
+            row = cursor.fetchone()
+            if row is None:
+                return 0
+            [created] = row
+            day = datetime.combine(created.date(), time())
+            archive = EVENT_ARCHIVE_PREFIX + day.strftime(
+                EVENT_ARCHIVE_DATE_FORMAT)
+            self._create_archive(cursor, archive, day)
+            cursor.execute(
+                "WITH archived AS ("
+                "  DELETE FROM ONLY maasserver_event WHERE id IN ("
+                "    SELECT id FROM ONLY maasserver_event"
+                "    WHERE created >= %%s AND created < %%s"
+                "    ORDER BY id LIMIT %%s)"
+                "  RETURNING *) "
+                "INSERT INTO %s SELECT * FROM archived" % archive,
+                [day, min(day + timedelta(days=1), cutoff), limit])
+            return cursor.rowcount
+
+    def _create_archive(self, cursor, archive, day):
+        """Create the `archive` table for `day`, if it does not yet exist.
+
+        Constraints and indexes are not inherited, so the archive gets its
+        own, matching those of `maasserver_event`. It is also constrained to
+        events created on `day`, so that the planner can skip it when
+        querying for events created on other days.
+        """
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS %(archive)s ("
+            "  PRIMARY KEY (id),"
+            "  FOREIGN KEY (node_id) REFERENCES maasserver_node (id)"
+            "    ON DELETE SET NULL DEFERRABLE INITIALLY DEFERRED,"
+            "  FOREIGN KEY (type_id) REFERENCES maasserver_eventtype (id)"
+            "    DEFERRABLE INITIALLY DEFERRED,"
+            "  CHECK (created >= %%s AND created < %%s)"
+            ") INHERITS (maasserver_event);"
+            "CREATE INDEX IF NOT EXISTS %(archive)s_node_id_id_idx"
+            "  ON %(archive)s (node_id, id);" % {'archive': archive},
+            [day, day + timedelta(days=1)])
+
+    def get_archives(self):
+        """Return the names of the event archive tables, oldest first."""
+        with closing(connection.cursor()) as cursor:
+            cursor.execute(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid "
+                "WHERE pg_inherits.inhparent = 'maasserver_event'::regclass "
+                "AND child.relname LIKE %s "
+                "ORDER BY child.relname", [EVENT_ARCHIVE_PREFIX + '%'])
+            return [name for name, in cursor.fetchall()]
+
+    def expire_archives(self, cutoff):
+        """Drop the archives that only hold events created before `cutoff`.
+
+        An archive only holds events created on the day it is named after.
+
+        :return: The names of the dropped archives.
+        """
+        expired = []
+        for archive in self.get_archives():
+            day = datetime.strptime(
+                archive[len(EVENT_ARCHIVE_PREFIX):],
+                EVENT_ARCHIVE_DATE_FORMAT)
+            if day + timedelta(days=1) <= cutoff:
+                expired.append(archive)
+        if len(expired) > 0:
+            with closing(connection.cursor()) as cursor:
+                cursor.execute("DROP TABLE %s" % ", ".join(expired))
+        return expired
+
 
 class Event(CleanSave, TimestampedModel):
     """An `Event` represents a MAAS event.
@@ -1411,10 +1411,12 @@ class Interface(CleanSave, TimestampedModel):
             neighbour.save(update_fields=['time', 'count', 'updated'])
         return neighbour
 
-    def update_mdns_entry(self, avahi_json: dict):
+    def update_mdns_entry(self, avahi_json: dict, count: int=1):
         """Updates an mDNS entry observed on this interface.
 
         Input is expected to be the mDNS JSON from the controller.
+
+        :param count: The number of times the entry was observed.
         """
         # Circular imports
         from maasserver.models.mdns import MDNS
@@ -1428,14 +1430,14 @@ class Interface(CleanSave, TimestampedModel):
             hostname, ip, interface=self)
         if binding is None:
             binding = MDNS.objects.create(
-                interface=self, ip=ip, hostname=hostname)
+                interface=self, ip=ip, hostname=hostname, count=count)
             # If we deleted a previous mDNS entry, then we have already
             # generated a log statement about this mDNS entry.
             if not deleted:
                 maaslog.info("%s: New mDNS entry resolved: '%s' on %s." % (
                     self.get_log_string(), hostname, ip))
         else:
-            binding.count += 1
+            binding.count += count
             binding.save(update_fields=['count', 'updated'])
         return binding
 
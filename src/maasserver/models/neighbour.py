@@ -7,6 +7,9 @@ __all__ = [
     'Neighbour',
 ]
 
+from contextlib import closing
+
+from django.db import connection
 from django.db.models import (
     CASCADE,
     ForeignKey,
@@ -21,7 +24,10 @@ from maasserver.fields import (
 )
 from maasserver.models.cleansave import CleanSave
 from maasserver.models.interface import Interface
-from maasserver.models.timestampedmodel import TimestampedModel
+from maasserver.models.timestampedmodel import (
+    now,
+    TimestampedModel,
+)
 from maasserver.utils.orm import (
     get_one,
     MAASQueriesMixin,
@@ -33,6 +39,9 @@ from provisioningserver.utils.network import get_mac_organization
 
 maaslog = get_maas_logger("neighbour")
 
+# PostgreSQL limits the payload of a notification to 8000 bytes.
+MAX_NOTIFY_PAYLOAD = 7900
+
 
 class NeighbourQueriesMixin(MAASQueriesMixin):
 
@@ -132,6 +141,137 @@ class NeighbourManager(Manager, NeighbourQueriesMixin):
         # a UniqueViolation so this operation can be retried.
         return get_one(query, exception_class=UniqueViolation)
 
+    def record_bindings(self, observations):
+        """Records a batch of observed (IP, MAC) bindings.
+
+        This is the set-based equivalent of calling `update_neighbour()` on
+        each interface in turn. Observations of the same binding are merged
+        first, then obsolete bindings are removed with a single DELETE, and
+        current bindings are created or refreshed with a single upsert.
+
+        Per-row notifications are sent only for new and deleted bindings.
+        Refreshed bindings are announced with one coalesced `neighbour_update`
+        notification, whose payload is a space-separated list of IPs.
+
+        :param observations: An iterable of (interface, neighbour) tuples,
+            where each neighbour is the JSON reported by the controller.
+        """
+        # Merge repeated observations, keeping only the latest MAC for each
+        # (interface, IP, VID), as a sequence of updates would.
+        bindings = {}
+        interfaces = {}
+        for interface, neighbour in observations:
+            interfaces[interface.id] = interface
+            key = (interface.id, neighbour['ip'], neighbour.get('vid', None))
+            mac = neighbour['mac']
+            # Racks merge repeated observations too, and report how many.
+            count = neighbour.get('count', 1)
+            binding = bindings.pop(key, None)
+            if binding is not None and binding['mac'] == mac:
+                binding['time'] = neighbour['time']
+                binding['count'] += count
+            else:
+                binding = {
+                    'mac': mac, 'time': neighbour['time'], 'count': count}
+            bindings[key] = binding
+        if len(bindings) == 0:
+            return
+        deleted = self._delete_obsolete_bindings(bindings, interfaces)
+        refreshed = []
+        for interface_id, ip, vid, mac, inserted in self._upsert_bindings(
+                bindings):
+            if not inserted:
+                refreshed.append(ip)
+            elif (interface_id, ip, vid) not in deleted:
+                # If we deleted a previous neighbour, then we have already
+                # generated a log statement about this neighbour.
+                maaslog.info("%s: New MAC, IP binding observed%s: %s, %s" % (
+                    interfaces[interface_id].get_log_string(),
+                    self.get_vid_log_snippet(vid), mac, ip))
+        self._notify_refreshed(refreshed)
+
+    def _delete_obsolete_bindings(self, bindings, interfaces):
+        """Deletes bindings superseded by a different MAC.
+
+        :return: The set of (interface_id, ip, vid) keys with a deletion.
+        """
+        rows = ", ".join(
+            ["(%s, %s::inet, %s::integer, %s::macaddr)"] * len(bindings))
+        params = []
+        for (interface_id, ip, vid), binding in bindings.items():
+            params.extend((interface_id, ip, vid, binding['mac']))
+        query = """\
+            DELETE FROM maasserver_neighbour AS neighbour
+            USING (VALUES %s) AS binding(interface_id, ip, vid, mac_address)
+            WHERE neighbour.interface_id = binding.interface_id
+              AND neighbour.ip = binding.ip
+              AND neighbour.vid IS NOT DISTINCT FROM binding.vid
+              AND neighbour.mac_address <> binding.mac_address
+            RETURNING neighbour.interface_id, host(neighbour.ip),
+              neighbour.vid, neighbour.mac_address::text,
+              binding.mac_address::text
+        """ % rows
+        deleted = set()
+        with closing(connection.cursor()) as cursor:
+            cursor.execute(query, params)
+            for interface_id, ip, vid, old_mac, mac in cursor.fetchall():
+                maaslog.info("%s: IP address %s%s moved from %s to %s" % (
+                    interfaces[interface_id].get_log_string(), ip,
+                    self.get_vid_log_snippet(vid), old_mac, mac))
+                deleted.add((interface_id, ip, vid))
+        return deleted
+
+    def _upsert_bindings(self, bindings):
+        """Creates or refreshes the specified bindings.
+
+        Relies on the unique index over (interface_id, COALESCE(vid, -1),
+        mac_address, ip), which unlike `unique_together` also applies to
+        untagged bindings.
+
+        :return: A list of (interface_id, ip, vid, mac, inserted) tuples.
+        """
+        timestamp = now()
+        rows = ", ".join(
+            ["(%s, %s, %s, %s::inet, %s, %s::macaddr, %s, %s)"] *
+            len(bindings))
+        params = []
+        for (interface_id, ip, vid), binding in bindings.items():
+            params.extend((
+                timestamp, timestamp, interface_id, ip, vid, binding['mac'],
+                binding['time'], binding['count']))
+        query = """\
+            INSERT INTO maasserver_neighbour AS neighbour (
+              created, updated, interface_id, ip, vid, mac_address, time,
+              count)
+            VALUES %s
+            ON CONFLICT (interface_id, (COALESCE(vid, -1)), mac_address, ip)
+            DO UPDATE SET
+              time = EXCLUDED.time,
+              count = neighbour.count + EXCLUDED.count,
+              updated = EXCLUDED.updated
+            RETURNING interface_id, host(ip), vid, mac_address::text,
+              xmax = 0
+        """ % rows
+        with closing(connection.cursor()) as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+    def _notify_refreshed(self, ips):
+        """Sends coalesced `neighbour_update` notifications for `ips`."""
+        payloads = []
+        payload = ""
+        for ip in sorted(set(ips)):
+            if len(payload) + len(ip) + 1 > MAX_NOTIFY_PAYLOAD:
+                payloads.append(payload)
+                payload = ""
+            payload = ip if payload == "" else payload + " " + ip
+        if payload != "":
+            payloads.append(payload)
+        with closing(connection.cursor()) as cursor:
+            for payload in payloads:
+                cursor.execute(
+                    "SELECT pg_notify('neighbour_update', %s)", [payload])
+
     def get_by_updated_with_related_nodes(self):
         """Returns a `QuerySet` of neighbours, while also selecting related
         interfaces and nodes.
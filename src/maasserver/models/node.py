@@ -13,6 +13,7 @@ __all__ = [
     ]
 
 from collections import (
+    Counter,
     defaultdict,
     namedtuple,
     OrderedDict,
@@ -163,9 +164,12 @@ from maasserver.utils.dns import validate_hostname
 from maasserver.utils.mac import get_vendor_for_mac
 from maasserver.utils.orm import (
     get_one,
+    is_serialization_failure,
     MAASQueriesMixin,
     post_commit,
     post_commit_do,
+    request_transaction_retry,
+    savepoint,
     transactional,
     with_connection,
 )
@@ -608,6 +612,10 @@ class MachineManager(BaseNodeManager):
 
     extra_filters = {'node_type': NODE_TYPE.MACHINE}
 
+    # The number of machines to try, in one transaction, before asking for
+    # the transaction to be retried with the `node_acquire` lock.
+    max_claim_attempts = 16
+
     def get_available_machines_for_acquisition(self, for_user):
         """Find the machines that can be acquired by the given user.
 
@@ -619,6 +627,52 @@ class MachineManager(BaseNodeManager):
         available_machines = self.get_nodes(for_user, NodePermission.edit)
         return available_machines.filter(status=NODE_STATUS.READY)
 
+    def _try_claim_machine(self, machine):
+        """Try to lock `machine` for the rest of this transaction.
+
+        This does not wait: it returns `False` if another transaction holds
+        the machine's row right now, or the machine is no longer ready.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT id FROM maasserver_node "
+                "WHERE id = %s AND status = %s FOR UPDATE SKIP LOCKED",
+                [machine.id, NODE_STATUS.READY])
+            return cursor.fetchone() is not None
+
+    def claim_available_machine(self, machines):
+        """Claim the first of `machines` that no one else is acquiring.
+
+        Candidates are tried in turn with ``SELECT ... FOR UPDATE SKIP
+        LOCKED``. Machines being acquired by concurrent transactions are
+        skipped without waiting, as are those acquired since this
+        transaction began, so concurrent allocations don't serialise on the
+        `node_acquire` lock. The claim is held until the transaction ends.
+
+        :param machines: Candidate machines, best first.
+        :return: The claimed `Machine`, or `None` if `machines` is empty.
+        :raise RetryTransaction: if the first `max_claim_attempts` machines
+            were all taken.
+        """
+        candidates = machines[:self.max_claim_attempts]
+        for machine in candidates:
+            try:
+                with savepoint():
+                    claimed = self._try_claim_machine(machine)
+            except Exception as error:
+                if is_serialization_failure(error):
+                    # Acquired by a transaction that has since committed.
+                    continue
+                else:
+                    raise
+            if claimed:
+                return machine
+        if len(candidates) == 0:
+            return None
+        # The candidates are heavily contended, or the information in this
+        # transaction is stale. Retry with the `node_acquire` lock.
+        request_transaction_retry(locks.node_acquire)
+
 
 class DeviceManager(BaseNodeManager):
     """Devices are all the non-deployable nodes."""
@@ -3584,11 +3638,12 @@ class Node(CleanSave, TimestampedModel):
         # Query for the interfaces again here; if we use the cached
         # interface_set, we could skip a newly-created bridge if it was created
         # at deployment time.
-        for interface in Interface.objects.filter(node=self):
-            claimed_ips = interface.claim_auto_ips(
-                exclude_addresses=exclude_addresses)
-            for ip in claimed_ips:
-                exclude_addresses.add(str(ip.ip))
+        with StaticIPAddress.objects.reusing_free_addresses():
+            for interface in Interface.objects.filter(node=self):
+                claimed_ips = interface.claim_auto_ips(
+                    exclude_addresses=exclude_addresses)
+                for ip in claimed_ips:
+                    exclude_addresses.add(str(ip.ip))
 
     @transactional
     def release_interface_config(self):
@@ -3761,33 +3816,34 @@ class Node(CleanSave, TimestampedModel):
         """Copy the source onto the destination interfaces in the mapping."""
         if exclude_addresses is None:
             exclude_addresses = []
-        for self_interface, source_interface in mapping.items():
-            self_interface.vlan = source_interface.vlan
-            self_interface.params = source_interface.params
-            self_interface.ipv4_params = source_interface.ipv4_params
-            self_interface.ipv6_params = source_interface.ipv6_params
-            self_interface.enabled = source_interface.enabled
-            self_interface.acquired = source_interface.acquired
-            self_interface.save()
-
-            for ip_address in source_interface.ip_addresses.all():
-                if ip_address.ip and ip_address.alloc_type in [
-                        IPADDRESS_TYPE.AUTO, IPADDRESS_TYPE.STICKY,
-                        IPADDRESS_TYPE.USER_RESERVED]:
-                    new_ip = StaticIPAddress.objects.allocate_new(
-                        subnet=ip_address.subnet,
-                        alloc_type=ip_address.alloc_type,
-                        user=ip_address.user,
-                        exclude_addresses=exclude_addresses)
-                    self_interface.ip_addresses.add(new_ip)
-                    exclude_addresses.append(new_ip.id)
-                elif ip_address.alloc_type != IPADDRESS_TYPE.DISCOVERED:
-                    self_ip_address = copy.deepcopy(ip_address)
-                    self_ip_address.id = None
-                    self_ip_address.pk = None
-                    self_ip_address.ip = None
-                    self_ip_address.save(force_insert=True)
-                    self_interface.ip_addresses.add(self_ip_address)
+        with StaticIPAddress.objects.reusing_free_addresses():
+            for self_interface, source_interface in mapping.items():
+                self_interface.vlan = source_interface.vlan
+                self_interface.params = source_interface.params
+                self_interface.ipv4_params = source_interface.ipv4_params
+                self_interface.ipv6_params = source_interface.ipv6_params
+                self_interface.enabled = source_interface.enabled
+                self_interface.acquired = source_interface.acquired
+                self_interface.save()
+
+                for ip_address in source_interface.ip_addresses.all():
+                    if ip_address.ip and ip_address.alloc_type in [
+                            IPADDRESS_TYPE.AUTO, IPADDRESS_TYPE.STICKY,
+                            IPADDRESS_TYPE.USER_RESERVED]:
+                        new_ip = StaticIPAddress.objects.allocate_new(
+                            subnet=ip_address.subnet,
+                            alloc_type=ip_address.alloc_type,
+                            user=ip_address.user,
+                            exclude_addresses=exclude_addresses)
+                        self_interface.ip_addresses.add(new_ip)
+                        exclude_addresses.append(new_ip.id)
+                    elif ip_address.alloc_type != IPADDRESS_TYPE.DISCOVERED:
+                        self_ip_address = copy.deepcopy(ip_address)
+                        self_ip_address.id = None
+                        self_ip_address.pk = None
+                        self_ip_address.ip = None
+                        self_ip_address.save(force_insert=True)
+                        self_interface.ip_addresses.add(self_ip_address)
         return exclude_addresses
 
     def _get_interface_layers_for_copy(
@@ -5505,17 +5561,24 @@ class Controller(Node):
             Neighbour data is gathered directly from the ARP monitoring process
             running on each rack interface.
         """
+        # Circular imports
+        from maasserver.models.neighbour import Neighbour
         # Determine which interfaces' neighbours need updating.
         interface_set = {neighbour['interface'] for neighbour in neighbours}
         interfaces = Interface.objects.get_interface_dict_for_node(
             self, names=interface_set, fetch_fabric_vlan=True)
+        observations = []
+        reported_vids = set()
         for neighbour in neighbours:
             interface = interfaces.get(neighbour['interface'], None)
             if interface is not None:
-                interface.update_neighbour(neighbour)
+                if interface.neighbour_discovery_state is not False:
+                    observations.append((interface, neighbour))
                 vid = neighbour.get("vid", None)
-                if vid is not None:
+                if vid is not None and (interface, vid) not in reported_vids:
+                    reported_vids.add((interface, vid))
                     interface.report_vid(vid)
+        Neighbour.objects.record_bindings(observations)
 
     def report_mdns_entries(self, entries):
         """Update the mDNS entries on this controller.
@@ -5528,10 +5591,16 @@ class Controller(Node):
         interface_set = {entry['interface'] for entry in entries}
         interfaces = Interface.objects.get_interface_dict_for_node(
             self, names=interface_set)
+        # Repeats of an entry in the same report would only bump its count.
+        repeats = Counter()
         for entry in entries:
-            interface = interfaces.get(entry['interface'], None)
+            key = (entry['interface'], entry['hostname'], entry['address'])
+            repeats[key] += entry.get('count', 1)
+        for (ifname, hostname, address), seen in repeats.items():
+            interface = interfaces.get(ifname, None)
             if interface is not None:
-                interface.update_mdns_entry(entry)
+                interface.update_mdns_entry(
+                    {'hostname': hostname, 'address': address}, count=seen)
 
     def get_discovery_state(self):
         """Returns the interface monitoring state for this Controller.
@@ -9,13 +9,13 @@ topology information derived from LLDP.
 
 __all__ = [
     "get_probed_details",
+    "get_probed_details_fingerprints",
     "get_single_probed_details",
     "script_output_nsmap",
 ]
-import base64
-
 from django.db import connection
 from metadataserver.enum import SCRIPT_STATUS
+from metadataserver.fields import iter_binary_chunks
 from provisioningserver.refresh.node_info_scripts import (
     LLDP_OUTPUT_NAME,
     LSHW_OUTPUT_NAME,
@@ -92,6 +92,48 @@ def get_probed_details(nodes):
         for node_id, script_name, stdout in cursor.fetchall():
             system_id = node_ids[node_id].system_id
             namespace = script_output_nsmap[script_name]
-            stdout_decoded = base64.b64decode(stdout)
+            stdout_decoded = b''.join(iter_binary_chunks(stdout))
             ret[system_id][namespace] = stdout_decoded
     return ret
+
+
+def get_probed_details_fingerprints(nodes):
+    """Return fingerprints of the details of the nodes in the given list.
+
+    A node's fingerprint changes whenever the details returned for it by
+    `get_probed_details` would, i.e. when its commissioning output changes,
+    but the details themselves are not fetched from the database.
+
+    :return: A ``{system_id: fingerprint}`` map, where each fingerprint is a
+        tuple of ``(namespace, digest)`` pairs.
+    """
+    node_ids = {node.id: node for node in nodes}
+    ret = {node.system_id: [] for node in nodes}
+    with connection.cursor() as cursor:
+        sql_query = """
+            SELECT
+              script_set.node_id, script_result.script_name,
+              md5(script_result.stdout)
+            FROM
+              metadataserver_scriptresult AS script_result,
+              metadataserver_scriptset AS script_set,
+              maasserver_node AS node
+            WHERE
+              script_set.node_id IN %s AND
+              script_set.id = script_result.script_set_id AND
+              script_result.status = %s AND
+              script_result.script_name IN %s AND
+              script_set.id = node.current_commissioning_script_set_id;
+        """
+        cursor.execute(sql_query, [
+            tuple(node_ids), SCRIPT_STATUS.PASSED,
+            tuple(script_output_nsmap)
+        ])
+        for node_id, script_name, digest in cursor.fetchall():
+            system_id = node_ids[node_id].system_id
+            namespace = script_output_nsmap[script_name]
+            ret[system_id].append((namespace, digest))
+    return {
+        system_id: tuple(sorted(fingerprint))
+        for system_id, fingerprint in ret.items()
+    }
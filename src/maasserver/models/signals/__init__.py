@@ -19,8 +19,10 @@ __all__ = [
     "nodes",
     "partitions",
     "power",
+    "rendered_config",
     "services",
     "staticipaddress",
+    "subnets",
 ]
 
 from maasserver.models.signals import (
@@ -39,6 +41,8 @@ from maasserver.models.signals import (
     nodes,
     partitions,
     power,
+    rendered_config,
     services,
     staticipaddress,
+    subnets,
 )
@@ -0,0 +1,92 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Respond to changes that affect the configuration composed for curtin."""
+
+__all__ = [
+    "signals",
+]
+
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+)
+from maasserver.models import (
+    Bcache,
+    BlockDevice,
+    BondInterface,
+    BridgeInterface,
+    CacheSet,
+    Config,
+    Domain,
+    Fabric,
+    Filesystem,
+    FilesystemGroup,
+    Interface,
+    ISCSIBlockDevice,
+    Partition,
+    PartitionTable,
+    PhysicalBlockDevice,
+    PhysicalInterface,
+    RAID,
+    Space,
+    StaticIPAddress,
+    StaticRoute,
+    Subnet,
+    UnknownInterface,
+    VirtualBlockDevice,
+    VLAN,
+    VLANInterface,
+    VolumeGroup,
+)
+from maasserver.preseed_cache import rendered_config_cache
+from maasserver.utils.signals import SignalsManager
+
+
+signals = SignalsManager()
+
+
+RENDERED_CONFIG_CLASSES = [
+    Bcache,
+    BlockDevice,
+    BondInterface,
+    BridgeInterface,
+    CacheSet,
+    Config,
+    Domain,
+    Fabric,
+    Filesystem,
+    FilesystemGroup,
+    Interface,
+    ISCSIBlockDevice,
+    Partition,
+    PartitionTable,
+    PhysicalBlockDevice,
+    PhysicalInterface,
+    RAID,
+    Space,
+    StaticIPAddress,
+    StaticRoute,
+    Subnet,
+    UnknownInterface,
+    VirtualBlockDevice,
+    VLAN,
+    VLANInterface,
+    VolumeGroup,
+]
+
+
+def invalidate_rendered_config(sender, instance, **kwargs):
+    # Other region processes learn of the change through the postgres
+    # triggers once it is committed, but this transaction must not use the
+    # cache until then.
+    rendered_config_cache.invalidateOnCommit()
+
+
+for klass in RENDERED_CONFIG_CLASSES:
+    signals.watch(post_save, invalidate_rendered_config, sender=klass)
+    signals.watch(post_delete, invalidate_rendered_config, sender=klass)
+
+
+# Enable all signals by default.
+signals.enable()
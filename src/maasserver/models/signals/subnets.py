@@ -0,0 +1,38 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Respond to subnet and VLAN changes."""
+
+__all__ = [
+    "signals",
+]
+
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+)
+from maasserver.models import (
+    Subnet,
+    VLAN,
+)
+from maasserver.subnet_index import subnet_index_cache
+from maasserver.utils.signals import SignalsManager
+
+
+signals = SignalsManager()
+
+
+def invalidate_subnet_index(sender, instance, **kwargs):
+    # Other region processes learn of the change through the
+    # sys_subnet_index triggers once it is committed, but this transaction
+    # must not use the index until then.
+    subnet_index_cache.invalidateOnCommit()
+
+
+for klass in Subnet, VLAN:
+    signals.watch(post_save, invalidate_subnet_index, sender=klass)
+    signals.watch(post_delete, invalidate_subnet_index, sender=klass)
+
+
+# Enable all signals by default.
+signals.enable()
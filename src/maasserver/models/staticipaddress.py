@@ -18,6 +18,8 @@ from collections import (
     defaultdict,
     namedtuple,
 )
+from contextlib import contextmanager
+import threading
 
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
@@ -128,9 +130,31 @@ def convert_leases_to_dict(leases):
     return ip_leases
 
 
+# The advisory lock classid used to claim addresses while they are being
+# allocated; the objid is derived from the address. This is distinct from the
+# classid used for `maasserver.locks`.
+ADDRESS_CLAIM_CLASSID = 20190327
+
+
+class FreeAddressesThreadLocal(threading.local):
+    """The free addresses of subnets, by subnet ID, while they are being
+    reused by `StaticIPAddressManager.reusing_free_addresses`; `None`
+    otherwise.
+    """
+    def __init__(self):
+        super().__init__()
+        self.subnets = None
+
+free_addresses_thread_local = FreeAddressesThreadLocal()
+
+
 class StaticIPAddressManager(Manager):
     """A utility to manage collections of IPAddresses."""
 
+    # The number of free addresses to try, in one transaction, before asking
+    # for the transaction to be retried with the `address_allocation` lock.
+    max_claim_attempts = 64
+
     def _verify_alloc_type(self, alloc_type, user=None):
         """Check validity of an `alloc_type` parameter when allocating.
 
@@ -247,6 +271,103 @@ class StaticIPAddressManager(Manager):
             ipaddress.save()
             return ipaddress
 
+    def _try_claim_address(self, address):
+        """Try to claim `address` for the rest of this transaction.
+
+        This does not wait: it returns `False` if another transaction is
+        allocating the same address right now. Two addresses can map to the
+        same claim, in which case one is merely skipped.
+        """
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT pg_try_advisory_xact_lock(%s, %s)",
+            [ADDRESS_CLAIM_CLASSID, int(address) & 0x7fffffff])
+        [claimed] = cursor.fetchone()
+        return claimed
+
+    @contextmanager
+    def reusing_free_addresses(self):
+        """Context manager to reuse the free addresses of subnets.
+
+        Within this context, and within a transaction, the free addresses of
+        a subnet are computed when first allocating from it and then handed
+        out in turn to later allocations, rather than being recomputed for
+        each of them. Addresses allocated by other means in the meantime are
+        skipped, but addresses newly reserved by other means (IP ranges,
+        static routes, and so on) are not noticed, so do not change those
+        within this context.
+        """
+        if free_addresses_thread_local.subnets is not None:
+            # The outermost context decides when to forget.
+            yield
+        else:
+            free_addresses_thread_local.subnets = {}
+            try:
+                yield
+            finally:
+                free_addresses_thread_local.subnets = None
+
+    def _get_free_addresses(self, subnet, exclude_addresses=None):
+        """Return the free addresses of `subnet`, and those to pass over.
+
+        See `reusing_free_addresses`.
+        """
+        subnets = free_addresses_thread_local.subnets
+        if subnets is None:
+            return subnet.get_free_ip_ranges(exclude_addresses), frozenset()
+        free = subnets.get(subnet.id)
+        if free is None:
+            free = subnets[subnet.id] = subnet.get_free_ip_ranges()
+        if exclude_addresses is None:
+            return free, frozenset()
+        else:
+            return free, frozenset(
+                int(IPAddress(address)) for address in exclude_addresses)
+
+    def _allocate_free_address(
+            self, subnet, alloc_type, user=None, exclude_addresses=None):
+        """Allocate the best free address in `subnet`.
+
+        Free addresses are tried in turn, best-fitting first. Addresses that
+        another transaction is allocating at the same time are skipped
+        without waiting, as are addresses that turn out to have been taken
+        since this transaction began; neither requires the transaction to be
+        retried, so concurrent allocations from one subnet don't stampede.
+
+        :return: `StaticIPAddress`, or `None` if there are no free addresses
+            that have not been observed on the network.
+        :raise RetryTransaction: if `max_claim_attempts` addresses were all
+            taken.
+        """
+        free, exclude = self._get_free_addresses(subnet, exclude_addresses)
+        version = subnet.get_ipnetwork().version
+        for _ in range(self.max_claim_attempts):
+            address = free.pop(exclude)
+            if address is None:
+                return None
+            address = IPAddress(address, version)
+            if not self._try_claim_address(address):
+                continue
+            ipaddress = StaticIPAddress(alloc_type=alloc_type, subnet=subnet)
+            try:
+                with orm.savepoint():
+                    ipaddress.set_ip_address(address.format())
+                    ipaddress.save()
+            except IntegrityError as error:
+                if orm.is_unique_violation(error):
+                    # Taken by a transaction that has since committed.
+                    continue
+                else:
+                    raise
+            else:
+                # See `_attempt_allocation` for why the user is saved later.
+                ipaddress.user = user
+                ipaddress.save()
+                return ipaddress
+        # The subnet is heavily contended, or the information in this
+        # transaction is very stale. Retry with the `address_allocation` lock.
+        orm.request_transaction_retry(locks.address_allocation)
+
     def allocate_new(
             self, subnet=None, alloc_type=IPADDRESS_TYPE.AUTO, user=None,
             requested_address=None, exclude_addresses=[]):
@@ -279,6 +400,13 @@ class StaticIPAddressManager(Manager):
                     "Could not find an appropriate subnet.")
 
         if requested_address is None:
+            ipaddress = self._allocate_free_address(
+                subnet, alloc_type, user=user,
+                exclude_addresses=exclude_addresses)
+            if ipaddress is not None:
+                return ipaddress
+            # Only addresses observed on the network remain, if any; pick the
+            # least recently seen.
             requested_address = subnet.get_next_ip_for_allocation(
                 exclude_addresses=exclude_addresses)
             return self._attempt_allocation_of_free_address(
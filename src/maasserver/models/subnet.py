@@ -51,6 +51,8 @@ from maasserver.fields import (
 from maasserver.models.cleansave import CleanSave
 from maasserver.models.staticroute import StaticRoute
 from maasserver.models.timestampedmodel import TimestampedModel
+from maasserver.subnet_index import subnet_index_cache
+from maasserver.utils.freeips import FreeIPRanges
 from maasserver.utils.orm import MAASQueriesMixin
 from netaddr import (
     AddrFormatError,
@@ -160,10 +162,17 @@ class SubnetQueriesMixin(MAASQueriesMixin):
 
     def get_best_subnet_for_ip(self, ip):
         """Find the most-specific managed Subnet the specified IP address
-        belongs to."""
+        belongs to.
+
+        This is answered from the in-memory subnet index when it is usable,
+        and from the database otherwise.
+        """
         ip = IPAddress(ip)
         if ip.is_ipv4_mapped():
             ip = ip.ipv4()
+        index = subnet_index_cache.get_index()
+        if index is not None:
+            return self._from_index(index, ip)
         subnets = self.raw(
             self.find_best_subnet_for_ip_query,
             params=[str(ip)])
@@ -173,6 +182,67 @@ class SubnetQueriesMixin(MAASQueriesMixin):
         else:
             return None
 
+    # As `find_best_subnet_for_ip_query`, but for many IP addresses at once.
+    # DISTINCT ON picks the first row per IP address, so the ORDER BY must
+    # lead with it.
+    find_best_subnets_for_ips_query = """
+        SELECT DISTINCT ON (ips.ip)
+            subnet.*,
+            host(ips.ip) "for_ip",
+            masklen(subnet.cidr) "prefixlen",
+            vlan.dhcp_on "dhcp_on"
+        FROM unnest(%s::inet[]) AS ips(ip)
+        INNER JOIN maasserver_subnet AS subnet
+            ON ips.ip << subnet.cidr
+        INNER JOIN maasserver_vlan AS vlan
+            ON subnet.vlan_id = vlan.id
+        ORDER BY
+            ips.ip,
+            dhcp_on DESC,
+            prefixlen DESC
+        """
+
+    def _from_index(self, index, ip):
+        """Return the best `Subnet` for `ip` found in `index`, or `None`."""
+        values = index.lookup(ip)
+        if values is None:
+            return None
+        else:
+            return self.model.from_db(self.db, index.field_names, values)
+
+    def get_best_subnets_for_ips(self, ips):
+        """Find the most-specific managed Subnet for each of the specified IP
+        addresses with a single query.
+
+        :return: A dict mapping each IP address string in `ips` to its
+            `Subnet`. IP addresses without a subnet are not included.
+        """
+        normalised = {}
+        for ip in ips:
+            address = IPAddress(ip)
+            if address.is_ipv4_mapped():
+                address = address.ipv4()
+            normalised.setdefault(str(address), []).append(ip)
+        if len(normalised) == 0:
+            return {}
+        index = subnet_index_cache.get_index()
+        if index is not None:
+            best_subnets = {}
+            for address, requested in normalised.items():
+                subnet = self._from_index(index, address)
+                if subnet is not None:
+                    for ip in requested:
+                        best_subnets[ip] = subnet
+            return best_subnets
+        subnets = self.raw(
+            self.find_best_subnets_for_ips_query,
+            params=[list(normalised)])
+        best_subnets = {}
+        for subnet in subnets:
+            for ip in normalised.get(subnet.for_ip, []):
+                best_subnets[ip] = subnet
+        return best_subnets
+
     def validate_filter_specifiers(self, specifiers):
         """Validate the given filter string."""
         try:
@@ -787,6 +857,21 @@ class Subnet(CleanSave, TimestampedModel):
         free_range = min(free_ranges, key=attrgetter('num_addresses'))
         return str(IPAddress(free_range.first))
 
+    def get_free_ip_ranges(
+            self, exclude_addresses: Optional[Iterable]=None) -> FreeIPRanges:
+        """Return the addresses in this subnet that are free for allocation.
+
+        Addresses are ordered by the same heuristic as
+        `get_next_ip_for_allocation`, so that they can be tried in turn.
+        Observed neighbours are not considered free.
+
+        :param exclude_addresses: Optional list of addresses to exclude.
+        """
+        free_ranges = self.get_ipranges_not_in_use(
+            exclude_addresses=exclude_addresses, with_neighbours=True)
+        return FreeIPRanges(
+            (free_range.first, free_range.last) for free_range in free_ranges)
+
     def render_json_for_related_ips(
             self, with_username=True, with_summary=True):
         """Render a representation of this subnet's related IP addresses,
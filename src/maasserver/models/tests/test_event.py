@@ -5,10 +5,18 @@
 
 __all__ = []
 
+from contextlib import closing
+from datetime import (
+    datetime,
+    timedelta,
+)
 import logging
 import random
 
-from django.db import IntegrityError
+from django.db import (
+    connection,
+    IntegrityError,
+)
 from maasserver.models import (
     Event,
     event as event_module,
@@ -160,3 +168,112 @@ class EventTest(MAASServerTestCase):
         event_type = EventType.objects.get(name=type_name)
         self.assertIsNotNone(event_type)
         self.assertEqual(2, Event.objects.filter(node=node).count())
+
+
+class EventArchiveTest(MAASServerTestCase):
+
+    def make_Event(self, created, **kwargs):
+        event = factory.make_Event(**kwargs)
+        event.save(_created=created)
+        return event
+
+    def count_unarchived(self):
+        return Event.objects.extra(
+            where=["maasserver_event.tableoid = "
+                   "'maasserver_event'::regclass"]).count()
+
+    def test_archive_events_moves_old_events(self):
+        cutoff = datetime(2019, 3, 1, 12)
+        old = [self.make_Event(cutoff - timedelta(hours=1)) for _ in range(3)]
+        new = self.make_Event(cutoff + timedelta(hours=1))
+        self.assertEqual(3, Event.objects.archive_events(cutoff))
+        self.assertEqual(
+            ["maasserver_event_archive_20190301"],
+            Event.objects.get_archives())
+        self.assertEqual(1, self.count_unarchived())
+        # Archived events are still found through the events table.
+        self.assertItemsEqual(
+            [event.id for event in old + [new]],
+            Event.objects.values_list("id", flat=True))
+
+    def test_archive_events_adds_to_archive_for_the_day(self):
+        cutoff = datetime(2019, 3, 1, 12)
+        self.make_Event(cutoff - timedelta(hours=2))
+        Event.objects.archive_events(cutoff - timedelta(hours=1))
+        self.make_Event(cutoff - timedelta(minutes=30))
+        self.assertEqual(1, Event.objects.archive_events(cutoff))
+        self.assertEqual(
+            ["maasserver_event_archive_20190301"],
+            Event.objects.get_archives())
+        self.assertEqual(0, self.count_unarchived())
+
+    def test_archive_events_archives_by_day_created(self):
+        cutoff = datetime(2019, 3, 2, 12)
+        first = self.make_Event(datetime(2019, 3, 1, 6))
+        second = self.make_Event(datetime(2019, 3, 2, 6))
+        self.assertEqual(1, Event.objects.archive_events(cutoff))
+        self.assertEqual(1, Event.objects.archive_events(cutoff))
+        self.assertEqual(0, Event.objects.archive_events(cutoff))
+        self.assertEqual(
+            ["maasserver_event_archive_20190301",
+             "maasserver_event_archive_20190302"],
+            Event.objects.get_archives())
+        self.assertEqual(0, self.count_unarchived())
+        with closing(connection.cursor()) as cursor:
+            cursor.execute(
+                "SELECT id FROM maasserver_event_archive_20190301")
+            self.assertEqual([(first.id,)], cursor.fetchall())
+            cursor.execute(
+                "SELECT id FROM maasserver_event_archive_20190302")
+            self.assertEqual([(second.id,)], cursor.fetchall())
+
+    def test_archive_events_moves_at_most_limit_events(self):
+        cutoff = datetime(2019, 3, 1, 12)
+        events = [
+            self.make_Event(cutoff - timedelta(hours=1)) for _ in range(3)]
+        self.assertEqual(2, Event.objects.archive_events(cutoff, limit=2))
+        self.assertEqual(1, self.count_unarchived())
+        self.assertEqual(1, Event.objects.archive_events(cutoff, limit=2))
+        self.assertEqual(0, self.count_unarchived())
+        self.assertItemsEqual(
+            [event.id for event in events],
+            Event.objects.values_list("id", flat=True))
+
+    def test_archive_is_constrained_to_its_day(self):
+        self.make_Event(datetime(2019, 3, 1, 6))
+        Event.objects.archive_events(datetime(2019, 3, 1, 12))
+        event = self.make_Event(datetime(2019, 3, 2, 6))
+        with closing(connection.cursor()) as cursor:
+            self.assertRaises(
+                IntegrityError, cursor.execute,
+                "INSERT INTO maasserver_event_archive_20190301 "
+                "SELECT * FROM ONLY maasserver_event WHERE id = %s",
+                [event.id])
+
+    def test_archive_events_does_nothing_without_old_events(self):
+        cutoff = datetime(2019, 3, 1, 12)
+        self.make_Event(cutoff + timedelta(hours=1))
+        self.assertEqual(0, Event.objects.archive_events(cutoff))
+        self.assertEqual([], Event.objects.get_archives())
+
+    def test_archived_events_are_unlinked_from_deleted_nodes(self):
+        cutoff = datetime(2019, 3, 1, 12)
+        node = factory.make_Node()
+        event = self.make_Event(cutoff - timedelta(hours=1), node=node)
+        Event.objects.archive_events(cutoff)
+        node.delete()
+        self.assertIsNone(Event.objects.get(id=event.id).node)
+
+    def test_expire_archives_drops_archives_of_expired_events(self):
+        for day in (1, 2, 3):
+            self.make_Event(datetime(2019, 3, day, 6))
+            Event.objects.archive_events(datetime(2019, 3, day, 12))
+        self.make_Event(datetime(2019, 3, 4, 6))
+        self.assertEqual(
+            ["maasserver_event_archive_20190301",
+             "maasserver_event_archive_20190302"],
+            Event.objects.expire_archives(datetime(2019, 3, 3, 12)))
+        self.assertEqual(
+            ["maasserver_event_archive_20190303"],
+            Event.objects.get_archives())
+        self.assertEqual(2, Event.objects.count())
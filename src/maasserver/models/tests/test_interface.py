@@ -1257,6 +1257,15 @@ class InterfaceUpdateMDNSEntryTest(MAASServerTestCase):
         self.assertThat(mdns_entry.count, Equals(2))
         self.assertThat(mdns_entry.updated, Not(Equals(yesterday)))
 
+    def test___adds_count_of_observations(self):
+        iface = factory.make_Interface(INTERFACE_TYPE.PHYSICAL)
+        iface.mdns_discovery_state = True
+        json = self.make_mdns_entry_json()
+        iface.update_mdns_entry(json, count=3)
+        self.assertThat(MDNS.objects.first().count, Equals(3))
+        iface.update_mdns_entry(json, count=2)
+        self.assertThat(MDNS.objects.first().count, Equals(5))
+
     def test__replaces_obsolete_entry(self):
         iface = factory.make_Interface(INTERFACE_TYPE.PHYSICAL)
         iface.mdns_discovery_state = True
@@ -5,9 +5,22 @@
 
 __all__ = []
 
+from unittest.mock import (
+    call,
+    MagicMock,
+)
+
+from maasserver.enum import INTERFACE_TYPE
+from maasserver.models import neighbour as neighbour_module
+from maasserver.models.neighbour import Neighbour
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
-from maastesting.matchers import IsNonEmptyString
+from maastesting.matchers import (
+    IsNonEmptyString,
+    MockCalledOnceWith,
+    MockCallsMatch,
+)
+from testtools.matchers import Equals
 
 
 class TestNeighbourModel(MAASServerTestCase):
@@ -15,3 +28,117 @@ class TestNeighbourModel(MAASServerTestCase):
     def test_mac_organization(self):
         neighbour = factory.make_Neighbour(mac_address="48:51:b7:00:00:00")
         self.assertThat(neighbour.mac_organization, IsNonEmptyString)
+
+
+class TestNeighbourManagerRecordBindings(MAASServerTestCase):
+    """Tests for `NeighbourManager.record_bindings`."""
+
+    def make_neighbour_json(self, vid=None, time=1):
+        return {
+            'ip': factory.make_ipv4_address(),
+            'mac': factory.make_mac_address(),
+            'time': time,
+            'vid': vid,
+        }
+
+    def get_bindings(self):
+        return [
+            (neighbour.ip, str(neighbour.mac_address), neighbour.vid,
+             neighbour.time, neighbour.count)
+            for neighbour in Neighbour.objects.order_by('id')
+        ]
+
+    def test__creates_new_bindings(self):
+        iface = factory.make_Interface(INTERFACE_TYPE.PHYSICAL)
+        first = self.make_neighbour_json()
+        second = self.make_neighbour_json(vid=100)
+        Neighbour.objects.record_bindings([(iface, first), (iface, second)])
+        self.assertThat(self.get_bindings(), Equals([
+            (first['ip'], first['mac'], None, 1, 1),
+            (second['ip'], second['mac'], 100, 1, 1),
+        ]))
+
+    def test__refreshes_existing_bindings(self):
+        iface = factory.make_Interface(INTERFACE_TYPE.PHYSICAL)
+        json = self.make_neighbour_json()
+        Neighbour.objects.record_bindings([(iface, json)])
+        Neighbour.objects.record_bindings([(iface, dict(json, time=2))])
+        self.assertThat(self.get_bindings(), Equals([
+            (json['ip'], json['mac'], None, 2, 2),
+        ]))
+
+    def test__merges_repeated_observations(self):
+        iface = factory.make_Interface(INTERFACE_TYPE.PHYSICAL)
+        json = self.make_neighbour_json()
+        Neighbour.objects.record_bindings([
+            (iface, json),
+            (iface, dict(json, time=2)),
+            (iface, dict(json, time=3, count=3)),
+        ])
+        self.assertThat(self.get_bindings(), Equals([
+            (json['ip'], json['mac'], None, 3, 5),
+        ]))
+
+    def test__replaces_obsolete_bindings(self):
+        iface = factory.make_Interface(INTERFACE_TYPE.PHYSICAL)
+        json = self.make_neighbour_json(vid=100)
+        Neighbour.objects.record_bindings([(iface, json)])
+        moved = dict(json, mac=factory.make_mac_address(), time=2)
+        Neighbour.objects.record_bindings([(iface, moved)])
+        self.assertThat(self.get_bindings(), Equals([
+            (json['ip'], moved['mac'], 100, 2, 1),
+        ]))
+
+    def test__keeps_latest_mac_observed_in_batch(self):
+        iface = factory.make_Interface(INTERFACE_TYPE.PHYSICAL)
+        json = self.make_neighbour_json()
+        moved = dict(json, mac=factory.make_mac_address(), time=2)
+        Neighbour.objects.record_bindings([(iface, json), (iface, moved)])
+        self.assertThat(self.get_bindings(), Equals([
+            (json['ip'], moved['mac'], None, 2, 1),
+        ]))
+
+    def test__logs_new_and_moved_bindings(self):
+        iface = factory.make_Interface(INTERFACE_TYPE.PHYSICAL)
+        json = self.make_neighbour_json()
+        moved = dict(json, mac=factory.make_mac_address(), time=2)
+        logger = self.patch(neighbour_module, "maaslog")
+        Neighbour.objects.record_bindings([(iface, json)])
+        Neighbour.objects.record_bindings([(iface, moved)])
+        self.assertThat(logger.info, MockCallsMatch(
+            call("%s: New MAC, IP binding observed: %s, %s" % (
+                iface.get_log_string(), json['mac'], json['ip'])),
+            call("%s: IP address %s moved from %s to %s" % (
+                iface.get_log_string(), json['ip'], json['mac'],
+                moved['mac'])),
+        ))
+
+    def test__notifies_refreshed_bindings_once(self):
+        iface = factory.make_Interface(INTERFACE_TYPE.PHYSICAL)
+        first = self.make_neighbour_json()
+        second = self.make_neighbour_json()
+        Neighbour.objects.record_bindings([(iface, first), (iface, second)])
+        notify = self.patch(Neighbour.objects, "_notify_refreshed")
+        Neighbour.objects.record_bindings([(iface, first), (iface, second)])
+        self.assertThat(
+            notify, MockCalledOnceWith([first['ip'], second['ip']]))
+
+    def test__notify_refreshed_splits_payloads(self):
+        self.patch(neighbour_module, "MAX_NOTIFY_PAYLOAD", 20)
+        connection = self.patch(neighbour_module, "connection")
+        cursor = MagicMock()
+        connection.cursor.return_value = cursor
+        Neighbour.objects._notify_refreshed(
+            ["10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.1"])
+        self.assertThat(cursor.execute, MockCallsMatch(
+            call("SELECT pg_notify('neighbour_update', %s)",
+                 ["10.0.0.1 10.0.0.2"]),
+            call("SELECT pg_notify('neighbour_update', %s)",
+                 ["10.0.0.3"]),
+        ))
+
+    def test__does_nothing_without_observations(self):
+        notify = self.patch(Neighbour.objects, "_notify_refreshed")
+        Neighbour.objects.record_bindings([])
+        self.assertThat(self.get_bindings(), Equals([]))
+        self.assertThat(notify.call_count, Equals(0))
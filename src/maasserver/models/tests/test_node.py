@@ -15,6 +15,7 @@ import os
 import random
 import re
 from textwrap import dedent
+import threading
 from unittest.mock import (
     ANY,
     call,
@@ -38,6 +39,7 @@ from django.db.models.query import QuerySet
 from fixtures import LoggerFixture
 from maasserver import (
     bootresources,
+    locks,
     preseed as preseed_module,
     server_address,
 )
@@ -86,6 +88,7 @@ from maasserver.models import (
     Interface,
     LicenseKey,
     Machine,
+    Neighbour,
     Node,
     node as node_module,
     OwnerData,
@@ -158,6 +161,7 @@ from maasserver.tests.test_preseed_network import AssertNetworkConfigMixin
 from maasserver.tests.test_preseed_storage import AssertStorageConfigMixin
 from maasserver.utils.orm import (
     get_one,
+    make_serialization_failure,
     post_commit,
     post_commit_hooks,
     reload_object,
@@ -497,6 +501,107 @@ class TestMachineManager(MAASServerTestCase):
             [],
             list(Machine.objects.get_available_machines_for_acquisition(user)))
 
+    def test_claim_available_machine_claims_first_machine(self):
+        machines = [self.make_machine() for _ in range(3)]
+        self.assertEqual(
+            machines[0],
+            Machine.objects.claim_available_machine(
+                Machine.objects.filter(
+                    id__in=[machine.id for machine in machines]).order_by(
+                    'id')))
+
+    def test_claim_available_machine_returns_None_if_empty(self):
+        self.assertIsNone(
+            Machine.objects.claim_available_machine(Machine.objects.none()))
+
+    def test_claim_available_machine_skips_machines_claimed_elsewhere(self):
+        machines = [self.make_machine() for _ in range(3)]
+        self.patch(
+            Machine.objects, '_try_claim_machine').side_effect = [False, True]
+        self.assertEqual(
+            machines[1],
+            Machine.objects.claim_available_machine(
+                Machine.objects.all().order_by('id')))
+
+    def test_claim_available_machine_skips_machines_acquired_since(self):
+        machines = [self.make_machine() for _ in range(3)]
+        self.patch(Machine.objects, '_try_claim_machine').side_effect = [
+            make_serialization_failure(), True]
+        self.assertEqual(
+            machines[1],
+            Machine.objects.claim_available_machine(
+                Machine.objects.all().order_by('id')))
+
+    def test_claim_available_machine_retries_with_lock_when_contended(self):
+        self.make_machine()
+        self.patch(Machine.objects, '_try_claim_machine').return_value = False
+        request_transaction_retry = self.patch(
+            node_module, 'request_transaction_retry')
+        Machine.objects.claim_available_machine(Machine.objects.all())
+        self.assertThat(
+            request_transaction_retry, MockCalledOnceWith(locks.node_acquire))
+
+    def test_claim_available_machine_tries_max_claim_attempts_machines(self):
+        for _ in range(3):
+            self.make_machine()
+        self.patch(Machine.objects, 'max_claim_attempts', 2)
+        try_claim_machine = self.patch(Machine.objects, '_try_claim_machine')
+        try_claim_machine.return_value = False
+        self.patch(node_module, 'request_transaction_retry')
+        Machine.objects.claim_available_machine(Machine.objects.all())
+        self.assertEqual(2, try_claim_machine.call_count)
+
+    def test_claim_available_machine_ignores_machines_no_longer_ready(self):
+        machine = self.make_machine()
+        Machine.objects.filter(id=machine.id).update(
+            status=NODE_STATUS.ALLOCATED)
+        self.assertFalse(Machine.objects._try_claim_machine(machine))
+
+
+class TestMachineManagerClaimConcurrency(MAASTransactionServerTestCase):
+
+    def test_claim_available_machine_under_extreme_concurrency(self):
+        count = 20  # Allocate this number of machines.
+        machines = transactional(lambda: [
+            factory.make_Node(status=NODE_STATUS.READY)
+            for _ in range(count)
+        ])()
+        user = transactional(factory.make_User)()
+        concurrency = threading.Semaphore(16)
+        mutex = threading.Lock()
+        results = []
+
+        @transactional
+        def allocate():
+            machine = Machine.objects.claim_available_machine(
+                Machine.objects.get_available_machines_for_acquisition(
+                    user).order_by('id'))
+            machine.acquire(user)
+            return machine.id
+
+        def allocate_one():
+            try:
+                with concurrency:
+                    machine_id = allocate()
+            except Exception as error:
+                with mutex:
+                    results.append(error)
+            else:
+                with mutex:
+                    results.append(machine_id)
+
+        threads = [
+            threading.Thread(target=allocate_one)
+            for _ in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertItemsEqual(
+            [machine.id for machine in machines], results)
+
 
 class TestControllerManager(MAASServerTestCase):
 
@@ -7649,30 +7754,43 @@ class TestControllerUpdateDiscoveryState(MAASServerTestCase):
 class TestReportNeighbours(MAASServerTestCase):
     """Tests for `Controller.report_neighbours()."""
 
-    def test__calls_update_neighbour_for_each_neighbour(self):
+    def test__records_bindings_for_each_neighbour(self):
         rack = factory.make_RackController()
-        factory.make_Interface(name='eth0', node=rack)
-        factory.make_Interface(name='eth1', node=rack)
-        update_neighbour = self.patch(
-            interface_module.Interface, 'update_neighbour')
+        eth0 = factory.make_Interface(name='eth0', node=rack)
+        eth1 = factory.make_Interface(name='eth1', node=rack)
+        for interface in (eth0, eth1):
+            interface.neighbour_discovery_state = True
+            interface.save()
+        record_bindings = self.patch(Neighbour.objects, 'record_bindings')
         neighbours = [
             {'interface': 'eth0', 'mac': factory.make_mac_address()},
             {'interface': 'eth1', 'mac': factory.make_mac_address()},
         ]
         rack.report_neighbours(neighbours)
-        self.assertThat(update_neighbour, MockCallsMatch(
-            *[call(neighbour) for neighbour in neighbours]
-        ))
+        self.assertThat(record_bindings, MockCalledOnceWith([
+            (eth0, neighbours[0]),
+            (eth1, neighbours[1]),
+        ]))
+
+    def test__skips_interfaces_without_neighbour_discovery(self):
+        rack = factory.make_RackController()
+        factory.make_Interface(name='eth0', node=rack)
+        record_bindings = self.patch(Neighbour.objects, 'record_bindings')
+        rack.report_neighbours([
+            {'interface': 'eth0', 'mac': factory.make_mac_address()},
+        ])
+        self.assertThat(record_bindings, MockCalledOnceWith([]))
 
     def test__calls_report_vid_for_each_vid(self):
         rack = factory.make_RackController()
         factory.make_Interface(name='eth0', node=rack)
         factory.make_Interface(name='eth1', node=rack)
         # Just make this a no-op for simplicity.
-        self.patch(interface_module.Interface, 'update_neighbour')
+        self.patch(Neighbour.objects, 'record_bindings')
         report_vid = self.patch(
             interface_module.Interface, 'report_vid')
         neighbours = [
+            {'interface': 'eth0', 'mac': factory.make_mac_address(), 'vid': 3},
             {'interface': 'eth0', 'mac': factory.make_mac_address(), 'vid': 3},
             {'interface': 'eth1', 'mac': factory.make_mac_address(), 'vid': 7},
         ]
@@ -7690,13 +7808,36 @@ class TestReportMDNSEntries(MAASServerTestCase):
         update_mdns_entry = self.patch(
             interface_module.Interface, 'update_mdns_entry')
         entries = [
-            {'interface': 'eth0', 'hostname': factory.make_name('eth0')},
-            {'interface': 'eth1', 'hostname': factory.make_name('eth1')},
+            {
+                'interface': 'eth0', 'hostname': factory.make_name('eth0'),
+                'address': factory.make_ipv4_address(),
+            },
+            {
+                'interface': 'eth1', 'hostname': factory.make_name('eth1'),
+                'address': factory.make_ipv4_address(),
+            },
         ]
         rack.report_mdns_entries(entries)
-        self.assertThat(update_mdns_entry, MockCallsMatch(
-            *[call(entry) for entry in entries]
-        ))
+        self.assertThat(update_mdns_entry, MockCallsMatch(*[
+            call({
+                'hostname': entry['hostname'], 'address': entry['address'],
+            }, count=1)
+            for entry in entries
+        ]))
+
+    def test__counts_repeated_entries(self):
+        rack = factory.make_RackController()
+        factory.make_Interface(name='eth0', node=rack)
+        update_mdns_entry = self.patch(
+            interface_module.Interface, 'update_mdns_entry')
+        entry = {
+            'interface': 'eth0', 'hostname': factory.make_name('eth0'),
+            'address': factory.make_ipv4_address(),
+        }
+        rack.report_mdns_entries([entry, dict(entry, count=3)])
+        self.assertThat(update_mdns_entry, MockCalledOnceWith({
+            'hostname': entry['hostname'], 'address': entry['address'],
+        }, count=4))
 
 
 class UpdateInterfacesMixin:
@@ -7,6 +7,7 @@ __all__ = []
 
 from maasserver.models.nodeprobeddetails import (
     get_probed_details,
+    get_probed_details_fingerprints,
     get_single_probed_details,
     script_output_nsmap,
 )
@@ -89,3 +90,37 @@ class TestNodeDetail(MAASServerTestCase):
             # returned by get_probed_details.
             self.make_script_set_and_results(node, "new")
         self.assertDictEqual(expected, get_probed_details(nodes))
+
+    def test_get_probed_details_fingerprints(self):
+        nodes = [factory.make_Node() for _ in range(3)]
+        for node in nodes:
+            self.make_script_set_and_results(node, "old")
+            script_set, _ = self.make_script_set_and_results(node)
+            node.current_commissioning_script_set = script_set
+            node.save()
+        fingerprints = get_probed_details_fingerprints(nodes)
+        self.assertItemsEqual(
+            [node.system_id for node in nodes], fingerprints)
+        # Every namespace is fingerprinted, and nodes with the same
+        # details have the same fingerprint.
+        self.assertEqual(
+            ["lldp", "lshw"],
+            [namespace for namespace, _ in fingerprints[nodes[0].system_id]])
+        self.assertEqual(1, len(set(fingerprints.values())))
+
+    def test_get_probed_details_fingerprints_change_with_details(self):
+        node = factory.make_Node()
+        script_set, _ = self.make_script_set_and_results(node)
+        node.current_commissioning_script_set = script_set
+        node.save()
+        before = get_probed_details_fingerprints([node])
+        script_set, _ = self.make_script_set_and_results(node, "new")
+        node.current_commissioning_script_set = script_set
+        node.save()
+        after = get_probed_details_fingerprints([node])
+        self.assertNotEqual(before, after)
+
+    def test_get_probed_details_fingerprints_without_details(self):
+        node = factory.make_Node()
+        self.assertEqual(
+            {node.system_id: ()}, get_probed_details_fingerprints([node]))
@@ -10,7 +10,11 @@ from random import (
     shuffle,
 )
 import threading
-from unittest.mock import sentinel
+from unittest.mock import (
+    call,
+    Mock,
+    sentinel,
+)
 
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
@@ -47,6 +51,7 @@ from maasserver.utils.orm import (
     transactional,
 )
 from maasserver.websockets.base import dehydrate_datetime
+from maastesting.matchers import MockCallsMatch
 from netaddr import IPAddress
 from psycopg2.errorcodes import FOREIGN_KEY_VIOLATION
 from testtools import ExpectedException
@@ -298,6 +303,83 @@ class TestStaticIPAddressManager(MAASServerTestCase):
                 list(orm.retry_context.stack._cm_pending),
                 Equals([locks.address_allocation]))
 
+    def test_allocate_new_allocates_from_smallest_free_range(self):
+        subnet = factory.make_Subnet(
+            cidr="10.0.0.0/24", gateway_ip=None, dns_servers=[])
+        factory.make_IPRange(
+            subnet, "10.0.0.50", "10.0.0.250",
+            alloc_type=IPRANGE_TYPE.RESERVED)
+        ipaddress = StaticIPAddress.objects.allocate_new(subnet)
+        self.assertEqual("10.0.0.251", ipaddress.ip)
+        ipaddress = StaticIPAddress.objects.allocate_new(subnet)
+        self.assertEqual("10.0.0.252", ipaddress.ip)
+
+    def test_allocate_new_skips_addresses_claimed_elsewhere(self):
+        subnet = factory.make_Subnet(
+            cidr="10.0.0.0/24", gateway_ip=None, dns_servers=[])
+        try_claim = self.patch(
+            StaticIPAddress.objects, "_try_claim_address")
+        try_claim.side_effect = [False, True]
+        ipaddress = StaticIPAddress.objects.allocate_new(subnet)
+        self.assertEqual("10.0.0.2", ipaddress.ip)
+
+    def test_allocate_new_skips_addresses_taken_since_transaction_began(self):
+        subnet = factory.make_Subnet(
+            cidr="10.0.0.0/24", gateway_ip=None, dns_servers=[])
+        set_ip_address = self.patch(StaticIPAddress, "set_ip_address")
+        set_ip_address.side_effect = [orm.make_unique_violation(), None]
+        with orm.retry_context:
+            StaticIPAddress.objects.allocate_new(subnet)
+            # No retry was needed.
+            self.assertThat(
+                orm.retry_context.stack._cm_pending, HasLength(0))
+        self.assertThat(set_ip_address, MockCallsMatch(
+            call("10.0.0.1"), call("10.0.0.2")))
+
+    def test_reusing_free_addresses_computes_free_addresses_once(self):
+        subnet = factory.make_Subnet(
+            cidr="10.0.0.0/24", gateway_ip=None, dns_servers=[])
+        get_free_ip_ranges = self.patch(
+            subnet, "get_free_ip_ranges",
+            Mock(wraps=subnet.get_free_ip_ranges))
+        with StaticIPAddress.objects.reusing_free_addresses():
+            ips = [
+                StaticIPAddress.objects.allocate_new(subnet).ip
+                for _ in range(3)
+            ]
+        self.assertEqual(["10.0.0.1", "10.0.0.2", "10.0.0.3"], ips)
+        self.assertThat(get_free_ip_ranges, MockCallsMatch(call()))
+
+    def test_reusing_free_addresses_passes_over_excluded_addresses(self):
+        subnet = factory.make_Subnet(
+            cidr="10.0.0.0/24", gateway_ip=None, dns_servers=[])
+        with StaticIPAddress.objects.reusing_free_addresses():
+            ipaddress = StaticIPAddress.objects.allocate_new(
+                subnet, exclude_addresses=["10.0.0.1"])
+            self.assertEqual("10.0.0.2", ipaddress.ip)
+            ipaddress = StaticIPAddress.objects.allocate_new(subnet)
+            self.assertEqual("10.0.0.1", ipaddress.ip)
+
+    def test_reusing_free_addresses_skips_addresses_allocated_since(self):
+        subnet = factory.make_Subnet(
+            cidr="10.0.0.0/24", gateway_ip=None, dns_servers=[])
+        with StaticIPAddress.objects.reusing_free_addresses():
+            StaticIPAddress.objects.allocate_new(subnet)
+            factory.make_StaticIPAddress(ip="10.0.0.2", subnet=subnet)
+            ipaddress = StaticIPAddress.objects.allocate_new(subnet)
+        self.assertEqual("10.0.0.3", ipaddress.ip)
+
+    def test_reusing_free_addresses_forgets_free_addresses_on_exit(self):
+        subnet = factory.make_Subnet(
+            cidr="10.0.0.0/24", gateway_ip=None, dns_servers=[])
+        with StaticIPAddress.objects.reusing_free_addresses():
+            StaticIPAddress.objects.allocate_new(subnet)
+        factory.make_IPRange(
+            subnet, "10.0.0.2", "10.0.0.9", alloc_type=IPRANGE_TYPE.RESERVED)
+        with StaticIPAddress.objects.reusing_free_addresses():
+            ipaddress = StaticIPAddress.objects.allocate_new(subnet)
+        self.assertEqual("10.0.0.10", ipaddress.ip)
+
     def test_allocate_new_propagates_other_integrity_errors(self):
         set_ip_address = self.patch(StaticIPAddress, "set_ip_address")
         set_ip_address.side_effect = orm.make_unique_violation()
@@ -329,6 +411,16 @@ class TestStaticIPAddressManagerTransactional(MAASTransactionServerTestCase):
         mutex = threading.Lock()
         results = []
 
+        retries = []
+        request_transaction_retry = orm.request_transaction_retry
+
+        def record_retry(*extra_contexts):
+            with mutex:
+                retries.append(extra_contexts)
+            request_transaction_retry(*extra_contexts)
+
+        self.patch(orm, "request_transaction_retry", record_retry)
+
         @transactional
         def allocate():
             return StaticIPAddress.objects.allocate_new(subnet)
@@ -360,6 +452,9 @@ class TestStaticIPAddressManagerTransactional(MAASTransactionServerTestCase):
         self.assertThat(ips, HasLength(count))
         self.assertThat(ips, AllMatch(
             AfterPreprocessing(subnet.is_valid_static_ip, Is(True))))
+        # Allocations skip addresses that others have claimed, rather than
+        # retrying the whole transaction.
+        self.assertThat(retries, HasLength(0))
 
 
 class TestStaticIPAddressManagerMapping(MAASServerTestCase):
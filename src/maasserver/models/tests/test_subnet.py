@@ -719,6 +719,43 @@ class TestGetBestSubnetForIP(MAASServerTestCase):
         self.expectThat(subnet, Is(None))
 
 
+class TestGetBestSubnetsForIPs(MAASServerTestCase):
+
+    def test__returns_most_specific_subnet_for_each_ip(self):
+        factory.make_Subnet(cidr="10.0.0.0/8")
+        subnet_24 = factory.make_Subnet(cidr="10.1.1.0/24")
+        subnet_16 = factory.make_Subnet(cidr="10.1.0.0/16")
+        subnet_64 = factory.make_Subnet(cidr="2001:db8:1:2::/64")
+        subnets = Subnet.objects.get_best_subnets_for_ips(
+            ["10.1.1.1", "10.1.2.1", "2001:db8:1:2::1"])
+        self.assertEqual({
+            "10.1.1.1": subnet_24,
+            "10.1.2.1": subnet_16,
+            "2001:db8:1:2::1": subnet_64,
+        }, subnets)
+
+    def test__prefers_managed_subnets(self):
+        factory.make_Subnet(cidr="10.1.1.0/24", dhcp_on=False)
+        vlan = factory.make_VLAN(
+            dhcp_on=True, primary_rack=factory.make_RackController())
+        managed = factory.make_Subnet(cidr="10.1.0.0/16", vlan=vlan)
+        subnets = Subnet.objects.get_best_subnets_for_ips(["10.1.1.1"])
+        self.assertEqual({"10.1.1.1": managed}, subnets)
+
+    def test__handles_ipv4_mapped_ipv6_addr(self):
+        expected_subnet = factory.make_Subnet(cidr="10.1.1.0/24")
+        subnets = Subnet.objects.get_best_subnets_for_ips(["::ffff:10.1.1.1"])
+        self.assertEqual({"::ffff:10.1.1.1": expected_subnet}, subnets)
+
+    def test__omits_ips_without_subnet(self):
+        factory.make_Subnet(cidr="10.0.0.0/8")
+        self.assertEqual(
+            {}, Subnet.objects.get_best_subnets_for_ips(["192.168.1.1"]))
+
+    def test__returns_empty_for_no_ips(self):
+        self.assertEqual({}, Subnet.objects.get_best_subnets_for_ips([]))
+
+
 class SubnetLabelTest(MAASServerTestCase):
 
     def test__returns_cidr_for_null_name(self):
@@ -1245,6 +1282,41 @@ class TestSubnetGetNextIPForAllocation(MAASServerTestCase):
         self.assertThat(ip, Equals("10.0.0.5"))
 
 
+class TestSubnetGetFreeIPRanges(MAASServerTestCase):
+
+    def pop_all(self, free):
+        ips = []
+        while free:
+            ips.append(str(IPAddress(free.pop())))
+        return ips
+
+    def test__orders_addresses_smallest_free_range_first(self):
+        subnet = factory.make_Subnet(
+            cidr="10.0.0.0/29", gateway_ip=None, dns_servers=[])
+        factory.make_StaticIPAddress(ip="10.0.0.4", cidr="10.0.0.0/29")
+        free = subnet.get_free_ip_ranges()
+        self.assertEqual(5, len(free))
+        self.assertEqual(
+            subnet.get_next_ip_for_allocation(), str(IPAddress(free.pop())))
+        self.assertEqual(
+            ["10.0.0.6", "10.0.0.1", "10.0.0.2", "10.0.0.3"],
+            self.pop_all(free))
+
+    def test__avoids_excluded_addresses(self):
+        subnet = factory.make_Subnet(
+            cidr="10.0.0.0/30", gateway_ip=None, dns_servers=[])
+        free = subnet.get_free_ip_ranges(exclude_addresses=["10.0.0.1"])
+        self.assertEqual(["10.0.0.2"], self.pop_all(free))
+
+    def test__avoids_observed_neighbours(self):
+        subnet = factory.make_Subnet(
+            cidr="10.0.0.0/30", gateway_ip=None, dns_servers=[])
+        rackif = factory.make_Interface(vlan=subnet.vlan)
+        factory.make_Discovery(ip="10.0.0.1", interface=rackif)
+        free = subnet.get_free_ip_ranges()
+        self.assertEqual(["10.0.0.2"], self.pop_all(free))
+
+
 class TestUnmanagedSubnets(MAASServerTestCase):
 
     def test__allocation_uses_reserved_range(self):
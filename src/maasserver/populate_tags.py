@@ -6,42 +6,40 @@
 __all__ = [
     'populate_tag_for_multiple_nodes',
     'populate_tags',
+    'populate_tags_for_multiple_nodes',
     'populate_tags_for_single_node',
 ]
 
 from functools import partial
-from math import ceil
+import multiprocessing
+import os
+import threading
+import time
+from zlib import crc32
 
-from apiclient.creds import convert_tuple_to_string
 from django.db.transaction import TransactionManagementError
 from lxml import etree
 from maasserver import logger
-from maasserver.models.node import (
-    Node,
-    RackController,
-)
+from maasserver.models.node import Node
 from maasserver.models.nodeprobeddetails import (
     get_probed_details,
+    get_probed_details_fingerprints,
     get_single_probed_details,
     script_output_nsmap,
 )
-from maasserver.models.user import (
-    create_auth_token,
-    get_auth_tokens,
-    get_creds_tuple,
-)
-from maasserver.rpc import getAllClients
+from maasserver.models.tag import Tag
 from maasserver.utils.orm import (
     in_transaction,
     transactional,
 )
+from maasserver.utils.threads import deferToDatabase
 from provisioningserver.logger import (
     get_maas_logger,
     LegacyLogger,
 )
-from provisioningserver.rpc.cluster import EvaluateTag
 from provisioningserver.tags import (
     DEFAULT_BATCH_SIZE,
+    evaluate_tags_for_nodes,
     gen_batches,
     merge_details,
 )
@@ -52,7 +50,12 @@ from provisioningserver.utils.twisted import (
     synchronous,
 )
 from provisioningserver.utils.xpath import try_match_xpath
-from twisted.internet.defer import DeferredList
+from twisted.internet.defer import (
+    inlineCallbacks,
+    returnValue,
+)
+from twisted.internet.threads import deferToThread
+from twisted.python.threadable import isInIOThread
 
 
 maaslog = get_maas_logger("tags")
@@ -67,150 +70,270 @@ tag_nsmap = {
 }
 
 
-def chunk_list(items, num_chunks):
-    """Split `items` into (at most) `num_chunks` lists.
+class TagEvaluator:
+    """Evaluates tag definitions against nodes' details in a process pool.
+
+    Nodes are assigned to the processes in the pool by system ID, so each
+    process sees the same nodes every time and keeps their merged details
+    documents in its `parsed_details_cache`. Only the fingerprints of the
+    details are fetched up-front; the details themselves are fetched and
+    sent to a process only for the nodes it does not have cached.
 
-    Every chunk will have at least one element in its list, which may
-    mean that we don't actually get as many chunks as the user asked
-    for.  The final chunk (of how ever many we create) is likely to be
-    smaller than the rest, since we always round up to the nearest
-    integer for chunk size.
+    The pool is started when first needed, and stopped by `close`. Batches
+    no bigger than the batch size are evaluated in the calling process,
+    without a cache.
     """
-    size = ceil(len(items) / num_chunks)
-    for i in range(0, len(items), size):
-        yield items[i:i + size]
+
+    def __init__(self, processes=None):
+        if processes is None:
+            processes = min(4, os.cpu_count() or 1)
+        self.processes = processes
+        self.pools = None
+        self.lock = threading.Lock()
+
+    def getPools(self):
+        """Return one single-process pool for each shard of nodes."""
+        with self.lock:
+            if self.pools is None:
+                # Spawn rather than fork: this process has threads and
+                # database connections that must not be shared.
+                context = multiprocessing.get_context("spawn")
+                self.pools = [
+                    context.Pool(processes=1)
+                    for _ in range(self.processes)
+                ]
+            return self.pools
+
+    def close(self):
+        """Stop the processes in the pool."""
+        with self.lock:
+            pools, self.pools = self.pools, None
+        if pools is not None:
+            for pool in pools:
+                pool.terminate()
+                pool.join()
+
+    def getShard(self, node):
+        return crc32(node.system_id.encode("ascii")) % self.processes
+
+    @synchronous
+    def evaluate(self, definitions, nodes, batch_size=DEFAULT_BATCH_SIZE):
+        """Evaluate `definitions` against the details of `nodes`.
+
+        This must be called in a transaction, which is held while waiting
+        for the pool. See `evaluateOutsideTransaction`.
+
+        :return: A ``{node: [index, ...]}`` map of the indexes in
+            `definitions` of the expressions matching each node.
+        """
+        definitions = tuple(definitions)
+        nsmap = tuple(sorted(tag_nsmap.items()))
+        nodes = list(nodes)
+        if self.processes <= 0 or len(nodes) <= batch_size:
+            details = get_probed_details(nodes) if nodes else {}
+            matches, _ = evaluate_tags_for_nodes(
+                definitions, nsmap, (
+                    (node.system_id, None, details[node.system_id])
+                    for node in nodes),
+                cache=None)
+        else:
+            matches = {}
+            for batch in gen_batches(nodes, batch_size):
+                # First ask each process to evaluate the nodes it has
+                # cached, then send the details of those it did not have.
+                fingerprints = get_probed_details_fingerprints(batch)
+                batch_matches, missing = self._evaluateInPool(
+                    definitions, nsmap, batch, fingerprints)
+                if missing:
+                    batch = [
+                        node for node in batch if node.system_id in missing]
+                    details = get_probed_details(batch)
+                    missing_matches, _ = self._evaluateInPool(
+                        definitions, nsmap, batch, fingerprints, details)
+                    batch_matches.update(missing_matches)
+                matches.update(batch_matches)
+        return {node: matches[node.system_id] for node in nodes}
+
+    @asynchronous
+    @inlineCallbacks
+    def evaluateOutsideTransaction(
+            self, definitions, nodes, batch_size=DEFAULT_BATCH_SIZE):
+        """Evaluate `definitions` against the details of `nodes`.
+
+        As `evaluate`, but the details of each batch are fetched in short
+        transactions, and the evaluation is waited for in a thread that is
+        not a database thread.
+
+        :return: A `Deferred` firing with a ``{node: [index, ...]}`` map.
+        """
+        definitions = tuple(definitions)
+        nsmap = tuple(sorted(tag_nsmap.items()))
+        nodes = list(nodes)
+        if self.processes <= 0 or len(nodes) <= batch_size:
+            if len(nodes) == 0:
+                details = {}
+            else:
+                details = yield deferToDatabase(
+                    transactional(get_probed_details), nodes)
+            matches, _ = yield deferToThread(
+                evaluate_tags_for_nodes, definitions, nsmap, [
+                    (node.system_id, None, details[node.system_id])
+                    for node in nodes],
+                cache=None)
+        else:
+            matches = {}
+            for batch in gen_batches(nodes, batch_size):
+                fingerprints = yield deferToDatabase(
+                    transactional(get_probed_details_fingerprints), batch)
+                batch_matches, missing = yield deferToThread(
+                    self._evaluateInPool, definitions, nsmap, batch,
+                    fingerprints)
+                if missing:
+                    batch = [
+                        node for node in batch if node.system_id in missing]
+                    details = yield deferToDatabase(
+                        transactional(get_probed_details), batch)
+                    missing_matches, _ = yield deferToThread(
+                        self._evaluateInPool, definitions, nsmap, batch,
+                        fingerprints, details)
+                    batch_matches.update(missing_matches)
+                matches.update(batch_matches)
+        returnValue({node: matches[node.system_id] for node in nodes})
+
+    def _evaluateInPool(
+            self, definitions, nsmap, nodes, fingerprints, details=None):
+        """Evaluate `nodes` in the processes of their shards.
+
+        This blocks until every process has finished, and does not use the
+        database.
+
+        :param details: A ``{system_id: details}`` map, or `None` to have
+            each process use the documents it has cached.
+        :return: A ``(matches, missing)`` tuple, as returned by
+            `evaluate_tags_for_nodes`.
+        """
+        pools = self.getPools()
+        shards = [[] for _ in pools]
+        for node in nodes:
+            shards[self.getShard(node)].append(node)
+        results = [
+            pools[shard].apply_async(
+                evaluate_tags_for_nodes, (definitions, nsmap, [
+                    (node.system_id, fingerprints[node.system_id],
+                     None if details is None else details[node.system_id])
+                    for node in shard_nodes
+                ]))
+            for shard, shard_nodes in enumerate(shards) if shard_nodes
+        ]
+        matches, missing = {}, set()
+        for result in results:
+            shard_matches, shard_missing = result.get()
+            matches.update(shard_matches)
+            missing.update(shard_missing)
+        return matches, missing
+
+
+# The evaluator used to populate tags in this process.
+tag_evaluator = TagEvaluator()
 
 
-@synchronous
 def populate_tags(tag):
     """Evaluate `tag` for all nodes.
 
-    This returns a `Deferred` that will fire when all tags have been
-    evaluated. The return value is intended FOR TESTING ONLY because:
-
-    - You must not use the `Deferred` in the calling thread; it must only be
-      manipulated in the reactor thread. Pretending it's not there is safer
-      than chaining code onto it because it's easy to get wrong.
-
-    - The call may not finish for 10 minutes or more. It is therefore not a
-      good thing to be waiting for in a web request.
+    The nodes and their details are read, and the nodes matching `tag` are
+    recorded, in short transactions. The details are evaluated here in the
+    region by `tag_evaluator`, outside of any transaction.
 
+    This returns a `Deferred` when called in the reactor, and otherwise
+    waits for the evaluation to finish. The `Deferred` is intended FOR
+    TESTING ONLY; the call may take some time, so it is not a good thing to
+    be waiting for in a web request.
     """
     # This function cannot be called inside a transaction. The function manages
-    # its own transaction.
-    if in_transaction():
+    # its own transactions. There is no database connection in the reactor
+    # thread, so there can be no transaction there either.
+    if not isInIOThread() and in_transaction():
         raise TransactionManagementError(
             '`populate_tags` cannot be called inside an existing transaction.')
 
     logger.debug('Evaluating the "%s" tag for all nodes.', tag.name)
-
-    clients = getAllClients()
-    if len(clients) == 0:
-        # We have no clients so we need to do the work locally.
-        @transactional
-        def _populate_tag():
-            return populate_tag_for_multiple_nodes(tag, Node.objects.all())
-
-        return _populate_tag()
-    else:
-        # Split the work between the connected rack controllers.
-        @transactional
-        def _generate_work():
-            node_ids = Node.objects.all().values_list("system_id", flat=True)
-            node_ids = [{"system_id": node_id} for node_id in node_ids]
-            chunked_node_ids = list(chunk_list(node_ids, len(clients)))
-            connected_racks = []
-            for idx, client in enumerate(clients):
-                rack = RackController.objects.get(system_id=client.ident)
-                token = _get_or_create_auth_token(rack.owner)
-                creds = convert_tuple_to_string(get_creds_tuple(token))
-                if len(chunked_node_ids) > idx:
-                    connected_racks.append({
-                        "system_id": rack.system_id,
-                        "hostname": rack.hostname,
-                        "client": client,
-                        "tag_name": tag.name,
-                        "tag_definition": tag.definition,
-                        "tag_nsmap": [
-                            {"prefix": prefix, "uri": uri}
-                            for prefix, uri in tag_nsmap.items()
-                        ],
-                        "credentials": creds,
-                        "nodes": list(chunked_node_ids[idx]),
-                    })
-            return connected_racks
-
-        return _do_populate_tags(_generate_work())
-
-
-def _get_or_create_auth_token(user):
-    """Get the most recent OAuth token for `user`, or create one."""
-    for token in reversed(get_auth_tokens(user)):
-        return token
-    else:
-        return create_auth_token(user)
+    return _do_populate_tags(tag)
 
 
 @asynchronous(timeout=FOREVER)
-def _do_populate_tags(clients):
-    """Send RPC calls to each rack controller, requesting evaluation of tags.
+def _do_populate_tags(tag):
+    """Evaluate `tag` for all nodes, without holding a transaction."""
+
+    @transactional
+    def get_nodes():
+        return list(Node.objects.all())
+
+    @inlineCallbacks
+    def populate(definition):
+        nodes = yield deferToDatabase(get_nodes)
+        started = time.monotonic()
+        matches = yield tag_evaluator.evaluateOutsideTransaction(
+            [definition], nodes)
+        elapsed = time.monotonic() - started
+        yield deferToDatabase(_record_tag_matches, tag.id, definition, matches)
+        _log_throughput(1, len(nodes), elapsed)
+
+    d = populate(tag.definition)
+    d.addErrback(log.err, 'Failed to evaluate the "%s" tag.' % tag.name)
+    return d
+
+
+@transactional
+def _record_tag_matches(tag_id, definition, matches):
+    """Record which nodes match the tag with `tag_id`.
 
-    :param clients: List of connected rack controllers that EvaluateTag
-        will be called.
+    Nothing is recorded if the tag has been deleted, or redefined -- which
+    schedules its evaluation again -- since `definition` was evaluated.
+    Nodes deleted in the meantime are left out.
+
+    :param matches: As returned by `TagEvaluator.evaluate`.
+    """
+    try:
+        tag = Tag.objects.get(id=tag_id)
+    except Tag.DoesNotExist:
+        return
+    if tag.definition != definition:
+        return
+    node_ids = set(
+        Node.objects.filter(id__in=[node.id for node in matches])
+        .values_list("id", flat=True))
+    _update_tag_nodes([tag], {
+        node: indexes
+        for node, indexes in matches.items()
+        if node.id in node_ids
+    })
+
+
+def _update_tag_nodes(tags, matches):
+    """Set the nodes of each of `tags` to those that match it.
+
+    :param matches: As returned by `TagEvaluator.evaluate`.
     """
+    for index, tag in enumerate(tags):
+        nodes_matching, nodes_nonmatching = classify(
+            lambda indexes: index in indexes, matches.items())
+        tag.node_set.remove(*nodes_nonmatching)
+        tag.node_set.add(*nodes_matching)
 
-    def call_client(client_info):
-        client = client_info["client"]
-        return client(
-            EvaluateTag,
-            system_id=client_info["system_id"],
-            tag_name=client_info["tag_name"],
-            tag_definition=client_info["tag_definition"],
-            tag_nsmap=client_info["tag_nsmap"],
-            credentials=client_info["credentials"],
-            nodes=client_info["nodes"])
-
-    def check_results(results):
-        for client_info, (success, result) in zip(clients, results):
-            if success:
-                maaslog.info(
-                    "Tag %s (%s) evaluated on rack controller %s (%s)",
-                    client_info['tag_name'],
-                    client_info['tag_definition'],
-                    client_info['hostname'],
-                    client_info['system_id'])
-            else:
-                maaslog.error(
-                    "Tag %s (%s) could not be evaluated on rack controller "
-                    "%s (%s): %s",
-                    client_info['tag_name'],
-                    client_info['tag_definition'],
-                    client_info['hostname'],
-                    client_info['system_id'],
-                    result.getErrorMessage())
-
-    d = DeferredList((
-        call_client(client_info)
-        for client_info in clients),
-        consumeErrors=True)
-    d.addCallback(check_results)
-    d.addErrback(log.err)
-
-    # Do *not* return a Deferred; the caller is not meant to wait around for
-    # this to finish. However, for the sake of testing, we return the Deferred
-    # wrapped up in a list so that crochet does not block.
-    return [d]
+
+def _log_throughput(tag_count, node_count, elapsed):
+    maaslog.info(
+        "Evaluated %d tag(s) against %d node(s) in %.1f seconds "
+        "(%.1f nodes/sec).", tag_count, node_count, elapsed,
+        node_count / elapsed if elapsed > 0 else node_count)
 
 
 @synchronous
 def populate_tags_for_single_node(tags, node):
     """Reevaluate all tags for a single node.
 
-    Presumably this node's details have recently changed. Use `populate_tags`
-    when many nodes need reevaluating AND there are rack controllers available
-    to which to farm-out work. Use `populate_tag_for_multiple_nodes` when many
-    nodes need reevaluating locally, i.e. when there are no rack controllers
-    connected.
+    Presumably this node's details have recently changed. Use
+    `populate_tags_for_multiple_nodes` when many nodes need reevaluating.
     """
     probed_details = get_single_probed_details(node)
     probed_details_doc = merge_details(probed_details)
@@ -227,22 +350,25 @@ def populate_tags_for_single_node(tags, node):
 def populate_tag_for_multiple_nodes(tag, nodes, batch_size=DEFAULT_BATCH_SIZE):
     """Reevaluate a single tag for a multiple nodes.
 
-    Presumably this tag's expression has recently changed. Use `populate_tags`
-    when many nodes need reevaluating AND there are rack controllers available
-    to which to farm-out work. Use this only when many nodes need reevaluating
-    locally, i.e. when there are no rack controllers connected.
+    Presumably this tag's expression has recently changed. See
+    `populate_tags_for_multiple_nodes`.
     """
-    # Same expression, multuple documents: compile expression with XPath.
-    xpath = etree.XPath(tag.definition, namespaces=tag_nsmap)
-    # The XML details documents can be large so work in batches.
-    for batch in gen_batches(nodes, batch_size):
-        probed_details = get_probed_details(batch)
-        probed_details_docs_by_node = {
-            node: merge_details(probed_details[node.system_id])
-            for node in batch
-        }
-        nodes_matching, nodes_nonmatching = classify(
-            partial(try_match_xpath, xpath, logger=maaslog),
-            probed_details_docs_by_node.items())
-        tag.node_set.remove(*nodes_nonmatching)
-        tag.node_set.add(*nodes_matching)
+    populate_tags_for_multiple_nodes([tag], nodes, batch_size=batch_size)
+
+
+@synchronous
+def populate_tags_for_multiple_nodes(
+        tags, nodes, batch_size=DEFAULT_BATCH_SIZE):
+    """Reevaluate many tags for many nodes.
+
+    The nodes' details are evaluated against every tag in one pass, using
+    `tag_evaluator`. Throughput is logged in nodes per second.
+    """
+    tags = [tag for tag in tags if tag.is_defined]
+    nodes = list(nodes)
+    started = time.monotonic()
+    matches = tag_evaluator.evaluate(
+        (tag.definition for tag in tags), nodes, batch_size=batch_size)
+    elapsed = time.monotonic() - started
+    _update_tag_nodes(tags, matches)
+    _log_throughput(len(tags), len(nodes), elapsed)
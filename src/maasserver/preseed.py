@@ -16,10 +16,15 @@ __all__ = [
     'OS_WITH_IPv6_SUPPORT',
     ]
 
-from collections import namedtuple
+from collections import (
+    namedtuple,
+    OrderedDict,
+)
+from copy import copy
 import json
 import os.path
 from pipes import quote
+import threading
 from urllib.parse import (
     urlencode,
     urlparse,
@@ -56,6 +61,7 @@ from maasserver.models import (
 )
 from maasserver.models.filesystem import Filesystem
 from maasserver.node_status import COMMISSIONING_LIKE_STATUSES
+from maasserver.preseed_cache import rendered_config_cache
 from maasserver.preseed_network import compose_curtin_network_config
 from maasserver.preseed_storage import compose_curtin_storage_config
 from maasserver.server_address import get_maas_facing_server_host
@@ -80,6 +86,7 @@ from provisioningserver.logger import (
 )
 from provisioningserver.rpc.exceptions import NoConnectionsAvailable
 from provisioningserver.utils import typed
+from provisioningserver.utils.fs import get_file_version
 from provisioningserver.utils.url import compose_URL
 import tempita
 import yaml
@@ -338,8 +345,9 @@ def get_curtin_yaml_config(request, node):
     kernel_config = compose_curtin_kernel_preseed(node)
     verbose_config = compose_curtin_verbose_preseed()
     network_yaml_settings = get_network_yaml_settings(osystem, release)
-    network_config = compose_curtin_network_config(
-        node, version=network_yaml_settings.version,
+    network_config = rendered_config_cache.render(
+        node, compose_curtin_network_config,
+        version=network_yaml_settings.version,
         source_routing=network_yaml_settings.source_routing)
 
     if osystem not in [
@@ -374,7 +382,8 @@ def get_curtin_yaml_config(request, node):
         supports_custom_storage = False
 
     if supports_custom_storage:
-        storage_config = compose_curtin_storage_config(node)
+        storage_config = rendered_config_cache.render(
+            node, compose_curtin_storage_config)
     else:
         storage_config = []
         maaslog.warning(
@@ -708,25 +717,93 @@ def compose_filename(elements):
     return '_'.join(elements)
 
 
+# A template found by `find_preseed_template`, or None for the path and
+# template if none was found, and the versions of the template locations
+# and of its file then.
+PreseedTemplateCacheEntry = namedtuple("PreseedTemplateCacheEntry", (
+    "location_versions",
+    "filepath",
+    "file_version",
+    "template",
+))
+
+# Templates found by `find_preseed_template`, keyed by (template locations,
+# filenames), least recently used first.
+preseed_template_cache = OrderedDict()
+preseed_template_cache_lock = threading.Lock()
+preseed_template_cache_size = 512
+
+
 def get_preseed_template(filenames):
     """Get the path and content for the first template found.
 
     :param filenames: An iterable of relative filenames.
     """
+    entry = find_preseed_template(filenames)
+    if entry.template is None:
+        return None, None
+    else:
+        return entry.filepath, entry.template.content
+
+
+def find_preseed_template(filenames):
+    """Find and compile the first template found.
+
+    Templates are compiled once and cached, as is finding no template.
+    They can still be changed on the fly: the cache is only used while
+    neither the template locations nor the template found have been
+    modified.
+
+    :param filenames: An iterable of relative filenames.
+    :return: A `PreseedTemplateCacheEntry`. Its template is shared, so it
+        must be copied before its `get_template` hook is set.
+    """
     assert not isinstance(filenames, (bytes, str))
+    filenames = tuple(filenames)
     assert all(isinstance(filename, str) for filename in filenames)
-    for location in settings.PRESEED_TEMPLATE_LOCATIONS:
+    locations = tuple(settings.PRESEED_TEMPLATE_LOCATIONS)
+    key = locations, filenames
+    location_versions = tuple(
+        get_file_version(location) for location in locations)
+    with preseed_template_cache_lock:
+        entry = preseed_template_cache.get(key)
+        if entry is not None:
+            preseed_template_cache.move_to_end(key)
+    if (entry is None or entry.location_versions != location_versions or
+            (entry.filepath is not None and
+             get_file_version(entry.filepath) != entry.file_version)):
+        entry = _load_preseed_template(locations, filenames)._replace(
+            location_versions=location_versions)
+        with preseed_template_cache_lock:
+            preseed_template_cache[key] = entry
+            while len(preseed_template_cache) > preseed_template_cache_size:
+                preseed_template_cache.popitem(last=False)
+    return entry
+
+
+def _load_preseed_template(locations, filenames):
+    """Load the first template found in `locations`.
+
+    :return: A `PreseedTemplateCacheEntry`, without the versions of the
+        locations.
+    """
+    for location in locations:
         for filename in filenames:
             filepath = os.path.join(location, filename)
+            # Get the version first, in case the template changes while
+            # it's being loaded.
+            file_version = get_file_version(filepath)
             try:
                 with open(filepath, "r", encoding="utf-8") as stream:
                     content = stream.read()
             except IOError:
                 pass  # Ignore.
             else:
-                return filepath, content
+                return PreseedTemplateCacheEntry(
+                    None, filepath, file_version,
+                    PreseedTemplate(content, name=filepath))
     else:
-        return None, None
+        return PreseedTemplateCacheEntry(None, None, None, None)
 
 
 def get_escape_singleton():
@@ -776,13 +853,14 @@ def load_preseed_template(node, prefix, osystem='', release=''):
         """
         filenames = list(get_preseed_filenames(
             node, name, osystem, release, default))
-        filepath, content = get_preseed_template(filenames)
-        if filepath is None:
+        entry = find_preseed_template(filenames)
+        if entry.template is None:
             raise TemplateNotFoundError(name)
-        # This is where the closure happens: pass `get_template` when
-        # instanciating PreseedTemplate.
-        return PreseedTemplate(
-            content, name=filepath, get_template=get_template)
+        # This is where the closure happens: set `get_template` on a copy
+        # of the compiled PreseedTemplate.
+        template = copy(entry.template)
+        template.get_template = get_template
+        return template
 
     return get_template(prefix, None, default=True)
 
@@ -0,0 +1,176 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""In-memory cache of the storage and network configuration for curtin.
+
+Each machine fetches its curtin configuration when it deploys, and again
+whenever curtin retries, and composing the storage and network parts of it
+takes many queries. Each region process keeps what it has composed for each
+machine until the postgres triggers report that the machine -- including
+its interfaces, addresses and storage -- or the networks, DNS or settings
+that any machine's configuration depends on, have changed.
+"""
+
+__all__ = [
+    "RenderedConfigCache",
+    "rendered_config_cache",
+]
+
+from collections import OrderedDict
+from datetime import timedelta
+from operator import attrgetter
+import threading
+import time
+
+from django.db import transaction
+
+
+class RenderedConfigCache:
+    """Configuration composed for each machine, kept current by notifications.
+
+    The cache is only used while the `PostgresListenerService` passed to
+    `listen` is connected, and never by a transaction that has changed
+    anything the configuration depends on but not yet committed.
+    """
+
+    # Changes to a machine, or to anything attached to it, are reported on
+    # this channel with the machine's system_id.
+    node_channel = "machine"
+
+    # Changes on these channels can affect the configuration of any machine.
+    global_channels = (
+        "config",
+        "controller",
+        "domain",
+        "fabric",
+        "space",
+        "staticroute",
+        "subnet",
+        "vlan",
+    )
+
+    # The fields of a machine that its configuration depends on. They are
+    # part of the key so that a change made to a machine in this
+    # transaction is never answered from the cache.
+    node_fields = attrgetter(
+        "architecture", "bios_boot_method", "boot_cluster_ip",
+        "boot_disk_id", "boot_interface_id", "distro_series", "domain_id",
+        "gateway_link_ipv4_id", "gateway_link_ipv6_id", "hostname",
+        "hwe_kernel", "osystem")
+
+    # Configuration is composed again after this many seconds regardless.
+    # This bounds how long a stale configuration can be kept if it was
+    # composed from a snapshot taken before a change, but only stored after
+    # that change had been reported.
+    max_age = timedelta(minutes=5).total_seconds()
+
+    # Configuration is kept for at most this many machines.
+    max_nodes = 1000
+
+    def __init__(self):
+        super(RenderedConfigCache, self).__init__()
+        self.lock = threading.Lock()
+        # Maps system_ids, least recently used first, to dicts of (time
+        # composed, configuration) tuples.
+        self.renderings = OrderedDict()
+        # The listener connection that was current when `renderings` were
+        # composed.
+        self.connection = None
+        self.generation = 0
+        self.listener = None
+
+    def listen(self, listener):
+        """Keep the cache current using notifications from `listener`.
+
+        Only the first listener in a process is used.
+        """
+        if self.listener is None:
+            self.listener = listener
+            listener.register(self.node_channel, self.nodeChanged)
+            for channel in self.global_channels:
+                listener.register(channel, self.configChanged)
+
+    def nodeChanged(self, action, system_id):
+        """Called when a machine_* message is received."""
+        self.invalidate(system_id)
+
+    def configChanged(self, action, obj_id):
+        """Called when a message is received on one of `global_channels`."""
+        self.invalidate()
+
+    def invalidate(self, system_id=None):
+        """Discard the configuration of `system_id`, or of every machine."""
+        with self.lock:
+            if system_id is None:
+                self.renderings.clear()
+            else:
+                self.renderings.pop(system_id, None)
+            self.generation += 1
+
+    def invalidateOnCommit(self):
+        """Don't use the cache in this transaction.
+
+        Configuration composed elsewhere in this process while this
+        transaction is in progress is not stored. Once it has committed, the
+        postgres triggers report what was changed.
+        """
+        if not self._hasUncommittedChanges():
+            transaction.on_commit(self.changesCommitted)
+
+    def changesCommitted(self):
+        """Don't store configuration composed before this point."""
+        with self.lock:
+            self.generation += 1
+
+    def _hasUncommittedChanges(self):
+        connection = transaction.get_connection()
+        return any(
+            func == self.changesCommitted
+            for _, func in connection.run_on_commit)
+
+    def render(self, node, compose, *args, **kwargs):
+        """Return `compose(node, *args, **kwargs)`, from the cache if possible.
+
+        :param compose: A function returning a list of YAML documents, such
+            as `compose_curtin_storage_config`.
+        """
+        listener = self.listener
+        if (listener is None or not listener.connected() or
+                self._hasUncommittedChanges()):
+            return compose(node, *args, **kwargs)
+
+        key = (
+            compose, args, tuple(sorted(kwargs.items())),
+            self.node_fields(node))
+        now = time.monotonic()
+        with self.lock:
+            if listener.connection is not self.connection:
+                # The listener has reconnected since this configuration was
+                # composed, so notifications may have been missed.
+                self.renderings.clear()
+                self.connection = listener.connection
+                self.generation += 1
+            renderings = self.renderings.get(node.system_id)
+            if renderings is not None:
+                self.renderings.move_to_end(node.system_id)
+                rendering = renderings.get(key)
+                if rendering is not None:
+                    composed, documents = rendering
+                    if now - composed < self.max_age:
+                        return list(documents)
+            generation = self.generation
+
+        documents = compose(node, *args, **kwargs)
+        with self.lock:
+            # Only store the configuration if nothing changed while it was
+            # being composed.
+            if generation == self.generation:
+                renderings = self.renderings.setdefault(node.system_id, {})
+                renderings[key] = now, list(documents)
+                self.renderings.move_to_end(node.system_id)
+                while len(self.renderings) > self.max_nodes:
+                    self.renderings.popitem(last=False)
+        return documents
+
+
+rendered_config_cache = RenderedConfigCache()
@@ -16,6 +16,34 @@ METRICS_DEFINITIONS = [
     MetricDefinition(
         'Histogram', 'maas_websocket_call_latency',
         'Latency of a Websocket handler call', ['call']),
+    MetricDefinition(
+        'Histogram', 'maas_websocket_notify_latency',
+        'Latency between a database notification and it being sent to '
+        'Websocket clients', ['handler']),
+    MetricDefinition(
+        'Counter', 'maas_websocket_notify_queries_saved',
+        'Websocket notification lookups avoided by coalescing and sharing '
+        'dehydrated objects between clients', ['handler']),
+    MetricDefinition(
+        'Histogram', 'maas_dhcp_config_generation_latency',
+        'Time taken to generate the DHCP configuration for a rack '
+        'controller', []),
+    MetricDefinition(
+        'Counter', 'maas_dhcp_config_updates',
+        'DHCP configuration updates sent to rack controllers, by whether '
+        'only the changed hosts or the full configuration was sent',
+        ['family', 'method']),
+    MetricDefinition(
+        'Gauge', 'maas_status_messages_queued',
+        'Status messages from nodes waiting to be processed', []),
+    MetricDefinition(
+        'Histogram', 'maas_status_message_ingestion_latency',
+        'Time between a status message being received from a node and it '
+        'being stored', []),
+    MetricDefinition(
+        'Histogram', 'maas_listener_notify_relay_latency',
+        'Time between the master regiond process receiving a database '
+        'notification and a worker process receiving it', []),
 ]
 
 
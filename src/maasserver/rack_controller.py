@@ -30,6 +30,13 @@ DHCP:
     for messages on 'sys_dhcp_{id}' channel and set that rack controller as
     needing an update. Any time a message is received on this queue that rack
     controller is marked as needing an update.
+
+Boot configuration:
+    Each regiond process also listens on the 'sys_boot_config' channel. When
+    a message arrives, naming the MAC addresses and hardware UUID of a node
+    whose boot configuration may have changed, every rack controller watched
+    by this process is told to discard its cached boot configurations for
+    that node.
 """
 
 __all__ = [
@@ -37,14 +44,17 @@ __all__ = [
 ]
 
 from functools import partial
+import json
 import os
 
 from maasserver import dhcp
 from maasserver.listener import PostgresListenerUnregistrationError
 from maasserver.models.node import RackController
+from maasserver.rpc import getClientFor
 from maasserver.utils.orm import transactional
 from maasserver.utils.threads import deferToDatabase
 from provisioningserver.logger import LegacyLogger
+from provisioningserver.rpc.cluster import InvalidateBootConfig
 from provisioningserver.rpc.exceptions import NoConnectionsAvailable
 from provisioningserver.utils.twisted import (
     asynchronous,
@@ -55,6 +65,7 @@ from twisted.application.service import Service
 from twisted.internet import reactor
 from twisted.internet.defer import (
     CancelledError,
+    DeferredList,
     maybeDeferred,
 )
 from twisted.internet.task import LoopingCall
@@ -99,6 +110,8 @@ class RackControllerService(Service):
             self.processId = processId
             self.postgresListener.register(
                 "sys_core_%d" % self.processId, self.coreHandler)
+            self.postgresListener.register(
+                "sys_boot_config", self.bootConfigHandler)
             return self.processId
 
         @transactional
@@ -150,6 +163,14 @@ class RackControllerService(Service):
                 # Error is acceptable as it might not have been called yet.
                 pass
 
+            # Unregister the boot configuration handler.
+            try:
+                self.postgresListener.unregister(
+                    "sys_boot_config", self.bootConfigHandler)
+            except PostgresListenerUnregistrationError:
+                # Error is acceptable as it might not have been called yet.
+                pass
+
             # Unregister all DHCP handling.
             for rack_id in self.watching:
                 try:
@@ -232,6 +253,50 @@ class RackControllerService(Service):
                 "[pid:{pid()}] recieved DHCP push notify when not watching "
                 "for rack: {rack_id}", pid=os.getpid, rack_id=rack_id)
 
+    def bootConfigHandler(self, channel, message):
+        """Called when the `sys_boot_config` message is received."""
+        if len(self.watching) == 0:
+            return None
+        payload = json.loads(message)
+        d = deferToDatabase(self.getSystemIDs, set(self.watching))
+        d.addCallback(
+            self.invalidateBootConfig, payload["macs"],
+            payload["hardware_uuid"])
+        d.addErrback(
+            log.err, "Failed to invalidate cached boot configurations.")
+        return d
+
+    @transactional
+    def getSystemIDs(self, rack_ids):
+        """Return the system IDs of the rack controllers in `rack_ids`."""
+        return list(
+            RackController.objects.filter(id__in=rack_ids).values_list(
+                "system_id", flat=True))
+
+    def invalidateBootConfig(self, system_ids, macs, hardware_uuid):
+        """Tell each of the rack controllers in `system_ids` to discard its
+        cached boot configurations for `macs` and `hardware_uuid`."""
+
+        def invalidate(client):
+            return client(
+                InvalidateBootConfig, macs=macs, hardware_uuid=hardware_uuid)
+
+        def eb_invalidate(failure, system_id):
+            # Entries expire soon enough, so don't fret when a rack
+            # controller has gone away.
+            if not failure.check(NoConnectionsAvailable):
+                log.err(
+                    failure, "Failed to invalidate cached boot "
+                    "configurations on rack controller '%s'." % system_id)
+
+        ds = []
+        for system_id in system_ids:
+            d = getClientFor(system_id)
+            d.addCallback(invalidate)
+            d.addErrback(eb_invalidate, system_id)
+            ds.append(d)
+        return DeferredList(ds)
+
     def startProcessing(self):
         """Start the process looping call."""
         if not self.processing.running:
@@ -12,6 +12,12 @@ DNS:
     as requiring an update. Once marked for update the DNS configuration is
     updated and bind9 is told to reload.
 
+    Changes that only affect some zones are also announced on channel
+    'sys_dns_updates' with the IDs of the changed domains and subnets, just
+    before the matching 'sys_dns' message. When every change since the last
+    update is scoped that way only those zones are regenerated and reloaded;
+    anything else, including retrying a failed update, regenerates all zones.
+
 Proxy:
     The regiond process listens for messages from Postgres on channel
     'sys_proxy'. Any time a message is recieved on that channel the maas-proxy
@@ -29,10 +35,14 @@ __all__ = [
     "RegionControllerService",
 ]
 
+import json
 from operator import attrgetter
 
 from maasserver import locks
-from maasserver.dns.config import dns_update_all_zones
+from maasserver.dns.config import (
+    dns_update_all_zones,
+    dns_update_zones,
+)
 from maasserver.macaroon_auth import get_auth_info
 from maasserver.models.config import Config
 from maasserver.models.dnspublication import DNSPublication
@@ -102,6 +112,8 @@ class RegionControllerService(Service):
         self.processing.clock = self.clock
         self.processingDefer = None
         self.needsDNSUpdate = False
+        self.dnsUpdateZones = None
+        self.dnsZoneUpdates = {}
         self.needsProxyUpdate = False
         self.needsRBACUpdate = False
         self.postgresListener = postgresListener
@@ -117,6 +129,8 @@ class RegionControllerService(Service):
         """Start listening for messages."""
         super(RegionControllerService, self).startService()
         self.postgresListener.register("sys_dns", self.markDNSForUpdate)
+        self.postgresListener.register(
+            "sys_dns_updates", self.markDNSZonesForUpdate)
         self.postgresListener.register("sys_proxy", self.markProxyForUpdate)
         self.postgresListener.register("sys_rbac", self.markRBACForUpdate)
 
@@ -130,6 +144,8 @@ class RegionControllerService(Service):
         """Close the controller."""
         super(RegionControllerService, self).stopService()
         self.postgresListener.unregister("sys_dns", self.markDNSForUpdate)
+        self.postgresListener.unregister(
+            "sys_dns_updates", self.markDNSZonesForUpdate)
         self.postgresListener.unregister("sys_proxy", self.markProxyForUpdate)
         self.postgresListener.unregister("sys_rbac", self.markRBACForUpdate)
         if self.processingDefer is not None:
@@ -138,10 +154,35 @@ class RegionControllerService(Service):
             return d
 
     def markDNSForUpdate(self, channel, message):
-        """Called when the `sys_dns` message is received."""
+        """Called when the `sys_dns` message is received.
+
+        The message is the serial of the new DNS publication. If the zones
+        it changed were announced on `sys_dns_updates`, only those zones are
+        marked for update, unless an update of all zones is already pending.
+        Otherwise all zones are marked for update.
+        """
+        zones = self.dnsZoneUpdates.pop(message, None)
+        if zones is None:
+            self.dnsUpdateZones = None
+        elif not self.needsDNSUpdate:
+            self.dnsUpdateZones = tuple(set(ids) for ids in zones)
+        elif self.dnsUpdateZones is not None:
+            for pending, ids in zip(self.dnsUpdateZones, zones):
+                pending.update(ids)
         self.needsDNSUpdate = True
         self.startProcessing()
 
+    def markDNSZonesForUpdate(self, channel, message):
+        """Called when the `sys_dns_updates` message is received.
+
+        The message holds the serial of the DNS publication about to be
+        announced on `sys_dns`, and the IDs of the domains and subnets whose
+        zones it changed.
+        """
+        zones = json.loads(message)
+        self.dnsZoneUpdates[str(zones["serial"])] = (
+            zones["domains"], zones["subnets"])
+
     def markProxyForUpdate(self, channel, message):
         """Called when the `sys_proxy` message is received."""
         self.needsProxyUpdate = True
@@ -181,13 +222,23 @@ class RegionControllerService(Service):
             if delay:
                 return pause(delay)
 
+        def _onDNSFailureRetry(failure):
+            """Retry the DNS update on failure, updating all zones."""
+            if self.retryOnFailure:
+                self.dnsUpdateZones = None
+            return _onFailureRetry(failure, 'needsDNSUpdate')
+
         defers = []
         if self.needsDNSUpdate:
             self.needsDNSUpdate = False
-            d = deferToDatabase(transactional(dns_update_all_zones))
+            zones, self.dnsUpdateZones = self.dnsUpdateZones, None
+            if zones is None:
+                d = deferToDatabase(transactional(dns_update_all_zones))
+            else:
+                d = deferToDatabase(transactional(dns_update_zones), *zones)
             d.addCallback(self._checkSerial)
             d.addCallback(self._logDNSReload)
-            d.addErrback(_onFailureRetry, 'needsDNSUpdate')
+            d.addErrback(_onDNSFailureRetry)
             d.addErrback(
                 log.err,
                 "Failed configuring DNS.")
@@ -0,0 +1,84 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Event log maintenance service for the region controller."""
+
+__all__ = [
+    "EventLogMaintenanceService",
+]
+
+from datetime import timedelta
+
+from maasserver.models import (
+    Config,
+    Event,
+)
+from maasserver.models.timestampedmodel import now
+from maasserver.utils.orm import transactional
+from maasserver.utils.threads import deferToDatabase
+from provisioningserver.logger import LegacyLogger
+from provisioningserver.utils.twisted import synchronous
+from twisted.application.internet import TimerService
+
+
+log = LegacyLogger()
+
+
+class EventLogMaintenanceService(TimerService):
+    """Periodically archive old events, and drop expired archives.
+
+    When the `event_log_retention_days` configuration is set, events older
+    than `archive_after` are moved into daily archive tables, and once every
+    event in an archive is older than that many days, the archive is
+    dropped. Otherwise events are kept in the events table forever.
+    """
+
+    interval = timedelta(hours=1).total_seconds()
+
+    # Recent events are kept in the events table itself.
+    archive_after = timedelta(days=1)
+
+    # Events are moved in batches of this size, one transaction each.
+    batch_size = 1000
+
+    def __init__(self, reactor):
+        super().__init__(self.interval, self._tryMaintain)
+        self.clock = reactor
+
+    def _tryMaintain(self):
+        d = deferToDatabase(self._maintain)
+        d.addCallback(self._logMaintenance)
+        d.addErrback(log.err, "Failed to maintain the event log.")
+        return d
+
+    @synchronous
+    def _maintain(self):
+        """Archive old events, then drop expired archives.
+
+        :return: A tuple of the number of events archived, and the names of
+            the archives dropped.
+        """
+        retention = transactional(Config.objects.get_config)(
+            'event_log_retention_days')
+        if retention <= 0:
+            return 0, []
+        current_time = now()
+        archive_events = transactional(Event.objects.archive_events)
+        archived = 0
+        while True:
+            count = archive_events(
+                current_time - self.archive_after, self.batch_size)
+            if count == 0:
+                break
+            archived += count
+        dropped = transactional(Event.objects.expire_archives)(
+            current_time - timedelta(days=retention))
+        return archived, dropped
+
+    def _logMaintenance(self, result):
+        archived, dropped = result
+        if archived > 0:
+            log.msg("Archived %d event(s)." % archived)
+        if len(dropped) > 0:
+            log.msg("Dropped expired event archive(s): %s." % (
+                ", ".join(dropped)))
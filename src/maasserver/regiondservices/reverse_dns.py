@@ -70,15 +70,22 @@ class ReverseDNSService(Service):
 
     @defer.inlineCallbacks
     def consumeNeighbourEvent(self, action: str=None, cidr: str=None):
-        """Given an event from the postgresListener, resolve RDNS for an IP.
+        """Given an event from the postgresListener, resolve RDNS for IPs.
 
         This method is called when an observed neighbour is changed.
 
         :param action: one of {'create', 'update', 'delete'}
         :param cidr: the 'ip' field in the neighbour table, after PostgreSQL
             casts it to a string. It will end up looking like "x.x.x.x/32"
-            or "yyyy:yyyy::yyyy/128".
+            or "yyyy:yyyy::yyyy/128". Refreshed neighbours are coalesced into
+            a single 'update' whose payload is a space-separated list of IPs.
         """
+        for address in cidr.split():
+            yield self.consumeNeighbourAddress(action, address)
+
+    @defer.inlineCallbacks
+    def consumeNeighbourAddress(self, action: str, cidr: str):
+        """Resolve RDNS for a single IP from a neighbour event."""
         ip = cidr.split('/')[0]  # Strip off the "/<prefixlen>".
         if action in ('create', 'update'):
             # XXX mpontillo 2016-10-19: We might consider throttling this on
@@ -0,0 +1,132 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `maasserver.regiondservices.event_log`."""
+
+__all__ = []
+
+from datetime import (
+    datetime,
+    timedelta,
+)
+from unittest.mock import call
+
+from crochet import wait_for
+from maasserver.models import (
+    Config,
+    Event,
+)
+from maasserver.regiondservices import event_log
+from maasserver.testing.factory import factory
+from maasserver.testing.testcase import MAASServerTestCase
+from maastesting.matchers import (
+    DocTestMatches,
+    MockCalledOnceWith,
+    MockCallsMatch,
+    MockNotCalled,
+)
+from maastesting.testcase import MAASTestCase
+from maastesting.twisted import TwistedLoggerFixture
+from testtools.matchers import Equals
+from twisted.internet import reactor
+from twisted.internet.defer import (
+    fail,
+    inlineCallbacks,
+    succeed,
+)
+
+
+wait_for_reactor = wait_for(30)  # 30 seconds.
+
+
+class TestEventLogMaintenanceService_Basic(MAASTestCase):
+    """Basic tests for `EventLogMaintenanceService`."""
+
+    def test_service_uses__tryMaintain_as_periodic_function(self):
+        service = event_log.EventLogMaintenanceService(reactor)
+        self.assertThat(service.call, Equals((service._tryMaintain, (), {})))
+
+    def test_service_iterates_every_hour(self):
+        service = event_log.EventLogMaintenanceService(reactor)
+        self.assertThat(service.step, Equals(3600.0))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__tryMaintain_logs_archived_and_dropped(self):
+        service = event_log.EventLogMaintenanceService(reactor)
+        self.patch(event_log, "deferToDatabase").return_value = succeed(
+            (3, ["maasserver_event_archive_20190301"]))
+        with TwistedLoggerFixture() as logger:
+            yield service._tryMaintain()
+        self.assertThat(logger.output, DocTestMatches(
+            "Archived 3 event(s).\\n"
+            "Dropped expired event archive(s): "
+            "maasserver_event_archive_20190301."))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__tryMaintain_logs_errors(self):
+        service = event_log.EventLogMaintenanceService(reactor)
+        self.patch(event_log, "deferToDatabase").return_value = fail(
+            ZeroDivisionError())
+        with TwistedLoggerFixture() as logger:
+            yield service._tryMaintain()
+        self.assertThat(logger.output, DocTestMatches(
+            "Failed to maintain the event log.\\n..."))
+
+
+class TestEventLogMaintenanceService(MAASServerTestCase):
+    """Tests for `EventLogMaintenanceService` with the database."""
+
+    def patch_now(self, current_time):
+        self.patch(event_log, "now").return_value = current_time
+
+    def test__maintain_does_nothing_by_default(self):
+        current_time = datetime(2019, 3, 2, 12)
+        self.patch_now(current_time)
+        factory.make_Event().save(_created=current_time - timedelta(days=2))
+        archive_events = self.patch(Event.objects, "archive_events")
+        expire_archives = self.patch(Event.objects, "expire_archives")
+        service = event_log.EventLogMaintenanceService(reactor)
+        self.assertThat(service._maintain(), Equals((0, [])))
+        # Events are kept forever, in the events table, by default.
+        self.assertThat(archive_events, MockNotCalled())
+        self.assertThat(expire_archives, MockNotCalled())
+
+    def test__maintain_archives_events(self):
+        current_time = datetime(2019, 3, 2, 12)
+        self.patch_now(current_time)
+        Config.objects.set_config("event_log_retention_days", 7)
+        factory.make_Event().save(_created=current_time - timedelta(days=2))
+        factory.make_Event().save(_created=current_time)
+        service = event_log.EventLogMaintenanceService(reactor)
+        self.assertThat(service._maintain(), Equals((1, [])))
+
+    def test__maintain_archives_events_in_batches(self):
+        current_time = datetime(2019, 3, 2, 12)
+        self.patch_now(current_time)
+        Config.objects.set_config("event_log_retention_days", 7)
+        for _ in range(5):
+            factory.make_Event().save(
+                _created=current_time - timedelta(days=2))
+        archive_events = self.patch_autospec(Event.objects, "archive_events")
+        archive_events.side_effect = [2, 2, 1, 0]
+        service = event_log.EventLogMaintenanceService(reactor)
+        service.batch_size = 2
+        self.assertThat(service._maintain(), Equals((5, [])))
+        cutoff = current_time - service.archive_after
+        self.assertThat(archive_events, MockCallsMatch(
+            call(cutoff, 2), call(cutoff, 2), call(cutoff, 2),
+            call(cutoff, 2)))
+
+    def test__maintain_expires_archives(self):
+        current_time = datetime(2019, 3, 2, 12)
+        self.patch_now(current_time)
+        Config.objects.set_config("event_log_retention_days", 7)
+        expire_archives = self.patch(Event.objects, "expire_archives")
+        expire_archives.return_value = ["maasserver_event_archive_20190201"]
+        service = event_log.EventLogMaintenanceService(reactor)
+        self.assertThat(service._maintain(), Equals(
+            (0, ["maasserver_event_archive_20190201"])))
+        self.assertThat(expire_archives, MockCalledOnceWith(
+            current_time - timedelta(days=7)))
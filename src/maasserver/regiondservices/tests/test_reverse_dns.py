@@ -82,6 +82,20 @@ class TestReverseDNSService(
         self.assertThat(result.ip, Equals(ip))
         self.assertThat(result.hostname, Equals(hostname2))
 
+    @wait_for(30)
+    @inlineCallbacks
+    def test__updates_rdns_entries_for_coalesced_update(self):
+        hostname = factory.make_hostname()
+        self.set_fake_twisted_dns_reply([hostname])
+        service = ReverseDNSService()
+        yield service.startService()
+        ips = [factory.make_ip_address(ipv6=False) for _ in range(3)]
+        yield service.consumeNeighbourEvent("update", " ".join(ips))
+        service.stopService()
+        results = yield deferToDatabase(
+            lambda: {rdns.ip: rdns.hostname for rdns in RDNS.objects.all()})
+        self.assertThat(results, Equals({ip: hostname for ip in ips}))
+
     @wait_for(30)
     @inlineCallbacks
     def test__deletes_rdns_entry(self):
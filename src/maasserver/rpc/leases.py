@@ -5,17 +5,21 @@
 
 __all__ = [
     "update_lease",
+    "update_leases",
 ]
 
+from collections import defaultdict
 from datetime import datetime
 
 from maasserver.enum import (
     IPADDRESS_FAMILY,
     IPADDRESS_TYPE,
+    IPRANGE_TYPE,
 )
 from maasserver.models import (
     DNSResource,
     Interface,
+    IPRange,
     Node,
     StaticIPAddress,
     Subnet,
@@ -88,8 +92,83 @@ def update_lease(
     subnet = Subnet.objects.get_best_subnet_for_ip(ip)
     if subnet is None:
         raise LeaseUpdateError("No subnet exists for: %s" % ip)
+    _check_subnet_family(subnet, ip_family)
+    _log_lease(action, mac, ip, timestamp, lease_time, hostname)
 
-    # Check that the subnet family is the same.
+    # We will recieve actions on all addresses in the subnet. We only want
+    # to update the addresses in the dynamic range.
+    dynamic_range = subnet.get_dynamic_range_for_ip(IPAddress(ip))
+    if dynamic_range is None:
+        # Do nothing.
+        return {}
+
+    interfaces = list(Interface.objects.filter(mac_address=mac))
+    _apply_lease(
+        subnet, interfaces, action, mac, ip, timestamp, lease_time, hostname)
+    return {}
+
+
+@synchronous
+@transactional
+def update_leases(updates):
+    """Update a batch of DHCP leases from a cluster.
+
+    :param updates: A list of dicts, each with the arguments to
+        `update_lease`, as found in
+        :py:class`~provisioningserver.rpc.region.UpdateLeases`.
+
+    The updates are applied in order in a single transaction. The subnets,
+    dynamic ranges and interfaces for the whole batch are found up-front
+    with one query each, instead of once per lease. An update that
+    `update_lease` would reject is logged and skipped so that it cannot
+    hold up the rest of the batch.
+    """
+    subnets = Subnet.objects.get_best_subnets_for_ips(
+        update["ip"] for update in updates)
+    dynamic_ranges = defaultdict(list)
+    for iprange in IPRange.objects.filter(
+            type=IPRANGE_TYPE.DYNAMIC,
+            subnet_id__in={subnet.id for subnet in subnets.values()}):
+        dynamic_ranges[iprange.subnet_id].append(iprange.netaddr_iprange)
+    interfaces_by_mac = defaultdict(list)
+    for interface in Interface.objects.filter(
+            mac_address__in={update["mac"] for update in updates}):
+        interfaces_by_mac[str(interface.mac_address).lower()].append(
+            interface)
+
+    for update in updates:
+        action, mac, ip = update["action"], update["mac"], update["ip"]
+        timestamp = update["timestamp"]
+        lease_time = update.get("lease_time")
+        hostname = update.get("hostname")
+        subnet = subnets.get(ip)
+        try:
+            if action not in ["commit", "expiry", "release"]:
+                raise LeaseUpdateError("Unknown lease action: %s" % action)
+            if subnet is None:
+                raise LeaseUpdateError("No subnet exists for: %s" % ip)
+            _check_subnet_family(subnet, update["ip_family"])
+        except LeaseUpdateError as error:
+            log.msg("Lease update ignored: %s" % error)
+            continue
+        _log_lease(action, mac, ip, timestamp, lease_time, hostname)
+
+        # We will recieve actions on all addresses in the subnet. We only
+        # want to update the addresses in the dynamic range.
+        address = IPAddress(ip)
+        if not any(
+                address in iprange for iprange in dynamic_ranges[subnet.id]):
+            continue
+
+        interfaces = interfaces_by_mac[mac.lower()]
+        interfaces[:] = _apply_lease(
+            subnet, interfaces, action, mac, ip, timestamp, lease_time,
+            hostname)
+    return {}
+
+
+def _check_subnet_family(subnet, ip_family):
+    """Raise `LeaseUpdateError` if `subnet` is not in `ip_family`."""
     subnet_family = subnet.get_ipnetwork().version
     if ip_family == "ipv4" and subnet_family != IPADDRESS_FAMILY.IPv4:
         raise LeaseUpdateError(
@@ -98,6 +177,8 @@ def update_lease(
         raise LeaseUpdateError(
             "Family for the subnet does not match. Expected: %s" % ip_family)
 
+
+def _log_lease(action, mac, ip, timestamp, lease_time, hostname):
     created = datetime.fromtimestamp(timestamp)
     log.msg("Lease update: %s for %s on %s at %s%s%s" % (
         action, ip, mac, created,
@@ -105,14 +186,17 @@ def update_lease(
         ' (hostname: %s)' % hostname if _is_valid_hostname(hostname) else ''
     ))
 
-    # We will recieve actions on all addresses in the subnet. We only want
-    # to update the addresses in the dynamic range.
-    dynamic_range = subnet.get_dynamic_range_for_ip(IPAddress(ip))
-    if dynamic_range is None:
-        # Do nothing.
-        return {}
 
-    interfaces = list(Interface.objects.filter(mac_address=mac))
+def _apply_lease(
+        subnet, interfaces, action, mac, ip, timestamp, lease_time, hostname):
+    """Apply a lease to the DISCOVERED addresses of `interfaces`.
+
+    :return: The interfaces the lease was applied to. This includes a new
+        `UnknownInterface` when a MAC address unknown to MAAS is given an IP
+        address.
+    """
+    subnet_family = subnet.get_ipnetwork().version
+    created = datetime.fromtimestamp(timestamp)
     if len(interfaces) == 0 and action == "commit":
         # A MAC address that is unknown to MAAS was given an IP address. Create
         # an unknown interface for this lease.
@@ -122,7 +206,7 @@ def update_lease(
         interfaces = [unknown_interface]
     elif len(interfaces) == 0:
         # No interfaces and not commit action so nothing needs to be done.
-        return {}
+        return interfaces
 
     sip = None
     # Delete all discovered IP addresses attached to all interfaces of the same
@@ -187,4 +271,4 @@ def update_lease(
             sip.save()
         for interface in interfaces:
             interface.ip_addresses.add(sip)
-    return {}
+    return interfaces
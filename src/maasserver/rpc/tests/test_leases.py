@@ -20,6 +20,7 @@ from maasserver.models.staticipaddress import StaticIPAddress
 from maasserver.rpc.leases import (
     LeaseUpdateError,
     update_lease,
+    update_leases,
 )
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
@@ -27,6 +28,7 @@ from maasserver.utils.orm import (
     get_one,
     reload_object,
 )
+from maastesting.djangotestcase import count_queries
 from netaddr import IPAddress
 from testtools.matchers import (
     Contains,
@@ -381,3 +383,83 @@ class TestUpdateLease(MAASServerTestCase):
         self.assertItemsEqual(
             [boot_interface.id],
             sip.interface_set.values_list("id", flat=True))
+
+
+class TestUpdateLeases(MAASServerTestCase):
+
+    def make_update(self, subnet, action="commit", mac=None):
+        dynamic_range = subnet.get_dynamic_ranges()[0]
+        if mac is None:
+            mac = factory.make_mac_address()
+        return {
+            "action": action,
+            "mac": mac,
+            "ip": factory.pick_ip_in_IPRange(dynamic_range),
+            "ip_family": "ipv4",
+            "timestamp": int(time.time()),
+            "lease_time": random.randint(30, 1000),
+            "hostname": factory.make_name("host"),
+        }
+
+    def make_managed_subnet(self):
+        return factory.make_ipv4_Subnet_with_IPRanges(
+            with_static_range=False, dhcp_on=True)
+
+    def test_applies_all_updates(self):
+        subnet = self.make_managed_subnet()
+        node = factory.make_Node_with_Interface_on_Subnet(subnet=subnet)
+        boot_interface = node.get_boot_interface()
+        known = self.make_update(subnet, mac=boot_interface.mac_address)
+        unknown = self.make_update(subnet)
+        update_leases([known, unknown])
+        sip = StaticIPAddress.objects.get(
+            alloc_type=IPADDRESS_TYPE.DISCOVERED, ip=known["ip"])
+        self.assertItemsEqual(
+            [boot_interface.id],
+            sip.interface_set.values_list("id", flat=True))
+        unknown_interface = UnknownInterface.objects.get(
+            mac_address=unknown["mac"])
+        self.assertItemsEqual(
+            [unknown["ip"]],
+            unknown_interface.ip_addresses.values_list("ip", flat=True))
+
+    def test_applies_updates_in_order(self):
+        subnet = self.make_managed_subnet()
+        commit = self.make_update(subnet)
+        expiry = dict(commit, action="expiry")
+        update_leases([commit, expiry])
+        unknown_interface = UnknownInterface.objects.get(
+            mac_address=commit["mac"])
+        self.assertItemsEqual(
+            [None],
+            unknown_interface.ip_addresses.values_list("ip", flat=True))
+
+    def test_skips_invalid_updates(self):
+        subnet = self.make_managed_subnet()
+        invalid = self.make_update(subnet, action=factory.make_name("action"))
+        no_subnet = dict(
+            self.make_update(subnet), ip=factory.make_ipv4_address())
+        valid = self.make_update(subnet)
+        update_leases([invalid, no_subnet, valid])
+        self.assertIsNotNone(
+            StaticIPAddress.objects.filter(
+                alloc_type=IPADDRESS_TYPE.DISCOVERED,
+                ip=valid["ip"]).first())
+
+    def test_ignores_addresses_outside_dynamic_range(self):
+        subnet = self.make_managed_subnet()
+        update = self.make_update(subnet)
+        subnet.get_dynamic_ranges().delete()
+        update_leases([update])
+        self.assertIsNone(
+            StaticIPAddress.objects.filter(
+                alloc_type=IPADDRESS_TYPE.DISCOVERED,
+                ip=update["ip"]).first())
+
+    def test_queries_are_constant_for_batch_lookups(self):
+        subnet = self.make_managed_subnet()
+        updates = [
+            self.make_update(subnet, action="expiry") for _ in range(3)]
+        count_one, _ = count_queries(update_leases, updates[:1])
+        count_many, _ = count_queries(update_leases, updates)
+        self.assertEqual(count_one, count_many)
@@ -0,0 +1,216 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""In-memory longest-prefix-match index of subnets.
+
+`SubnetManager.get_best_subnet_for_ip` is called for every lease update,
+every boot configuration request, and from many other places. Rather than
+query the database each time, each region process keeps an index of all
+subnets. The index is rebuilt in the background whenever the
+`sys_subnet_index` triggers report that a subnet, or DHCP on a VLAN, has
+changed.
+"""
+
+__all__ = [
+    "SubnetIndex",
+    "subnet_index_cache",
+]
+
+import threading
+
+from django.db import transaction
+from maasserver.utils.orm import transactional
+from maasserver.utils.threads import deferToDatabase
+from netaddr import (
+    IPAddress,
+    IPNetwork,
+)
+from provisioningserver.logger import LegacyLogger
+from twisted.internet import reactor
+
+
+log = LegacyLogger()
+
+
+class SubnetIndex:
+    """Longest-prefix-match index over a set of subnets.
+
+    Subnets are grouped into tables by IP version, VLAN DHCP status and
+    prefix length, each keyed by network address, so a lookup costs one
+    dictionary probe per distinct prefix length. Tables are probed in the
+    order used by `SubnetManager.find_best_subnet_for_ip_query`: subnets on
+    VLANs with DHCP enabled first, and then the most specific.
+    """
+
+    def __init__(self, field_names, rows):
+        """Build the index.
+
+        :param field_names: The names of the `Subnet` fields in each row.
+        :param rows: Tuples of field values, as named by `field_names`, each
+            followed by the `dhcp_on` flag of the subnet's VLAN.
+        """
+        self.field_names = tuple(field_names)
+        cidr_index = self.field_names.index("cidr")
+        tables = {}
+        count = 0
+        for row in rows:
+            values, dhcp_on = tuple(row[:-1]), row[-1]
+            network = IPNetwork(values[cidr_index])
+            width = 32 if network.version == 4 else 128
+            if network.prefixlen == width:
+                # PostgreSQL's << operator looks for strict containment, so
+                # an address is never found in a /32 or /128 subnet.
+                continue
+            shift = width - network.prefixlen
+            key = network.version, dhcp_on, network.prefixlen
+            tables.setdefault(key, {})[network.first >> shift] = values
+            count += 1
+        self.tables = {4: [], 6: []}
+        for (version, dhcp_on, prefixlen), table in sorted(
+                tables.items(), key=lambda item: (
+                    not item[0][1], -item[0][2])):
+            width = 32 if version == 4 else 128
+            self.tables[version].append((width - prefixlen, table))
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, ip):
+        """Return the field values of the best subnet for `ip`, or `None`.
+
+        Mutable values are copied, so callers may change them freely.
+        """
+        ip = IPAddress(ip)
+        if ip.is_ipv4_mapped():
+            ip = ip.ipv4()
+        value = int(ip)
+        for shift, table in self.tables[ip.version]:
+            values = table.get(value >> shift)
+            if values is not None:
+                return tuple(
+                    list(field) if isinstance(field, list) else field
+                    for field in values)
+        return None
+
+
+class SubnetIndexCache:
+    """The `SubnetIndex` for this process, kept current by notifications.
+
+    The index is only used while the `PostgresListenerService` passed to
+    `listen` is connected, and never by a transaction that has changed a
+    subnet or VLAN but not yet committed; callers must fall back to the
+    database when `get_index` returns `None`.
+    """
+
+    channel = "sys_subnet_index"
+
+    def __init__(self):
+        super(SubnetIndexCache, self).__init__()
+        self.lock = threading.Lock()
+        self.index = None
+        # The listener connection that was current when `index` was built.
+        self.connection = None
+        self.generation = 0
+        self.listener = None
+        self.building = False
+        self.rebuildPending = False
+
+    def listen(self, listener):
+        """Keep the index current using notifications from `listener`.
+
+        Only the first listener in a process is used.
+        """
+        if self.listener is None:
+            self.listener = listener
+            listener.register(self.channel, self.subnetsChanged)
+
+    def subnetsChanged(self, channel, payload):
+        """Called when the `sys_subnet_index` message is received."""
+        self.invalidate()
+        self.scheduleRebuild()
+
+    def invalidate(self):
+        """Discard the current index."""
+        with self.lock:
+            self.index = None
+            self.connection = None
+            self.generation += 1
+
+    def invalidateOnCommit(self):
+        """Discard the current index, and again when this transaction commits.
+
+        Until then, `get_index` returns `None` in this transaction.
+        """
+        self.invalidate()
+        transaction.on_commit(self.invalidate)
+
+    def get_index(self):
+        """Return the current `SubnetIndex`, or `None` if it cannot be used.
+
+        If there is no usable index but one could be built, a rebuild is
+        requested.
+        """
+        listener = self.listener
+        if listener is None or self._hasUncommittedChanges():
+            return None
+        with self.lock:
+            index, connection = self.index, self.connection
+        if index is not None and listener.connection is connection:
+            return index
+        if listener.connected():
+            reactor.callFromThread(self.requestRebuild)
+        return None
+
+    def _hasUncommittedChanges(self):
+        connection = transaction.get_connection()
+        return any(
+            func == self.invalidate
+            for _, func in connection.run_on_commit)
+
+    def requestRebuild(self):
+        """Rebuild the index if it is missing or stale."""
+        if (self.index is not None and
+                self.listener.connection is not self.connection):
+            # The listener has reconnected since the index was built, so
+            # notifications may have been missed.
+            self.invalidate()
+        if self.index is None and not self.building:
+            self.scheduleRebuild()
+
+    def scheduleRebuild(self):
+        """Rebuild the index, or do so again once a rebuild has finished."""
+        if self.building:
+            self.rebuildPending = True
+        else:
+            self.building = True
+            d = deferToDatabase(self._build)
+            d.addCallback(
+                self._install, self.generation, self.listener.connection)
+            d.addErrback(log.err, "Failed to build the subnet index.")
+            d.addBoth(self._built)
+
+    @transactional
+    def _build(self):
+        # Import here to avoid circular imports.
+        from maasserver.models.subnet import Subnet
+        field_names = [
+            field.attname for field in Subnet._meta.concrete_fields]
+        rows = Subnet.objects.values_list(*field_names, "vlan__dhcp_on")
+        return SubnetIndex(field_names, rows)
+
+    def _install(self, index, generation, connection):
+        with self.lock:
+            # Only install the index if nothing changed while it was built.
+            if generation == self.generation and connection is not None:
+                self.index = index
+                self.connection = connection
+
+    def _built(self, _):
+        self.building = False
+        if self.rebuildPending:
+            self.rebuildPending = False
+            self.scheduleRebuild()
+
+
+subnet_index_cache = SubnetIndexCache()
@@ -7,6 +7,7 @@ __all__ = []
 
 from datetime import datetime
 from email.utils import format_datetime
+import hashlib
 import http.client
 from io import BytesIO
 import json
@@ -46,6 +47,7 @@ from maasserver.bootresources import (
     BootResourceStore,
     download_all_boot_resources,
     download_boot_resources,
+    get_byte_range,
     get_simplestream_endpoint,
     set_global_default_releases,
     SimpleStreamsHandler,
@@ -61,6 +63,7 @@ from maasserver.enum import (
     BOOT_RESOURCE_TYPE,
     COMPONENT,
 )
+from maasserver.largefile_cache import LargeFileCache
 from maasserver.listener import PostgresListenerService
 from maasserver.models import (
     BootResource,
@@ -163,6 +166,41 @@ class TestHelpers(MAASServerTestCase):
         self.assertEqual([], endpoint['selections'])
 
 
+class TestGetByteRange(MAASTestCase):
+    """Tests for `get_byte_range`."""
+
+    scenarios = (
+        ("none", {"header": None, "expected": None}),
+        ("first_last", {"header": "bytes=10-19", "expected": (10, 10)}),
+        ("first", {"header": "bytes=90-", "expected": (90, 10)}),
+        ("suffix", {"header": "bytes=-15", "expected": (85, 15)}),
+        ("long_suffix", {"header": "bytes=-150", "expected": (0, 100)}),
+        ("past_end", {"header": "bytes=50-150", "expected": (50, 50)}),
+        ("other_unit", {"header": "items=0-9", "expected": None}),
+        ("multiple", {"header": "bytes=0-9,20-29", "expected": None}),
+        ("backwards", {"header": "bytes=9-0", "expected": None}),
+        ("garbage", {"header": "bytes=a-b", "expected": None}),
+        ("empty", {"header": "bytes=-", "expected": None}),
+    )
+
+    def test_returns_range(self):
+        self.assertEqual(self.expected, get_byte_range(self.header, 100))
+
+
+class TestGetByteRangeUnsatisfiable(MAASTestCase):
+    """Tests for `get_byte_range` with ranges that cannot be satisfied."""
+
+    scenarios = (
+        ("at_end", {"header": "bytes=100-", "size": 100}),
+        ("empty_suffix", {"header": "bytes=-0", "size": 100}),
+        ("empty_content", {"header": "bytes=-10", "size": 0}),
+    )
+
+    def test_raises_ValueError(self):
+        self.assertRaises(
+            ValueError, get_byte_range, self.header, self.size)
+
+
 class SimplestreamsEnvFixture(Fixture):
     """Clears the env variables set by the methods that interact with
     simplestreams."""
@@ -515,6 +553,11 @@ class TestConnectionWrapper(MAASTransactionServerTestCase):
     the actual content, the transaction to create the data needs be committed.
     """
 
+    def setUp(self):
+        super(TestConnectionWrapper, self).setUp()
+        # Read every download from the database.
+        self.patch(bootresources, "get_largefile_cache").return_value = None
+
     def make_file_for_client(self):
         # Set up the database information inside of a transaction. This is
         # done so the information is committed. As the new connection needs
@@ -620,6 +663,68 @@ class TestConnectionWrapper(MAASTransactionServerTestCase):
             AssertConnectionWrapper.connection.connection)
 
 
+class TestFilesHandlerWithCache(MAASTransactionServerTestCase):
+    """Tests for downloads served through the `LargeFileCache`."""
+
+    def setUp(self):
+        super(TestFilesHandlerWithCache, self).setUp()
+        self.cache = LargeFileCache(self.make_dir(), 1024 * 1024)
+        self.patch(
+            bootresources, "get_largefile_cache").return_value = self.cache
+
+    make_file_for_client = TestConnectionWrapper.make_file_for_client
+
+    def read_response(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_download_copies_file_into_cache(self):
+        content, url = self.make_file_for_client()
+        response = MAASSensibleClient().get(url)
+        self.assertEqual(http.client.OK, response.status_code)
+        self.assertEqual("bytes", response["Accept-Ranges"])
+        self.assertEqual(content, self.read_response(response))
+        sha256 = hashlib.sha256(content).hexdigest()
+        with open(self.cache.get_path(sha256), "rb") as stream:
+            self.assertEqual(content, stream.read())
+
+    def test_download_reads_cached_file(self):
+        content, url = self.make_file_for_client()
+        client = MAASSensibleClient()
+        self.read_response(client.get(url))
+        mock_get_new_connection = self.patch(
+            bootresources.ConnectionWrapper, '_get_new_connection')
+        response = client.get(url)
+        self.assertEqual(content, self.read_response(response))
+        self.assertThat(mock_get_new_connection, MockNotCalled())
+
+    def test_download_range_of_cached_file(self):
+        content, url = self.make_file_for_client()
+        client = MAASSensibleClient()
+        self.read_response(client.get(url))
+        response = client.get(url, HTTP_RANGE="bytes=100-199")
+        self.assertEqual(http.client.PARTIAL_CONTENT, response.status_code)
+        self.assertEqual(
+            "bytes 100-199/%d" % len(content), response["Content-Range"])
+        self.assertEqual("100", response["Content-Length"])
+        self.assertEqual(content[100:200], self.read_response(response))
+
+    def test_download_range_of_uncached_file_sends_whole_file(self):
+        content, url = self.make_file_for_client()
+        response = MAASSensibleClient().get(url, HTTP_RANGE="bytes=100-199")
+        self.assertEqual(http.client.OK, response.status_code)
+        self.assertEqual(content, self.read_response(response))
+
+    def test_download_unsatisfiable_range(self):
+        content, url = self.make_file_for_client()
+        response = MAASSensibleClient().get(
+            url, HTTP_RANGE="bytes=%d-" % len(content))
+        self.assertEqual(
+            http.client.REQUESTED_RANGE_NOT_SATISFIABLE,
+            response.status_code)
+        self.assertEqual(
+            "bytes */%d" % len(content), response["Content-Range"])
+
+
 def make_product(ftype=None, kflavor=None, subarch=None):
     """Make product dictionary that is just like the one provided
     from simplsetreams."""
@@ -968,6 +1073,28 @@ class TestBootResourceStore(MAASServerTestCase):
         self.assertEqual(rfile.largefile.size, len(written_data))
         self.assertEqual(rfile.largefile.size, rfile.largefile.total_size)
 
+    def test_write_content_thread_commits_per_commit_size(self):
+        store = BootResourceStore()
+        store.read_size = 1024
+        store.commit_size = 4 * 1024
+        size = int(2.5 * store.commit_size)
+        rfile, reader, content = make_boot_resource_file_with_stream(size=size)
+        saved_sizes = []
+        save = LargeFile.save
+
+        def record_save(largefile, *args, **kwargs):
+            saved_sizes.append(largefile.size)
+            return save(largefile, *args, **kwargs)
+
+        self.patch(LargeFile, "save", record_save)
+        store.write_content_thread(rfile.id, reader)
+        with rfile.largefile.content.open('rb') as stream:
+            written_data = stream.read()
+        self.assertEqual(content, written_data)
+        # The size is reset once, then saved once per commit.
+        self.assertEqual(
+            [0, store.commit_size, 2 * store.commit_size, size], saved_sizes)
+
     def test_write_content_doesnt_write_if_cancel(self):
         store = BootResourceStore()
         size = int(2.5 * store.read_size)
@@ -1408,6 +1535,38 @@ class TestBootResourceTransactional(MAASTransactionServerTestCase):
         self.assertFalse(
             BootResource.objects.filter(id=resource.id).exists())
 
+    def test_perform_write_starts_at_most_write_threads(self):
+        store = BootResourceStore()
+        store.write_threads = 2
+        store._content_to_finalize = {
+            rid: sentinel.reader for rid in range(5)}
+        mock_thread = self.patch(bootresources.threading, "Thread")
+        store.perform_write()
+        self.assertEqual(2, mock_thread.call_count)
+
+    def test_write_worker_writes_until_queue_empty(self):
+        store = BootResourceStore()
+        store._content_to_finalize = {
+            rid: sentinel.reader for rid in range(3)}
+        mock_write = self.patch(store, "write_content_thread")
+        store._write_worker()
+        self.assertEqual(3, mock_write.call_count)
+        self.assertEqual({}, store._content_to_finalize)
+
+    def test_write_worker_stops_when_cancelled(self):
+        store = BootResourceStore()
+        store._content_to_finalize = {
+            rid: sentinel.reader for rid in range(3)}
+
+        def cancel(rid, reader):
+            store._cancel_finalize = True
+
+        mock_write = self.patch(store, "write_content_thread")
+        mock_write.side_effect = cancel
+        store._write_worker()
+        self.assertEqual(1, mock_write.call_count)
+        self.assertEqual(2, len(store._content_to_finalize))
+
     def test_perform_writes_writes_all_content(self):
         with transaction.atomic():
             files = [make_boot_resource_file_with_stream() for _ in range(3)]
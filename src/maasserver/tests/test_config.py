@@ -115,6 +115,22 @@ class TestRegionConfigurationWorkerOptions(MAASTestCase):
         self.assertEqual({'num_workers': workers}, config.store)
 
 
+class TestRegionConfigurationBootResourceOptions(MAASTestCase):
+    """Tests for the boot resource options in `RegionConfiguration`."""
+
+    def test__default(self):
+        config = RegionConfiguration({})
+        self.assertEqual(20 * 1024, config.boot_resources_cache_size)
+
+    def test__set_and_get(self):
+        config = RegionConfiguration({})
+        size = random.randint(0, 100000)
+        config.boot_resources_cache_size = size
+        self.assertEqual(size, config.boot_resources_cache_size)
+        # It's also stored in the configuration database.
+        self.assertEqual({'boot_resources_cache_size': size}, config.store)
+
+
 class TestRegionConfigurationDebugOptions(MAASTestCase):
     """Tests for the debug options in `RegionConfiguration`."""
 
@@ -59,6 +59,8 @@ from provisioningserver.rpc.cluster import (
     ConfigureDHCPv4_V2,
     ConfigureDHCPv6,
     ConfigureDHCPv6_V2,
+    UpdateDHCPv4Hosts,
+    UpdateDHCPv6Hosts,
     ValidateDHCPv4Config,
     ValidateDHCPv4Config_V2,
     ValidateDHCPv6Config,
@@ -2022,6 +2024,75 @@ class TestConfigureDHCP(MAASTransactionServerTestCase):
         yield deferToDatabase(service_status_updated)
 
 
+class TestConfigureDHCPHosts(MAASTransactionServerTestCase):
+    """Tests for `configure_dhcp` sending only the changed hosts."""
+
+    create_rack_controller = TestConfigureDHCP.create_rack_controller
+
+    def setUp(self):
+        super(TestConfigureDHCPHosts, self).setUp()
+        self.patch(dhcp.settings, "DHCP_CONNECT", True)
+        self.addCleanup(dhcp._dhcp_states.clear)
+
+    @synchronous
+    def prepare_rpc(self, rack_controller):
+        """"Set up test case for speaking RPC to `rack_controller`."""
+        self.useFixture(RegionEventLoopFixture('rpc'))
+        self.useFixture(RunningEventLoopFixture())
+        fixture = self.useFixture(MockLiveRegionToClusterRPCFixture())
+        cluster = fixture.makeCluster(
+            rack_controller, ConfigureDHCPv4_V2, ConfigureDHCPv6_V2,
+            UpdateDHCPv4Hosts, UpdateDHCPv6Hosts)
+        stubs = (
+            cluster.ConfigureDHCPv4_V2, cluster.ConfigureDHCPv6_V2,
+            cluster.UpdateDHCPv4Hosts, cluster.UpdateDHCPv6Hosts)
+        for stub in stubs:
+            stub.side_effect = always_succeed_with({})
+        return stubs
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__sends_only_hosts_when_nothing_else_changed(self):
+        rack_controller, config = yield deferToDatabase(
+            self.create_rack_controller)
+        ipv4_stub, ipv6_stub, ipv4_hosts_stub, ipv6_hosts_stub = (
+            yield deferToThread(self.prepare_rpc, rack_controller))
+
+        yield dhcp.configure_dhcp(rack_controller)
+        yield dhcp.configure_dhcp(rack_controller)
+
+        self.assertEqual(1, ipv4_stub.call_count)
+        self.assertEqual(1, ipv6_stub.call_count)
+        self.assertThat(
+            ipv4_hosts_stub, MockCalledOnceWith(
+                ANY, omapi_key=config.omapi_key, fingerprint=ANY,
+                remove=[], add=[], modify=[]))
+        self.assertThat(
+            ipv6_hosts_stub, MockCalledOnceWith(
+                ANY, omapi_key=config.omapi_key, fingerprint=ANY,
+                remove=[], add=[], modify=[]))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__sends_full_configuration_when_hosts_update_fails(self):
+        rack_controller, _ = yield deferToDatabase(
+            self.create_rack_controller)
+        ipv4_stub, ipv6_stub, ipv4_hosts_stub, ipv6_hosts_stub = (
+            yield deferToThread(self.prepare_rpc, rack_controller))
+        ipv4_hosts_stub.side_effect = always_fail_with(
+            CannotConfigureDHCP("state has changed"))
+        ipv6_hosts_stub.side_effect = always_fail_with(
+            CannotConfigureDHCP("state has changed"))
+
+        yield dhcp.configure_dhcp(rack_controller)
+        yield dhcp.configure_dhcp(rack_controller)
+
+        self.assertEqual(1, ipv4_hosts_stub.call_count)
+        self.assertEqual(1, ipv6_hosts_stub.call_count)
+        self.assertEqual(2, ipv4_stub.call_count)
+        self.assertEqual(2, ipv6_stub.call_count)
+
+
 class TestValidateDHCPConfig(MAASTransactionServerTestCase):
     """Tests for `validate_dhcp_config`."""
 
@@ -18,6 +18,7 @@ from maasserver import (
     eventloop,
     ipc,
     nonces_cleanup,
+    populate_tags,
     rack_controller,
     region_controller,
     stats,
@@ -29,8 +30,10 @@ from maasserver.eventloop import (
     DEFAULT_PORT,
     MAASServices,
 )
+from maasserver.listener import PostgresListenerWorkerService
 from maasserver.prometheus.stats import PrometheusService
 from maasserver.regiondservices import (
+    event_log,
     ntp,
     service_monitor_service,
     syslog,
@@ -45,7 +48,10 @@ from maasserver.utils.orm import (
     transactional,
 )
 from maastesting.factory import factory
-from maastesting.matchers import MockCallsMatch
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockCallsMatch,
+)
 from maastesting.testcase import MAASTestCase
 from metadataserver import api_twisted
 from provisioningserver.utils.twisted import asynchronous
@@ -94,6 +100,19 @@ class TestMAASServices(MAASTestCase):
         self.assertThat(calls, MockCallsMatch(call(), call()))
         self.assertThat(services.running, Equals(1))
 
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__closes_tag_evaluator_when_stopped(self):
+        close = self.patch(populate_tags.tag_evaluator, "close")
+        services = MAASServices(Mock())
+        service = Mock()
+        services.addService(service)
+        yield services.startService()
+        yield services.stopService()
+        self.assertThat(service.stopService, MockCalledOnceWith())
+        self.assertThat(close, MockCalledOnceWith())
+        self.assertThat(services.running, Equals(0))
+
 
 class TestRegionEventLoop(MAASTestCase):
 
@@ -509,6 +528,22 @@ class TestFactories(MAASTestCase):
         self.assertTrue(
             eventloop.loop.factories["syslog"]["only_on_master"])
 
+    def test_make_EventLogMaintenanceService(self):
+        service = eventloop.make_EventLogMaintenanceService()
+        self.assertThat(service, IsInstance(
+            event_log.EventLogMaintenanceService))
+        # It is registered as a factory in RegionEventLoop.
+        self.assertIs(
+            eventloop.make_EventLogMaintenanceService,
+            eventloop.loop.factories["event-log-maintenance"]["factory"])
+        # Has a no dependencies.
+        self.assertEquals(
+            [],
+            eventloop.loop.factories["event-log-maintenance"]["requires"])
+        self.assertTrue(
+            eventloop.loop.factories["event-log-maintenance"][
+                "only_on_master"])
+
     def test_make_WorkersService(self):
         service = eventloop.make_WorkersService()
         self.assertThat(service, IsInstance(
@@ -527,16 +562,18 @@ class TestFactories(MAASTestCase):
             eventloop.loop.factories["workers"]["not_all_in_one"])
 
     def test_make_IPCMasterService(self):
-        service = eventloop.make_IPCMasterService()
+        listener = FakePostgresListenerService()
+        service = eventloop.make_IPCMasterService(listener)
         self.assertThat(service, IsInstance(
             ipc.IPCMasterService))
+        self.assertIs(listener, service.listener)
         # It is registered as a factory in RegionEventLoop.
         self.assertIs(
             eventloop.make_IPCMasterService,
             eventloop.loop.factories["ipc-master"]["factory"])
-        # Has a no dependencies.
+        # Has a dependency of postgres-listener.
         self.assertEquals(
-            [],
+            ["postgres-listener-master"],
             eventloop.loop.factories["ipc-master"]["requires"])
         # Has an optional dependency on workers.
         self.assertEquals(
@@ -560,6 +597,24 @@ class TestFactories(MAASTestCase):
         self.assertFalse(
             eventloop.loop.factories["ipc-worker"]["only_on_master"])
 
+    def test_make_PostgresListenerWorkerService(self):
+        ipcWorker = ipc.IPCWorkerService(sentinel.reactor)
+        service = eventloop.make_PostgresListenerWorkerService(ipcWorker)
+        self.assertThat(service, IsInstance(
+            PostgresListenerWorkerService))
+        self.assertIs(service, ipcWorker.listener)
+        # It is registered as a factory in RegionEventLoop.
+        self.assertIs(
+            eventloop.make_PostgresListenerWorkerService,
+            eventloop.loop.factories["postgres-listener-worker"]["factory"])
+        # Has a dependency of ipc-worker.
+        self.assertEquals(
+            ["ipc-worker"],
+            eventloop.loop.factories["postgres-listener-worker"]["requires"])
+        self.assertFalse(
+            eventloop.loop.factories[
+                "postgres-listener-worker"]["only_on_master"])
+
     def test_make_PrometheusExporterService(self):
         service = eventloop.make_PrometheusExporterService()
         self.assertIsInstance(service, StreamServerEndpointService)
@@ -20,6 +20,10 @@ from maasserver.ipc import (
     IPCMasterService,
     IPCWorkerService,
 )
+from maasserver.listener import (
+    PostgresListenerService,
+    PostgresListenerWorkerService,
+)
 from maasserver.models import timestampedmodel
 from maasserver.models.node import RegionController
 from maasserver.models.regioncontrollerprocess import RegionControllerProcess
@@ -43,7 +47,10 @@ from provisioningserver.utils.twisted import (
     callOut,
     DeferredValue,
 )
-from testtools.matchers import MatchesStructure
+from testtools.matchers import (
+    HasLength,
+    MatchesStructure,
+)
 from twisted.internet import reactor
 from twisted.internet.defer import (
     inlineCallbacks,
@@ -85,9 +92,11 @@ class TestIPCCommunication(MAASTransactionServerTestCase):
         self.ipc_path = os.path.join(
             self.useFixture(TempDirectory()).path, 'maas-regiond.sock')
 
-    def make_IPCMasterService(self, workers=None, run_loop=False):
+    def make_IPCMasterService(
+            self, workers=None, run_loop=False, listener=None):
         master = IPCMasterService(
-            reactor, workers=workers, socket_path=self.ipc_path)
+            reactor, workers=workers, socket_path=self.ipc_path,
+            listener=listener)
 
         if not run_loop:
             # Prevent the update loop from running.
@@ -111,8 +120,10 @@ class TestIPCCommunication(MAASTransactionServerTestCase):
         new_method.side_effect = mock_method
         return dv
 
-    def make_IPCMasterService_with_wrap(self, workers=None, run_loop=False):
-        master = self.make_IPCMasterService(workers=workers, run_loop=run_loop)
+    def make_IPCMasterService_with_wrap(
+            self, workers=None, run_loop=False, listener=None):
+        master = self.make_IPCMasterService(
+            workers=workers, run_loop=run_loop, listener=listener)
 
         dv_connected = self.wrap_async_method(master, 'registerWorker')
         dv_disconnected = self.wrap_async_method(master, 'unregisterWorker')
@@ -216,6 +227,43 @@ class TestIPCCommunication(MAASTransactionServerTestCase):
         yield disconnected.get(timeout=2)
         yield master.stopService()
 
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_worker_receives_notifications_relayed_by_master(self):
+        pid = random.randint(1, 512)
+        self.patch(os, 'getpid').return_value = pid
+        master_listener = PostgresListenerService()
+        master, connected, disconnected = (
+            self.make_IPCMasterService_with_wrap(listener=master_listener))
+        yield master.startService()
+
+        worker = IPCWorkerService(reactor, socket_path=self.ipc_path)
+        worker_listener = PostgresListenerWorkerService(worker)
+        channel = factory.make_name("sys_")
+        received = DeferredValue()
+        worker_listener.register(
+            channel, lambda *notification: received.set(notification))
+        yield worker.startService()
+        yield worker_listener.startService()
+
+        yield connected.get(timeout=2)
+        # Requests over IPC are answered in order, so once this has been
+        # answered the channel registered at start-up has been too.
+        yield worker.listenerRegisterChannel(channel)
+        self.assertEquals(
+            {channel}, master.connections[pid]['listener']['channels'])
+        self.assertThat(master_listener.relays, HasLength(1))
+
+        master_listener.processNotify(channel, "payload")
+        notification = yield received.get(timeout=2)
+        self.assertEquals((channel, "payload"), notification)
+
+        yield worker_listener.stopService()
+        yield worker.stopService()
+        yield disconnected.get(timeout=2)
+        self.assertEquals({}, master_listener.relays)
+        yield master.stopService()
+
     @wait_for_reactor
     @inlineCallbacks
     def test_registerWorker_sets_regiond_degraded_with_less_than_workers(self):
@@ -0,0 +1,282 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `maasserver.largefile_cache`."""
+
+__all__ = []
+
+import fcntl
+import hashlib
+import os
+from unittest.mock import Mock
+
+from maasserver import largefile_cache
+from maasserver.largefile_cache import (
+    get_largefile_cache,
+    LargeFileCache,
+    LargeFileCacheError,
+)
+from maasserver.testing.config import RegionConfigurationFixture
+from maastesting.factory import factory
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockNotCalled,
+)
+from maastesting.testcase import MAASTestCase
+from maastesting.utils import age_file
+from testtools.matchers import HasLength
+
+
+class FakeLargeFile:
+
+    def __init__(self, content):
+        self.sha256 = hashlib.sha256(content).hexdigest()
+        self.total_size = len(content)
+
+
+class FakeContent:
+    """Stands in for a `ConnectionWrapper`."""
+
+    def __init__(self, content, block_size=1024):
+        self.blocks = [
+            content[offset:offset + block_size]
+            for offset in range(0, len(content), block_size)
+        ]
+        self.close = Mock()
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+
+class TestLargeFileCache(MAASTestCase):
+
+    def make_cache(self, max_size=1024 * 1024):
+        cache = LargeFileCache(self.make_dir(), max_size)
+        cache.block_size = 1024
+        cache.poll_interval = 0.01
+        return cache
+
+    def make_content(self, size=4000):
+        content = factory.make_bytes(size)
+        return content, FakeLargeFile(content)
+
+    def populate(self, cache, content):
+        largefile = FakeLargeFile(content)
+        with open(cache.get_path(largefile.sha256), "wb") as stream:
+            stream.write(content)
+        return largefile
+
+    def test_read_returns_None_when_not_cached(self):
+        cache = self.make_cache()
+        content, largefile = self.make_content()
+        self.assertIsNone(cache.read(largefile))
+
+    def test_read_returns_cached_content(self):
+        cache = self.make_cache()
+        content = factory.make_bytes(4000)
+        largefile = self.populate(cache, content)
+        self.assertEqual(content, b"".join(cache.read(largefile)))
+
+    def test_read_returns_range(self):
+        cache = self.make_cache()
+        content = factory.make_bytes(4000)
+        largefile = self.populate(cache, content)
+        self.assertEqual(
+            content[1000:3500], b"".join(cache.read(largefile, 1000, 2500)))
+
+    def test_read_marks_file_as_recently_used(self):
+        cache = self.make_cache()
+        largefile = self.populate(cache, factory.make_bytes(4000))
+        path = cache.get_path(largefile.sha256)
+        age_file(path, 3600)
+        mtime = os.stat(path).st_mtime
+        cache.read(largefile)
+        self.assertGreater(os.stat(path).st_mtime, mtime)
+
+    def test_read_discards_file_of_wrong_size(self):
+        cache = self.make_cache()
+        content, largefile = self.make_content()
+        path = cache.get_path(largefile.sha256)
+        with open(path, "wb") as stream:
+            stream.write(content[:-1])
+        self.assertIsNone(cache.read(largefile))
+        self.assertFalse(os.path.exists(path))
+
+    def test_read_discards_corrupt_file(self):
+        cache = self.make_cache()
+        content = factory.make_bytes(4000)
+        largefile = self.populate(cache, content)
+        path = cache.get_path(largefile.sha256)
+        with open(path, "r+b") as stream:
+            stream.write(bytes([content[0] ^ 0xff]))
+        self.assertRaises(LargeFileCacheError, b"".join, cache.read(largefile))
+        self.assertFalse(os.path.exists(path))
+
+    def test_fetch_copies_content_into_cache(self):
+        cache = self.make_cache()
+        content, largefile = self.make_content()
+        source = FakeContent(content)
+        self.assertEqual(content, b"".join(cache.fetch(largefile, source)))
+        self.assertThat(source.close, MockCalledOnceWith())
+        with open(cache.get_path(largefile.sha256), "rb") as stream:
+            self.assertEqual(content, stream.read())
+        self.assertFalse(
+            os.path.exists(cache.get_path(largefile.sha256, ".partial")))
+
+    def test_fetch_reads_cached_content(self):
+        cache = self.make_cache()
+        content = factory.make_bytes(4000)
+        largefile = self.populate(cache, content)
+        source = Mock()
+        self.assertEqual(content, b"".join(cache.fetch(largefile, source)))
+        self.assertThat(source.close, MockCalledOnceWith())
+
+    def test_fetch_follows_copy_in_progress(self):
+        cache = self.make_cache()
+        content, largefile = self.make_content()
+        copy = cache.fetch(largefile, FakeContent(content))
+        copied = [next(copy)]
+        follow = cache.fetch(largefile, FakeContent(content))
+        followed = [next(follow)]
+        copied.extend(copy)
+        followed.extend(follow)
+        self.assertEqual(content, b"".join(copied))
+        self.assertEqual(content, b"".join(followed))
+
+    def test_fetch_discards_copy_with_wrong_checksum(self):
+        cache = self.make_cache()
+        content, largefile = self.make_content()
+        source = FakeContent(factory.make_bytes(len(content)))
+        self.assertRaises(
+            LargeFileCacheError, list, cache.fetch(largefile, source))
+        self.assertEqual(
+            [largefile.sha256 + ".lock"], os.listdir(cache.path))
+
+    def test_fetch_discards_unfinished_copy(self):
+        cache = self.make_cache()
+        content, largefile = self.make_content()
+        copy = cache.fetch(largefile, FakeContent(content))
+        next(copy)
+        copy.close()
+        self.assertEqual(
+            [largefile.sha256 + ".lock"], os.listdir(cache.path))
+
+    def test_fetch_follower_fails_when_copy_is_abandoned(self):
+        cache = self.make_cache()
+        content, largefile = self.make_content()
+        copy = cache.fetch(largefile, FakeContent(content))
+        next(copy)
+        follow = cache.fetch(largefile, FakeContent(content))
+        next(follow)
+        copy.close()
+        self.assertRaises(LargeFileCacheError, list, follow)
+
+    def test_evict_removes_least_recently_used_files(self):
+        cache = self.make_cache(max_size=8000)
+        largefiles = [
+            self.populate(cache, factory.make_bytes(4000))
+            for _ in range(3)
+        ]
+        for age, largefile in zip((30, 20, 10), largefiles):
+            age_file(cache.get_path(largefile.sha256), age)
+        cache.evict()
+        self.assertItemsEqual(
+            [largefile.sha256 for largefile in largefiles[1:]],
+            os.listdir(cache.path))
+
+    def test_evict_removes_abandoned_copies(self):
+        cache = self.make_cache()
+        content, largefile = self.make_content()
+        partial = cache.get_path(largefile.sha256, ".partial")
+        with open(partial, "wb") as stream:
+            stream.write(content[:1000])
+        age_file(partial, cache.abandoned_after + 60)
+        cache.evict()
+        self.assertFalse(os.path.exists(partial))
+
+    def test_evict_removes_locks_of_evicted_files(self):
+        cache = self.make_cache(max_size=4000)
+        largefiles = [
+            self.populate(cache, factory.make_bytes(4000))
+            for _ in range(2)
+        ]
+        for largefile in largefiles:
+            os.close(cache._lock(largefile.sha256))
+        age_file(cache.get_path(largefiles[0].sha256), 30)
+        cache.evict()
+        self.assertItemsEqual(
+            [largefiles[1].sha256, largefiles[1].sha256 + ".lock"],
+            os.listdir(cache.path))
+
+    def test_evict_removes_locks_of_failed_copies(self):
+        cache = self.make_cache()
+        content, largefile = self.make_content()
+        list(cache.fetch(largefile, FakeContent(content[:1000])))
+        cache.evict()
+        self.assertEqual([], os.listdir(cache.path))
+
+    def test_evict_keeps_locks_of_copies_in_progress(self):
+        cache = self.make_cache()
+        content, largefile = self.make_content()
+        copy = cache.fetch(largefile, FakeContent(content))
+        next(copy)
+        cache.evict()
+        self.assertItemsEqual(
+            [largefile.sha256 + ".partial", largefile.sha256 + ".lock"],
+            os.listdir(cache.path))
+        copy.close()
+
+    def test_evict_keeps_locks_that_are_held(self):
+        cache = self.make_cache()
+        lock = cache._lock(factory.make_name("sha256"))
+        self.addCleanup(os.close, lock)
+        cache.evict()
+        self.assertThat(os.listdir(cache.path), HasLength(1))
+
+    def test_lock_is_retaken_when_lock_file_is_removed(self):
+        cache = self.make_cache()
+        sha256 = factory.make_name("sha256")
+        path = cache.get_path(sha256, ".lock")
+        flock, locked = fcntl.flock, []
+
+        def flock_as_lock_file_is_evicted(fd, operation):
+            if len(locked) == 0:
+                os.unlink(path)
+            locked.append(fd)
+            return flock(fd, operation)
+
+        self.patch(
+            largefile_cache.fcntl, "flock", flock_as_lock_file_is_evicted)
+        lock = cache._lock(sha256)
+        self.addCleanup(os.close, lock)
+        self.assertThat(locked, HasLength(2))
+        self.assertEqual(os.stat(path).st_ino, os.fstat(lock).st_ino)
+
+
+class TestGetLargeFileCache(MAASTestCase):
+
+    def setUp(self):
+        super(TestGetLargeFileCache, self).setUp()
+        get_largefile_cache.cache_clear()
+        self.addCleanup(get_largefile_cache.cache_clear)
+
+    def test_returns_cache_of_configured_size(self):
+        self.useFixture(RegionConfigurationFixture(
+            boot_resources_cache_size=100))
+        cache = get_largefile_cache()
+        self.assertIsInstance(cache, LargeFileCache)
+        self.assertEqual(100 * 1024 * 1024, cache.max_size)
+        self.assertTrue(os.path.isdir(cache.path))
+
+    def test_creates_cache_once(self):
+        self.useFixture(RegionConfigurationFixture(
+            boot_resources_cache_size=100))
+        cache = get_largefile_cache()
+        open_config = self.patch(largefile_cache.RegionConfiguration, "open")
+        self.assertIs(cache, get_largefile_cache())
+        self.assertThat(open_config, MockNotCalled())
+
+    def test_returns_None_when_disabled(self):
+        self.useFixture(RegionConfigurationFixture(
+            boot_resources_cache_size=0))
+        self.assertIsNone(get_largefile_cache())
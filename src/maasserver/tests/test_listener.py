@@ -22,6 +22,8 @@ from maasserver.listener import (
     PostgresListenerRegistrationError,
     PostgresListenerService,
     PostgresListenerUnregistrationError,
+    PostgresListenerWorkerService,
+    RelayedConnection,
 )
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
@@ -55,6 +57,7 @@ from twisted.internet.defer import (
     Deferred,
     DeferredQueue,
     inlineCallbacks,
+    succeed,
 )
 from twisted.logger import LogLevel
 from twisted.python.failure import Failure
@@ -597,3 +600,197 @@ class TestPostgresListenerService(MAASServerTestCase):
                 call("UNLISTEN %s_create;" % channel),
                 call("UNLISTEN %s_delete;" % channel),
                 call("UNLISTEN %s_update;" % channel)))
+
+    def test_registerRelay_adds_channel_and_relay(self):
+        listener = PostgresListenerService()
+        channel = factory.make_name("channel")
+        listener.registerRelay(channel, sentinel.relay)
+        self.assertEqual({sentinel.relay}, listener.relays[channel])
+
+    def test_registerRelay_calls_registerChannel_when_connected(self):
+        listener = PostgresListenerService()
+        listener.registeredChannels = True
+        listener.connection = sentinel.connection
+        mock_registerChannel = self.patch(listener, "registerChannel")
+        channel = factory.make_name("channel")
+        listener.registerRelay(channel, sentinel.relay)
+        self.assertThat(mock_registerChannel, MockCalledOnceWith(channel))
+
+    def test_unregisterRelay_raises_error_if_relay_not_registered(self):
+        listener = PostgresListenerService()
+        channel = factory.make_name("channel")
+        listener.registerRelay(channel, sentinel.relay)
+        with ExpectedException(PostgresListenerUnregistrationError):
+            listener.unregisterRelay(channel, sentinel.other_relay)
+
+    def test_unregisterRelay_calls_unregisterChannel_for_last_relay(self):
+        listener = PostgresListenerService()
+        channel = factory.make_name("channel")
+        listener.registerRelay(channel, sentinel.relay)
+        listener.registerRelay(channel, sentinel.other_relay)
+        listener.registeredChannels = True
+        listener.connection = sentinel.connection
+        mock_unregisterChannel = self.patch(listener, "unregisterChannel")
+        listener.unregisterRelay(channel, sentinel.relay)
+        self.assertThat(mock_unregisterChannel, MockNotCalled())
+        listener.unregisterRelay(channel, sentinel.other_relay)
+        self.assertThat(mock_unregisterChannel, MockCalledOnceWith(channel))
+        self.assertEqual({}, listener.relays)
+
+    def test_unregisterRelay_keeps_channel_with_handlers(self):
+        listener = PostgresListenerService()
+        channel = factory.make_name("channel")
+        listener.register(channel, sentinel.handler)
+        listener.registerRelay(channel, sentinel.relay)
+        listener.registeredChannels = True
+        listener.connection = sentinel.connection
+        mock_unregisterChannel = self.patch(listener, "unregisterChannel")
+        listener.unregisterRelay(channel, sentinel.relay)
+        self.assertThat(mock_unregisterChannel, MockNotCalled())
+
+    def test_unregister_keeps_channel_with_relays(self):
+        listener = PostgresListenerService()
+        channel = factory.make_name("channel")
+        listener.register(channel, sentinel.handler)
+        listener.registerRelay(channel, sentinel.relay)
+        listener.registeredChannels = True
+        listener.connection = sentinel.connection
+        mock_unregisterChannel = self.patch(listener, "unregisterChannel")
+        listener.unregister(channel, sentinel.handler)
+        self.assertThat(mock_unregisterChannel, MockNotCalled())
+
+    def test_registerChannels_includes_relayed_channels(self):
+        listener = PostgresListenerService()
+        listener.register("node", sentinel.handler)
+        listener.registerRelay("node", sentinel.relay)
+        listener.registerRelay("sys_dns", sentinel.relay)
+        mock_registerChannel = self.patch(listener, "registerChannel")
+        listener.registerChannels()
+        self.assertItemsEqual(
+            [call("node"), call("sys_dns")],
+            mock_registerChannel.call_args_list)
+
+    def test_processNotify_relays_without_queueing_relay_only_channels(self):
+        listener = PostgresListenerService()
+        relay = MagicMock()
+        listener.registerRelay("node", relay)
+        listener.processNotify("node_update", sentinel.payload)
+        self.assertThat(
+            relay, MockCalledOnceWith("node_update", sentinel.payload))
+        self.assertEqual(set(), listener.notifications)
+
+    def test_processNotify_relays_and_queues_handled_channels(self):
+        listener = PostgresListenerService()
+        relay = MagicMock()
+        listener.register("node", sentinel.handler)
+        listener.registerRelay("node", relay)
+        listener.processNotify("node_update", "payload")
+        self.assertThat(relay, MockCalledOnceWith("node_update", "payload"))
+        self.assertEqual({("node_update", "payload")}, listener.notifications)
+
+    def test_processNotify_relays_system_channel_to_all_relays(self):
+        listener = PostgresListenerService()
+        relays = [MagicMock(), MagicMock()]
+        handler = MagicMock()
+        channel = factory.make_name("sys_")
+        listener.register(channel, handler)
+        for relay in relays:
+            listener.registerRelay(channel, relay)
+        mock_unregisterChannel = self.patch(listener, "unregisterChannel")
+        listener.processNotify(channel, sentinel.payload)
+        for relay in relays:
+            self.assertThat(
+                relay, MockCalledOnceWith(channel, sentinel.payload))
+        self.assertThat(
+            handler, MockCalledOnceWith(channel, sentinel.payload))
+        self.assertThat(mock_unregisterChannel, MockNotCalled())
+
+    def test_relayConnected_calls_each_relay_once(self):
+        listener = PostgresListenerService()
+        relay = MagicMock()
+        listener.registerRelay("node", relay)
+        listener.registerRelay("sys_dns", relay)
+        listener.relayConnected()
+        self.assertThat(relay, MockCalledOnceWith(None, None))
+
+
+class FakeIPCWorkerService:
+    """Stands in for `IPCWorkerService` in `PostgresListenerWorkerService`."""
+
+    def __init__(self):
+        self.protocol = DeferredValue()
+        self.listenerRegisterChannel = MagicMock(return_value=succeed(None))
+        self.listenerUnregisterChannel = MagicMock(return_value=succeed(None))
+
+
+class TestPostgresListenerWorkerService(MAASServerTestCase):
+
+    def test_sets_itself_as_listener_on_ipc_worker(self):
+        ipcWorker = FakeIPCWorkerService()
+        listener = PostgresListenerWorkerService(ipcWorker)
+        self.assertIs(listener, ipcWorker.listener)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_tryConnection_registers_channels_once_connected_to_master(self):
+        ipcWorker = FakeIPCWorkerService()
+        listener = PostgresListenerWorkerService(ipcWorker)
+        listener.register("node", sentinel.handler)
+        d = listener.startService()
+        self.assertFalse(listener.connected())
+        self.assertThat(ipcWorker.listenerRegisterChannel, MockNotCalled())
+        ipcWorker.protocol.set(sentinel.protocol)
+        yield d
+        try:
+            self.assertTrue(listener.connected())
+            self.assertIs(sentinel.protocol, listener.connection.protocol)
+            self.assertTrue(listener.registeredChannels)
+            self.assertTrue(listener.notifier.running)
+            self.assertThat(
+                ipcWorker.listenerRegisterChannel, MockCalledOnceWith("node"))
+        finally:
+            yield listener.stopService()
+        self.assertFalse(listener.connected())
+        self.assertFalse(listener.notifier.running)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_stopping_cancels_start(self):
+        listener = PostgresListenerWorkerService(FakeIPCWorkerService())
+        listener.startService()
+        yield listener.stopService()
+        self.assertIsNone(listener.connecting)
+        self.assertFalse(listener.connected())
+
+    def test_register_asks_master_once_connected(self):
+        ipcWorker = FakeIPCWorkerService()
+        listener = PostgresListenerWorkerService(ipcWorker)
+        listener.connection = RelayedConnection(sentinel.protocol)
+        listener.registeredChannels = True
+        listener.register("node", sentinel.handler)
+        self.assertThat(
+            ipcWorker.listenerRegisterChannel, MockCalledOnceWith("node"))
+        listener.unregister("node", sentinel.handler)
+        self.assertThat(
+            ipcWorker.listenerUnregisterChannel, MockCalledOnceWith("node"))
+
+    def test_notify_processes_notification(self):
+        listener = PostgresListenerWorkerService(FakeIPCWorkerService())
+        listener.connection = RelayedConnection(sentinel.protocol)
+        listener.register("node", sentinel.handler)
+        listener.notify("node_update", "payload", 0.0)
+        self.assertEqual({("node_update", "payload")}, listener.notifications)
+
+    def test_notify_ignores_notification_when_not_connected(self):
+        listener = PostgresListenerWorkerService(FakeIPCWorkerService())
+        listener.register("node", sentinel.handler)
+        listener.notify("node_update", "payload", 0.0)
+        self.assertEqual(set(), listener.notifications)
+
+    def test_notify_replaces_connection_when_master_reconnects(self):
+        listener = PostgresListenerWorkerService(FakeIPCWorkerService())
+        connection = listener.connection = RelayedConnection(
+            sentinel.protocol)
+        listener.notify(None, None, 0.0)
+        self.assertIsNot(connection, listener.connection)
+        self.assertIs(sentinel.protocol, listener.connection.protocol)
@@ -236,6 +236,7 @@ class TestRegionMasterServiceMaker(TestServiceMaker):
             "reverse-dns",
             "ntp",
             "syslog",
+            "event-log-maintenance",
             "workers",
             "ipc-master",
         ]
@@ -334,6 +335,7 @@ class TestRegionAllInOneServiceMaker(TestServiceMaker):
             "reverse-dns",
             "ntp",
             "syslog",
+            "event-log-maintenance",
             # "workers",  Prevented in all-in-one.
             "ipc-master",
         ]
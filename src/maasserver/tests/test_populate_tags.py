@@ -5,39 +5,24 @@
 
 __all__ = []
 
-from unittest.mock import (
-    ANY,
-    call,
-    create_autospec,
-)
-
-from apiclient.creds import convert_tuple_to_string
 from django.db import transaction
 from fixtures import FakeLogger
-from maasserver import (
-    populate_tags as populate_tags_module,
-    rpc as rpc_module,
-)
+from maasserver import populate_tags as populate_tags_module
 from maasserver.models import (
     Node,
     Tag,
     tag as tag_module,
 )
-from maasserver.models.user import (
-    create_auth_token,
-    get_auth_tokens,
-    get_creds_tuple,
+from maasserver.models.nodeprobeddetails import (
+    get_probed_details as original_get_probed_details,
 )
 from maasserver.populate_tags import (
-    _do_populate_tags,
+    _record_tag_matches,
     populate_tag_for_multiple_nodes,
     populate_tags,
+    populate_tags_for_multiple_nodes,
     populate_tags_for_single_node,
-)
-from maasserver.rpc.testing.fixtures import MockLiveRegionToClusterRPCFixture
-from maasserver.testing.eventloop import (
-    RegionEventLoopFixture,
-    RunningEventLoopFixture,
+    TagEvaluator,
 )
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import (
@@ -45,16 +30,6 @@ from maasserver.testing.testcase import (
     MAASTransactionServerTestCase,
 )
 from maasserver.utils.orm import post_commit_hooks
-from maasserver.utils.threads import deferToDatabase
-from maastesting.matchers import (
-    MockCalledOnceWith,
-    MockCallsMatch,
-)
-from maastesting.twisted import (
-    always_fail_with,
-    always_succeed_with,
-    extract_result,
-)
 from metadataserver.enum import (
     RESULT_TYPE,
     SCRIPT_STATUS,
@@ -63,9 +38,10 @@ from provisioningserver.refresh.node_info_scripts import (
     LLDP_OUTPUT_NAME,
     LSHW_OUTPUT_NAME,
 )
-from provisioningserver.rpc.cluster import EvaluateTag
-from provisioningserver.rpc.common import Client
-from provisioningserver.utils.twisted import asynchronous
+from provisioningserver.tags import (
+    evaluate_tags_for_nodes,
+    ParsedDetailsCache,
+)
 from testtools.matchers import (
     HasLength,
     IsInstance,
@@ -75,7 +51,31 @@ from testtools.matchers import (
 from twisted.internet import reactor
 from twisted.internet.base import DelayedCall
 from twisted.internet.task import Clock
-from twisted.internet.threads import blockingCallFromThread
+from twisted.internet.threads import (
+    blockingCallFromThread,
+    deferToThread as original_deferToThread,
+)
+
+
+class FakeResult:
+
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+class FakePool:
+    """Stands in for a `multiprocessing.Pool` of one process."""
+
+    def __init__(self):
+        self.cache = ParsedDetailsCache()
+        self.calls = []
+
+    def apply_async(self, func, args):
+        self.calls.append(args)
+        return FakeResult(func(*args, cache=self.cache))
 
 
 def make_script_result(node, script_name=None, stdout=None, exit_status=0):
@@ -102,145 +102,8 @@ def make_lldp_result(node, stdout=None, exit_status=0):
     return make_script_result(node, LLDP_OUTPUT_NAME, stdout, exit_status)
 
 
-class TestDoPopulateTags(MAASServerTestCase):
-
-    def patch_clients(self, rack_controllers):
-        clients = [
-            create_autospec(Client, instance=True)
-            for _ in rack_controllers
-        ]
-        for rack, client in zip(rack_controllers, clients):
-            client.side_effect = always_succeed_with(None)
-            client.ident = rack.system_id
-
-        _get_clients = self.patch_autospec(
-            populate_tags_module, "getAllClients")
-        _get_clients.return_value = clients
-
-        return clients
-
-    def test__makes_calls_to_each_client_given(self):
-        rack_controllers = [factory.make_RackController() for _ in range(3)]
-        clients = self.patch_clients(rack_controllers)
-
-        tag_name = factory.make_name("tag")
-        tag_definition = factory.make_name("definition")
-        tag_nsmap_prefix = factory.make_name("prefix")
-        tag_nsmap_uri = factory.make_name("uri")
-        tag_nsmap = [{"prefix": tag_nsmap_prefix, "uri": tag_nsmap_uri}]
-
-        work = []
-        rack_creds = []
-        rack_nodes = []
-        for rack, client in zip(rack_controllers, clients):
-            creds = factory.make_name("creds")
-            rack_creds.append(creds)
-            nodes = [
-                {"system_id": factory.make_Node().system_id}
-                for _ in range(3)
-            ]
-            rack_nodes.append(nodes)
-            work.append({
-                "system_id": rack.system_id,
-                "hostname": rack.hostname,
-                "client": client,
-                "tag_name": tag_name,
-                "tag_definition": tag_definition,
-                "tag_nsmap": tag_nsmap,
-                "credentials": creds,
-                "nodes": nodes,
-            })
-
-        [d] = _do_populate_tags(work)
-
-        self.assertIsNone(extract_result(d))
-
-        for rack, client, creds, nodes in zip(
-                rack_controllers, clients, rack_creds, rack_nodes):
-            self.expectThat(client, MockCallsMatch(call(
-                EvaluateTag, tag_name=tag_name, tag_definition=tag_definition,
-                system_id=rack.system_id,
-                tag_nsmap=tag_nsmap, credentials=creds, nodes=nodes)))
-
-    def test__logs_successes(self):
-        rack_controllers = [factory.make_RackController()]
-        clients = self.patch_clients(rack_controllers)
-
-        tag_name = factory.make_name("tag")
-        tag_definition = factory.make_name("definition")
-        tag_nsmap = {}
-
-        work = []
-        for rack, client in zip(rack_controllers, clients):
-            work.append({
-                "system_id": rack.system_id,
-                "hostname": rack.hostname,
-                "client": client,
-                "tag_name": tag_name,
-                "tag_definition": tag_definition,
-                "tag_nsmap": tag_nsmap,
-                "credentials": factory.make_name("creds"),
-                "nodes": [
-                    {"system_id": factory.make_Node().system_id}
-                    for _ in range(3)
-                ],
-            })
-
-        with FakeLogger("maas") as log:
-            [d] = _do_populate_tags(work)
-            self.assertIsNone(extract_result(d))
-
-        self.assertDocTestMatches(
-            "Tag tag-... (definition-...) evaluated on rack "
-            "controller ... (...)",
-            log.output)
-
-    def test__logs_failures(self):
-        rack_controllers = [factory.make_RackController()]
-        clients = self.patch_clients(rack_controllers)
-        clients[0].side_effect = always_fail_with(
-            ZeroDivisionError("splendid day for a spot of cricket"))
-
-        tag_name = factory.make_name("tag")
-        tag_definition = factory.make_name("definition")
-        tag_nsmap = {}
-
-        work = []
-        for rack, client in zip(rack_controllers, clients):
-            work.append({
-                "system_id": rack.system_id,
-                "hostname": rack.hostname,
-                "client": client,
-                "tag_name": tag_name,
-                "tag_definition": tag_definition,
-                "tag_nsmap": tag_nsmap,
-                "credentials": factory.make_name("creds"),
-                "nodes": [
-                    {"system_id": factory.make_Node().system_id}
-                    for _ in range(3)
-                ],
-            })
-
-        with FakeLogger("maas") as log:
-            [d] = _do_populate_tags(work)
-            self.assertIsNone(extract_result(d))
-
-        self.assertDocTestMatches(
-            "Tag tag-... (definition-...) could not be evaluated ... (...): "
-            "splendid day for a spot of cricket", log.output)
-
-
-class TestPopulateTagsEndToNearlyEnd(MAASTransactionServerTestCase):
-    """Tests for populating tags on racks.
-
-    This happens when there are connected rack controllers able to carry out
-    the task.
-    """
-
-    def prepare_live_rpc(self):
-        self.useFixture(RegionEventLoopFixture("rpc"))
-        self.useFixture(RunningEventLoopFixture())
-        return self.useFixture(MockLiveRegionToClusterRPCFixture())
+class TestPopulateTagsInRegion(MAASTransactionServerTestCase):
+    """Tests for populating tags in the region."""
 
     def test__populate_tags_fails_called_in_transaction(self):
         with transaction.atomic():
@@ -248,47 +111,6 @@ class TestPopulateTagsEndToNearlyEnd(MAASTransactionServerTestCase):
             self.assertRaises(
                 transaction.TransactionManagementError, populate_tags, tag)
 
-    def test__calls_are_made_to_all_clusters(self):
-        rpc_fixture = self.prepare_live_rpc()
-        rack_controllers = [factory.make_RackController() for _ in range(3)]
-        protocols = []
-        rack_creds = []
-        for rack in rack_controllers:
-            tokens = list(get_auth_tokens(rack.owner))
-            if len(tokens) > 0:
-                # Use the latest token.
-                token = tokens[-1]
-            else:
-                token = create_auth_token(rack.owner)
-            creds = convert_tuple_to_string(get_creds_tuple(token))
-            rack_creds.append(creds)
-
-            protocol = rpc_fixture.makeCluster(rack, EvaluateTag)
-            protocol.EvaluateTag.side_effect = always_succeed_with({})
-            protocols.append(protocol)
-        tag = factory.make_Tag(populate=False)
-
-        [d] = populate_tags(tag)
-
-        # `d` is a testing-only convenience. We must wait for it to fire, and
-        # we must do that from the reactor thread.
-        wait_for_populate = asynchronous(lambda: d)
-        wait_for_populate().wait(10)
-
-        for rack, protocol, creds in zip(
-                rack_controllers, protocols, rack_creds):
-            self.expectThat(protocol.EvaluateTag, MockCalledOnceWith(
-                protocol, tag_name=tag.name, tag_definition=tag.definition,
-                system_id=rack.system_id,
-                tag_nsmap=ANY, credentials=creds, nodes=ANY))
-
-
-class TestPopulateTagsInRegion(MAASTransactionServerTestCase):
-    """Tests for populating tags in the region.
-
-    This happens when there are no rack controllers to carry out the task.
-    """
-
     def test__saving_tag_schedules_node_population(self):
         clock = self.patch(tag_module, "reactor", Clock())
 
@@ -307,17 +129,13 @@ class TestPopulateTagsInRegion(MAASTransactionServerTestCase):
             call, MatchesAll(
                 IsInstance(DelayedCall),
                 MatchesStructure.byEquality(
-                    time=0, func=deferToDatabase,
-                    args=(populate_tags, tag), kw={}),
+                    time=0, func=populate_tags, args=(tag,), kw={}),
                 first_only=True,
             ))
 
-    def test__populate_in_region_when_no_clients(self):
+    def test__populate_in_region(self):
         clock = self.patch(tag_module, "reactor", Clock())
 
-        # Ensure there are no clients.
-        self.patch(rpc_module, 'getAllClients').return_value = []
-
         with post_commit_hooks:
             node = factory.make_Node()
             # Make a Tag by hand to trigger normal node population handling
@@ -333,6 +151,70 @@ class TestPopulateTagsInRegion(MAASTransactionServerTestCase):
         # The tag's node set has been updated.
         self.assertItemsEqual([node], tag.node_set.all())
 
+    def test__populate_tags_evaluates_outside_of_transactions(self):
+        with transaction.atomic():
+            nodes = [factory.make_Node() for _ in range(2)]
+            make_lshw_result(nodes[0], b"<foo/>")
+            tag = factory.make_Tag("foo", "/foo", populate=False)
+        deferToThread = self.patch(populate_tags_module, "deferToThread")
+        deferToThread.side_effect = original_deferToThread
+        populate_tags(tag)
+        self.assertIn(
+            evaluate_tags_for_nodes,
+            [args[0] for args, _ in deferToThread.call_args_list])
+        with transaction.atomic():
+            self.assertItemsEqual([nodes[0]], tag.node_set.all())
+
+    def test__populate_tags_evaluates_in_pool_outside_of_transactions(self):
+        with transaction.atomic():
+            nodes = [factory.make_Node() for _ in range(4)]
+            make_lshw_result(nodes[0], b"<foo/>")
+            tag = factory.make_Tag("foo", "/foo", populate=False)
+        evaluator = TagEvaluator(2)
+        evaluator.pools = [FakePool() for _ in range(2)]
+        deferToThread = self.patch(populate_tags_module, "deferToThread")
+        deferToThread.side_effect = original_deferToThread
+        with transaction.atomic():
+            matches = evaluator.evaluateOutsideTransaction(
+                [tag.definition], nodes, batch_size=2).wait(5)
+        self.assertEqual(
+            {nodes[0]: [0], nodes[1]: [], nodes[2]: [], nodes[3]: []},
+            matches)
+        self.assertIn(
+            evaluator._evaluateInPool,
+            [args[0] for args, _ in deferToThread.call_args_list])
+
+
+class TestRecordTagMatches(MAASServerTestCase):
+
+    def test_records_matching_nodes(self):
+        nodes = [factory.make_Node() for _ in range(2)]
+        tag = factory.make_Tag("foo", "/foo", populate=False)
+        _record_tag_matches(tag.id, "/foo", {nodes[0]: [0], nodes[1]: []})
+        self.assertItemsEqual([nodes[0]], tag.node_set.all())
+
+    def test_ignores_deleted_nodes(self):
+        nodes = [factory.make_Node() for _ in range(2)]
+        tag = factory.make_Tag("foo", "/foo", populate=False)
+        matches = {node: [0] for node in nodes}
+        Node.objects.filter(id=nodes[1].id).delete()
+        _record_tag_matches(tag.id, "/foo", matches)
+        self.assertItemsEqual([nodes[0]], tag.node_set.all())
+
+    def test_ignores_redefined_tag(self):
+        node = factory.make_Node()
+        tag = factory.make_Tag("foo", "/bar", populate=False)
+        _record_tag_matches(tag.id, "/foo", {node: [0]})
+        self.assertItemsEqual([], tag.node_set.all())
+
+    def test_ignores_deleted_tag(self):
+        node = factory.make_Node()
+        tag = factory.make_Tag("foo", "/foo", populate=False)
+        tag_id = tag.id
+        tag.delete()
+        _record_tag_matches(tag_id, "/foo", {node: [0]})
+        self.assertItemsEqual([], node.tags.all())
+
 
 class TestPopulateTagsForSingleNode(MAASServerTestCase):
 
@@ -384,3 +266,106 @@ class TestPopulateTagForMultipleNodes(MAASServerTestCase):
         self.assertItemsEqual(
             [node.hostname for node in nodes[0:2]],
             [node.hostname for node in Node.objects.filter(tags__name='bar')])
+
+
+class TestPopulateTagsForMultipleNodes(MAASServerTestCase):
+
+    def test_updates_nodes_with_all_tags(self):
+        nodes = [factory.make_Node() for _ in range(3)]
+        make_lshw_result(nodes[0], b"<foo/>")
+        make_lldp_result(nodes[1], b"<bar/>")
+        tags = [
+            factory.make_Tag("foo", "/foo", populate=False),
+            factory.make_Tag("bar", "//lldp:bar", populate=False),
+            Tag(name="empty", definition=""),
+        ]
+        populate_tags_for_multiple_nodes(tags, nodes)
+        self.assertItemsEqual([nodes[0]], tags[0].node_set.all())
+        self.assertItemsEqual([nodes[1]], tags[1].node_set.all())
+
+    def test_logs_throughput(self):
+        nodes = [factory.make_Node() for _ in range(3)]
+        tag = factory.make_Tag("foo", "/foo", populate=False)
+        with FakeLogger("maas") as log:
+            populate_tags_for_multiple_nodes([tag], nodes)
+        self.assertDocTestMatches(
+            "Evaluated 1 tag(s) against 3 node(s) in ... seconds "
+            "(... nodes/sec).", log.output)
+
+
+class TestTagEvaluator(MAASServerTestCase):
+
+    def make_evaluator(self, processes=2):
+        evaluator = TagEvaluator(processes)
+        evaluator.pools = [FakePool() for _ in range(processes)]
+        return evaluator
+
+    def test_evaluates_small_batches_in_process(self):
+        evaluator = self.make_evaluator()
+        nodes = [factory.make_Node() for _ in range(3)]
+        make_lshw_result(nodes[0], b"<foo/>")
+        matches = evaluator.evaluate(["/foo", "/bar"], nodes)
+        self.assertEqual({nodes[0]: [0], nodes[1]: [], nodes[2]: []}, matches)
+        for pool in evaluator.pools:
+            self.assertEqual([], pool.calls)
+
+    def test_evaluates_batches_in_pool(self):
+        evaluator = self.make_evaluator()
+        nodes = [factory.make_Node() for _ in range(4)]
+        for node in nodes[:2]:
+            make_lshw_result(node, b"<foo/>")
+        matches = evaluator.evaluate(["/foo", "/bar"], nodes, batch_size=2)
+        self.assertEqual({
+            nodes[0]: [0], nodes[1]: [0], nodes[2]: [], nodes[3]: []
+        }, matches)
+        for node in nodes:
+            pool = evaluator.pools[evaluator.getShard(node)]
+            self.assertIn(node.system_id, pool.cache.documents)
+
+    def test_sends_details_only_for_nodes_not_cached(self):
+        evaluator = self.make_evaluator()
+        nodes = [factory.make_Node() for _ in range(4)]
+        for node in nodes:
+            make_lshw_result(node, b"<foo/>")
+        get_probed_details = self.patch(
+            populate_tags_module, "get_probed_details")
+        get_probed_details.side_effect = original_get_probed_details
+        evaluator.evaluate(["/foo"], nodes, batch_size=2)
+        fetched = [
+            node for args, _ in get_probed_details.call_args_list
+            for node in args[0]
+        ]
+        self.assertItemsEqual(nodes, fetched)
+
+        # Nothing is fetched once the documents are cached.
+        get_probed_details.reset_mock()
+        matches = evaluator.evaluate(["/foo"], nodes, batch_size=2)
+        self.assertEqual({node: [0] for node in nodes}, matches)
+        self.assertEqual([], get_probed_details.call_args_list)
+
+        # Changing a node's commissioning output invalidates its document.
+        nodes[0].current_commissioning_script_set = None
+        nodes[0].save()
+        make_lshw_result(nodes[0], b"<bar/>")
+        matches = evaluator.evaluate(["/foo"], nodes, batch_size=2)
+        self.assertEqual([], matches[nodes[0]])
+        fetched = [
+            node for args, _ in get_probed_details.call_args_list
+            for node in args[0]
+        ]
+        self.assertEqual([nodes[0]], fetched)
+
+    def test_getShard_is_stable(self):
+        evaluator = TagEvaluator(4)
+        node = factory.make_Node()
+        shard = evaluator.getShard(node)
+        self.assertEqual(shard, evaluator.getShard(node))
+        self.assertIn(shard, range(4))
+
+    def test_evaluates_in_spawned_processes(self):
+        evaluator = TagEvaluator(1)
+        self.addCleanup(evaluator.close)
+        nodes = [factory.make_Node() for _ in range(2)]
+        make_lshw_result(nodes[0], b"<foo/>")
+        matches = evaluator.evaluate(["/foo"], nodes, batch_size=1)
+        self.assertEqual({nodes[0]: [0], nodes[1]: []}, matches)
@@ -49,6 +49,7 @@ from maasserver.preseed import (
     compose_enlistment_preseed_url,
     compose_preseed_url,
     curtin_maas_reporter,
+    find_preseed_template,
     GENERIC_FILENAME,
     get_curtin_cloud_config,
     get_curtin_config,
@@ -92,6 +93,7 @@ from maastesting.matchers import (
     MockNotCalled,
 )
 from maastesting.testcase import MAASTestCase
+from maastesting.utils import age_file
 from metadataserver.models import NodeKey
 from provisioningserver.drivers.osystem.ubuntu import UbuntuOS
 from provisioningserver.rpc.exceptions import NoConnectionsAvailable
@@ -337,6 +339,53 @@ class TestGetPreseedTemplate(MAASServerTestCase):
             (template_path, template_content),
             get_preseed_template([template_filename]))
 
+    def test_find_preseed_template_caches_template(self):
+        template_path = self.make_file(contents=factory.make_string())
+        self.patch(
+            settings, "PRESEED_TEMPLATE_LOCATIONS",
+            [os.path.dirname(template_path)])
+        filenames = [os.path.basename(template_path)]
+        entry = find_preseed_template(filenames)
+        self.patch(preseed_module, "_load_preseed_template")
+        self.assertIs(
+            entry.template, find_preseed_template(filenames).template)
+        self.assertThat(
+            preseed_module._load_preseed_template, MockNotCalled())
+
+    def test_find_preseed_template_caches_not_finding_template(self):
+        self.patch(settings, "PRESEED_TEMPLATE_LOCATIONS", [self.make_dir()])
+        filenames = [factory.make_name("template")]
+        find_preseed_template(filenames)
+        self.patch(preseed_module, "_load_preseed_template")
+        self.assertIsNone(find_preseed_template(filenames).template)
+        self.assertThat(
+            preseed_module._load_preseed_template, MockNotCalled())
+
+    def test_get_preseed_template_reloads_modified_template(self):
+        template_path = self.make_file(contents="old")
+        self.patch(
+            settings, "PRESEED_TEMPLATE_LOCATIONS",
+            [os.path.dirname(template_path)])
+        filenames = [os.path.basename(template_path)]
+        get_preseed_template(filenames)
+        with open(template_path, "w") as stream:
+            stream.write("new")
+        age_file(template_path, 10)
+        self.assertEqual(
+            (template_path, "new"), get_preseed_template(filenames))
+
+    def test_get_preseed_template_finds_template_added_to_location(self):
+        location = self.make_dir()
+        self.patch(settings, "PRESEED_TEMPLATE_LOCATIONS", [location])
+        filename = factory.make_name("template")
+        self.assertEqual((None, None), get_preseed_template([filename]))
+        template_path = os.path.join(location, filename)
+        with open(template_path, "w") as stream:
+            stream.write("content")
+        age_file(location, -10)
+        self.assertEqual(
+            (template_path, "content"), get_preseed_template([filename]))
+
 
 class TestLoadPreseedTemplate(MAASServerTestCase):
     """Tests for `load_preseed_template`."""
@@ -367,6 +416,17 @@ class TestLoadPreseedTemplate(MAASServerTestCase):
         template = load_preseed_template(node, name)
         self.assertIsInstance(template, PreseedTemplate)
 
+    def test_load_preseed_template_copies_cached_template(self):
+        name = factory.make_string()
+        self.create_template(self.location, name)
+        node = factory.make_Node()
+        template = load_preseed_template(node, name)
+        other_template = load_preseed_template(node, name)
+        self.assertIsNot(template, other_template)
+        self.assertIs(template._parsed, other_template._parsed)
+        self.assertIsNot(
+            template.get_template, other_template.get_template)
+
     def test_load_preseed_template_raises_if_no_template(self):
         node = factory.make_Node()
         unknown_template_name = factory.make_string()
@@ -0,0 +1,177 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `maasserver.preseed_cache`."""
+
+__all__ = []
+
+from unittest.mock import (
+    call,
+    Mock,
+)
+
+from maasserver import preseed_cache as preseed_cache_module
+from maasserver.preseed_cache import (
+    RenderedConfigCache,
+    rendered_config_cache,
+)
+from maasserver.testing.factory import factory
+from maasserver.testing.testcase import MAASServerTestCase
+from maastesting.matchers import MockCallsMatch
+
+
+class FakeListener:
+
+    def __init__(self):
+        self.connection = object()
+        self.register = Mock()
+
+    def connected(self):
+        return self.connection is not None
+
+
+class TestRenderedConfigCache(MAASServerTestCase):
+
+    def make_cache(self):
+        cache = RenderedConfigCache()
+        listener = FakeListener()
+        cache.listen(listener)
+        return cache, listener
+
+    def make_compose(self):
+        return Mock(side_effect=lambda node, *args, **kwargs: [
+            factory.make_string()])
+
+    def test_listen_registers_for_notifications(self):
+        cache, listener = self.make_cache()
+        self.assertThat(listener.register, MockCallsMatch(
+            call("machine", cache.nodeChanged),
+            *(call(channel, cache.configChanged)
+              for channel in cache.global_channels)))
+
+    def test_listen_only_uses_first_listener(self):
+        cache, listener = self.make_cache()
+        cache.listen(FakeListener())
+        self.assertIs(listener, cache.listener)
+
+    def test_render_without_listener_composes_every_time(self):
+        cache = RenderedConfigCache()
+        compose = self.make_compose()
+        node = factory.make_Node()
+        self.assertNotEqual(
+            cache.render(node, compose), cache.render(node, compose))
+        self.assertEqual(2, compose.call_count)
+
+    def test_render_while_disconnected_composes_every_time(self):
+        cache, listener = self.make_cache()
+        listener.connection = None
+        compose = self.make_compose()
+        node = factory.make_Node()
+        cache.render(node, compose)
+        cache.render(node, compose)
+        self.assertEqual(2, compose.call_count)
+
+    def test_render_caches_configuration(self):
+        cache, listener = self.make_cache()
+        compose = self.make_compose()
+        node = factory.make_Node()
+        documents = cache.render(node, compose, version=2)
+        self.assertEqual(documents, cache.render(node, compose, version=2))
+        self.assertThat(compose, MockCallsMatch(call(node, version=2)))
+
+    def test_render_keys_on_arguments(self):
+        cache, listener = self.make_cache()
+        compose = self.make_compose()
+        node = factory.make_Node()
+        self.assertNotEqual(
+            cache.render(node, compose, version=1),
+            cache.render(node, compose, version=2))
+
+    def test_render_keys_on_node_fields(self):
+        cache, listener = self.make_cache()
+        compose = self.make_compose()
+        node = factory.make_Node()
+        documents = cache.render(node, compose)
+        node.hostname = factory.make_name("host")
+        self.assertNotEqual(documents, cache.render(node, compose))
+
+    def test_render_composes_again_after_max_age(self):
+        cache, listener = self.make_cache()
+        compose = self.make_compose()
+        node = factory.make_Node()
+        monotonic = self.patch(preseed_cache_module.time, "monotonic")
+        monotonic.return_value = 1000.0
+        documents = cache.render(node, compose)
+        monotonic.return_value += cache.max_age
+        self.assertNotEqual(documents, cache.render(node, compose))
+
+    def test_render_discards_configuration_after_reconnect(self):
+        cache, listener = self.make_cache()
+        compose = self.make_compose()
+        node = factory.make_Node()
+        documents = cache.render(node, compose)
+        listener.connection = object()
+        self.assertNotEqual(documents, cache.render(node, compose))
+
+    def test_render_does_not_store_if_invalidated_while_composing(self):
+        cache, listener = self.make_cache()
+        node = factory.make_Node()
+
+        def compose(node):
+            cache.invalidate(node.system_id)
+            return [factory.make_string()]
+
+        documents = cache.render(node, compose)
+        self.assertNotEqual(documents, cache.render(node, compose))
+
+    def test_render_keeps_at_most_max_nodes(self):
+        cache, listener = self.make_cache()
+        self.patch(cache, "max_nodes", 2)
+        compose = self.make_compose()
+        nodes = [factory.make_Node() for _ in range(3)]
+        for node in nodes:
+            cache.render(node, compose)
+        self.assertEqual(
+            [node.system_id for node in nodes[1:]], list(cache.renderings))
+
+    def test_nodeChanged_invalidates_only_that_node(self):
+        cache, listener = self.make_cache()
+        compose = self.make_compose()
+        node, other_node = factory.make_Node(), factory.make_Node()
+        documents = cache.render(node, compose)
+        other_documents = cache.render(other_node, compose)
+        cache.nodeChanged("update", node.system_id)
+        self.assertNotEqual(documents, cache.render(node, compose))
+        self.assertEqual(other_documents, cache.render(other_node, compose))
+
+    def test_configChanged_invalidates_every_node(self):
+        cache, listener = self.make_cache()
+        compose = self.make_compose()
+        node, other_node = factory.make_Node(), factory.make_Node()
+        documents = cache.render(node, compose)
+        other_documents = cache.render(other_node, compose)
+        cache.configChanged("update", "1")
+        self.assertNotEqual(documents, cache.render(node, compose))
+        self.assertNotEqual(
+            other_documents, cache.render(other_node, compose))
+
+    def test_render_bypassed_with_uncommitted_changes(self):
+        self.patch(rendered_config_cache, "listener", FakeListener())
+        compose = self.make_compose()
+        node = factory.make_Node()
+        factory.make_Interface(node=node)
+        self.assertTrue(rendered_config_cache._hasUncommittedChanges())
+        rendered_config_cache.render(node, compose)
+        rendered_config_cache.render(node, compose)
+        self.assertEqual(2, compose.call_count)
+
+    def test_changesCommitted_prevents_storing_configuration(self):
+        cache, listener = self.make_cache()
+        node = factory.make_Node()
+
+        def compose(node):
+            cache.changesCommitted()
+            return [factory.make_string()]
+
+        documents = cache.render(node, compose)
+        self.assertNotEqual(documents, cache.render(node, compose))
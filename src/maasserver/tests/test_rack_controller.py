@@ -5,6 +5,7 @@
 
 __all__ = []
 
+import json
 import random
 from unittest.mock import (
     call,
@@ -27,6 +28,8 @@ from maastesting.matchers import (
     MockCallsMatch,
     MockNotCalled,
 )
+from provisioningserver.rpc.cluster import InvalidateBootConfig
+from provisioningserver.rpc.exceptions import NoConnectionsAvailable
 from testtools import ExpectedException
 from testtools.matchers import MatchesStructure
 from twisted.internet import reactor
@@ -78,9 +81,9 @@ class TestRackControllerService(MAASTransactionServerTestCase):
         yield service.startService()
         self.assertThat(
             listener.register,
-            MockCalledOnceWith(
-                "sys_core_%d" % regionProcessId,
-                service.coreHandler))
+            MockCallsMatch(
+                call("sys_core_%d" % regionProcessId, service.coreHandler),
+                call("sys_boot_config", service.bootConfigHandler)))
         self.assertEqual(regionProcessId, service.processId)
 
     @wait_for_reactor
@@ -149,8 +152,9 @@ class TestRackControllerService(MAASTransactionServerTestCase):
         yield service.stopService()
         self.assertThat(
             listener.unregister,
-            MockCalledOnceWith(
-                "sys_core_%d" % service.processId, service.coreHandler))
+            MockCallsMatch(
+                call("sys_core_%d" % service.processId, service.coreHandler),
+                call("sys_boot_config", service.bootConfigHandler)))
         self.assertIsNone(service.starting)
 
     @wait_for_reactor
@@ -164,8 +168,9 @@ class TestRackControllerService(MAASTransactionServerTestCase):
         yield service.stopService()
         self.assertThat(
             listener.unregister,
-            MockCalledOnceWith(
-                "sys_core_%d" % processId, service.coreHandler))
+            MockCallsMatch(
+                call("sys_core_%d" % processId, service.coreHandler),
+                call("sys_boot_config", service.bootConfigHandler)))
 
     @wait_for_reactor
     @inlineCallbacks
@@ -280,6 +285,49 @@ class TestRackControllerService(MAASTransactionServerTestCase):
         self.assertEquals(set(), service.needsDHCPUpdate)
         self.assertThat(mock_startProcessing, MockNotCalled())
 
+    def test_bootConfigHandler_does_nothing_when_not_watching(self):
+        service = RackControllerService(
+            sentinel.ipcWorker, sentinel.listener)
+        mock_getSystemIDs = self.patch(service, "getSystemIDs")
+        self.assertIsNone(service.bootConfigHandler(
+            "sys_boot_config", '{"macs": [], "hardware_uuid": null}'))
+        self.assertThat(mock_getSystemIDs, MockNotCalled())
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_bootConfigHandler_invalidates_watched_racks(self):
+        racks = yield deferToDatabase(transactional(
+            lambda: [factory.make_RackController() for _ in range(2)]))
+        service = RackControllerService(
+            sentinel.ipcWorker, sentinel.listener)
+        service.watching = {racks[0].id}
+        client = Mock(return_value=succeed({}))
+        mock_getClientFor = self.patch(rack_controller, "getClientFor")
+        mock_getClientFor.return_value = succeed(client)
+        mac = factory.make_mac_address()
+        hardware_uuid = factory.make_UUID()
+        yield service.bootConfigHandler(
+            "sys_boot_config", json.dumps({
+                "macs": [mac], "hardware_uuid": hardware_uuid}))
+        self.assertThat(
+            mock_getClientFor, MockCalledOnceWith(racks[0].system_id))
+        self.assertThat(
+            client, MockCalledOnceWith(
+                InvalidateBootConfig, macs=[mac],
+                hardware_uuid=hardware_uuid))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_invalidateBootConfig_ignores_disconnected_racks(self):
+        service = RackControllerService(
+            sentinel.ipcWorker, sentinel.listener)
+        mock_getClientFor = self.patch(rack_controller, "getClientFor")
+        mock_getClientFor.return_value = fail(NoConnectionsAvailable())
+        mock_err = self.patch(rack_controller.log, "err")
+        yield service.invalidateBootConfig(
+            [factory.make_name("system_id")], [], None)
+        self.assertThat(mock_err, MockNotCalled())
+
     def test_startProcessing_doesnt_call_start_when_looping_call_running(self):
         service = RackControllerService(
             sentinel.ipcWorker, sentinel.listener)
@@ -89,6 +89,7 @@ class TestRegionControllerService(MAASServerTestCase):
             listener.register,
             MockCallsMatch(
                 call("sys_dns", service.markDNSForUpdate),
+                call("sys_dns_updates", service.markDNSZonesForUpdate),
                 call("sys_proxy", service.markProxyForUpdate),
                 call("sys_rbac", service.markRBACForUpdate)))
 
@@ -132,6 +133,7 @@ class TestRegionControllerService(MAASServerTestCase):
             listener.unregister,
             MockCallsMatch(
                 call("sys_dns", service.markDNSForUpdate),
+                call("sys_dns_updates", service.markDNSZonesForUpdate),
                 call("sys_proxy", service.markProxyForUpdate),
                 call("sys_rbac", service.markRBACForUpdate)))
 
@@ -152,6 +154,58 @@ class TestRegionControllerService(MAASServerTestCase):
         self.assertTrue(service.needsDNSUpdate)
         self.assertThat(mock_startProcessing, MockCalledOnceWith())
 
+    def test_markDNSForUpdate_marks_all_zones_without_zone_messages(self):
+        listener = MagicMock()
+        service = self.make_service(listener)
+        self.patch(service, "startProcessing")
+        service.markDNSForUpdate(None, None)
+        self.assertIsNone(service.dnsUpdateZones)
+
+    def test_markDNSForUpdate_marks_only_announced_zones(self):
+        listener = MagicMock()
+        service = self.make_service(listener)
+        self.patch(service, "startProcessing")
+        service.markDNSZonesForUpdate(
+            None, '{"serial": 10, "domains": [1], "subnets": [2, 3]}')
+        service.markDNSForUpdate(None, "10")
+        self.assertEqual(({1}, {2, 3}), service.dnsUpdateZones)
+        self.assertEqual({}, service.dnsZoneUpdates)
+
+    def test_markDNSForUpdate_marks_zones_of_each_publication(self):
+        # PostgreSQL folds together identical messages sent in one
+        # transaction, so every message carries the publication serial.
+        listener = MagicMock()
+        service = self.make_service(listener)
+        self.patch(service, "startProcessing")
+        service.markDNSZonesForUpdate(
+            None, '{"serial": 10, "domains": [1], "subnets": [2]}')
+        service.markDNSForUpdate(None, "10")
+        service.markDNSZonesForUpdate(
+            None, '{"serial": 11, "domains": [3], "subnets": [4]}')
+        service.markDNSForUpdate(None, "11")
+        self.assertEqual(({1, 3}, {2, 4}), service.dnsUpdateZones)
+        self.assertEqual({}, service.dnsZoneUpdates)
+
+    def test_markDNSForUpdate_marks_all_zones_for_unannounced_serial(self):
+        listener = MagicMock()
+        service = self.make_service(listener)
+        self.patch(service, "startProcessing")
+        service.markDNSZonesForUpdate(
+            None, '{"serial": 10, "domains": [1], "subnets": [2]}')
+        service.markDNSForUpdate(None, "10")
+        service.markDNSForUpdate(None, "11")
+        self.assertIsNone(service.dnsUpdateZones)
+
+    def test_markDNSForUpdate_keeps_all_zones_when_pending(self):
+        listener = MagicMock()
+        service = self.make_service(listener)
+        self.patch(service, "startProcessing")
+        service.markDNSForUpdate(None, None)
+        service.markDNSZonesForUpdate(
+            None, '{"serial": 10, "domains": [1], "subnets": [2]}')
+        service.markDNSForUpdate(None, "10")
+        self.assertIsNone(service.dnsUpdateZones)
+
     def test_markProxyForUpdate_sets_needsProxyUpdate_and_starts_process(self):
         listener = MagicMock()
         service = self.make_service(listener)
@@ -250,6 +304,46 @@ class TestRegionControllerService(MAASServerTestCase):
             MockCalledOnceWith(
                 "Reloaded DNS configuration; regiond started."))
 
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_process_updates_only_marked_zones(self):
+        service = self.make_service(sentinel.listener)
+        service.needsDNSUpdate = True
+        service.dnsUpdateZones = ({1}, {2})
+        dns_result = (random.randint(1, 1000), [factory.make_name('domain')])
+        mock_dns_update_all_zones = self.patch(
+            region_controller, "dns_update_all_zones")
+        mock_dns_update_zones = self.patch(
+            region_controller, "dns_update_zones")
+        mock_dns_update_zones.return_value = dns_result
+        mock_check_serial = self.patch(service, "_checkSerial")
+        mock_check_serial.return_value = succeed(dns_result)
+        self.patch(region_controller.log, "msg")
+        service.startProcessing()
+        yield service.processingDefer
+        self.assertThat(mock_dns_update_all_zones, MockNotCalled())
+        self.assertThat(mock_dns_update_zones, MockCalledOnceWith({1}, {2}))
+        self.assertThat(mock_check_serial, MockCalledOnceWith(dns_result))
+        self.assertIsNone(service.dnsUpdateZones)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_process_retries_failed_zones_update_with_all_zones(self):
+        service = RegionControllerService(sentinel.listener)
+        service.needsDNSUpdate = True
+        service.dnsUpdateZones = ({1}, {2})
+        mock_dns_update_zones = self.patch(
+            region_controller, "dns_update_zones")
+        mock_dns_update_zones.side_effect = factory.make_exception()
+        mock_dns_update_all_zones = self.patch(
+            region_controller, "dns_update_all_zones")
+        mock_dns_update_all_zones.return_value = None
+        self.patch(region_controller.log, "err")
+        service.startProcessing()
+        yield service.processingDefer
+        self.assertThat(mock_dns_update_zones, MockCalledOnceWith({1}, {2}))
+        self.assertThat(mock_dns_update_all_zones, MockCalledOnceWith())
+
     @wait_for_reactor
     @inlineCallbacks
     def test_process_updates_proxy(self):
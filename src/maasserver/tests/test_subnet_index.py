@@ -0,0 +1,239 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `maasserver.subnet_index`."""
+
+__all__ = []
+
+import random
+from unittest.mock import (
+    Mock,
+    sentinel,
+)
+
+from maasserver import subnet_index as subnet_index_module
+from maasserver.models import Subnet
+from maasserver.subnet_index import (
+    SubnetIndex,
+    SubnetIndexCache,
+)
+from maasserver.testing.factory import factory
+from maasserver.testing.testcase import MAASServerTestCase
+from maastesting.djangotestcase import count_queries
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockNotCalled,
+)
+from maastesting.testcase import MAASTestCase
+from netaddr import IPNetwork
+from twisted.internet.defer import (
+    Deferred,
+    succeed,
+)
+
+
+def make_index(*subnets):
+    """Make a `SubnetIndex` from (cidr, dhcp_on) pairs.
+
+    Each subnet's field values are ``(cidr,)``.
+    """
+    return SubnetIndex(["cidr"], [
+        (cidr, dhcp_on) for cidr, dhcp_on in subnets])
+
+
+class TestSubnetIndex(MAASTestCase):
+
+    def test_finds_nothing_when_empty(self):
+        index = make_index()
+        self.assertIsNone(index.lookup("10.0.0.1"))
+        self.assertIsNone(index.lookup("2001:db8::1"))
+
+    def test_finds_containing_subnet(self):
+        index = make_index(("10.0.0.0/24", False), ("10.1.0.0/24", False))
+        self.assertEqual(("10.1.0.0/24",), index.lookup("10.1.0.99"))
+
+    def test_prefers_longest_prefix(self):
+        index = make_index(
+            ("10.0.0.0/8", False), ("10.1.0.0/16", False),
+            ("10.1.2.0/24", False))
+        self.assertEqual(("10.1.2.0/24",), index.lookup("10.1.2.3"))
+        self.assertEqual(("10.1.0.0/16",), index.lookup("10.1.3.3"))
+        self.assertEqual(("10.0.0.0/8",), index.lookup("10.2.3.3"))
+
+    def test_prefers_dhcp_on(self):
+        index = make_index(("10.0.0.0/8", True), ("10.1.0.0/16", False))
+        self.assertEqual(("10.0.0.0/8",), index.lookup("10.1.2.3"))
+
+    def test_finds_ipv6_subnet(self):
+        index = make_index(("2001:db8::/32", False), ("10.0.0.0/8", False))
+        self.assertEqual(("2001:db8::/32",), index.lookup("2001:db8::1"))
+
+    def test_maps_ipv4_mapped_addresses(self):
+        index = make_index(("10.0.0.0/8", False))
+        self.assertEqual(("10.0.0.0/8",), index.lookup("::ffff:10.0.0.1"))
+
+    def test_ignores_host_subnets(self):
+        # Like the << operator, which needs strict containment.
+        index = make_index(("10.0.0.1/32", False), ("2001:db8::1/128", True))
+        self.assertIsNone(index.lookup("10.0.0.1"))
+        self.assertIsNone(index.lookup("2001:db8::1"))
+        self.assertEqual(0, len(index))
+
+    def test_lookup_copies_mutable_values(self):
+        index = SubnetIndex(["cidr", "dns_servers"], [
+            ("10.0.0.0/8", ["10.0.0.2"], False)])
+        index.lookup("10.0.0.1")[1].append("10.0.0.3")
+        self.assertEqual(
+            ("10.0.0.0/8", ["10.0.0.2"]), index.lookup("10.0.0.1"))
+
+
+class TestSubnetIndexAgainstDatabase(MAASServerTestCase):
+
+    def test_agrees_with_query(self):
+        vlans = [factory.make_VLAN(), factory.make_VLAN(dhcp_on=True)]
+        cidrs = [
+            "10.0.0.0/8", "10.8.0.0/16", "10.8.24.0/24", "10.8.24.16/28",
+            "10.8.24.17/32", "2001:db8::/32", "2001:db8:1::/48",
+        ]
+        for cidr in cidrs:
+            factory.make_Subnet(cidr=cidr, vlan=random.choice(vlans))
+        index = SubnetIndexCache()._build()
+        ips = [
+            str(IPNetwork(cidr)[1]) for cidr in cidrs
+        ] + ["10.8.24.17", "192.168.0.1", "2001:db8:2::1"]
+        for ip in ips:
+            expected = Subnet.objects.get_best_subnet_for_ip(ip)
+            values = index.lookup(ip)
+            if expected is None:
+                self.assertIsNone(values, ip)
+            else:
+                subnet = Subnet.objects._from_index(index, ip)
+                self.assertEqual(expected.id, subnet.id, ip)
+                self.assertEqual(expected.cidr, subnet.cidr, ip)
+
+    def test_get_best_subnet_for_ip_uses_index_without_queries(self):
+        subnet = factory.make_Subnet(cidr="10.0.0.0/24")
+        index = SubnetIndexCache()._build()
+        self.patch(
+            subnet_index_module.subnet_index_cache,
+            "get_index").return_value = index
+        count, found = count_queries(
+            Subnet.objects.get_best_subnet_for_ip, "10.0.0.1")
+        self.assertEqual(0, count)
+        self.assertEqual(subnet.id, found.id)
+        self.assertEqual(subnet.vlan_id, found.vlan_id)
+
+    def test_get_best_subnets_for_ips_uses_index_without_queries(self):
+        subnet = factory.make_Subnet(cidr="10.0.0.0/24")
+        index = SubnetIndexCache()._build()
+        self.patch(
+            subnet_index_module.subnet_index_cache,
+            "get_index").return_value = index
+        count, found = count_queries(
+            Subnet.objects.get_best_subnets_for_ips,
+            ["10.0.0.1", "10.1.0.1"])
+        self.assertEqual(0, count)
+        self.assertEqual({"10.0.0.1"}, set(found))
+        self.assertEqual(subnet.id, found["10.0.0.1"].id)
+
+
+class FakeListener:
+
+    def __init__(self):
+        self.connection = object()
+        self.register = Mock()
+
+    def connected(self):
+        return self.connection is not None
+
+
+class TestSubnetIndexCache(MAASServerTestCase):
+
+    def make_cache(self):
+        cache = SubnetIndexCache()
+        listener = FakeListener()
+        cache.listen(listener)
+        return cache, listener
+
+    def install(self, cache, listener, index=sentinel.index):
+        cache._install(index, cache.generation, listener.connection)
+
+    def test_listen_registers_for_notifications(self):
+        cache, listener = self.make_cache()
+        self.assertThat(listener.register, MockCalledOnceWith(
+            "sys_subnet_index", cache.subnetsChanged))
+
+    def test_listen_only_uses_first_listener(self):
+        cache, listener = self.make_cache()
+        cache.listen(FakeListener())
+        self.assertIs(listener, cache.listener)
+
+    def test_get_index_without_listener(self):
+        self.assertIsNone(SubnetIndexCache().get_index())
+
+    def test_get_index_returns_installed_index(self):
+        cache, listener = self.make_cache()
+        self.install(cache, listener)
+        self.assertIs(sentinel.index, cache.get_index())
+
+    def test_get_index_requests_rebuild_when_missing(self):
+        cache, listener = self.make_cache()
+        reactor = self.patch(subnet_index_module, "reactor")
+        self.assertIsNone(cache.get_index())
+        self.assertThat(
+            reactor.callFromThread, MockCalledOnceWith(cache.requestRebuild))
+
+    def test_get_index_does_not_rebuild_when_disconnected(self):
+        cache, listener = self.make_cache()
+        listener.connection = None
+        reactor = self.patch(subnet_index_module, "reactor")
+        self.assertIsNone(cache.get_index())
+        self.assertThat(reactor.callFromThread, MockNotCalled())
+
+    def test_get_index_ignores_index_after_reconnect(self):
+        cache, listener = self.make_cache()
+        self.install(cache, listener)
+        listener.connection = object()
+        self.patch(subnet_index_module, "reactor")
+        self.assertIsNone(cache.get_index())
+
+    def test_get_index_ignored_with_uncommitted_changes(self):
+        self.patch(
+            subnet_index_module, "subnet_index_cache", self.make_cache()[0])
+        cache = subnet_index_module.subnet_index_cache
+        self.install(cache, cache.listener)
+        factory.make_Subnet()
+        self.install(cache, cache.listener)
+        self.assertIsNone(cache.get_index())
+
+    def test_subnetsChanged_invalidates_and_rebuilds(self):
+        cache, listener = self.make_cache()
+        self.install(cache, listener)
+        deferToDatabase = self.patch(subnet_index_module, "deferToDatabase")
+        deferToDatabase.return_value = succeed(sentinel.rebuilt)
+        cache.subnetsChanged("sys_subnet_index", "")
+        self.assertThat(deferToDatabase, MockCalledOnceWith(cache._build))
+        self.assertIs(sentinel.rebuilt, cache.index)
+        self.assertFalse(cache.building)
+
+    def test_changes_while_building_rebuild_again(self):
+        cache, listener = self.make_cache()
+        builds = [Deferred(), Deferred()]
+        deferToDatabase = self.patch(subnet_index_module, "deferToDatabase")
+        deferToDatabase.side_effect = builds
+        cache.subnetsChanged("sys_subnet_index", "")
+        cache.subnetsChanged("sys_subnet_index", "")
+        builds[0].callback(sentinel.stale)
+        self.assertIsNone(cache.index)
+        builds[1].callback(sentinel.fresh)
+        self.assertIs(sentinel.fresh, cache.index)
+        self.assertEqual(2, deferToDatabase.call_count)
+
+    def test_requestRebuild_does_nothing_while_building(self):
+        cache, listener = self.make_cache()
+        deferToDatabase = self.patch(subnet_index_module, "deferToDatabase")
+        deferToDatabase.return_value = Deferred()
+        cache.requestRebuild()
+        cache.requestRebuild()
+        self.assertEqual(1, deferToDatabase.call_count)
+        self.assertFalse(cache.rebuildPending)
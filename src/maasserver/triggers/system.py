@@ -893,19 +893,21 @@ DHCP_CONFIG_NTP_SERVERS_DELETE = dedent("""\
 
 
 # Triggered when DNS needs to be published. In essense this means on insert
-# into maasserver_dnspublication.
+# into maasserver_dnspublication. The serial of the publication is sent so
+# that PostgreSQL does not fold together the messages of several publications
+# made in one transaction.
 DNS_PUBLISH = dedent("""\
     CREATE OR REPLACE FUNCTION sys_dns_publish()
     RETURNS trigger AS $$
     BEGIN
-      PERFORM pg_notify('sys_dns', '');
+      PERFORM pg_notify('sys_dns', NEW.serial::text);
       RETURN NEW;
     END;
     $$ LANGUAGE plpgsql;
     """)
 
 
-# Procedure to mark DNS as needing an update.
+# Procedure to mark DNS as needing an update. All zones will be regenerated.
 DNS_PUBLISH_UPDATE = dedent("""\
     CREATE OR REPLACE FUNCTION sys_dns_publish_update(reason text)
     RETURNS void as $$
@@ -920,6 +922,32 @@ DNS_PUBLISH_UPDATE = dedent("""\
     """)
 
 
+# Procedure to mark DNS as needing an update of only some zones: the forward
+# zones of the domains in `domain_ids` and the reverse zones of the subnets in
+# `subnet_ids`. The zones are announced with the serial of the publication,
+# which `sys_dns` carries too. Changes that add, remove, or rename zones must
+# use `sys_dns_publish_update` instead.
+DNS_PUBLISH_ZONES_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_dns_publish_zones_update(
+      reason text, domain_ids integer[], subnet_ids integer[])
+    RETURNS void as $$
+    DECLARE
+      publication_serial bigint;
+    BEGIN
+      publication_serial := nextval('maasserver_zone_serial_seq');
+      PERFORM pg_notify('sys_dns_updates', json_build_object(
+        'serial', publication_serial,
+        'domains', array_remove(COALESCE(domain_ids, '{}'), NULL),
+        'subnets', array_remove(COALESCE(subnet_ids, '{}'), NULL))::text);
+      INSERT INTO maasserver_dnspublication
+        (serial, created, source)
+      VALUES
+        (publication_serial, now(), substring(reason FOR 255));
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
 # Triggered when a new domain is added. Increments the zone serial and
 # notifies that DNS needs to be updated.
 DNS_DOMAIN_INSERT = dedent("""\
@@ -993,54 +1021,60 @@ DNS_DOMAIN_DELETE = dedent("""\
 DNS_STATICIPADDRESS_UPDATE = dedent("""\
     CREATE OR REPLACE FUNCTION sys_dns_staticipaddress_update()
     RETURNS trigger as $$
+    DECLARE
+      domain_ids integer[];
+      subnet_ids integer[];
     BEGIN
       IF ((OLD.ip IS NULL and NEW.ip IS NOT NULL) OR
           (OLD.ip IS NOT NULL and NEW.ip IS NULL) OR
           (OLD.ip != NEW.ip)) OR
           (OLD.alloc_type != NEW.alloc_type) THEN
-        IF EXISTS (
-            SELECT
-              domain.id
-            FROM maasserver_staticipaddress AS staticipaddress
-            LEFT JOIN (
-              maasserver_interface_ip_addresses AS iia
-              JOIN maasserver_interface AS interface ON
-                iia.interface_id = interface.id
-              JOIN maasserver_node AS node ON
-                node.id = interface.node_id) ON
-              iia.staticipaddress_id = staticipaddress.id
-            LEFT JOIN (
-              maasserver_dnsresource_ip_addresses AS dia
-              JOIN maasserver_dnsresource AS dnsresource ON
-                dia.dnsresource_id = dnsresource.id) ON
-              dia.staticipaddress_id = staticipaddress.id
-            JOIN maasserver_domain AS domain ON
-              domain.id = node.domain_id OR domain.id = dnsresource.domain_id
-            WHERE
-              domain.authoritative = TRUE AND
-              (staticipaddress.id = OLD.id OR
-               staticipaddress.id = NEW.id))
-        THEN
+        SELECT
+          array_agg(DISTINCT domain.id) INTO domain_ids
+        FROM maasserver_staticipaddress AS staticipaddress
+        LEFT JOIN (
+          maasserver_interface_ip_addresses AS iia
+          JOIN maasserver_interface AS interface ON
+            iia.interface_id = interface.id
+          JOIN maasserver_node AS node ON
+            node.id = interface.node_id) ON
+          iia.staticipaddress_id = staticipaddress.id
+        LEFT JOIN (
+          maasserver_dnsresource_ip_addresses AS dia
+          JOIN maasserver_dnsresource AS dnsresource ON
+            dia.dnsresource_id = dnsresource.id) ON
+          dia.staticipaddress_id = staticipaddress.id
+        JOIN maasserver_domain AS domain ON
+          domain.id = node.domain_id OR domain.id = dnsresource.domain_id
+        WHERE
+          domain.authoritative = TRUE AND
+          (staticipaddress.id = OLD.id OR
+           staticipaddress.id = NEW.id);
+        IF domain_ids IS NOT NULL THEN
+          subnet_ids := ARRAY[OLD.subnet_id, NEW.subnet_id];
           IF OLD.ip IS NULL and NEW.ip IS NOT NULL THEN
-            PERFORM sys_dns_publish_update(
-              'ip ' || host(NEW.ip) || ' allocated');
+            PERFORM sys_dns_publish_zones_update(
+              'ip ' || host(NEW.ip) || ' allocated',
+              domain_ids, subnet_ids);
             RETURN NEW;
           ELSIF OLD.ip IS NOT NULL and NEW.ip IS NULL THEN
-            PERFORM sys_dns_publish_update(
-              'ip ' || host(OLD.ip) || ' released');
+            PERFORM sys_dns_publish_zones_update(
+              'ip ' || host(OLD.ip) || ' released',
+              domain_ids, subnet_ids);
             RETURN NEW;
           ELSIF OLD.ip != NEW.ip THEN
-            PERFORM sys_dns_publish_update(
-              'ip ' || host(OLD.ip) || ' changed to ' || host(NEW.ip));
+            PERFORM sys_dns_publish_zones_update(
+              'ip ' || host(OLD.ip) || ' changed to ' || host(NEW.ip),
+              domain_ids, subnet_ids);
             RETURN NEW;
           END IF;
 
           -- Made it this far then only alloc_type has changed. Only send
           -- a notification is the IP address is assigned.
           IF NEW.ip IS NOT NULL THEN
-            PERFORM sys_dns_publish_update(
+            PERFORM sys_dns_publish_zones_update(
               'ip ' || host(OLD.ip) || ' alloc_type changed to ' ||
-              NEW.alloc_type);
+              NEW.alloc_type, domain_ids, subnet_ids);
           END IF;
         END IF;
       END IF;
@@ -1076,9 +1110,9 @@ DNS_NIC_IP_LINK = dedent("""\
               maasserver_domain.id = node.domain_id AND
               maasserver_domain.authoritative = TRUE))
       THEN
-        PERFORM sys_dns_publish_update(
+        PERFORM sys_dns_publish_zones_update(
           'ip ' || host(ip.ip) || ' connected to ' || node.hostname ||
-          ' on ' || nic.name);
+          ' on ' || nic.name, ARRAY[node.domain_id], ARRAY[ip.subnet_id]);
       END IF;
       RETURN NEW;
     END;
@@ -1113,9 +1147,9 @@ DNS_NIC_IP_UNLINK = dedent("""\
               maasserver_domain.id = node.domain_id AND
               maasserver_domain.authoritative = TRUE))
       THEN
-        PERFORM sys_dns_publish_update(
+        PERFORM sys_dns_publish_zones_update(
           'ip ' || host(ip.ip) || ' disconnected from ' || node.hostname ||
-          ' on ' || nic.name);
+          ' on ' || nic.name, ARRAY[node.domain_id], ARRAY[ip.subnet_id]);
       END IF;
       RETURN OLD;
     END;
@@ -1778,6 +1812,115 @@ RBAC_CONFIG_UPDATE = dedent("""\
     """)
 
 
+# Triggered when DHCP is turned on or off for a VLAN. Notifies region
+# processes that their in-memory subnet index must be rebuilt.
+SUBNET_INDEX_VLAN_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_subnet_index_vlan_update()
+    RETURNS trigger as $$
+    BEGIN
+      IF OLD.dhcp_on != NEW.dhcp_on THEN
+        PERFORM pg_notify('sys_subnet_index', '');
+      END IF;
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
+# Notifies rack controllers, through the region processes that manage them,
+# that cached boot configurations for a node must be discarded.
+BOOT_CONFIG_NOTIFY = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_boot_config_notify(
+      nid integer, hardware_uuid text)
+    RETURNS void AS $$
+    BEGIN
+      PERFORM pg_notify('sys_boot_config', json_build_object(
+        'macs', ARRAY(
+          SELECT CAST(iface.mac_address AS text)
+          FROM maasserver_interface AS iface
+          WHERE iface.node_id = nid AND iface.mac_address IS NOT NULL),
+        'hardware_uuid', hardware_uuid)::text);
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
+# Triggered when a node is created. Discards a cached "no response" for the
+# hardware UUID of a newly enlisted machine.
+BOOT_CONFIG_NODE_INSERT = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_boot_config_node_insert()
+    RETURNS trigger as $$
+    BEGIN
+      PERFORM sys_boot_config_notify(NEW.id, NEW.hardware_uuid);
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
+# Triggered when a node is updated. Only notifies when a field that the boot
+# configuration, or the boot purpose, depends on has changed.
+BOOT_CONFIG_NODE_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_boot_config_node_update()
+    RETURNS trigger as $$
+    BEGIN
+      IF (OLD.status != NEW.status OR
+          OLD.netboot != NEW.netboot OR
+          OLD.node_type != NEW.node_type OR
+          OLD.osystem != NEW.osystem OR
+          OLD.distro_series != NEW.distro_series OR
+          OLD.hostname != NEW.hostname OR
+          OLD.domain_id IS DISTINCT FROM NEW.domain_id OR
+          OLD.architecture IS DISTINCT FROM NEW.architecture OR
+          OLD.hwe_kernel IS DISTINCT FROM NEW.hwe_kernel OR
+          OLD.min_hwe_kernel IS DISTINCT FROM NEW.min_hwe_kernel) THEN
+        PERFORM sys_boot_config_notify(NEW.id, NEW.hardware_uuid);
+      END IF;
+      IF OLD.hardware_uuid IS DISTINCT FROM NEW.hardware_uuid THEN
+        PERFORM sys_boot_config_notify(NEW.id, OLD.hardware_uuid);
+        PERFORM sys_boot_config_notify(NEW.id, NEW.hardware_uuid);
+      END IF;
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
+# Triggered when an interface is created. Discards a cached "no response"
+# for the MAC address of a newly enlisted machine.
+BOOT_CONFIG_INTERFACE_INSERT = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_boot_config_interface_insert()
+    RETURNS trigger as $$
+    BEGIN
+      IF NEW.mac_address IS NOT NULL THEN
+        PERFORM pg_notify('sys_boot_config', json_build_object(
+          'macs', ARRAY[CAST(NEW.mac_address AS text)],
+          'hardware_uuid', NULL)::text);
+      END IF;
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
+# Triggered when an interface is updated. Only notifies when its MAC
+# address has changed.
+BOOT_CONFIG_INTERFACE_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_boot_config_interface_update()
+    RETURNS trigger as $$
+    BEGIN
+      IF OLD.mac_address IS DISTINCT FROM NEW.mac_address THEN
+        PERFORM pg_notify('sys_boot_config', json_build_object(
+          'macs', ARRAY[
+            CAST(OLD.mac_address AS text), CAST(NEW.mac_address AS text)],
+          'hardware_uuid', NULL)::text);
+      END IF;
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
 def render_sys_proxy_procedure(proc_name, on_delete=False):
     """Render a database procedure with name `proc_name` that notifies that a
     proxy update is needed.
@@ -1795,6 +1938,23 @@ def render_sys_proxy_procedure(proc_name, on_delete=False):
         """ % (proc_name, 'NEW' if not on_delete else 'OLD'))
 
 
+def render_sys_subnet_index_procedure(proc_name, on_delete=False):
+    """Render a database procedure with name `proc_name` that notifies that
+    the in-memory subnet index must be rebuilt.
+
+    :param proc_name: Name of the procedure.
+    :param on_delete: True when procedure will be used as a delete trigger.
+    """
+    return dedent("""\
+        CREATE OR REPLACE FUNCTION %s() RETURNS trigger AS $$
+        BEGIN
+          PERFORM pg_notify('sys_subnet_index', '');
+          RETURN %s;
+        END;
+        $$ LANGUAGE plpgsql;
+        """ % (proc_name, 'NEW' if not on_delete else 'OLD'))
+
+
 @transactional
 def register_system_triggers():
     """Register all system triggers into the database."""
@@ -1907,6 +2067,7 @@ def register_system_triggers():
         "maasserver_dnspublication",
         "sys_dns_publish", "insert")
     register_procedure(DNS_PUBLISH_UPDATE)
+    register_procedure(DNS_PUBLISH_ZONES_UPDATE)
 
     # - Domain
     register_procedure(DNS_DOMAIN_INSERT)
@@ -2039,6 +2200,55 @@ def register_system_triggers():
         "maasserver_config", "sys_proxy_config_use_peer_proxy_update",
         "update")
 
+    # Subnet index
+
+    # - Subnet
+    register_procedure(
+        render_sys_subnet_index_procedure("sys_subnet_index_subnet_insert"))
+    register_trigger(
+        "maasserver_subnet",
+        "sys_subnet_index_subnet_insert", "insert")
+    register_procedure(
+        render_sys_subnet_index_procedure("sys_subnet_index_subnet_update"))
+    register_trigger(
+        "maasserver_subnet",
+        "sys_subnet_index_subnet_update", "update")
+    register_procedure(
+        render_sys_subnet_index_procedure(
+            "sys_subnet_index_subnet_delete", on_delete=True))
+    register_trigger(
+        "maasserver_subnet",
+        "sys_subnet_index_subnet_delete", "delete")
+
+    # - VLAN
+    register_procedure(SUBNET_INDEX_VLAN_UPDATE)
+    register_trigger(
+        "maasserver_vlan",
+        "sys_subnet_index_vlan_update", "update")
+
+    # Boot configuration cache
+    register_procedure(BOOT_CONFIG_NOTIFY)
+
+    # - Node
+    register_procedure(BOOT_CONFIG_NODE_INSERT)
+    register_trigger(
+        "maasserver_node",
+        "sys_boot_config_node_insert", "insert")
+    register_procedure(BOOT_CONFIG_NODE_UPDATE)
+    register_trigger(
+        "maasserver_node",
+        "sys_boot_config_node_update", "update")
+
+    # - Interface
+    register_procedure(BOOT_CONFIG_INTERFACE_INSERT)
+    register_trigger(
+        "maasserver_interface",
+        "sys_boot_config_interface_insert", "insert")
+    register_procedure(BOOT_CONFIG_INTERFACE_UPDATE)
+    register_trigger(
+        "maasserver_interface",
+        "sys_boot_config_interface_update", "update")
+
     # - RBACSync
     register_procedure(RBAC_SYNC)
     register_trigger(
@@ -61,6 +61,14 @@ class TestTriggers(MAASServerTestCase):
             "subnet_sys_proxy_subnet_insert",
             "subnet_sys_proxy_subnet_update",
             "subnet_sys_proxy_subnet_delete",
+            "subnet_sys_subnet_index_subnet_insert",
+            "subnet_sys_subnet_index_subnet_update",
+            "subnet_sys_subnet_index_subnet_delete",
+            "vlan_sys_subnet_index_vlan_update",
+            "node_sys_boot_config_node_insert",
+            "node_sys_boot_config_node_update",
+            "interface_sys_boot_config_interface_insert",
+            "interface_sys_boot_config_interface_update",
             "resourcepool_sys_rbac_rpool_insert",
             "resourcepool_sys_rbac_rpool_update",
             "resourcepool_sys_rbac_rpool_delete",
@@ -19,6 +19,7 @@ from maasserver.enum import (
     INTERFACE_TYPE,
     IPADDRESS_TYPE,
     IPRANGE_TYPE,
+    NODE_STATUS,
     RDNS_MODE,
 )
 from maasserver.models.config import Config
@@ -44,7 +45,10 @@ from maasserver.utils.threads import deferToDatabase
 from netaddr import IPAddress
 from provisioningserver.utils.twisted import DeferredValue
 from testtools import ExpectedException
-from testtools.matchers import Equals
+from testtools.matchers import (
+    Equals,
+    IsInstance,
+)
 from twisted.internet.defer import (
     CancelledError,
     DeferredList,
@@ -3062,6 +3066,26 @@ class TestDNSDomainListener(
             self.getCapturedPublication().source,
             Equals("added zone %s" % name))
 
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_serial_for_domain_insert_authorative(self):
+        yield deferToDatabase(register_system_triggers)
+        yield self.capturePublication()
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_dns", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(
+                self.create_domain, {'authoritative': True})
+            channel, message = yield dv.get(timeout=2)
+            yield self.assertPublicationUpdated()
+        finally:
+            yield listener.stopService()
+        self.assertThat(
+            message, Equals(str(self.getCapturedPublication().serial)))
+
     @wait_for_reactor
     @inlineCallbacks
     def test_doesnt_send_message_for_domain_insert_not_authorative(self):
@@ -3393,6 +3417,78 @@ class TestDNSInterfaceStaticIPAddressListener(
             Equals("ip %s connected to %s on %s" % (
                 sip.ip, node.hostname, interface.name)))
 
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_zones_for_interface_staticipaddress_link(self):
+        yield deferToDatabase(register_system_triggers)
+        interface = yield deferToDatabase(self.create_interface)
+        node = yield deferToDatabase(lambda nic: nic.node, interface)
+        subnet = yield deferToDatabase(self.create_subnet)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_dns_updates", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(self.create_staticipaddress, {
+                "interface": interface,
+                "subnet": subnet,
+            })
+            channel, message = yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+        zones = json.loads(message)
+        self.assertThat(zones.pop("serial"), IsInstance(int))
+        self.assertThat(zones, Equals({
+            "domains": [node.domain_id],
+            "subnets": [subnet.id],
+        }))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_zones_and_serial_for_each_change_in_transaction(self):
+        yield deferToDatabase(register_system_triggers)
+        interface = yield deferToDatabase(self.create_interface)
+        other_interface = yield deferToDatabase(self.create_interface)
+        subnet = yield deferToDatabase(self.create_subnet)
+        messages = []
+        dv = DeferredValue()
+
+        def capture(channel, message):
+            messages.append((channel, message))
+            if len(messages) == 4:
+                dv.set(messages)
+
+        listener = self.make_listener_without_delay()
+        listener.register("sys_dns_updates", capture)
+        listener.register("sys_dns", capture)
+        yield listener.startService()
+
+        @transactional
+        def link_addresses():
+            for nic in (interface, other_interface):
+                self.create_staticipaddress({
+                    "interface": nic,
+                    "subnet": subnet,
+                })
+
+        try:
+            yield deferToDatabase(link_addresses)
+            yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+        # Each announcement of zones is followed by the message for its
+        # publication, which carries the same serial.
+        self.assertThat(
+            [channel for channel, _ in messages],
+            Equals(["sys_dns_updates", "sys_dns"] * 2))
+        serials = [
+            str(json.loads(message)["serial"])
+            for _, message in messages[0::2]
+        ]
+        self.assertThat(
+            [message for _, message in messages[1::2]], Equals(serials))
+
     @wait_for_reactor
     @inlineCallbacks
     def test_doesnt_send_message_for_nic_link_non_authorative_domain(self):
@@ -4691,6 +4787,150 @@ class TestProxyListener(
             yield listener.stopService()
 
 
+class TestSubnetIndexListener(
+        MAASTransactionServerTestCase, TransactionalHelpersMixin):
+    """End-to-end test for the subnet index triggers code."""
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_subnet_insert(self):
+        yield deferToDatabase(register_system_triggers)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_subnet_index", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(self.create_subnet)
+            yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_subnet_update(self):
+        yield deferToDatabase(register_system_triggers)
+        subnet = yield deferToDatabase(self.create_subnet)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_subnet_index", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(self.update_subnet, subnet.id, {
+                "gateway_ip": factory.pick_ip_in_network(
+                    subnet.get_ipnetwork()),
+            })
+            yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_subnet_delete(self):
+        yield deferToDatabase(register_system_triggers)
+        subnet = yield deferToDatabase(self.create_subnet)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_subnet_index", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(self.delete_subnet, subnet.id)
+            yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_vlan_dhcp_on_update(self):
+        yield deferToDatabase(register_system_triggers)
+        primary_rack = yield deferToDatabase(self.create_rack_controller)
+        vlan = yield deferToDatabase(self.create_vlan)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_subnet_index", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(self.update_vlan, vlan.id, {
+                "dhcp_on": True,
+                "primary_rack": primary_rack,
+            })
+            yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+
+
+class TestBootConfigListener(
+        MAASTransactionServerTestCase, TransactionalHelpersMixin):
+    """End-to-end test for the boot configuration triggers code."""
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_node_status_update(self):
+        yield deferToDatabase(register_system_triggers)
+        node = yield deferToDatabase(self.create_node_with_interface, {
+            "status": NODE_STATUS.READY,
+        })
+        interface = yield deferToDatabase(
+            self.get_node_boot_interface, node.system_id)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_boot_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(self.update_node, node.system_id, {
+                "status": NODE_STATUS.COMMISSIONING,
+            })
+            channel, payload = yield dv.get(timeout=2)
+            self.assertEqual({
+                "macs": [str(interface.mac_address)],
+                "hardware_uuid": node.hardware_uuid,
+            }, json.loads(payload))
+        finally:
+            yield listener.stopService()
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_node_netboot_update(self):
+        yield deferToDatabase(register_system_triggers)
+        node = yield deferToDatabase(self.create_node, {"netboot": True})
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_boot_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(self.update_node, node.system_id, {
+                "netboot": False,
+            })
+            yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_interface_insert(self):
+        yield deferToDatabase(register_system_triggers)
+        node = yield deferToDatabase(self.create_node)
+        mac = factory.make_mac_address()
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_boot_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(
+                self.create_interface, {"node": node, "mac_address": mac})
+            channel, payload = yield dv.get(timeout=2)
+            self.assertEqual(
+                {"macs": [mac], "hardware_uuid": None}, json.loads(payload))
+        finally:
+            yield listener.stopService()
+
+
 class TestRBACResourcePoolListener(
         MAASTransactionServerTestCase, TransactionalHelpersMixin,
         RBACHelpersMixin):
@@ -1420,7 +1420,11 @@ def register_websocket_triggers():
     register_procedure(
         render_notification_procedure(
             'neighbour_delete_notify', 'neighbour_delete', 'OLD.ip'))
-    register_triggers("maasserver_neighbour", "neighbour")
+    # Refreshing the time and count of a binding does not notify; those are
+    # coalesced into one notification by `NeighbourManager.record_bindings`.
+    register_triggers(
+        "maasserver_neighbour", "neighbour",
+        fields=['interface_id', 'ip', 'mac_address', 'vid'])
 
     # StaticRoute table
     register_procedure(
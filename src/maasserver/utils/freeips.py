@@ -0,0 +1,61 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Free IP address ranges, best-fitting first."""
+
+__all__ = [
+    "FreeIPRanges",
+]
+
+import heapq
+
+
+class FreeIPRanges:
+    """The free addresses of a subnet, ordered for allocation.
+
+    Addresses are handed out from the *smallest* free contiguous range
+    first, lowest address first, so that larger ranges are preserved for
+    applications that need them. Taking the next address costs O(log n) in
+    the number of ranges.
+    """
+
+    def __init__(self, ranges):
+        """Initialise with `ranges`, an iterable of ``(first, last)`` integer
+        pairs, inclusive, that must not overlap."""
+        super(FreeIPRanges, self).__init__()
+        self._heap = [(last - first, first, last) for first, last in ranges]
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        """Return the number of free addresses."""
+        return sum(last - first + 1 for _, first, last in self._heap)
+
+    def __bool__(self):
+        return len(self._heap) != 0
+
+    def pop(self, exclude=frozenset()):
+        """Remove and return the best address to allocate next, or `None`.
+
+        :param exclude: Addresses to pass over; they remain free.
+        """
+        skipped = []
+        address = self._pop()
+        while address is not None and address in exclude:
+            skipped.append(address)
+            address = self._pop()
+        for address_skipped in skipped:
+            heapq.heappush(
+                self._heap, (0, address_skipped, address_skipped))
+        return address
+
+    def _pop(self):
+        if len(self._heap) == 0:
+            return None
+        size, first, last = self._heap[0]
+        if first == last:
+            heapq.heappop(self._heap)
+        else:
+            # The remainder of the range is still the smallest, so it stays
+            # at the top of the heap.
+            self._heap[0] = size - 1, first + 1, last
+        return first
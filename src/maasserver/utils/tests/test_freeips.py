@@ -0,0 +1,51 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `maasserver.utils.freeips`."""
+
+__all__ = []
+
+from maasserver.utils.freeips import FreeIPRanges
+from maastesting.testcase import MAASTestCase
+
+
+class TestFreeIPRanges(MAASTestCase):
+
+    def pop_all(self, free):
+        addresses = []
+        while free:
+            addresses.append(free.pop())
+        return addresses
+
+    def test_empty(self):
+        free = FreeIPRanges([])
+        self.assertFalse(free)
+        self.assertEqual(0, len(free))
+        self.assertIsNone(free.pop())
+
+    def test_counts_addresses(self):
+        free = FreeIPRanges([(1, 3), (10, 10)])
+        self.assertTrue(free)
+        self.assertEqual(4, len(free))
+
+    def test_pops_from_smallest_range_first(self):
+        free = FreeIPRanges([(1, 5), (10, 11), (20, 22)])
+        self.assertEqual(
+            [10, 11, 20, 21, 22, 1, 2, 3, 4, 5], self.pop_all(free))
+
+    def test_pops_lowest_range_of_equal_size_first(self):
+        free = FreeIPRanges([(20, 21), (10, 11)])
+        self.assertEqual([10, 11, 20, 21], self.pop_all(free))
+
+    def test_pop_passes_over_excluded_addresses(self):
+        free = FreeIPRanges([(1, 3), (10, 11)])
+        self.assertEqual(11, free.pop(exclude={10}))
+        self.assertEqual(4, len(free))
+        self.assertEqual([10, 1, 2, 3], self.pop_all(free))
+
+    def test_handles_large_ranges(self):
+        first = 0x20010db8 << 96
+        free = FreeIPRanges([(first, first + 2 ** 64 - 1)])
+        self.assertEqual(first, free.pop())
+        self.assertEqual(first + 1, free.pop())
+        self.assertEqual(2 ** 64 - 2, len(free))
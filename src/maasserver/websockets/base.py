@@ -166,6 +166,11 @@ class Handler(metaclass=HandlerMetaclass):
         self.user = user
         self.cache = cache
         self.request = request
+        # Shared between all the handlers that are notified of the same
+        # change on behalf of users in the same permission class. Set by the
+        # `WebSocketFactory` while fanning out a notification so that the
+        # object is only looked up and dehydrated once.
+        self.notify_cache = None
         # Holds a set of all pks that the client has loaded and has on their
         # end of the connection. This is used to inform the client of the
         # correct notifications based on what items the client has.
@@ -555,19 +560,15 @@ class Handler(metaclass=HandlerMetaclass):
             else:
                 return None
 
-        self.user.refresh_from_db()
-        try:
-            obj = self.listen(channel, action, pk)
-        except HandlerDoesNotExistError:
-            obj = None
+        obj = self._listen_shared(channel, action, pk)
         if action == "create" and obj is not None:
             if pk in self.cache['loaded_pks']:
                 # The user already knows about this node, so its not a create
                 # to the user but an update.
-                return self.on_listen_for_active_pk("update", pk, obj)
+                return self._on_listen_shared("update", pk, obj)
             else:
                 self.cache['loaded_pks'].add(pk)
-                return self.on_listen_for_active_pk(action, pk, obj)
+                return self._on_listen_shared(action, pk, obj)
         elif action == "update":
             if pk in self.cache['loaded_pks']:
                 if obj is None:
@@ -577,12 +578,12 @@ class Handler(metaclass=HandlerMetaclass):
                     return (self._meta.handler_name, "delete", pk)
                 else:
                     # Just a normal update to the client.
-                    return self.on_listen_for_active_pk(action, pk, obj)
+                    return self._on_listen_shared(action, pk, obj)
             elif obj is not None:
                 # User just got access to this new object. Send the message to
                 # the client as a create action instead of an update.
                 self.cache['loaded_pks'].add(pk)
-                return self.on_listen_for_active_pk("create", pk, obj)
+                return self._on_listen_shared("create", pk, obj)
             else:
                 # User doesn't have access to this object, so do nothing.
                 pass
@@ -592,6 +593,42 @@ class Handler(metaclass=HandlerMetaclass):
             pass
         return None
 
+    def _listen_shared(self, channel, action, pk):
+        """Return the object for `pk` as seen by this handler's user.
+
+        When `notify_cache` is set the lookup is shared by every handler in
+        the same permission class, otherwise `listen` is called directly.
+        """
+        cache = self.notify_cache
+        key = ("listen", channel, action, pk)
+        if cache is not None and key in cache:
+            return cache[key]
+        self.user.refresh_from_db()
+        try:
+            obj = self.listen(channel, action, pk)
+        except HandlerDoesNotExistError:
+            obj = None
+        if cache is not None:
+            cache[key] = obj
+        return obj
+
+    def _on_listen_shared(self, action, pk, obj):
+        """Return `on_listen_for_active_pk`, sharing the dehydrated result
+        with the other handlers in the same permission class.
+
+        Only whether `pk` is this client's active object differs between
+        clients, so that forms part of the cache key.
+        """
+        cache = self.notify_cache
+        if cache is None:
+            return self.on_listen_for_active_pk(action, pk, obj)
+        active = (
+            'active_pk' in self.cache and pk == self.cache['active_pk'])
+        key = ("dehydrate", action, pk, active)
+        if key not in cache:
+            cache[key] = self.on_listen_for_active_pk(action, pk, obj)
+        return cache[key]
+
     def on_listen_for_active_pk(self, action, pk, obj):
         """Return the correct data for `obj` depending on if its the
         active primary key."""
@@ -191,19 +191,29 @@ class NodeResultHandler(TimestampedModelHandler):
         ]
 
     def get_result_data(self, params):
-        """Return the raw script result data."""
+        """Return the raw script result data.
+
+        :param id: The id of the script result.
+        :param data_type: One of combined, stdout, stderr, or result.
+        :param offset: Only return data from this byte onwards.
+        :param length: Only return up to this many bytes of data.
+        """
         id = params.get('id')
         data_type = params.get('data_type', 'combined')
         if data_type not in {'combined', 'stdout', 'stderr', 'result'}:
             return "Unknown data_type %s" % data_type
         if data_type == 'combined':
             data_type = 'output'
-        script_result = ScriptResult.objects.filter(
-            id=id).only(data_type).first()
+        script_result = ScriptResult.objects.filter(id=id).only('id').first()
         if script_result is None:
             return "Unknown ScriptResult id %s" % id
-        data = getattr(script_result, data_type)
-        return data.decode().strip()
+        if 'offset' in params or 'length' in params:
+            # A range may split a multi-byte character at either end.
+            data = script_result.read_data(
+                data_type, params.get('offset', 0), params.get('length'))
+            return data.decode(errors='replace')
+        else:
+            return script_result.read_data(data_type).decode().strip()
 
     def get_history(self, params):
         """Return a list of historic results."""
@@ -288,6 +288,23 @@ class TestNodeResultHandler(MAASServerTestCase):
             stderr.decode(), handler.get_result_data(
                 {'id': script_result.id, 'data_type': 'stderr'}))
 
+    def test_get_result_data_gets_range(self):
+        user = factory.make_User()
+        handler = NodeResultHandler(user, {}, None)
+        node = factory.make_Node()
+        stdout = factory.make_string(size=100).encode('utf-8')
+        script_result = factory.make_ScriptResult(
+            status=SCRIPT_STATUS.PASSED, stdout=stdout,
+            script_set=factory.make_ScriptSet(node=node))
+        self.assertEquals(
+            stdout[10:30].decode(), handler.get_result_data({
+                'id': script_result.id, 'data_type': 'stdout',
+                'offset': 10, 'length': 20}))
+        self.assertEquals(
+            stdout[90:].decode(), handler.get_result_data({
+                'id': script_result.id, 'data_type': 'stdout',
+                'offset': 90}))
+
     def test_get_result_data_gets_result(self):
         user = factory.make_User()
         handler = NodeResultHandler(user, {}, None)
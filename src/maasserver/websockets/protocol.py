@@ -7,7 +7,10 @@ __all__ = [
     "WebSocketProtocol",
 ]
 
-from collections import deque
+from collections import (
+    deque,
+    OrderedDict,
+)
 from functools import partial
 from http.cookies import SimpleCookie
 import json
@@ -27,6 +30,7 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.http import HttpRequest
 from maasserver.eventloop import services
+from maasserver.prometheus.metrics import PROMETHEUS_METRICS
 from maasserver.utils.orm import transactional
 from maasserver.utils.threads import deferToDatabase
 from maasserver.websockets import handlers
@@ -38,7 +42,10 @@ from provisioningserver.utils.twisted import (
     synchronous,
 )
 from provisioningserver.utils.url import splithost
-from twisted.internet import defer
+from twisted.internet import (
+    defer,
+    reactor,
+)
 from twisted.internet.defer import (
     fail,
     inlineCallbacks,
@@ -89,6 +96,21 @@ def get_cookie(cookies: Optional[str], cookie_name: str) -> Optional[str]:
         return None
 
 
+def coalesce_notify_actions(previous, action):
+    """Return the action equivalent to `previous` followed by `action`.
+
+    Handlers decide from the current state of the object whether an update
+    is a create, update or delete for each client, so anything other than a
+    repeat of the same action or a final delete is an update.
+    """
+    if previous == action:
+        return action
+    elif action == "delete":
+        return action
+    else:
+        return "update"
+
+
 class WebSocketProtocol(Protocol):
     """The web-socket protocol that supports the web UI.
 
@@ -407,10 +429,19 @@ class WebSocketFactory(Factory):
 
     protocol = WebSocketProtocol
 
-    def __init__(self, listener):
+    # Seconds that notifications from the database are held before being
+    # sent to the clients. Repeated notifications for the same object inside
+    # this window are coalesced into a single notification.
+    NOTIFY_COALESCE_WINDOW = 0.25
+
+    def __init__(self, listener, clock=reactor):
         self.handlers = {}
         self.clients = []
         self.listener = listener
+        self.clock = clock
+        self.pendingNotifies = OrderedDict()
+        self.flushNotifiesCall = None
+        self.flushingNotifies = None
         self.cacheHandlers()
         self.registerNotifiers()
 
@@ -421,6 +452,11 @@ class WebSocketFactory(Factory):
     def stopFactory(self):
         """Unregister RPC events."""
         self.unregisterRPCEvents()
+        if self.flushNotifiesCall is not None:
+            if self.flushNotifiesCall.active():
+                self.flushNotifiesCall.cancel()
+            self.flushNotifiesCall = None
+        self.pendingNotifies.clear()
 
     def getSessionEngine(self):
         """Returns the session engine being used by Django.
@@ -458,21 +494,117 @@ class WebSocketFactory(Factory):
         for handler in self.handlers.values():
             for channel in handler._meta.listen_channels:
                 self.listener.register(
-                    channel, partial(self.onNotify, handler, channel))
+                    channel, partial(self.queueNotify, handler, channel))
+
+    def queueNotify(self, handler_class, channel, action, obj_id):
+        """Queue a notification from the database to be sent to the clients.
+
+        Notifications for the same object that arrive before the queue is
+        flushed are coalesced, so the object is only processed once.
+        """
+        key = (handler_class, channel, obj_id)
+        pending = self.pendingNotifies.get(key)
+        if pending is None:
+            self.pendingNotifies[key] = [action, self.clock.seconds()]
+        else:
+            pending[0] = coalesce_notify_actions(pending[0], action)
+            if len(self.clients) > 0:
+                PROMETHEUS_METRICS.update(
+                    'maas_websocket_notify_queries_saved', 'inc',
+                    value=len(self.clients),
+                    labels={'handler': handler_class._meta.handler_name})
+        self.scheduleFlushNotifies()
+
+    def scheduleFlushNotifies(self):
+        """Schedule `flushNotifies` unless already scheduled or running."""
+        if (len(self.pendingNotifies) > 0 and
+                self.flushNotifiesCall is None and
+                self.flushingNotifies is None):
+            self.flushNotifiesCall = self.clock.callLater(
+                self.NOTIFY_COALESCE_WINDOW, self.flushNotifies)
+
+    def flushNotifies(self):
+        """Send all of the queued notifications to the clients.
+
+        Notifications queued while this is running are held until it has
+        finished, so only one flush is ever hitting the database.
+        """
+        self.flushNotifiesCall = None
+        pending, self.pendingNotifies = self.pendingNotifies, OrderedDict()
+
+        @inlineCallbacks
+        def sendAll():
+            for key, (action, queued) in pending.items():
+                handler_class, channel, obj_id = key
+                try:
+                    yield self.onNotify(
+                        handler_class, channel, action, obj_id,
+                        queued=queued)
+                except Exception:
+                    log.err(
+                        None, "Failed to send notification %s %s(%s)." % (
+                            channel, action, obj_id))
+
+        def done(result):
+            self.flushingNotifies = None
+            self.scheduleFlushNotifies()
+            return result
+
+        self.flushingNotifies = sendAll()
+        self.flushingNotifies.addBoth(done)
+        return self.flushingNotifies
+
+    def getNotifyPermissionKey(self, client):
+        """Return the permission class of `client` for notifications.
+
+        Clients in the same permission class see exactly the same dehydrated
+        objects. What a user sees depends on their ownership of objects and
+        RBAC roles as well as their superuser status, so only clients
+        authenticated as the same user share a permission class.
+        """
+        return client.user.id
 
     @inlineCallbacks
-    def onNotify(self, handler_class, channel, action, obj_id):
-        for client in self.clients:
+    def onNotify(self, handler_class, channel, action, obj_id, queued=None):
+        """Send a notification to all clients.
+
+        The object is looked up and dehydrated once for each permission
+        class in a single transaction, with each client's handler only
+        filtering the shared result against what that client has loaded.
+        """
+        if queued is None:
+            queued = self.clock.seconds()
+        clients = list(self.clients)
+        notify_caches = {}
+        client_handlers = []
+        for client in clients:
             handler = client.buildHandler(handler_class)
-            data = yield deferToDatabase(
-                self.processNotify, handler, channel, action, obj_id)
+            handler.notify_cache = notify_caches.setdefault(
+                self.getNotifyPermissionKey(client), {})
+            client_handlers.append(handler)
+        results = yield deferToDatabase(
+            self.processNotifies, client_handlers, channel, action, obj_id)
+        for client, data in zip(clients, results):
             if data is not None:
                 (name, client_action, data) = data
                 client.sendNotify(name, client_action, data)
+        labels = {'handler': handler_class._meta.handler_name}
+        saved = len(client_handlers) - len(notify_caches)
+        if saved > 0:
+            PROMETHEUS_METRICS.update(
+                'maas_websocket_notify_queries_saved', 'inc',
+                value=saved, labels=labels)
+        PROMETHEUS_METRICS.update(
+            'maas_websocket_notify_latency', 'observe',
+            value=self.clock.seconds() - queued, labels=labels)
 
     @transactional
-    def processNotify(self, handler, channel, action, obj_id):
-        return handler.on_listen(channel, action, obj_id)
+    def processNotifies(self, client_handlers, channel, action, obj_id):
+        """Return the result of `on_listen` for each of `client_handlers`."""
+        return [
+            handler.on_listen(channel, action, obj_id)
+            for handler in client_handlers
+        ]
 
     def registerRPCEvents(self):
         """Register for connected and disconnected events from the RPC
@@ -828,6 +828,58 @@ class TestHandler(MAASServerTestCase, FakeNodesHandlerMixin):
             mock_dehydrate,
             MockCalledOnceWith(node, for_list=False))
 
+    def test_on_listen_shares_listen_through_notify_cache(self):
+        node = factory.make_Node()
+        handler = self.make_nodes_handler()
+        handler.notify_cache = {}
+        other = self.make_nodes_handler()
+        other.notify_cache = handler.notify_cache
+        mock_listen = self.patch(handler, "listen")
+        mock_listen.return_value = node
+        mock_other_listen = self.patch(other, "listen")
+        handler.on_listen(sentinel.channel, "update", node.system_id)
+        other.on_listen(sentinel.channel, "update", node.system_id)
+        self.expectThat(mock_listen, MockCalledOnceWith(
+            sentinel.channel, "update", node.system_id))
+        self.expectThat(mock_other_listen, MockNotCalled())
+
+    def test_on_listen_shares_dehydrate_through_notify_cache(self):
+        node = factory.make_Node()
+        handler = self.make_nodes_handler()
+        handler.notify_cache = {}
+        other = self.make_nodes_handler()
+        other.notify_cache = handler.notify_cache
+        mock_dehydrate = self.patch(handler, "full_dehydrate")
+        mock_dehydrate.return_value = sentinel.data
+        mock_other_dehydrate = self.patch(other, "full_dehydrate")
+        expected = (handler._meta.handler_name, "create", sentinel.data)
+        self.expectThat(
+            handler.on_listen(sentinel.channel, "update", node.system_id),
+            Equals(expected))
+        self.expectThat(
+            other.on_listen(sentinel.channel, "update", node.system_id),
+            Equals(expected))
+        self.expectThat(mock_other_dehydrate, MockNotCalled())
+        self.expectThat(
+            other.cache["loaded_pks"], Equals({node.system_id}))
+
+    def test_on_listen_notify_cache_separates_active_pk(self):
+        node = factory.make_Node()
+        handler = self.make_nodes_handler()
+        handler.notify_cache = {}
+        other = self.make_nodes_handler()
+        other.notify_cache = handler.notify_cache
+        other.cache["active_pk"] = node.system_id
+        self.patch(handler, "full_dehydrate").return_value = sentinel.list
+        mock_other_dehydrate = self.patch(other, "full_dehydrate")
+        mock_other_dehydrate.return_value = sentinel.full
+        handler.on_listen(sentinel.channel, "update", node.system_id)
+        self.expectThat(
+            other.on_listen(sentinel.channel, "update", node.system_id),
+            Equals((other._meta.handler_name, "create", sentinel.full)))
+        self.expectThat(
+            mock_other_dehydrate, MockCalledOnceWith(node, for_list=False))
+
     def test_listen_calls_get_object_with_pk_on_other_actions(self):
         handler = self.make_nodes_handler()
         mock_get_object = self.patch(handler, "get_object")
@@ -29,6 +29,7 @@ from maasserver.websockets.handlers import (
     MachineHandler,
 )
 from maasserver.websockets.protocol import (
+    coalesce_notify_actions,
     MSG_TYPE,
     RESPONSE_TYPE,
     WebSocketFactory,
@@ -40,6 +41,7 @@ from maastesting.matchers import (
     IsFiredDeferred,
     MockCalledOnceWith,
     MockCalledWith,
+    MockNotCalled,
 )
 from maastesting.testcase import MAASTestCase
 from maastesting.twisted import TwistedLoggerFixture
@@ -56,6 +58,7 @@ from twisted.internet.defer import (
     inlineCallbacks,
     succeed,
 )
+from twisted.internet.task import Clock
 from twisted.web.server import NOT_DONE_YET
 
 
@@ -891,6 +894,101 @@ class TestWebSocketFactory(MAASTestCase, MakeProtocolFactoryMixin):
             ALL_NOTIFIERS, factory.listener.listeners.keys())
 
 
+class TestCoalesceNotifyActions(MAASTestCase):
+
+    scenarios = (
+        ("create-create", dict(
+            previous="create", action="create", expected="create")),
+        ("create-update", dict(
+            previous="create", action="update", expected="update")),
+        ("update-update", dict(
+            previous="update", action="update", expected="update")),
+        ("create-delete", dict(
+            previous="create", action="delete", expected="delete")),
+        ("update-delete", dict(
+            previous="update", action="delete", expected="delete")),
+        ("delete-create", dict(
+            previous="delete", action="create", expected="update")),
+        ("delete-update", dict(
+            previous="delete", action="update", expected="update")),
+    )
+
+    def test_coalesce_notify_actions(self):
+        self.assertEqual(
+            self.expected,
+            coalesce_notify_actions(self.previous, self.action))
+
+
+class TestWebSocketFactoryNotifyQueue(MAASTestCase, MakeProtocolFactoryMixin):
+
+    def make_factory_with_clock(self):
+        factory = self.make_factory()
+        factory.clock = Clock()
+        self.patch(factory, "onNotify").return_value = succeed(None)
+        return factory
+
+    def test_registerNotifiers_registers_queueNotify(self):
+        factory = self.make_factory()
+        [notifier] = factory.listener.listeners["zone"]
+        self.assertEqual(factory.queueNotify, notifier.func)
+
+    def test_queueNotify_sends_after_coalesce_window(self):
+        factory = self.make_factory_with_clock()
+        factory.queueNotify(sentinel.handler, "zone", "update", 1)
+        self.assertThat(factory.onNotify, MockNotCalled())
+        factory.clock.advance(factory.NOTIFY_COALESCE_WINDOW)
+        self.assertThat(
+            factory.onNotify, MockCalledOnceWith(
+                sentinel.handler, "zone", "update", 1, queued=0))
+
+    def test_queueNotify_coalesces_notifications_for_same_object(self):
+        factory = self.make_factory_with_clock()
+        handler = MagicMock()
+        factory.queueNotify(handler, "zone", "create", 1)
+        factory.queueNotify(handler, "zone", "update", 1)
+        factory.queueNotify(handler, "zone", "update", 2)
+        factory.clock.advance(factory.NOTIFY_COALESCE_WINDOW)
+        self.assertEqual(
+            [
+                ((handler, "zone", "update", 1), {"queued": 0}),
+                ((handler, "zone", "update", 2), {"queued": 0}),
+            ],
+            factory.onNotify.call_args_list)
+
+    def test_queueNotify_holds_notifications_while_flushing(self):
+        factory = self.make_factory_with_clock()
+        d = defer.Deferred()
+        factory.onNotify.return_value = d
+        factory.queueNotify(sentinel.handler, "zone", "update", 1)
+        factory.clock.advance(factory.NOTIFY_COALESCE_WINDOW)
+        factory.queueNotify(sentinel.handler, "zone", "update", 2)
+        factory.clock.advance(factory.NOTIFY_COALESCE_WINDOW)
+        self.assertEqual(1, factory.onNotify.call_count)
+        factory.onNotify.return_value = succeed(None)
+        d.callback(None)
+        factory.clock.advance(factory.NOTIFY_COALESCE_WINDOW)
+        self.assertEqual(2, factory.onNotify.call_count)
+
+    def test_flushNotifies_logs_failures_and_continues(self):
+        factory = self.make_factory_with_clock()
+        factory.onNotify.side_effect = [
+            fail(ValueError("boom")), succeed(None)]
+        factory.queueNotify(sentinel.handler, "zone", "update", 1)
+        factory.queueNotify(sentinel.handler, "zone", "update", 2)
+        with TwistedLoggerFixture() as logger:
+            factory.clock.advance(factory.NOTIFY_COALESCE_WINDOW)
+        self.assertEqual(2, factory.onNotify.call_count)
+        self.assertIn("Failed to send notification", logger.output)
+
+    def test_stopFactory_cancels_pending_notifications(self):
+        factory = self.make_factory_with_clock()
+        factory.startFactory()
+        factory.queueNotify(sentinel.handler, "zone", "update", 1)
+        factory.stopFactory()
+        factory.clock.advance(factory.NOTIFY_COALESCE_WINDOW)
+        self.assertThat(factory.onNotify, MockNotCalled())
+
+
 class TestWebSocketFactoryTransactional(
         MAASTransactionServerTestCase, MakeProtocolFactoryMixin):
 
@@ -959,6 +1057,53 @@ class TestWebSocketFactoryTransactional(
         self.assertThat(
             mock_sendNotify, MockCalledWith(name, action, data))
 
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_onNotify_shares_notify_cache_between_same_user(self):
+        user = yield deferToDatabase(self.make_user)
+        protocol, factory = self.make_protocol_with_factory(user=user)
+        other = factory.buildProtocol(None)
+        other.user = user
+        other.request = protocol.request
+        factory.clients.append(other)
+        self.addCleanup(factory.clients.remove, other)
+        handler_class = MagicMock()
+        handler_class.side_effect = lambda *args: MagicMock(
+            on_listen=MagicMock(return_value=None))
+        handlers = []
+        self.patch(protocol, "buildHandler").side_effect = (
+            lambda cls: handlers.append(cls()) or handlers[-1])
+        self.patch(other, "buildHandler").side_effect = (
+            lambda cls: handlers.append(cls()) or handlers[-1])
+        yield factory.onNotify(
+            handler_class, sentinel.channel, "update", sentinel.obj_id)
+        self.assertEqual(2, len(handlers))
+        self.assertIs(handlers[0].notify_cache, handlers[1].notify_cache)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_onNotify_separates_notify_cache_between_users(self):
+        user = yield deferToDatabase(self.make_user)
+        other_user = yield deferToDatabase(self.make_user)
+        protocol, factory = self.make_protocol_with_factory(user=user)
+        other = factory.buildProtocol(None)
+        other.user = other_user
+        other.request = protocol.request
+        factory.clients.append(other)
+        self.addCleanup(factory.clients.remove, other)
+        handler_class = MagicMock()
+        handler_class.side_effect = lambda *args: MagicMock(
+            on_listen=MagicMock(return_value=None))
+        handlers = []
+        self.patch(protocol, "buildHandler").side_effect = (
+            lambda cls: handlers.append(cls()) or handlers[-1])
+        self.patch(other, "buildHandler").side_effect = (
+            lambda cls: handlers.append(cls()) or handlers[-1])
+        yield factory.onNotify(
+            handler_class, sentinel.channel, "update", sentinel.obj_id)
+        self.assertIsNot(
+            handlers[0].notify_cache, handlers[1].notify_cache)
+
     @wait_for_reactor
     @inlineCallbacks
     def test_updateRackController_calls_onNotify_for_controller_update(self):
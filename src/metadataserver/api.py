@@ -63,6 +63,7 @@ from maasserver.models import (
     SSLKey,
 )
 from maasserver.models.event import Event
+from maasserver.models.eventtype import EventType
 from maasserver.models.tag import Tag
 from maasserver.models.timestampedmodel import now
 from maasserver.node_status import NODE_TESTING_RESET_READY_TRANSITIONS
@@ -189,33 +190,37 @@ def check_version(version):
         raise UnknownMetadataVersion("Unknown metadata version: %s" % version)
 
 
-def add_event_to_node_event_log(
-        node, origin, action, description, result=None, created=None):
-    """Add an entry to the node's event log."""
+def get_node_event_type_name(node, result=None):
+    """Return the type of event for a status message from `node`."""
     if node.status == NODE_STATUS.COMMISSIONING:
         if result in ['SUCCESS', None]:
-            type_name = EVENT_TYPES.NODE_COMMISSIONING_EVENT
+            return EVENT_TYPES.NODE_COMMISSIONING_EVENT
         else:
-            type_name = EVENT_TYPES.NODE_COMMISSIONING_EVENT_FAILED
+            return EVENT_TYPES.NODE_COMMISSIONING_EVENT_FAILED
     elif node.status == NODE_STATUS.DEPLOYING:
         if result in ['SUCCESS', None]:
-            type_name = EVENT_TYPES.NODE_INSTALL_EVENT
+            return EVENT_TYPES.NODE_INSTALL_EVENT
         else:
-            type_name = EVENT_TYPES.NODE_INSTALL_EVENT_FAILED
+            return EVENT_TYPES.NODE_INSTALL_EVENT_FAILED
     elif node.status == NODE_STATUS.DEPLOYED and result in ['FAIL']:
-        type_name = EVENT_TYPES.NODE_POST_INSTALL_EVENT_FAILED
+        return EVENT_TYPES.NODE_POST_INSTALL_EVENT_FAILED
     elif node.status == NODE_STATUS.ENTERING_RESCUE_MODE:
         if result in ['SUCCESS', None]:
-            type_name = EVENT_TYPES.NODE_ENTERING_RESCUE_MODE_EVENT
+            return EVENT_TYPES.NODE_ENTERING_RESCUE_MODE_EVENT
         else:
-            type_name = EVENT_TYPES.NODE_ENTERING_RESCUE_MODE_EVENT_FAILED
+            return EVENT_TYPES.NODE_ENTERING_RESCUE_MODE_EVENT_FAILED
     elif node.node_type in [
             NODE_TYPE.RACK_CONTROLLER,
             NODE_TYPE.REGION_AND_RACK_CONTROLLER]:
-        type_name = EVENT_TYPES.REQUEST_CONTROLLER_REFRESH
+        return EVENT_TYPES.REQUEST_CONTROLLER_REFRESH
     else:
-        type_name = EVENT_TYPES.NODE_STATUS_EVENT
+        return EVENT_TYPES.NODE_STATUS_EVENT
+
 
+def add_event_to_node_event_log(
+        node, origin, action, description, result=None, created=None):
+    """Add an entry to the node's event log."""
+    type_name = get_node_event_type_name(node, result)
     event_details = EVENT_DETAILS[type_name]
     return Event.objects.register_event_and_event_type(
         type_name, type_level=event_details.level,
@@ -225,6 +230,26 @@ def add_event_to_node_event_log(
         system_id=node.system_id, created=created)
 
 
+def make_node_event_log_entry(
+        node, origin, action, description, result=None, created=None):
+    """Return an unsaved entry for the node's event log.
+
+    This is the same entry `add_event_to_node_event_log` adds, for when
+    several entries are saved together with `Event.objects.bulk_create`.
+    """
+    type_name = get_node_event_type_name(node, result)
+    event_details = EVENT_DETAILS[type_name]
+    event_type = EventType.objects.register(
+        type_name, event_details.description, event_details.level)
+    if created is None:
+        created = now()
+    return Event(
+        type=event_type, node=node, node_system_id=node.system_id,
+        node_hostname=node.hostname, action=action,
+        description="'%s' %s" % (origin, description),
+        created=created, updated=created)
+
+
 def process_file(
         results, script_set, script_name, content, request,
         default_exit_status=None):
@@ -6,8 +6,15 @@
 import base64
 import bz2
 from collections import defaultdict
-from datetime import datetime
+import copy
+from datetime import (
+    datetime,
+    timedelta,
+)
 import json
+import os
+import time
+from uuid import uuid4
 
 from maasserver.api.utils import extract_oauth_key_from_auth_header
 from maasserver.enum import (
@@ -16,27 +23,34 @@ from maasserver.enum import (
 )
 from maasserver.forms.pods import PodForm
 from maasserver.models import (
+    Event,
     Node,
     NodeMetadata,
 )
 from maasserver.preseed import CURTIN_INSTALL_LOG
+from maasserver.prometheus.metrics import PROMETHEUS_METRICS
 from maasserver.utils.orm import (
     in_transaction,
+    is_retryable_failure,
+    savepoint,
     transactional,
     TransactionManagementError,
 )
 from maasserver.utils.threads import deferToDatabase
 from metadataserver import logger
 from metadataserver.api import (
-    add_event_to_node_event_log,
+    make_node_event_log_entry,
     process_file,
 )
 from metadataserver.enum import SCRIPT_STATUS
 from metadataserver.models import NodeKey
 from provisioningserver.logger import LegacyLogger
+from provisioningserver.path import get_data_path
+from provisioningserver.utils.fs import FileLock
 from provisioningserver.utils.twisted import deferred
 from twisted.application.internet import TimerService
 from twisted.internet import reactor
+from twisted.internet.defer import DeferredList
 from twisted.web.resource import Resource
 from twisted.web.server import NOT_DONE_YET
 
@@ -220,24 +234,167 @@ def _create_pod_for_deployment(node):
             log.msg("Error while creating KVM pod: %s" % dict(pod_form.errors))
 
 
+# Naive UTC datetime of the Unix epoch, used to store message timestamps.
+EPOCH = datetime.utcfromtimestamp(0)
+
+
+class StatusMessageSpool:
+    """On-disk record of status messages waiting to be processed.
+
+    Messages are appended to the spool as lines of JSON. The spool is locked
+    for as long as it is open so that the spools left behind by a regiond
+    process that has gone away can be claimed by another.
+
+    Appending is done in the reactor. That blocks it only briefly: only
+    messages without files are spooled, which are small, and they are
+    flushed to the OS but not synced to disk. The spool protects against
+    regiond going away, not against the machine going down.
+    """
+
+    suffix = ".spool"
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = FileLock(path)
+        self.lock.acquire()
+        try:
+            self.stream = open(path, "a", encoding="ascii")
+        except:
+            self.lock.release()
+            raise
+
+    @classmethod
+    def create(cls, directory):
+        """Create a new spool in `directory`."""
+        return cls(os.path.join(directory, uuid4().hex + cls.suffix))
+
+    @classmethod
+    def claim(cls, directory):
+        """Yield the spools in `directory` no longer held by any process."""
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(cls.suffix):
+                try:
+                    yield cls(os.path.join(directory, filename))
+                except FileLock.NotAvailable:
+                    # The owner is still running.
+                    continue
+
+    def append(self, authorization, received, message):
+        """Record `message` from the node with the given `authorization`."""
+        timestamp = (message['timestamp'] - EPOCH) // timedelta(microseconds=1)
+        record = {
+            'authorization': authorization,
+            'received': received,
+            'message': dict(message, timestamp=timestamp),
+        }
+        self.stream.write(json.dumps(record) + "\n")
+        self.stream.flush()
+
+    def read(self):
+        """Yield `(authorization, received, message)` for each message."""
+        self.stream.flush()
+        with open(self.path, "r", encoding="ascii") as stream:
+            for line in stream:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Partially written when the owner went away.
+                    continue
+                message = record['message']
+                message['timestamp'] = EPOCH + timedelta(
+                    microseconds=message['timestamp'])
+                yield record['authorization'], record['received'], message
+
+    def close(self):
+        """Close the spool, leaving it to be claimed later."""
+        self.stream.close()
+        self.lock.release()
+
+    def discard(self):
+        """Close and remove the spool."""
+        self.stream.close()
+        try:
+            os.remove(self.path)
+        finally:
+            self.lock.release()
+
+
 class StatusWorkerService(TimerService, object):
-    """Service to update nodes from recieved status messages."""
+    """Service to update nodes from recieved status messages.
+
+    Messages that are not processed instantly are queued in memory and
+    recorded in a spool under `spool_dir`, from where they are recovered if
+    regiond stops before processing them. The queue is drained every
+    `check_interval` seconds, or as soon as `max_queued` messages are
+    waiting, and each node's messages are then processed in one
+    transaction.
+    """
 
     check_interval = 60  # Every second.
 
-    def __init__(self, dbtasks, clock=reactor):
+    # Drain the queue early once this many messages are waiting.
+    max_queued = 1000
+
+    def __init__(self, dbtasks, clock=reactor, spool_dir=None):
         # Call self._tryUpdateNodes() every self.check_interval.
         super(StatusWorkerService, self).__init__(
             self.check_interval, self._tryUpdateNodes)
         self.dbtasks = dbtasks
         self.clock = clock
         self.queue = defaultdict(list)
+        self.queued = 0
+        # When the oldest queued message for each authorization arrived.
+        self.received = {}
+        self.spool = None
+        if spool_dir is None:
+            spool_dir = get_data_path("/var/lib/maas/status-spool")
+        self.spool_dir = spool_dir
+
+    def startService(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.spool = StatusMessageSpool.create(self.spool_dir)
+        self._claimSpools()
+        super(StatusWorkerService, self).startService()
+
+    def stopService(self):
+        # Messages still queued stay in the spool for the next start.
+        self.spool.close()
+        self.spool = None
+        return super(StatusWorkerService, self).stopService()
+
+    def _claimSpools(self):
+        """Queue the messages left behind by other processes."""
+        for spool in StatusMessageSpool.claim(self.spool_dir):
+            for authorization, received, message in spool.read():
+                self._queueMessageLater(authorization, message, received)
+            spool.discard()
+
+    def _queueMessageLater(self, authorization, message, received):
+        if self.spool is not None:
+            self.spool.append(authorization, received, message)
+        self.queue[authorization].append(message)
+        self.received[authorization] = min(
+            received, self.received.get(authorization, received))
+        self.queued += 1
+        PROMETHEUS_METRICS.update(
+            'maas_status_messages_queued', 'set', value=self.queued)
+        if self.queued >= self.max_queued:
+            self._tryUpdateNodes()
 
     def _tryUpdateNodes(self):
         if len(self.queue) != 0:
             queue, self.queue = self.queue, defaultdict(list)
+            received, self.received = self.received, {}
+            self.queued = 0
+            PROMETHEUS_METRICS.update(
+                'maas_status_messages_queued', 'set', value=0)
+            # The messages being drained are kept in the current spool until
+            # they have all been stored; new messages go to a new spool.
+            spool = self.spool
+            if spool is not None:
+                self.spool = StatusMessageSpool.create(self.spool_dir)
             d = deferToDatabase(self._preProcessQueue, queue)
-            d.addCallback(self._processMessagesLater)
+            d.addCallback(self._processMessagesLater, received, spool)
             d.addErrback(log.err, "Failed to process node status messages.")
             return d
 
@@ -245,25 +402,33 @@ class StatusWorkerService(TimerService, object):
     def _preProcessQueue(self, queue):
         """Check authorizations.
 
-        Return a list of (node, messages) tuples, where each node is found
-        from its authorisation.
+        Return a list of (authorization, node, messages) tuples, where each
+        node is found from its authorisation.
         """
         keys = NodeKey.objects.filter(
             key__in=list(queue.keys())).select_related('node')
         return [
-            (key.node, queue[key.key])
+            (key.key, key.node, queue[key.key])
             for key in keys
         ]
 
-    def _processMessagesLater(self, tasks):
+    def _processMessagesLater(self, tasks, received, spool=None):
         # Move all messages on the queue off onto the database tasks queue.
         # We're not going to wait for them to be processed because we can't /
         # don't apply back-pressure to those systems that are producing these
         # messages anyway.
-        for node, messages in tasks:
-            self.dbtasks.addTask(self._processMessages, node, messages)
-
-    def _processMessages(self, node, messages):
+        done = []
+        for authorization, node, messages in tasks:
+            d = self.dbtasks.deferTask(
+                self._processMessages, node, messages,
+                received[authorization])
+            d.addErrback(log.err, "Unhandled failure in database task.")
+            done.append(d)
+        if spool is not None:
+            # Once every message has been stored the spool is not needed.
+            DeferredList(done).addCallback(lambda _: spool.discard())
+
+    def _processMessages(self, node, messages, received=None):
         # Push the messages into the database, recording them for this node.
         # This should be called in a non-reactor thread with a pre-existing
         # connection (e.g. via deferToDatabase).
@@ -273,18 +438,53 @@ class StatusWorkerService(TimerService, object):
                 "outside of a transaction.")
         else:
             # Here we're in a database thread, with a database connection.
-            for idx, message in enumerate(messages):
-                try:
-                    exists = self._processMessage(node, message)
-                    if not exists:
-                        # Node has been deleted no reason to continue saving
-                        # the events for this node.
-                        break
-                except:
-                    log.err(
-                        None,
-                        "Failed to process message "
-                        "for node: %s" % node.hostname)
+            try:
+                self._processNodeMessages(node, messages)
+            except:
+                log.err(
+                    None,
+                    "Failed to process messages "
+                    "for node: %s" % node.hostname)
+            if received is not None:
+                PROMETHEUS_METRICS.update(
+                    'maas_status_message_ingestion_latency', 'observe',
+                    value=time.time() - received)
+
+    @transactional
+    def _processNodeMessages(self, node, messages):
+        # Validate that the node still exists since this is a new transaction.
+        try:
+            node = Node.objects.get(id=node.id)
+        except Node.DoesNotExist:
+            return False
+
+        # Events are inserted together, and the node is saved once, at the
+        # end; the events are logged before any events the node itself
+        # records when it's saved.
+        events = []
+        save_node = False
+        for message in messages:
+            # The node as it was before this message, in case it fails.
+            unchanged = copy.copy(node)
+            try:
+                with savepoint():
+                    event, changed = self._handleMessage(node, message)
+            except Exception as error:
+                if is_retryable_failure(error):
+                    raise
+                log.err(
+                    None,
+                    "Failed to process message "
+                    "for node: %s" % node.hostname)
+                # Discard any changes the failed message made to the node.
+                node = unchanged
+            else:
+                events.append(event)
+                save_node = save_node or changed
+        Event.objects.bulk_create(events)
+        if save_node:
+            node.save()
+        return True
 
     @transactional
     def _processMessage(self, node, message):
@@ -294,6 +494,18 @@ class StatusWorkerService(TimerService, object):
         except Node.DoesNotExist:
             return False
 
+        event, save_node = self._handleMessage(node, message)
+        Event.objects.bulk_create([event])
+        if save_node:
+            node.save()
+        return True
+
+    def _handleMessage(self, node, message):
+        """Apply `message` to `node`.
+
+        :return: A tuple of the unsaved event for the node's event log and
+            whether the node has changed and needs saving.
+        """
         event_type = message['event_type']
         origin = message['origin']
         activity_name = message['name']
@@ -306,7 +518,7 @@ class StatusWorkerService(TimerService, object):
         default_exit_status = 1 if failed else 0
 
         # Add this event to the node event log.
-        add_event_to_node_event_log(
+        event = make_node_event_log_entry(
             node, origin, activity_name, description, result,
             message['timestamp'])
 
@@ -419,9 +631,7 @@ class StatusWorkerService(TimerService, object):
             node.reset_status_expires()
             save_node = True
 
-        if save_node:
-            node.save()
-        return True
+        return event, save_node
 
     def _retrieve_content(self, compression, encoding, content):
         """Extract the content of the sent file."""
@@ -502,4 +712,4 @@ class StatusWorkerService(TimerService, object):
                 log.err, "Failed to process status message instantly.")
             return d
         else:
-            self.queue[authorization].append(message)
+            self._queueMessageLater(authorization, message, time.time())
@@ -5,12 +5,15 @@
 
 __all__ = [
     'BinaryField',
+    'CompressedBinaryField',
+    'iter_binary_chunks',
     ]
 
 from base64 import (
     b64decode,
     b64encode,
 )
+import zlib
 
 from django.db import connection
 from maasserver.fields import Field
@@ -143,3 +146,65 @@ class BinaryField(Field):
         """Override Django's crack-smoking ``Field.get_default``."""
         default = self._get_default()
         return None if default is None else Bin(default)
+
+
+# Database values of a `CompressedBinaryField` which start with this are
+# base-64 encoded zlib streams. Anything else is plain base-64, as written by
+# `BinaryField`. The prefix cannot occur in base-64 so the two never clash.
+COMPRESSED_PREFIX = 'z:'
+
+# The size of the chunks `iter_binary_chunks` decompresses at a time.
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_binary_chunks(value, chunk_size=CHUNK_SIZE):
+    """Yield the binary data held in a `CompressedBinaryField` in chunks.
+
+    Data is only decompressed as far as the consumer reads, so reading the
+    start of a large value does not inflate all of it.
+
+    :param value: Either a `Bin`, or the field's database value.
+    """
+    if value is None:
+        return
+    elif isinstance(value, str) and value.startswith(COMPRESSED_PREFIX):
+        decompressor = zlib.decompressobj()
+        data = b64decode(value[len(COMPRESSED_PREFIX):])
+        while len(data) > 0:
+            chunk = decompressor.decompress(data, chunk_size)
+            data = decompressor.unconsumed_tail
+            if len(chunk) > 0:
+                yield chunk
+        chunk = decompressor.flush()
+        if len(chunk) > 0:
+            yield chunk
+    else:
+        if isinstance(value, str):
+            value = b64decode(value)
+        for start in range(0, len(value), chunk_size):
+            yield value[start:start + chunk_size]
+
+
+class CompressedBinaryField(BinaryField):
+    """A `BinaryField` which compresses its data in the database.
+
+    Values are still `Bin` on the Python side. Existing uncompressed
+    values, as written by `BinaryField`, are read as before and are
+    compressed the next time they are saved.
+    """
+
+    def to_python(self, value):
+        """Django overridable: convert database value to python-side value."""
+        if isinstance(value, str) and value.startswith(COMPRESSED_PREFIX):
+            return Bin(b''.join(iter_binary_chunks(value)))
+        else:
+            return super().to_python(value)
+
+    def get_db_prep_value(self, value, connection=None, prepared=False):
+        """Django overridable: convert python-side value to database value."""
+        if isinstance(value, Bin) and len(value) > 0:
+            return COMPRESSED_PREFIX + b64encode(
+                zlib.compress(value)).decode("ascii")
+        else:
+            return super().get_db_prep_value(
+                value, connection=connection, prepared=prepared)
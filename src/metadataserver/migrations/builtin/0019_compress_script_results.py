@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import metadataserver.fields
+
+
+OUTPUT_FIELDS = ['output', 'stdout', 'stderr', 'result']
+
+
+def compress_script_results(apps, schema_editor):
+    ScriptResult = apps.get_model('metadataserver', 'ScriptResult')
+    # Existing output is read as plain base-64 and written back compressed.
+    # Results are loaded one at a time as their output may be large.
+    script_results = ScriptResult.objects.only('id', *OUTPUT_FIELDS)
+    for script_result in script_results.iterator():
+        script_result.save(update_fields=OUTPUT_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metadataserver', '0018_script_result_skipped'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='scriptresult',
+            name='output',
+            field=metadataserver.fields.CompressedBinaryField(blank=True, default=b'', max_length=1048576),
+        ),
+        migrations.AlterField(
+            model_name='scriptresult',
+            name='result',
+            field=metadataserver.fields.CompressedBinaryField(blank=True, default=b'', max_length=1048576),
+        ),
+        migrations.AlterField(
+            model_name='scriptresult',
+            name='stderr',
+            field=metadataserver.fields.CompressedBinaryField(blank=True, default=b'', max_length=1048576),
+        ),
+        migrations.AlterField(
+            model_name='scriptresult',
+            name='stdout',
+            field=metadataserver.fields.CompressedBinaryField(blank=True, default=b'', max_length=1048576),
+        ),
+        migrations.RunPython(compress_script_results),
+    ]
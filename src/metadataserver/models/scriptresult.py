@@ -9,8 +9,10 @@ from datetime import (
     datetime,
     timedelta,
 )
+from pathlib import PurePath
 
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.db.models import (
     CASCADE,
     CharField,
@@ -22,7 +24,9 @@ from django.db.models import (
 )
 from maasserver.fields import JSONObjectField
 from maasserver.models.cleansave import CleanSave
+from maasserver.models.config import Config
 from maasserver.models.event import Event
+from maasserver.models.nodeprobeddetails import script_output_nsmap
 from maasserver.models.physicalblockdevice import PhysicalBlockDevice
 from maasserver.models.timestampedmodel import (
     now,
@@ -42,13 +46,28 @@ from metadataserver.enum import (
 )
 from metadataserver.fields import (
     Bin,
-    BinaryField,
+    CompressedBinaryField,
+    iter_binary_chunks,
 )
 from metadataserver.models.script import Script
 from metadataserver.models.scriptset import ScriptSet
 from provisioningserver.events import EVENT_TYPES
 import yaml
 
+# The fields holding the output of a script.
+OUTPUT_FIELDS = ('output', 'stdout', 'stderr', 'result')
+
+
+def truncate_output(data, max_size):
+    """Return the end of `data`, keeping at most `max_size` bytes of it.
+
+    The end of a script's output is kept as that is where errors are.
+    """
+    if len(data) <= max_size:
+        return data
+    marker = b"[... %d bytes truncated ...]\n" % (len(data) - max_size)
+    return marker + data[-max_size:]
+
 
 class ScriptResult(CleanSave, TimestampedModel):
 
@@ -86,13 +105,17 @@ class ScriptResult(CleanSave, TimestampedModel):
     script_name = CharField(
         max_length=255, unique=False, editable=False, null=True)
 
-    output = BinaryField(max_length=1024 * 1024, blank=True, default=b'')
+    output = CompressedBinaryField(
+        max_length=1024 * 1024, blank=True, default=b'')
 
-    stdout = BinaryField(max_length=1024 * 1024, blank=True, default=b'')
+    stdout = CompressedBinaryField(
+        max_length=1024 * 1024, blank=True, default=b'')
 
-    stderr = BinaryField(max_length=1024 * 1024, blank=True, default=b'')
+    stderr = CompressedBinaryField(
+        max_length=1024 * 1024, blank=True, default=b'')
 
-    result = BinaryField(max_length=1024 * 1024, blank=True, default=b'')
+    result = CompressedBinaryField(
+        max_length=1024 * 1024, blank=True, default=b'')
 
     # When the script started to run
     started = DateTimeField(editable=False, null=True, blank=True)
@@ -217,6 +240,48 @@ class ScriptResult(CleanSave, TimestampedModel):
 
         return parsed_yaml
 
+    def iter_data(self, name):
+        """Yield the named output of this script in chunks.
+
+        If the output has not been loaded it is read from the database, but
+        only decompressed as far as the caller reads.
+
+        :param name: One of `OUTPUT_FIELDS`.
+        """
+        assert name in OUTPUT_FIELDS, "Unknown output %r" % name
+        if name in self.get_deferred_fields():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT %s FROM %s WHERE id = %%s" % (
+                        self._meta.get_field(name).column,
+                        self._meta.db_table),
+                    [self.id])
+                row = cursor.fetchone()
+            value = None if row is None else row[0]
+        else:
+            value = getattr(self, name)
+        return iter_binary_chunks(value)
+
+    def read_data(self, name, offset=0, length=None):
+        """Return the named output of this script, or a range of it.
+
+        :param name: One of `OUTPUT_FIELDS`.
+        :param offset: The byte to start reading from.
+        :param length: The number of bytes to read, or None to read to the
+            end of the output.
+        """
+        end = None if length is None else offset + length
+        chunks = []
+        position = 0
+        for chunk in self.iter_data(name):
+            start = position
+            position += len(chunk)
+            if position > offset:
+                chunks.append(chunk[max(offset - start, 0):])
+            if end is not None and position >= end:
+                break
+        return b''.join(chunks)[:length]
+
     def store_result(
             self, exit_status=None, output=None, stdout=None, stderr=None,
             result=None, script_version_id=None, timedout=False):
@@ -326,6 +391,19 @@ class ScriptResult(CleanSave, TimestampedModel):
                     status=SCRIPT_STATUS.PENDING, started=None, ended=None,
                     updated=now())
 
+        # Only cap the output stored once the hooks above have processed it.
+        # The stdout parsed when evaluating tags is kept whole, as are tar
+        # archives, which are of no use once truncated.
+        max_size = Config.objects.get_config('max_script_result_size')
+        if max_size > 0 and '.tar' not in PurePath(self.name).suffixes:
+            for name, data in (
+                    ('output', output), ('stdout', stdout),
+                    ('stderr', stderr)):
+                if name == 'stdout' and self.name in script_output_nsmap:
+                    continue
+                if data is not None:
+                    setattr(self, name, Bin(truncate_output(data, max_size)))
+
         self.save()
 
     @property
@@ -11,8 +11,10 @@ import random
 from unittest.mock import MagicMock
 
 from django.core.exceptions import ValidationError
+from django.db import connection
 from maasserver.enum import NODE_TYPE
 from maasserver.models import (
+    Config,
     Event,
     EventType,
 )
@@ -36,6 +38,7 @@ from metadataserver.models import (
     scriptresult as scriptresult_module,
 )
 from provisioningserver.events import EVENT_TYPES
+from provisioningserver.refresh.node_info_scripts import LSHW_OUTPUT_NAME
 import yaml
 
 
@@ -154,6 +157,50 @@ class TestScriptResult(MAASServerTestCase):
         self.assertEquals(exit_status, script_result.exit_status)
         self.assertEquals(stderr, script_result.stderr)
 
+    def test_store_result_keeps_end_of_output_over_max_size(self):
+        Config.objects.set_config('max_script_result_size', 10)
+        script_result = factory.make_ScriptResult(status=SCRIPT_STATUS.RUNNING)
+
+        script_result.store_result(
+            0, output=b'0123456789abcdef', stdout=b'0123456789',
+            stderr=b'abcdef0123456789')
+
+        script_result = reload_object(script_result)
+        self.assertEquals(
+            b'[... 6 bytes truncated ...]\n6789abcdef', script_result.output)
+        self.assertEquals(b'0123456789', script_result.stdout)
+        self.assertEquals(
+            b'[... 6 bytes truncated ...]\n0123456789', script_result.stderr)
+
+    def test_store_result_keeps_all_stdout_parsed_for_tags(self):
+        Config.objects.set_config('max_script_result_size', 10)
+        script_set = factory.make_ScriptSet(
+            result_type=RESULT_TYPE.COMMISSIONING)
+        script_result = factory.make_ScriptResult(
+            script_set=script_set, status=SCRIPT_STATUS.RUNNING,
+            script_name=LSHW_OUTPUT_NAME)
+        # Skip the hook that parses the output.
+        self.patch(scriptresult_module, 'NODE_INFO_SCRIPTS', {})
+
+        script_result.store_result(
+            0, stdout=b'<list>0123456789</list>',
+            stderr=b'abcdef0123456789')
+
+        script_result = reload_object(script_result)
+        self.assertEquals(b'<list>0123456789</list>', script_result.stdout)
+        self.assertEquals(
+            b'[... 6 bytes truncated ...]\n0123456789', script_result.stderr)
+
+    def test_store_result_keeps_all_output_of_tar_archives(self):
+        Config.objects.set_config('max_script_result_size', 10)
+        script_result = factory.make_ScriptResult(
+            status=SCRIPT_STATUS.RUNNING, script_name='/tmp/curtin-logs.tar')
+
+        script_result.store_result(0, output=b'0123456789abcdef')
+
+        script_result = reload_object(script_result)
+        self.assertEquals(b'0123456789abcdef', script_result.output)
+
     def test_store_result_stores_result(self):
         script_result = factory.make_ScriptResult(status=SCRIPT_STATUS.RUNNING)
         exit_status = random.randint(0, 255)
@@ -646,3 +693,53 @@ class TestScriptResult(MAASServerTestCase):
         factory.make_ScriptResult(script=script)
         script_result = script_results[-1]
         self.assertItemsEqual(script_results, script_result.history)
+
+
+class TestScriptResultData(MAASServerTestCase):
+    """Test reading the output of a `ScriptResult`."""
+
+    def make_deferred_ScriptResult(self, **kwargs):
+        script_result = factory.make_ScriptResult(**kwargs)
+        return ScriptResult.objects.defer(
+            *scriptresult_module.OUTPUT_FIELDS).get(id=script_result.id)
+
+    def test_output_is_compressed_in_the_database(self):
+        output = b'output ' * 1000
+        script_result = factory.make_ScriptResult(output=output)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT output FROM metadataserver_scriptresult "
+                "WHERE id = %s", [script_result.id])
+            [stored] = cursor.fetchone()
+        self.assertTrue(stored.startswith('z:'))
+        self.assertLess(len(stored), len(output))
+        self.assertEquals(output, reload_object(script_result).output)
+
+    def test_read_data_reads_deferred_output(self):
+        stdout = factory.make_bytes(1024)
+        script_result = self.make_deferred_ScriptResult(stdout=stdout)
+        self.assertEquals(stdout, script_result.read_data('stdout'))
+        self.assertIn('stdout', script_result.get_deferred_fields())
+
+    def test_read_data_reads_range(self):
+        stderr = factory.make_bytes(1024)
+        script_result = self.make_deferred_ScriptResult(stderr=stderr)
+        self.assertEquals(
+            stderr[100:300], script_result.read_data('stderr', 100, 200))
+        self.assertEquals(
+            stderr[1000:], script_result.read_data('stderr', 1000))
+        self.assertEquals(b'', script_result.read_data('stderr', 2000))
+
+    def test_read_data_reads_range_across_chunks(self):
+        self.patch(scriptresult_module, 'iter_binary_chunks').side_effect = (
+            lambda value: (value[i:i + 10] for i in range(0, len(value), 10)))
+        output = factory.make_bytes(100)
+        script_result = factory.make_ScriptResult(output=output)
+        self.assertEquals(
+            output[15:55], script_result.read_data('output', 15, 40))
+
+    def test_read_data_reads_loaded_output(self):
+        output = factory.make_bytes(1024)
+        script_result = factory.make_ScriptResult(output=output)
+        self.assertEquals(
+            output[10:20], script_result.read_data('output', 10, 10))
@@ -78,6 +78,7 @@ from metadataserver.api import (
     get_node_for_request,
     get_queried_node,
     make_list_response,
+    make_node_event_log_entry,
     make_text_response,
     MetaDataHandler,
     process_file,
@@ -251,6 +252,25 @@ class TestHelpers(MAASServerTestCase):
         self.assertEqual(
             EVENT_TYPES.REQUEST_CONTROLLER_REFRESH, event.type.name)
 
+    def test_make_node_event_log_entry_returns_unsaved_event(self):
+        node = factory.make_Node(status=NODE_STATUS.COMMISSIONING)
+        origin = factory.make_name('origin')
+        action = factory.make_name('action')
+        description = factory.make_name('description')
+        event = make_node_event_log_entry(node, origin, action, description)
+        self.assertIsNone(event.id)
+        self.assertFalse(Event.objects.filter(node=node).exists())
+        Event.objects.bulk_create([event])
+        event = Event.objects.get(node=node)
+
+        self.assertEqual(node.system_id, event.node_system_id)
+        self.assertEqual(node.hostname, event.node_hostname)
+        self.assertEqual(action, event.action)
+        self.assertEqual("'%s' %s" % (origin, description), event.description)
+        self.assertEqual(
+            EVENT_TYPES.NODE_COMMISSIONING_EVENT, event.type.name)
+        self.assertEqual(event.created, event.updated)
+
     def test_process_file_creates_new_entry_for_output(self):
         results = {}
         script_result = factory.make_ScriptResult(status=SCRIPT_STATUS.RUNNING)
@@ -13,7 +13,9 @@ from datetime import (
 )
 from io import BytesIO
 import json
+import os
 import random
+import time
 from unittest.mock import (
     call,
     Mock,
@@ -24,6 +26,7 @@ from crochet import wait_for
 from maasserver.enum import NODE_STATUS
 from maasserver.models import (
     Event,
+    Node,
     NodeMetadata,
     Tag,
 )
@@ -57,6 +60,7 @@ from metadataserver.api_twisted import (
     _create_pod_for_deployment,
     POD_CREATION_ERROR,
     StatusHandlerResource,
+    StatusMessageSpool,
     StatusWorkerService,
 )
 from metadataserver.enum import (
@@ -72,9 +76,11 @@ from testtools.matchers import (
     MatchesSetwise,
 )
 from twisted.internet.defer import (
+    Deferred,
     inlineCallbacks,
     succeed,
 )
+from twisted.internet.task import Clock
 from twisted.web.server import NOT_DONE_YET
 from twisted.web.test.requesthelper import DummyRequest
 
@@ -223,7 +229,7 @@ class TestStatusWorkerServiceTransactional(MAASTransactionServerTestCase):
             for node, _ in nodes_with_tokens
         }
         dbtasks = Mock()
-        dbtasks.addTask = Mock()
+        dbtasks.deferTask = Mock()
         worker = StatusWorkerService(dbtasks)
         for node, token in nodes_with_tokens:
             for message in node_messages[node]:
@@ -231,7 +237,7 @@ class TestStatusWorkerServiceTransactional(MAASTransactionServerTestCase):
         yield worker._tryUpdateNodes()
         call_args = [
             (call_arg[0][1], call_arg[0][2])
-            for call_arg in dbtasks.addTask.call_args_list
+            for call_arg in dbtasks.deferTask.call_args_list
         ]
         self.assertThat(call_args, MatchesSetwise(*[
             MatchesListwise([Equals(node), Equals(messages)])
@@ -258,30 +264,128 @@ class TestStatusWorkerServiceTransactional(MAASTransactionServerTestCase):
 
     @wait_for_reactor
     @inlineCallbacks
-    def test__processMessages_doesnt_call_when_node_deleted(self):
+    def test__processMessages_processes_node_messages_together(self):
         worker = StatusWorkerService(sentinel.dbtasks)
-        mock_processMessage = self.patch(worker, "_processMessage")
-        mock_processMessage.return_value = False
+        mock_processNodeMessages = self.patch(worker, "_processNodeMessages")
         yield deferToDatabase(
             worker._processMessages, sentinel.node,
             [sentinel.message1, sentinel.message2])
         self.assertThat(
-            mock_processMessage,
-            MockCalledOnceWith(sentinel.node, sentinel.message1))
+            mock_processNodeMessages,
+            MockCalledOnceWith(
+                sentinel.node, [sentinel.message1, sentinel.message2]))
 
     @wait_for_reactor
     @inlineCallbacks
-    def test__processMessages_calls_processMessage(self):
+    def test__processMessages_records_ingestion_latency(self):
         worker = StatusWorkerService(sentinel.dbtasks)
-        mock_processMessage = self.patch(worker, "_processMessage")
+        self.patch(worker, "_processNodeMessages")
+        mock_update = self.patch(
+            api_twisted_module.PROMETHEUS_METRICS, "update")
+        received = time.time() - 10
         yield deferToDatabase(
-            worker._processMessages, sentinel.node,
-            [sentinel.message1, sentinel.message2])
+            worker._processMessages, sentinel.node, [sentinel.message],
+            received)
+        [call_args] = mock_update.call_args_list
+        self.assertEqual(
+            ('maas_status_message_ingestion_latency', 'observe'),
+            call_args[0])
+        self.assertGreaterEqual(call_args[1]['value'], 10)
+
+    def test_queueMessage_drains_queue_when_full(self):
+        worker = StatusWorkerService(sentinel.dbtasks)
+        worker.max_queued = 2
+        mock_tryUpdateNodes = self.patch(worker, "_tryUpdateNodes")
+        message = self.make_message()
+        worker.queueMessage(factory.make_name('token'), message)
+        self.assertThat(mock_tryUpdateNodes, MockNotCalled())
+        worker.queueMessage(factory.make_name('token'), self.make_message())
+        self.assertThat(mock_tryUpdateNodes, MockCalledOnceWith())
+
+    def test_queueMessage_records_queue_depth(self):
+        worker = StatusWorkerService(sentinel.dbtasks)
+        mock_update = self.patch(
+            api_twisted_module.PROMETHEUS_METRICS, "update")
+        worker.queueMessage(factory.make_name('token'), self.make_message())
+        worker.queueMessage(factory.make_name('token'), self.make_message())
         self.assertThat(
-            mock_processMessage,
-            MockCallsMatch(
-                call(sentinel.node, sentinel.message1),
-                call(sentinel.node, sentinel.message2)))
+            mock_update, MockCallsMatch(
+                call('maas_status_messages_queued', 'set', value=1),
+                call('maas_status_messages_queued', 'set', value=2)))
+
+    def test_startService_queues_messages_from_abandoned_spools(self):
+        spool_dir = self.make_dir()
+        message = self.make_message()
+        message['timestamp'] = datetime.utcfromtimestamp(
+            message['timestamp'])
+        spool = StatusMessageSpool.create(spool_dir)
+        spool.append(sentinel.token.__name__, 1234.5, message)
+        spool.close()
+        self.patch(StatusWorkerService, "_tryUpdateNodes")
+        worker = StatusWorkerService(
+            sentinel.dbtasks, clock=Clock(), spool_dir=spool_dir)
+        worker.startService()
+        self.addCleanup(worker.stopService)
+        self.assertEqual(
+            {sentinel.token.__name__: [message]}, dict(worker.queue))
+        self.assertEqual({sentinel.token.__name__: 1234.5}, worker.received)
+        self.assertFalse(os.path.exists(spool.path))
+        # The claimed messages were moved into the worker's own spool.
+        self.assertEqual(
+            [(sentinel.token.__name__, 1234.5, message)],
+            list(worker.spool.read()))
+
+    def test_startService_leaves_spools_held_by_others(self):
+        spool_dir = self.make_dir()
+        spool = StatusMessageSpool.create(spool_dir)
+        self.addCleanup(spool.discard)
+        spool.append(sentinel.token.__name__, 1234.5, {
+            'timestamp': datetime.utcnow()})
+        self.patch(StatusWorkerService, "_tryUpdateNodes")
+        worker = StatusWorkerService(
+            sentinel.dbtasks, clock=Clock(), spool_dir=spool_dir)
+        worker.startService()
+        self.addCleanup(worker.stopService)
+        self.assertEqual({}, dict(worker.queue))
+        self.assertTrue(os.path.exists(spool.path))
+
+    def test_stopService_leaves_queued_messages_in_spool(self):
+        spool_dir = self.make_dir()
+        self.patch(StatusWorkerService, "_tryUpdateNodes")
+        worker = StatusWorkerService(
+            sentinel.dbtasks, clock=Clock(), spool_dir=spool_dir)
+        worker.startService()
+        message = self.make_message()
+        worker.queueMessage(sentinel.token.__name__, message)
+        spool = worker.spool
+        worker.stopService()
+        self.assertIsNone(worker.spool)
+        [claimed] = StatusMessageSpool.claim(spool_dir)
+        self.addCleanup(claimed.discard)
+        self.assertEqual(spool.path, claimed.path)
+        self.assertEqual(
+            [message], [message for _, _, message in claimed.read()])
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__tryUpdateNodes_discards_spool_once_messages_stored(self):
+        nodes_with_tokens = yield deferToDatabase(self.make_nodes_with_tokens)
+        node, token = nodes_with_tokens[0]
+        spool_dir = self.make_dir()
+        dbtasks = Mock()
+        stored = Deferred()
+        dbtasks.deferTask.return_value = stored
+        worker = StatusWorkerService(dbtasks, spool_dir=spool_dir)
+        worker.spool = StatusMessageSpool.create(spool_dir)
+        self.addCleanup(lambda: worker.spool.discard())
+        worker.queueMessage(token.key, self.make_message())
+        spool = worker.spool
+        yield worker._tryUpdateNodes()
+        # New messages go into a new spool.
+        self.assertIsNot(spool, worker.spool)
+        self.assertTrue(os.path.exists(spool.path))
+        stored.callback(None)
+        self.assertFalse(os.path.exists(spool.path))
 
     @wait_for_reactor
     @inlineCallbacks
@@ -371,6 +475,111 @@ class TestStatusWorkerService(MAASServerTestCase):
         }
         self.assertFalse(self.processMessage(node1, payload))
 
+    def processNodeMessages(self, node, payloads):
+        worker = StatusWorkerService(sentinel.dbtasks)
+        return worker._processNodeMessages(node, payloads)
+
+    def make_payload(self, **kwargs):
+        payload = {
+            'event_type': 'progress',
+            'origin': 'cloudinit',
+            'name': factory.make_name('name'),
+            'description': factory.make_name('description'),
+            'timestamp': datetime.utcnow(),
+        }
+        payload.update(kwargs)
+        return payload
+
+    def test_process_node_messages_returns_false_when_node_deleted(self):
+        node = factory.make_Node(status=NODE_STATUS.DEPLOYING)
+        node.delete()
+        self.assertFalse(
+            self.processNodeMessages(node, [self.make_payload()]))
+
+    def test_process_node_messages_stores_events_in_order(self):
+        node = factory.make_Node(status=NODE_STATUS.DEPLOYING)
+        payloads = [self.make_payload() for _ in range(3)]
+        self.assertTrue(self.processNodeMessages(node, payloads))
+        self.assertEqual(
+            [
+                "'cloudinit' %s" % payload['description']
+                for payload in payloads
+            ],
+            [
+                event.description
+                for event in Event.objects.filter(node=node).order_by('id')
+            ])
+
+    def test_process_node_messages_skips_failed_message(self):
+        node = factory.make_Node(
+            interface=True, status=NODE_STATUS.COMMISSIONING)
+        payloads = [
+            self.make_payload(),
+            self.make_payload(files=[{
+                "path": "sample.txt",
+                "encoding": "uuencode",
+                "content": "",
+            }]),
+            self.make_payload(),
+        ]
+        self.processNodeMessages(node, payloads)
+        self.assertEqual(
+            [
+                "'cloudinit' %s" % payload['description']
+                for payload in (payloads[0], payloads[2])
+            ],
+            [
+                event.description
+                for event in Event.objects.filter(node=node).order_by('id')
+            ])
+
+    def test_process_node_messages_stores_events_before_node_changes(self):
+        node = factory.make_Node(
+            interface=True, status=NODE_STATUS.DISK_ERASING)
+        self.processNodeMessages(node, [
+            self.make_payload(),
+            self.make_payload(
+                event_type='finish', result='FAILURE', name='cmd-erase'),
+            self.make_payload(),
+        ])
+        self.assertEqual(
+            NODE_STATUS.FAILED_DISK_ERASING, reload_object(node).status)
+        descriptions = [
+            event.description
+            for event in Event.objects.filter(node=node).order_by('id')
+        ]
+        self.assertEqual(4, len(descriptions))
+        self.assertEqual("Failed to erase disks.", descriptions[3])
+
+    def test_process_node_messages_saves_node_once(self):
+        node = factory.make_Node(
+            interface=True, status=NODE_STATUS.DEPLOYING)
+        save = self.patch(Node, "save")
+        self.processNodeMessages(node, [
+            self.make_payload(
+                origin='curtin', event_type='start',
+                name='cmd-install/stage-early'),
+            self.make_payload(
+                origin='curtin', event_type='finish',
+                name='cmd-install/stage-early'),
+        ])
+        self.assertThat(save, MockCalledOnceWith())
+
+    def test_process_node_messages_keeps_changes_before_failed_message(self):
+        node = factory.make_Node(
+            interface=True, status=NODE_STATUS.DISK_ERASING)
+        self.processNodeMessages(node, [
+            self.make_payload(
+                event_type='finish', result='FAILURE', name='cmd-erase'),
+            self.make_payload(files=[{
+                "path": "sample.txt",
+                "encoding": "uuencode",
+                "content": "",
+            }]),
+        ])
+        self.assertEqual(
+            NODE_STATUS.FAILED_DISK_ERASING, reload_object(node).status)
+
     def test_status_installation_result_does_not_affect_other_node(self):
         node1 = factory.make_Node(status=NODE_STATUS.DEPLOYING)
         node2 = factory.make_Node(status=NODE_STATUS.DEPLOYING)
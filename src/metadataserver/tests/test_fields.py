@@ -12,9 +12,12 @@ from maasserver.testing.testcase import (
     MAASServerTestCase,
 )
 from maastesting.factory import factory
+from maastesting.testcase import MAASTestCase
 from metadataserver.fields import (
     Bin,
     BinaryField,
+    CompressedBinaryField,
+    iter_binary_chunks,
 )
 from metadataserver.tests.models import BinaryFieldModel
 
@@ -104,3 +107,62 @@ class TestBinaryField(MAASLegacyTransactionServerTestCase):
         field = BinaryField(null=True)
         self.patch(field, "default", b"wotcha")
         self.assertEqual(Bin(b"wotcha"), field.get_default())
+
+
+class TestCompressedBinaryField(MAASTestCase):
+    """Test CompressedBinaryField."""
+
+    def test_compresses_data(self):
+        data = b"Compressible " * 100
+        field = CompressedBinaryField()
+        db_value = field.get_db_prep_value(Bin(data))
+        self.assertTrue(db_value.startswith("z:"))
+        self.assertLess(len(db_value), len(data))
+        self.assertEqual(data, field.to_python(db_value))
+
+    def test_stores_empty_data_uncompressed(self):
+        field = CompressedBinaryField()
+        self.assertEqual("", field.get_db_prep_value(Bin(b"")))
+        self.assertEqual(b"", field.to_python(""))
+
+    def test_stores_and_retrieves_None(self):
+        field = CompressedBinaryField()
+        self.assertIsNone(field.get_db_prep_value(None))
+        self.assertIsNone(field.to_python(None))
+
+    def test_reads_uncompressed_data(self):
+        data = factory.make_bytes()
+        field = CompressedBinaryField()
+        self.assertEqual(
+            data, field.to_python(b64encode(data).decode("ascii")))
+
+    def test_returns_Bin(self):
+        field = CompressedBinaryField()
+        db_value = field.get_db_prep_value(Bin(b"Data"))
+        self.assertIsInstance(field.to_python(db_value), Bin)
+
+
+class TestIterBinaryChunks(MAASTestCase):
+    """Test iter_binary_chunks."""
+
+    def test_iterates_compressed_data(self):
+        data = factory.make_bytes(1000)
+        db_value = CompressedBinaryField().get_db_prep_value(Bin(data))
+        chunks = list(iter_binary_chunks(db_value, chunk_size=100))
+        self.assertEqual(data, b"".join(chunks))
+        self.assertTrue(all(len(chunk) <= 100 for chunk in chunks))
+
+    def test_iterates_uncompressed_data(self):
+        data = factory.make_bytes(250)
+        chunks = list(iter_binary_chunks(
+            b64encode(data).decode("ascii"), chunk_size=100))
+        self.assertEqual([data[:100], data[100:200], data[200:]], chunks)
+
+    def test_iterates_Bin(self):
+        data = factory.make_bytes(150)
+        chunks = list(iter_binary_chunks(Bin(data), chunk_size=100))
+        self.assertEqual([data[:100], data[100:]], chunks)
+
+    def test_iterates_nothing(self):
+        self.assertEqual([], list(iter_binary_chunks(None)))
+        self.assertEqual([], list(iter_binary_chunks("")))
@@ -12,6 +12,10 @@ from abc import (
     ABCMeta,
     abstractproperty,
 )
+from collections import (
+    namedtuple,
+    OrderedDict,
+)
 from errno import ENOENT
 from functools import lru_cache
 from io import BytesIO
@@ -35,6 +39,7 @@ from provisioningserver.utils import (
 from provisioningserver.utils.fs import (
     atomic_copy,
     atomic_symlink,
+    get_file_version,
 )
 from provisioningserver.utils.network import (
     convert_host_to_uri_str,
@@ -128,6 +133,21 @@ def gen_template_filenames(purpose, arch, subarch):
     yield "config.template"
 
 
+# A template found by `BootMethod.get_template`, or None for the template
+# if none was found, and the versions of its directory and file then.
+TemplateCacheEntry = namedtuple("TemplateCacheEntry", (
+    "dir_version",
+    "filename",
+    "file_version",
+    "template",
+))
+
+# Templates found by `BootMethod.get_template`, keyed by (template
+# directory, purpose, arch, subarch), least recently used first.
+template_cache = OrderedDict()
+template_cache_size = 512
+
+
 def get_remote_mac():
     """Gets the requestors MAC address from arp cache.
 
@@ -295,12 +315,13 @@ class BootMethod(metaclass=ABCMeta):
         """Gets the template directory for the boot method."""
         return locate_template("%s" % self.template_subdir)
 
-    @lru_cache(512)
     def get_template(self, purpose, arch, subarch):
         """Gets the best avaliable template for the boot method.
 
-        Templates are loaded each time here so that they can be changed on
-        the fly without restarting the provisioning server.
+        Templates are compiled once and cached, as is finding no template.
+        They can still be changed on the fly without restarting the
+        provisioning server: the cache is only used while neither the
+        template directory nor the template found have been modified.
 
         :param purpose: The boot purpose, e.g. "local".
         :param arch: Main machine architecture.
@@ -308,15 +329,23 @@ class BootMethod(metaclass=ABCMeta):
         :return: `tempita.Template`
         """
         pxe_templates_dir = self.get_template_dir()
-        for filename in gen_template_filenames(purpose, arch, subarch):
-            template_name = os.path.join(pxe_templates_dir, filename)
-            try:
-                return tempita.Template.from_filename(
-                    template_name, encoding="UTF-8")
-            except IOError as error:
-                if error.errno != ENOENT:
-                    raise
+        key = pxe_templates_dir, purpose, arch, subarch
+        dir_version = get_file_version(pxe_templates_dir)
+        entry = template_cache.get(key)
+        if (entry is None or dir_version is None or
+                entry.dir_version != dir_version or
+                (entry.filename is not None and
+                 get_file_version(entry.filename) != entry.file_version)):
+            entry = self._find_template(
+                pxe_templates_dir, purpose, arch, subarch)
+            if dir_version is not None:
+                template_cache[key] = entry._replace(dir_version=dir_version)
+                while len(template_cache) > template_cache_size:
+                    template_cache.popitem(last=False)
         else:
+            template_cache.move_to_end(key)
+
+        if entry.template is None:
             error = (
                 "No PXE template found in %r for:\n"
                 "  Purpose: %r, Arch: %r, Subarch: %r\n"
@@ -327,6 +356,28 @@ class BootMethod(metaclass=ABCMeta):
                     pxe_templates_dir, purpose, arch, subarch))
             try_send_rack_event(EVENT_TYPES.RACK_IMPORT_ERROR, error)
             raise AssertionError(error)
+        return entry.template
+
+    def _find_template(self, pxe_templates_dir, purpose, arch, subarch):
+        """Load the best available template from `pxe_templates_dir`.
+
+        :return: A `TemplateCacheEntry`, without the directory's version.
+        """
+        for filename in gen_template_filenames(purpose, arch, subarch):
+            template_name = os.path.join(pxe_templates_dir, filename)
+            # Get the version first, in case the template changes while
+            # it's being loaded.
+            file_version = get_file_version(template_name)
+            try:
+                template = tempita.Template.from_filename(
+                    template_name, encoding="UTF-8")
+            except IOError as error:
+                if error.errno != ENOENT:
+                    raise
+            else:
+                return TemplateCacheEntry(
+                    None, template_name, file_version, template)
+        return TemplateCacheEntry(None, None, None, None)
 
     def compose_template_namespace(self, kernel_params):
         """Composes the namespace variables that are used by a boot
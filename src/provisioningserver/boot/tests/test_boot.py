@@ -14,6 +14,7 @@ from maastesting.factory import factory
 from maastesting.matchers import (
     MockCalledOnce,
     MockCalledOnceWith,
+    MockNotCalled,
 )
 from maastesting.testcase import (
     MAASTestCase,
@@ -154,6 +155,69 @@ class TestBootMethod(MAASTestCase):
             IOError, method.get_template,
             *factory.make_names("purpose", "arch", "subarch"))
 
+    def make_method_with_templates_dir(self):
+        templates_dir = self.make_dir()
+        method = FakeBootMethod()
+        method.get_template_dir = lambda: templates_dir
+        return method, templates_dir
+
+    def touch_dir(self, path):
+        # Make sure the directory looks modified, however quickly the test
+        # runs, and whatever the resolution of its timestamps.
+        mtime = os.stat(path).st_mtime_ns + 10 ** 9
+        os.utime(path, ns=(mtime, mtime))
+
+    def test_get_template_caches_template(self):
+        method, templates_dir = self.make_method_with_templates_dir()
+        factory.make_file(templates_dir, 'config.template')
+        names = factory.make_names("purpose", "arch", "subarch")
+        template = method.get_template(*names)
+        from_filename = self.patch(tempita.Template, "from_filename")
+        self.assertIs(template, method.get_template(*names))
+        self.assertThat(from_filename, MockNotCalled())
+
+    def test_get_template_reloads_modified_template(self):
+        method, templates_dir = self.make_method_with_templates_dir()
+        filename = factory.make_file(
+            templates_dir, 'config.template', contents=b'old')
+        names = factory.make_names("purpose", "arch", "subarch")
+        self.assertEqual('old', method.get_template(*names).substitute())
+        with open(filename, 'wb') as stream:
+            stream.write(b'newer')
+        self.assertEqual('newer', method.get_template(*names).substitute())
+
+    def test_get_template_finds_new_template(self):
+        method, templates_dir = self.make_method_with_templates_dir()
+        factory.make_file(templates_dir, 'config.template')
+        purpose, arch, subarch = factory.make_names(
+            "purpose", "arch", "subarch")
+        method.get_template(purpose, arch, subarch)
+        specific_template = factory.make_file(
+            templates_dir, 'config.%s.template' % purpose)
+        self.touch_dir(templates_dir)
+        self.assertEqual(
+            specific_template,
+            method.get_template(purpose, arch, subarch).name)
+
+    def test_get_template_caches_not_found(self):
+        self.patch(boot, 'try_send_rack_event')
+        method, templates_dir = self.make_method_with_templates_dir()
+        names = factory.make_names("purpose", "arch", "subarch")
+        self.assertRaises(AssertionError, method.get_template, *names)
+        from_filename = self.patch(tempita.Template, "from_filename")
+        self.assertRaises(AssertionError, method.get_template, *names)
+        self.assertThat(from_filename, MockNotCalled())
+
+    def test_get_template_finds_template_added_after_not_found(self):
+        self.patch(boot, 'try_send_rack_event')
+        method, templates_dir = self.make_method_with_templates_dir()
+        names = factory.make_names("purpose", "arch", "subarch")
+        self.assertRaises(AssertionError, method.get_template, *names)
+        generic_template = factory.make_file(templates_dir, 'config.template')
+        self.touch_dir(templates_dir)
+        self.assertEqual(
+            generic_template, method.get_template(*names).name)
+
     def test_link_bootloader_links_simplestream_bootloader_files(self):
         method = FakeBootMethod()
         with tempdir() as tmp:
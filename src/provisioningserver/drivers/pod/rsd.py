@@ -39,6 +39,7 @@ from provisioningserver.utils.twisted import (
     asynchronous,
     pause,
 )
+from provisioningserver.utils.webclient import get_connection_pool
 from twisted.internet import reactor
 from twisted.internet.defer import inlineCallbacks
 from twisted.web.client import (
@@ -103,7 +104,14 @@ class RSDPodDriver(RedfishPowerDriverBase, PodDriverBase):
     @asynchronous
     def redfish_request(self, method, uri, headers=None, bodyProducer=None):
         """Send the redfish request and return the response."""
-        agent = Agent(reactor, contextFactory=WebClientContextFactory())
+        pool = get_connection_pool()
+        return pool.run(
+            uri, self._redfish_request, pool, method, uri, headers,
+            bodyProducer)
+
+    def _redfish_request(self, pool, method, uri, headers, bodyProducer):
+        agent = Agent(
+            reactor, contextFactory=WebClientContextFactory(), pool=pool)
         d = agent.request(
             method, uri, headers=headers, bodyProducer=bodyProducer)
 
@@ -21,6 +21,7 @@ from maastesting.factory import factory
 from maastesting.matchers import (
     MockCalledOnceWith,
     MockCallsMatch,
+    MockNotCalled,
 )
 from maastesting.testcase import (
     MAASTestCase,
@@ -394,15 +395,43 @@ POOLINFO_TEMPLATE = dedent("""
     </pool>
     """)
 
+DOMAIN_TEMPLATE = dedent("""
+    <domain type='kvm'>
+      <name>{name}</name>
+      <memory unit='KiB'>{memory}</memory>
+      <currentMemory unit='KiB'>{memory}</currentMemory>
+      <vcpu placement='static'>{cores}</vcpu>
+      <os>
+        <type arch='{arch}'>hvm</type>
+      </os>
+      <devices>
+    {devices}
+      </devices>
+    </domain>
+    """)
+
+DOMAIN_DISK_TEMPLATE = dedent("""    <disk type='file' device='disk'>
+      <source file='{path}'/>
+      <target dev='{target}' bus='virtio'/>
+    </disk>""")
+
+DOMAIN_INTERFACE_TEMPLATE = dedent("""    <interface type='bridge'>
+      <mac address='{mac}'/>
+      <source bridge='br0'/>
+      <model type='virtio'/>
+    </interface>""")
+
 
 class VirshRunFake:
     """Fake for running virtlib command.
 
-    It can be used to patch VirshSSH.run.
+    It can be used to patch VirshSSH.run. Like virsh, it runs each of
+    several commands separated by `;`.
     """
 
     def __init__(self):
         self.pools = []
+        self.domains = []
 
     def add_pool(self, name, active=True, autostart=True, pool_uuid=None,
                  capacity=None, allocation=None, available=None,
@@ -428,10 +457,81 @@ class VirshRunFake:
             'path': path,
         })
 
+    def add_domain(self, name, state='shut off', arch='x86_64', cores=None,
+                   memory=None, disks=None, macs=None):
+        """Add a domain, with `disks` as (target, path, capacity) tuples."""
+        if cores is None:
+            cores = random.randint(1, 8)
+        if memory is None:
+            memory = random.randint(1024, 4096) * 1024
+        if disks is None:
+            disks = [('vda', '/var/lib/libvirt/images/%s.qcow2' % name,
+                      random.randint(1024 ** 3, 4 * 1024 ** 3))]
+        if macs is None:
+            macs = [factory.make_mac_address()]
+        self.domains.append({
+            'name': name,
+            'state': state,
+            'arch': arch,
+            'cores': cores,
+            'memory': memory,
+            'disks': disks,
+            'macs': macs,
+        })
+
+    def get_domain(self, name):
+        for domain in self.domains:
+            if domain['name'] == name:
+                return domain
+        return None
+
     def __call__(self, args):
-        command = args.pop(0)
-        func = getattr(self, 'cmd_' + command.replace('-', '_'))
-        return func(*args)
+        outputs = []
+        command = []
+        for arg in args + [';']:
+            if arg != ';':
+                command.append(arg)
+            elif len(command) > 0:
+                name, *params = command
+                func = getattr(self, 'cmd_' + name.replace('-', '_'))
+                outputs.append(func(*params))
+                command = []
+        return '\n'.join(outputs)
+
+    def cmd_echo(self, *words):
+        return ' '.join(words).replace("'", '')
+
+    def cmd_list(self, *options):
+        template = ' {id: <6}{name: <31}{state}'
+        lines = [template.format(id='Id', name='Name', state='State')]
+        lines.append('----------------------------------------------------')
+        lines.extend(
+            template.format(
+                id=idx if domain['state'] == 'running' else '-',
+                name=domain['name'], state=domain['state'])
+            for idx, domain in enumerate(self.domains, 1))
+        return '\n'.join(lines)
+
+    def cmd_dumpxml(self, name):
+        domain = self.get_domain(name)
+        if domain is None:
+            return "error: failed to get domain '%s'" % name
+        devices = [
+            DOMAIN_DISK_TEMPLATE.format(path=path, target=target)
+            for target, path, _ in domain['disks']
+        ]
+        devices.extend(
+            DOMAIN_INTERFACE_TEMPLATE.format(mac=mac)
+            for mac in domain['macs'])
+        return DOMAIN_TEMPLATE.format(devices='\n'.join(devices), **domain)
+
+    def cmd_domblkinfo(self, name, device):
+        domain = self.get_domain(name)
+        for target, _, capacity in domain['disks']:
+            if target == device and capacity is not None:
+                return 'Capacity:       %d\nAllocation:     %d\n' % (
+                    capacity, capacity)
+        return "error: invalid argument: invalid path %s" % device
 
     def cmd_pool_list(self):
         template = ' {name: <21}{state: <11}{autostart}'
@@ -798,6 +898,182 @@ class TestVirshSSH(MAASTestCase):
             factory.make_name('device'))
         self.assertIsNone(expected)
 
+    def configure_virsh_fake(self, dom_prefix=None):
+        fake_runner = VirshRunFake()
+        self.patch(virsh.VirshSSH, 'run').side_effect = fake_runner
+        return virsh.VirshSSH(dom_prefix=dom_prefix), fake_runner
+
+    def test_run_sets_lost_prompt_on_timeout(self):
+        conn = self.configure_virshssh_pexpect()
+        conn.before = b''
+        self.patch(conn, 'sendline')
+        self.patch(conn, 'prompt').return_value = False
+        conn.run(['list'])
+        self.assertTrue(conn.lost_prompt)
+        self.assertFalse(conn.is_connected())
+
+    def test_is_connected(self):
+        conn = self.configure_virshssh_pexpect()
+        self.assertTrue(conn.is_connected())
+        conn.close()
+        self.assertFalse(conn.is_connected())
+
+    def test_is_connected_false_when_never_spawned(self):
+        self.assertFalse(virsh.VirshSSH().is_connected())
+
+    def test_run_many(self):
+        conn, fake_runner = self.configure_virsh_fake()
+        pool_name = factory.make_name('pool')
+        fake_runner.add_pool(pool_name)
+        self.assertEqual([
+            fake_runner.cmd_pool_list(),
+            fake_runner.cmd_pool_dumpxml(pool_name),
+        ], conn.run_many([['pool-list'], ['pool-dumpxml', pool_name]]))
+        self.assertThat(virsh.VirshSSH.run, MockCalledOnceWith(ANY))
+
+    def test_run_many_skips_echoed_command_line(self):
+        conn = virsh.VirshSSH()
+        marker = uuid4()
+        self.patch(virsh, 'uuid4').return_value = marker
+        self.patch(virsh.VirshSSH, 'run').return_value = '\n'.join([
+            # The command line wrapped by the terminal.
+            "list ; echo maas'-'%s" % marker.hex[:8],
+            marker.hex[8:],
+            'maas-%s' % marker.hex,
+            'output',
+            'maas-%s' % marker.hex,
+        ])
+        self.assertEqual(['output'], conn.run_many([['list']]))
+
+    def test_run_many_returns_none_for_missing_output(self):
+        conn = self.configure_virshssh('')
+        self.assertEqual(
+            [None, None], conn.run_many([['list'], ['pool-list']]))
+
+    def test_run_batched(self):
+        self.patch(virsh, 'VIRSH_BATCH_SIZE', 2)
+        conn = virsh.VirshSSH()
+        run_many = self.patch(conn, 'run_many')
+        run_many.side_effect = lambda commands: [
+            command[0] for command in commands]
+        commands = [[factory.make_name('command')] for _ in range(3)]
+        self.assertEqual(
+            [command[0] for command in commands],
+            conn.run_batched(commands))
+        self.assertThat(run_many, MockCallsMatch(
+            call(commands[:2]), call(commands[2:])))
+
+    def test_list_machine_states(self):
+        conn, fake_runner = self.configure_virsh_fake(dom_prefix='maas-')
+        fake_runner.add_domain('maas-one', state='running')
+        fake_runner.add_domain('maas-two', state='shut off')
+        fake_runner.add_domain('other', state='running')
+        self.assertEqual({
+            'maas-one': 'running',
+            'maas-two': 'shut off',
+        }, conn.list_machine_states())
+
+    def test_get_machines_xml(self):
+        conn, fake_runner = self.configure_virsh_fake()
+        names = [factory.make_name('machine') for _ in range(3)]
+        for name in names[:2]:
+            fake_runner.add_domain(name)
+        conn.get_machines_xml(names)
+        self.assertEqual(
+            {name: fake_runner.cmd_dumpxml(name).strip()
+             for name in names[:2]},
+            conn.xml)
+
+    def test_parse_domain_xml(self):
+        conn, fake_runner = self.configure_virsh_fake()
+        name = factory.make_name('machine')
+        mac = factory.make_mac_address()
+        fake_runner.add_domain(
+            name, arch='aarch64', cores=4, memory=2048 * 1024,
+            disks=[('vda', '/var/lib/libvirt/images/a.qcow2', 1024)],
+            macs=[mac])
+        self.assertEqual(
+            virsh.DomainInfo(
+                'arm64/generic', 4, 2048 * 1024,
+                [('vda', '/var/lib/libvirt/images/a.qcow2')],
+                [InterfaceInfo('bridge', 'br0', 'virtio', mac)]),
+            virsh.parse_domain_xml(fake_runner.cmd_dumpxml(name)))
+
+    def test_get_discovered_machines(self):
+        conn, fake_runner = self.configure_virsh_fake()
+        path = '/var/lib/libvirt/images'
+        storage_pools = [
+            DiscoveredPodStoragePool(
+                id=factory.make_name('uuid'), type='dir',
+                name=factory.make_name('pool'), storage=0, path=path),
+        ]
+        for state in ('running', 'shut off'):
+            fake_runner.add_domain(
+                factory.make_name('machine'), state=state,
+                disks=[
+                    (target, '%s/%s' % (path, factory.make_name('disk')),
+                     random.randint(1024 ** 3, 4 * 1024 ** 3))
+                    for target in ('vda', 'vdb')
+                ],
+                macs=[factory.make_mac_address() for _ in range(2)])
+
+        machines = conn.get_discovered_machines(storage_pools)
+        self.assertEqual(
+            [domain['name'] for domain in fake_runner.domains],
+            [machine.hostname for machine in machines])
+        self.assertEqual(
+            ['on', 'off'], [machine.power_state for machine in machines])
+        for machine, domain in zip(machines, fake_runner.domains):
+            self.assertEqual('amd64/generic', machine.architecture)
+            self.assertEqual(domain['cores'], machine.cores)
+            self.assertEqual(domain['memory'] / 1024, machine.memory)
+            self.assertEqual(
+                {'power_id': domain['name']}, machine.power_parameters)
+            self.assertEqual(
+                [(('/dev/%s' % target), capacity, storage_pools[0].id)
+                 for target, _, capacity in domain['disks']],
+                [(block_device.id_path, block_device.size,
+                  block_device.storage_pool)
+                 for block_device in machine.block_devices])
+            self.assertEqual(
+                domain['macs'], [
+                    interface.mac_address
+                    for interface in machine.interfaces])
+            self.assertEqual(
+                [True, False], [
+                    interface.boot for interface in machine.interfaces])
+        # One command for the states, then one each for all the XML and
+        # all the disk sizes.
+        self.assertEqual(3, virsh.VirshSSH.run.call_count)
+
+    def test_get_discovered_machines_skips_missing_storage(self):
+        conn, fake_runner = self.configure_virsh_fake()
+        storage_pools = [
+            DiscoveredPodStoragePool(
+                id=factory.make_name('uuid'), type='dir',
+                name=factory.make_name('pool'), storage=0, path='/'),
+        ]
+        fake_runner.add_domain(
+            factory.make_name('machine'), disks=[('vda', '/missing', None)])
+        fake_runner.add_domain(factory.make_name('machine'))
+        machines = conn.get_discovered_machines(storage_pools)
+        self.assertEqual(
+            [fake_runner.domains[1]['name']],
+            [machine.hostname for machine in machines])
+
+    def test_get_discovered_machines_falls_back_without_xml(self):
+        conn = virsh.VirshSSH()
+        name = factory.make_name('machine')
+        self.patch(conn, 'list_machine_states').return_value = {
+            name: 'running'}
+        self.patch(conn, 'run_many').return_value = [None]
+        get_discovered_machine = self.patch(conn, 'get_discovered_machine')
+        get_discovered_machine.return_value = sentinel.machine
+        machines = conn.get_discovered_machines(sentinel.storage_pools)
+        self.assertEqual([sentinel.machine], machines)
+        self.assertThat(get_discovered_machine, MockCalledOnceWith(
+            name, storage_pools=sentinel.storage_pools))
+
     def test_get_pod_arch(self):
         conn = self.configure_virshssh(SAMPLE_NODEINFO)
         nodeinfo = conn.get_pod_nodeinfo()
@@ -2159,10 +2435,115 @@ class TestVirsh(MAASTestCase):
                 domain=factory.make_string())
 
 
+class TestVirshSessions(MAASTestCase):
+    """Tests for `VirshSessions`."""
+
+    def setUp(self):
+        super(TestVirshSessions, self).setUp()
+        self.login = self.patch(virsh.VirshSSH, 'login')
+        self.login.return_value = True
+        self.is_connected = self.patch(virsh.VirshSSH, 'is_connected')
+        self.is_connected.return_value = True
+        self.logout = self.patch(virsh.VirshSSH, 'logout')
+
+    def test_get_logs_in(self):
+        sessions = virsh.VirshSessions()
+        poweraddr = factory.make_name('poweraddr')
+        session = sessions.get(poweraddr, sentinel.password)
+        self.assertIsInstance(session, virsh.VirshSSH)
+        self.assertThat(
+            self.login, MockCalledOnceWith(poweraddr, sentinel.password))
+
+    def test_get_raises_error_on_failed_login(self):
+        self.login.return_value = False
+        sessions = virsh.VirshSessions()
+        self.assertRaises(
+            virsh.VirshError, sessions.get, factory.make_name('poweraddr'))
+
+    def test_get_reuses_released_session(self):
+        sessions = virsh.VirshSessions()
+        poweraddr = factory.make_name('poweraddr')
+        session = sessions.get(poweraddr)
+        sessions.release(session)
+        self.assertIs(session, sessions.get(poweraddr))
+        self.assertThat(self.login, MockCalledOnceWith(poweraddr, None))
+
+    def test_get_does_not_share_sessions_between_pods(self):
+        sessions = virsh.VirshSessions()
+        session = sessions.get(factory.make_name('poweraddr'))
+        sessions.release(session)
+        self.assertIsNot(
+            session, sessions.get(factory.make_name('poweraddr')))
+
+    def test_get_does_not_share_session_in_use(self):
+        sessions = virsh.VirshSessions()
+        poweraddr = factory.make_name('poweraddr')
+        session = sessions.get(poweraddr)
+        self.assertIsNot(session, sessions.get(poweraddr))
+
+    def test_get_does_not_reuse_disconnected_session(self):
+        sessions = virsh.VirshSessions()
+        poweraddr = factory.make_name('poweraddr')
+        session = sessions.get(poweraddr)
+        sessions.release(session)
+        self.is_connected.return_value = False
+        self.assertIsNot(session, sessions.get(poweraddr))
+
+    def test_get_logs_out_of_expired_sessions(self):
+        sessions = virsh.VirshSessions()
+        sessions.idle_timeout = -1
+        poweraddr = factory.make_name('poweraddr')
+        session = sessions.get(poweraddr)
+        sessions.release(session)
+        self.assertIsNot(session, sessions.get(poweraddr))
+        self.assertThat(self.logout, MockCalledOnceWith())
+
+    def test_release_clears_cached_xml(self):
+        sessions = virsh.VirshSessions()
+        session = sessions.get(factory.make_name('poweraddr'))
+        session.xml[factory.make_name('machine')] = factory.make_string()
+        sessions.release(session)
+        self.assertEqual({}, session.xml)
+
+    def test_release_logs_out_of_extra_sessions(self):
+        sessions = virsh.VirshSessions()
+        poweraddr = factory.make_name('poweraddr')
+        in_use = [sessions.get(poweraddr) for _ in range(3)]
+        for session in in_use:
+            sessions.release(session)
+        self.assertThat(self.logout, MockCalledOnceWith())
+
+    def test_release_logs_out_of_expired_sessions(self):
+        sessions = virsh.VirshSessions()
+        sessions.idle_timeout = -1
+        poweraddr = factory.make_name('poweraddr')
+        session = sessions.get(poweraddr)
+        other = sessions.get(factory.make_name('poweraddr'))
+        sessions.release(session)
+        self.assertThat(self.logout, MockNotCalled())
+        sessions.release(other)
+        self.assertThat(self.logout, MockCalledOnceWith())
+        self.assertIsNot(session, sessions.get(poweraddr))
+
+    def test_close_logs_out_of_unused_sessions(self):
+        sessions = virsh.VirshSessions()
+        poweraddr = factory.make_name('poweraddr')
+        in_use = [sessions.get(poweraddr) for _ in range(2)]
+        sessions.release(in_use[0])
+        sessions.close()
+        self.assertThat(self.logout, MockCalledOnceWith())
+        self.assertIsNot(in_use[0], sessions.get(poweraddr))
+
+
 class TestVirshPodDriver(MAASTestCase):
 
     run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
 
+    def setUp(self):
+        super(TestVirshPodDriver, self).setUp()
+        # Keep sessions from leaking between tests.
+        self.patch(virsh, 'virsh_sessions', virsh.VirshSessions())
+
     def test_missing_packages(self):
         mock = self.patch(has_command_available)
         mock.return_value = False
@@ -2388,10 +2769,7 @@ class TestVirshPodDriver(MAASTestCase):
             'power_address': factory.make_name('power_address'),
             'power_pass': factory.make_name('power_pass'),
         }
-        machines = [
-            factory.make_name('machine')
-            for _ in range(3)
-        ]
+        machines = [MagicMock() for _ in range(3)]
         mock_pod = MagicMock()
         mock_pod.storage_pools = sentinel.storage_pools
         mock_login = self.patch(virsh.VirshSSH, 'login')
@@ -2405,10 +2783,9 @@ class TestVirshPodDriver(MAASTestCase):
         mock_get_pod_resources.return_value = mock_pod
         mock_get_pod_hints = self.patch(
             virsh.VirshSSH, 'get_pod_hints')
-        mock_list_machines = self.patch(virsh.VirshSSH, 'list_machines')
-        mock_get_discovered_machine = self.patch(
-            virsh.VirshSSH, 'get_discovered_machine')
-        mock_list_machines.return_value = machines
+        mock_get_discovered_machines = self.patch(
+            virsh.VirshSSH, 'get_discovered_machines')
+        mock_get_discovered_machines.return_value = machines
 
         discovered_pod = yield driver.discover(system_id, context)
         self.expectThat(mock_create_storage_pool, MockCalledOnceWith())
@@ -2417,14 +2794,88 @@ class TestVirshPodDriver(MAASTestCase):
         self.expectThat(
             mock_get_pod_hints, MockCalledOnceWith())
         self.expectThat(
-            mock_list_machines, MockCalledOnceWith())
+            mock_get_discovered_machines, MockCalledOnceWith(
+                sentinel.storage_pools))
+        self.expectThat(machines, Equals(discovered_pod.machines))
         self.expectThat(
-            mock_get_discovered_machine, MockCallsMatch(
-                call(machines[0], storage_pools=sentinel.storage_pools),
-                call(machines[1], storage_pools=sentinel.storage_pools),
-                call(machines[2], storage_pools=sentinel.storage_pools)))
+            [mock_pod.cpu_speed] * 3,
+            Equals([machine.cpu_speed for machine in machines]))
         self.expectThat(['virtual'], Equals(discovered_pod.tags))
 
+    @inlineCallbacks
+    def test_discover_reuses_session(self):
+        driver = VirshPodDriver()
+        context = {
+            'power_address': factory.make_name('power_address'),
+            'power_pass': factory.make_name('power_pass'),
+        }
+        mock_login = self.patch(virsh.VirshSSH, 'login')
+        mock_login.return_value = True
+        self.patch(virsh.VirshSSH, 'is_connected').return_value = True
+        self.patch(virsh.VirshSSH, 'list_pools').return_value = ['default']
+        self.patch(virsh.VirshSSH, 'get_pod_resources')
+        self.patch(virsh.VirshSSH, 'get_pod_hints')
+        self.patch(virsh.VirshSSH, 'get_discovered_machines')
+
+        yield driver.discover(factory.make_name('system_id'), context)
+        yield driver.discover(factory.make_name('system_id'), context)
+        self.assertThat(mock_login, MockCalledOnceWith(
+            context['power_address'], context['power_pass']))
+
+    @inlineCallbacks
+    def test_discover_releases_session_on_error(self):
+        driver = VirshPodDriver()
+        context = {
+            'power_address': factory.make_name('power_address'),
+            'power_pass': factory.make_name('power_pass'),
+        }
+        self.patch(virsh.VirshSSH, 'login').return_value = True
+        self.patch(virsh.VirshSSH, 'list_pools').side_effect = (
+            factory.make_exception())
+        release = self.patch(virsh.virsh_sessions, 'release')
+        with ExpectedException(Exception):
+            yield driver.discover(factory.make_name('system_id'), context)
+        self.assertThat(release, MockCalledOnceWith(ANY))
+
+    def test_get_query_group(self):
+        driver = VirshPodDriver()
+        context = self.make_context()
+        self.assertEqual(
+            (context['power_address'], context['power_pass']),
+            driver.get_query_group(context))
+
+    def test_get_query_group_blank_password(self):
+        driver = VirshPodDriver()
+        context = self.make_context()
+        context['power_pass'] = ''
+        self.assertEqual(
+            (context['power_address'], None),
+            driver.get_query_group(context))
+
+    def test_get_query_group_without_address(self):
+        driver = VirshPodDriver()
+        context = self.make_context()
+        del context['power_address']
+        self.assertIsNone(driver.get_query_group(context))
+
+    def test_power_query_group(self):
+        driver = VirshPodDriver()
+        self.patch(virsh.VirshSSH, 'login').return_value = True
+        self.patch(virsh.VirshSSH, 'list_machine_states').return_value = {
+            'vm-on': virsh.VirshVMState.ON,
+            'vm-off': virsh.VirshVMState.OFF,
+            'vm-odd': factory.make_name('state'),
+        }
+        power_address = factory.make_name('power_address')
+        contexts = {
+            system_id: {'power_address': power_address, 'power_id': vm}
+            for system_id, vm in (
+                ('a', 'vm-on'), ('b', 'vm-off'), ('c', 'vm-odd'),
+                ('d', 'vm-missing'))
+        }
+        self.assertEqual(
+            {'a': 'on', 'b': 'off'}, driver.power_query_group(contexts))
+
     @inlineCallbacks
     def test_compose(self):
         driver = VirshPodDriver()
@@ -13,6 +13,8 @@ import os
 import string
 from tempfile import NamedTemporaryFile
 from textwrap import dedent
+import threading
+import time
 from uuid import uuid4
 
 from lxml import etree
@@ -67,6 +69,10 @@ ADD_DEFAULT_NETWORK = dedent("""
 XPATH_ARCH = "/domain/os/type/@arch"
 XPATH_BOOT = "/domain/os/boot"
 XPATH_OS = "/domain/os"
+XPATH_VCPU = "/domain/vcpu"
+XPATH_MEMORY = "/domain/memory"
+XPATH_DISKS = "/domain/devices/disk[@device='disk']"
+XPATH_INTERFACES = "/domain/devices/interface"
 
 XPATH_POOL_TYPE = "/pool/@type"
 XPATH_POOL_AVAILABLE = "/pool/available"
@@ -255,9 +261,20 @@ InterfaceInfo = namedtuple("InterfaceInfo", (
 ))
 
 
+DomainInfo = namedtuple("DomainInfo", (
+    "architecture",
+    "cores",
+    "memory",
+    "block_devices",
+    "interfaces",
+))
+
 REQUIRED_PACKAGES = [["virsh", "libvirt-clients"],
                      ["virt-login-shell", "libvirt-clients"]]
 
+# The most commands sent to virsh in one go by `VirshSSH.run_many`.
+VIRSH_BATCH_SIZE = 20
+
 
 class VirshVMState:
     OFF = "shut off"
@@ -286,6 +303,47 @@ class VirshError(Exception):
     """Failure communicating to virsh. """
 
 
+def parse_domain_xml(xml):
+    """Parse the parts of a domain's XML that discovery needs.
+
+    This gives the same information as `dominfo`, `domblklist --details`
+    and `domiflist` do for the domain, from its `dumpxml` alone.
+
+    :return: A `DomainInfo`, with memory in KiB, and with block devices
+        as (target, source) tuples.
+    """
+    doc = etree.XML(xml)
+    evaluator = etree.XPathEvaluator(doc)
+    arch = evaluator(XPATH_ARCH)[0]
+    vcpu = evaluator(XPATH_VCPU)[0]
+    cores = int(vcpu.get('current', vcpu.text))
+    memory = int(evaluator(XPATH_MEMORY)[0].text)
+    block_devices = []
+    for disk in evaluator(XPATH_DISKS):
+        target = disk.find('target').get('dev')
+        source = disk.find('source')
+        if source is not None:
+            source = (
+                source.get('file') or source.get('dev') or
+                source.get('volume') or source.get('name'))
+        block_devices.append((target, source or '-'))
+    interfaces = []
+    for interface in evaluator(XPATH_INTERFACES):
+        source = interface.find('source')
+        if source is not None:
+            source = (
+                source.get('network') or source.get('bridge') or
+                source.get('dev'))
+        model = interface.find('model')
+        if model is not None:
+            model = model.get('type')
+        interfaces.append(InterfaceInfo(
+            interface.get('type'), source or '-', model or '-',
+            interface.find('mac').get('address')))
+    return DomainInfo(
+        ARCH_FIX.get(arch, arch), cores, memory, block_devices, interfaces)
+
+
 class VirshSSH(pexpect.spawn):
 
     PROMPT = r"virsh \#"
@@ -319,6 +377,9 @@ class VirshSSH(pexpect.spawn):
             self.dom_prefix = dom_prefix
         # Store a mapping of { machine_name: xml }.
         self.xml = {}
+        # Set when virsh did not answer a command in time, after which
+        # the output of later commands cannot be told apart.
+        self.lost_prompt = False
 
     def _execute(self, poweraddr):
         """Spawns the pexpect command."""
@@ -333,9 +394,9 @@ class VirshSSH(pexpect.spawn):
         return output
 
     def get_machine_xml(self, machine):
-        # Check if we have a cached version of the XML.
-        # This is a short-lived object, so we don't need to worry about
-        # expiring objects in the cache.
+        # Check if we have a cached version of the XML. Sessions are kept
+        # by `VirshSessions` between operations, which clears the cache
+        # before handing a session out again.
         if machine in self.xml:
             return self.xml[machine]
 
@@ -393,13 +454,63 @@ class VirshSSH(pexpect.spawn):
             return False
         return True
 
+    def is_connected(self):
+        """Is this session logged in, and still in step with virsh?"""
+        if self.closed or self.lost_prompt:
+            return False
+        try:
+            return self.isalive()
+        except Exception:
+            # Never spawned, or already gone.
+            return False
+
     def run(self, args):
         cmd = ' '.join(args)
         self.sendline(cmd)
-        self.prompt()
+        if not self.prompt():
+            self.lost_prompt = True
         result = self.before.decode("utf-8").splitlines()
         return '\n'.join(result[1:])
 
+    def run_many(self, commands):
+        """Run several commands in one round-trip to virsh.
+
+        The commands are sent on one line separated by `;`, with an `echo`
+        of a marker between each so their output can be split apart again.
+
+        :return: A list of the output of each command, with None for those
+            whose output could not be told apart.
+        """
+        marker = 'maas-%s' % uuid4().hex
+        # Quoting part of the marker means only the output of `echo`, and
+        # not the command line as virsh echoes it back, contains the marker.
+        echo = ['echo', marker.replace('-', "'-'", 1)]
+        args = list(echo)
+        for command in commands:
+            args.append(';')
+            args.extend(command)
+            args.append(';')
+            args.extend(echo)
+        outputs = []
+        lines = None
+        for line in self.run(args).splitlines():
+            if line.strip() == marker:
+                if lines is not None:
+                    outputs.append('\n'.join(lines))
+                lines = []
+            elif lines is not None:
+                lines.append(line)
+        outputs = outputs[:len(commands)]
+        return outputs + [None] * (len(commands) - len(outputs))
+
+    def run_batched(self, commands):
+        """Run `commands` with `run_many`, `VIRSH_BATCH_SIZE` at a time."""
+        outputs = []
+        for start in range(0, len(commands), VIRSH_BATCH_SIZE):
+            outputs.extend(
+                self.run_many(commands[start:start + VIRSH_BATCH_SIZE]))
+        return outputs
+
     def get_column_values(self, data, keys):
         """Return tuple of column value tuples based off keys."""
         data = data.strip().splitlines()
@@ -458,6 +569,26 @@ class VirshSSH(pexpect.spawn):
         machines = machines.strip().splitlines()
         return [m for m in machines if m.startswith(self.dom_prefix)]
 
+    def list_machine_states(self):
+        """Gets the state of all VMs, as a dict of name to state."""
+        output = self.run(['list', '--all']).strip()
+        # Parse the `virsh list --all` output, which will look something
+        # like the following:
+        #
+        #  Id    Name                           State
+        # ----------------------------------------------------
+        #  1     vm1                            running
+        #  -     vm2                            shut off
+        #
+        # That is, skip the two lines of header, and then extract the name
+        # and the state, which may contain spaces.
+        states = {}
+        for line in output.splitlines()[2:]:
+            values = line.split(None, 2)
+            if len(values) == 3 and values[1].startswith(self.dom_prefix):
+                states[values[1]] = values[2].strip()
+        return states
+
     def list_pools(self):
         """Lists all pools in the pod."""
         keys = ['Name']
@@ -591,6 +722,48 @@ class VirshSSH(pexpect.spawn):
         # Local storage in bytes.
         return local_storage
 
+    def get_machines_xml(self, machines):
+        """Read the XML of many VMs into the cache in batches."""
+        machines = [
+            machine for machine in machines
+            if machine not in self.xml
+        ]
+        outputs = self.run_batched([
+            ['dumpxml', machine]
+            for machine in machines
+        ])
+        for machine, output in zip(machines, outputs):
+            if output is None:
+                # Left for `get_machine_xml` to fetch on its own.
+                continue
+            output = output.strip()
+            if output.startswith("error:"):
+                maaslog.error("%s: Failed to get XML for machine", machine)
+            else:
+                self.xml[machine] = output
+
+    def get_machines_local_storage(self, devices):
+        """Gets the local storage for many (machine, device) tuples.
+
+        :return: A dict mapping each (machine, device) tuple to its size.
+        """
+        outputs = self.run_batched([
+            ['domblkinfo', machine, device]
+            for machine, device in devices
+        ])
+        sizes = {}
+        for (machine, device), output in zip(devices, outputs):
+            if output is None:
+                sizes[machine, device] = self.get_machine_local_storage(
+                    machine, device)
+            else:
+                try:
+                    sizes[machine, device] = int(
+                        self.get_key_value(output, "Capacity"))
+                except TypeError:
+                    sizes[machine, device] = None
+        return sizes
+
     def get_machine_local_storage(self, machine, device):
         """Gets the VM local storage for device."""
         output = self.run(['domblkinfo', machine, device]).strip()
@@ -742,6 +915,73 @@ class VirshSSH(pexpect.spawn):
         discovered_machine.interfaces = interfaces
         return discovered_machine
 
+    def get_discovered_machines(self, storage_pools):
+        """Gets all discovered machines in the pod.
+
+        This asks virsh for the state of every VM at once, and then for
+        their XML and the sizes of their disks in batches, rather than
+        running several commands for each VM in turn.
+        """
+        states = self.list_machine_states()
+        self.get_machines_xml(list(states))
+        domains = {
+            machine: parse_domain_xml(self.xml[machine])
+            for machine in states
+            if machine in self.xml
+        }
+        sizes = self.get_machines_local_storage([
+            (machine, device)
+            for machine, domain in domains.items()
+            for device, _ in domain.block_devices
+        ])
+
+        machines = []
+        for machine, state in states.items():
+            if machine in domains:
+                discovered_machine = self._make_discovered_machine(
+                    machine, state, domains[machine], sizes, storage_pools)
+            else:
+                discovered_machine = self.get_discovered_machine(
+                    machine, storage_pools=storage_pools)
+            if discovered_machine is not None:
+                machines.append(discovered_machine)
+        return machines
+
+    def _make_discovered_machine(
+            self, machine, state, domain, sizes, storage_pools):
+        """Make a discovered machine for `get_discovered_machines`."""
+        discovered_machine = DiscoveredMachine(
+            architecture=domain.architecture, cores=domain.cores,
+            cpu_speed=0, memory=int(domain.memory / 1024),
+            interfaces=[], block_devices=[], tags=[])
+        discovered_machine.hostname = machine
+        discovered_machine.power_state = VM_STATE_TO_POWER_STATE[state]
+        discovered_machine.power_parameters = {
+            'power_id': machine,
+        }
+        for device, source in domain.block_devices:
+            size = sizes[machine, device]
+            if size is None:
+                # See `get_discovered_machine`.
+                maaslog.error(
+                    "Unable to discover machine '%s' in virsh pod: storage "
+                    "device '%s' is missing its storage backing." % (
+                        machine, device))
+                return None
+            storage_pool = self.find_storage_pool(source, storage_pools)
+            discovered_machine.block_devices.append(
+                DiscoveredMachineBlockDevice(
+                    model=None, serial=None, size=size,
+                    id_path="/dev/%s" % device, tags=[],
+                    storage_pool=storage_pool.id))
+        for idx, interface_info in enumerate(domain.interfaces):
+            discovered_machine.interfaces.append(
+                DiscoveredMachineInterface(
+                    mac_address=interface_info.mac, boot=(idx == 0),
+                    attach_type=interface_info.type,
+                    attach_name=interface_info.source))
+        return discovered_machine
+
     def check_machine_can_startup(self, machine):
         """Check the machine for any startup errors
         after the domain is created in virsh.
@@ -1195,6 +1435,118 @@ class VirshSSH(pexpect.spawn):
             '--managed-save', '--nvram'])
 
 
+class VirshSessions:
+    """Logged-in `VirshSSH` sessions to pods, kept between operations.
+
+    Logging in to a pod spawns `virsh` over SSH, which costs far more than
+    most commands run once logged in. Sessions are released back here
+    after use, and handed out again for the same pod. Those left unused
+    for longer than `idle_timeout` seconds are logged out.
+    """
+
+    idle_timeout = 300
+    # The most unused sessions kept for each pod.
+    max_idle = 2
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Unused sessions, as { (poweraddr, password): [(session, time)] }.
+        self._idle = {}
+        # Sessions handed out, as { session: (poweraddr, password) }.
+        self._busy = {}
+
+    def get(self, poweraddr, password=None):
+        """Return a logged-in session to the pod at `poweraddr`.
+
+        :raise VirshError: If logging in to the pod fails.
+        """
+        key = poweraddr, password
+        with self._lock:
+            stale = self._expire(time.monotonic())
+            idle = self._idle.get(key, [])
+            while idle:
+                session, _ = idle.pop()
+                if session.is_connected():
+                    break
+                stale.append(session)
+            else:
+                session = None
+        for old_session in stale:
+            self._close(old_session)
+        if session is None:
+            session = VirshSSH()
+            if not session.login(poweraddr, password):
+                raise VirshError('Failed to login to virsh console.')
+        with self._lock:
+            self._busy[session] = key
+        return session
+
+    def release(self, session):
+        """Return `session`, from `get`, for it to be used again.
+
+        This also logs out of sessions that have been left idle for too
+        long, so that they do not linger once pods are no longer used.
+        """
+        # XML cached by the session may be out of date by the time it is
+        # next used.
+        session.xml.clear()
+        now = time.monotonic()
+        with self._lock:
+            stale = self._expire(now)
+            key = self._busy.pop(session)
+            idle = self._idle.setdefault(key, [])
+            if session.is_connected() and len(idle) < self.max_idle:
+                idle.append((session, now))
+            else:
+                stale.append(session)
+        for old_session in stale:
+            self._close(old_session)
+
+    def close(self):
+        """Log out of all unused sessions."""
+        with self._lock:
+            sessions = [
+                session
+                for idle in self._idle.values()
+                for session, _ in idle
+            ]
+            self._idle.clear()
+        for session in sessions:
+            self._close(session)
+
+    def _expire(self, now):
+        """Forget sessions unused since `idle_timeout` seconds before `now`.
+
+        The lock must be held. Returns the forgotten sessions to close.
+        """
+        stale = []
+        for key, idle in list(self._idle.items()):
+            stale.extend(
+                session for session, released in idle
+                if now - released > self.idle_timeout)
+            idle[:] = [
+                (session, released) for session, released in idle
+                if now - released <= self.idle_timeout
+            ]
+            if len(idle) == 0:
+                del self._idle[key]
+        return stale
+
+    def _close(self, session):
+        try:
+            if session.is_connected():
+                session.logout()
+            elif not session.closed:
+                session.close()
+        except Exception:
+            # It's going away either way.
+            pass
+
+
+# Sessions shared by all uses of the virsh pod driver.
+virsh_sessions = VirshSessions()
+
+
 class VirshPodDriver(PodDriver):
 
     name = 'virsh'
@@ -1230,25 +1582,27 @@ class VirshPodDriver(PodDriver):
         if power_pass == '':
             power_pass = None
 
-        conn = VirshSSH()
-        logged_in = yield deferToThread(conn.login, power_address, power_pass)
-        if not logged_in:
-            raise VirshError('Failed to login to virsh console.')
-
-        state = yield deferToThread(conn.get_machine_state, power_id)
-        if state is None:
-            raise VirshError('%s: Failed to get power state' % power_id)
-
-        if state == VirshVMState.OFF:
-            if power_change == 'on':
-                powered_on = yield deferToThread(conn.poweron, power_id)
-                if powered_on is False:
-                    raise VirshError('%s: Failed to power on VM' % power_id)
-        elif state == VirshVMState.ON:
-            if power_change == 'off':
-                powered_off = yield deferToThread(conn.poweroff, power_id)
-                if powered_off is False:
-                    raise VirshError('%s: Failed to power off VM' % power_id)
+        conn = yield deferToThread(
+            virsh_sessions.get, power_address, power_pass)
+        try:
+            state = yield deferToThread(conn.get_machine_state, power_id)
+            if state is None:
+                raise VirshError('%s: Failed to get power state' % power_id)
+
+            if state == VirshVMState.OFF:
+                if power_change == 'on':
+                    powered_on = yield deferToThread(conn.poweron, power_id)
+                    if powered_on is False:
+                        raise VirshError(
+                            '%s: Failed to power on VM' % power_id)
+            elif state == VirshVMState.ON:
+                if power_change == 'off':
+                    powered_off = yield deferToThread(conn.poweroff, power_id)
+                    if powered_off is False:
+                        raise VirshError(
+                            '%s: Failed to power off VM' % power_id)
+        finally:
+            yield deferToThread(virsh_sessions.release, conn)
 
     @inlineCallbacks
     def power_state_virsh(
@@ -1260,12 +1614,12 @@ class VirshPodDriver(PodDriver):
         if power_pass == '':
             power_pass = None
 
-        conn = VirshSSH()
-        logged_in = yield deferToThread(conn.login, power_address, power_pass)
-        if not logged_in:
-            raise VirshError('Failed to login to virsh console.')
-
-        state = yield deferToThread(conn.get_machine_state, power_id)
+        conn = yield deferToThread(
+            virsh_sessions.get, power_address, power_pass)
+        try:
+            state = yield deferToThread(conn.get_machine_state, power_id)
+        finally:
+            yield deferToThread(virsh_sessions.release, conn)
         if state is None:
             raise VirshError('Failed to get domain: %s' % power_id)
 
@@ -1289,17 +1643,41 @@ class VirshPodDriver(PodDriver):
         """Power query Virsh node."""
         return self.power_state_virsh(**context)
 
-    @inlineCallbacks
-    def get_virsh_connection(self, context):
-        """Connect and return the virsh connection."""
+    def get_query_group(self, context):
+        """Query all the VMs of a pod together."""
         power_address = context.get('power_address')
-        power_pass = context.get('power_pass')
-        # Login to Virsh console.
-        conn = VirshSSH()
-        logged_in = yield deferToThread(conn.login, power_address, power_pass)
-        if not logged_in:
-            raise VirshError('Failed to login to virsh console.')
-        return conn
+        if not power_address:
+            return None
+        return power_address, context.get('power_pass') or None
+
+    def power_query_group(self, contexts):
+        """Query the power state of VMs in one pod with `virsh list`."""
+        power_address, power_pass = self.get_query_group(
+            next(iter(contexts.values())))
+        conn = virsh_sessions.get(power_address, power_pass)
+        try:
+            states = conn.list_machine_states()
+        finally:
+            virsh_sessions.release(conn)
+        power_states = {}
+        for system_id, context in contexts.items():
+            state = states.get(context.get('power_id'))
+            if state in VM_STATE_TO_POWER_STATE:
+                power_states[system_id] = VM_STATE_TO_POWER_STATE[state]
+        return power_states
+
+    def get_virsh_connection(self, context):
+        """Return a deferred firing with a logged-in virsh session.
+
+        The session must be handed back with `release_virsh_connection`.
+        """
+        return deferToThread(
+            virsh_sessions.get, context.get('power_address'),
+            context.get('power_pass'))
+
+    def release_virsh_connection(self, conn):
+        """Hand back a session from `get_virsh_connection`."""
+        return deferToThread(virsh_sessions.release, conn)
 
     @inlineCallbacks
     def discover(self, system_id, context):
@@ -1308,28 +1686,26 @@ class VirshPodDriver(PodDriver):
         Returns a defer to a DiscoveredPod object.
         """
         conn = yield self.get_virsh_connection(context)
-
-        # Check that we have at least one storage pool.  If not, create it.
-        pools = yield deferToThread(conn.list_pools)
-        if not len(pools):
-            yield deferToThread(conn.create_storage_pool)
-
-        # Discover pod resources.
-        discovered_pod = yield deferToThread(conn.get_pod_resources)
-
-        # Discovered pod hints.
-        discovered_pod.hints = yield deferToThread(conn.get_pod_hints)
-
-        # Discover VMs.
-        machines = []
-        virtual_machines = yield deferToThread(conn.list_machines)
-        for vm in virtual_machines:
-            discovered_machine = yield deferToThread(
-                conn.get_discovered_machine, vm,
-                storage_pools=discovered_pod.storage_pools)
-            if discovered_machine is not None:
-                discovered_machine.cpu_speed = discovered_pod.cpu_speed
-                machines.append(discovered_machine)
+        try:
+            # Check that we have at least one storage pool.  If not, create
+            # it.
+            pools = yield deferToThread(conn.list_pools)
+            if not len(pools):
+                yield deferToThread(conn.create_storage_pool)
+
+            # Discover pod resources.
+            discovered_pod = yield deferToThread(conn.get_pod_resources)
+
+            # Discovered pod hints.
+            discovered_pod.hints = yield deferToThread(conn.get_pod_hints)
+
+            # Discover VMs.
+            machines = yield deferToThread(
+                conn.get_discovered_machines, discovered_pod.storage_pools)
+        finally:
+            yield self.release_virsh_connection(conn)
+        for discovered_machine in machines:
+            discovered_machine.cpu_speed = discovered_pod.cpu_speed
         discovered_pod.machines = machines
 
         # Set KVM Pod tags to 'virtual'.
@@ -1342,19 +1718,26 @@ class VirshPodDriver(PodDriver):
     def compose(self, system_id, context, request):
         """Compose machine."""
         conn = yield self.get_virsh_connection(context)
-        default_pool = context.get(
-            'default_storage_pool_id', context.get('default_storage_pool'))
-        created_machine = yield deferToThread(
-            conn.create_domain, request, default_pool)
-        hints = yield deferToThread(conn.get_pod_hints)
+        try:
+            default_pool = context.get(
+                'default_storage_pool_id',
+                context.get('default_storage_pool'))
+            created_machine = yield deferToThread(
+                conn.create_domain, request, default_pool)
+            hints = yield deferToThread(conn.get_pod_hints)
+        finally:
+            yield self.release_virsh_connection(conn)
         return created_machine, hints
 
     @inlineCallbacks
     def decompose(self, system_id, context):
         """Decompose machine."""
         conn = yield self.get_virsh_connection(context)
-        yield deferToThread(conn.delete_domain, context['power_id'])
-        hints = yield deferToThread(conn.get_pod_hints)
+        try:
+            yield deferToThread(conn.delete_domain, context['power_id'])
+            hints = yield deferToThread(conn.get_pod_hints)
+        finally:
+            yield self.release_virsh_connection(conn)
         return hints
 
 
@@ -277,6 +277,8 @@ class PowerDriver(PowerDriverBase):
 
     wait_time = DEFAULT_WAITING_POLICY
     queryable = True
+    # The most nodes `query_group` is asked to query at once.
+    query_group_size = 64
 
     def __init__(self, clock=reactor):
         self.clock = reactor
@@ -355,6 +357,34 @@ class PowerDriver(PowerDriverBase):
         else:
             raise exc_info[0](exc_info[1]).with_traceback(exc_info[2])
 
+    def get_query_group(self, context):
+        """Return a key for the nodes whose power can be queried together.
+
+        Nodes whose contexts have equal keys are queried together with
+        `query_group`. Return None, the default, to query a node on its own
+        with `query`.
+        """
+        return None
+
+    def power_query_group(self, contexts):
+        """Implement this method to query the power state of many nodes.
+
+        :param contexts: A dict mapping `Node.system_id` to power settings,
+            for nodes which all have the same `get_query_group` key.
+        :return: A dict mapping `Node.system_id` to the node's power state,
+            or to the `PowerError` querying it raised. Nodes which could not
+            be queried are left out, and are then queried on their own.
+        """
+        raise NotImplementedError()
+
+    def query_group(self, contexts):
+        """Performs the power query action for a group of nodes.
+
+        There are no retries. Nodes missing from the result are queried
+        again on their own with `query`, which does retry.
+        """
+        return deferToThread(self.power_query_group, contexts)
+
     @inlineCallbacks
     def perform_power(self, power_func, state_desired, system_id, context):
         """Provides the logic to perform the power actions.
@@ -155,6 +155,32 @@ IPMI_ERRORS = {
 maaslog = get_maas_logger("drivers.power.ipmi")
 
 
+def parse_ipmipower_stat(output):
+    """Parse the output of a multi-host `ipmipower --stat`.
+
+    Each line of output is of the form "host: state", or "host: error".
+
+    :return: A dict mapping each host to "on" or "off", or to the
+        `PowerError` reported for it. Hosts whose output is not understood
+        are left out.
+    """
+    results = {}
+    for line in output.splitlines():
+        host, sep, message = line.partition(":")
+        if sep == "":
+            continue
+        host, message = host.strip(), message.strip()
+        if message in ("on", "off"):
+            results[host] = message
+        else:
+            for error, error_info in IPMI_ERRORS.items():
+                if error in message:
+                    results[host] = error_info['exception'](
+                        error_info['message'])
+                    break
+    return results
+
+
 class IPMI_DRIVER:
     DEFAULT = ''
     LAN = 'LAN'
@@ -211,6 +237,8 @@ class IPMIPowerDriver(PowerDriver):
     ]
     ip_extractor = make_ip_extractor('power_address')
     wait_time = (4, 8, 16, 32)
+    # The number of hosts `ipmipower` queries in parallel by default.
+    query_group_size = 64
 
     def detect_missing_packages(self):
         if not shell.has_command_available('ipmipower'):
@@ -271,6 +299,22 @@ class IPMIPowerDriver(PowerDriver):
         match = re.search(":\s*(on|off)", stdout)
         return stdout if match is None else match.group(1)
 
+    @staticmethod
+    def _get_common_args(
+            power_address, power_user, power_pass, power_driver):
+        """Return the arguments `ipmipower` and `ipmi-chassis-config` share.
+
+        :param power_address: A host, or a comma-separated list of them.
+        """
+        common_args = []
+        if is_power_parameter_set(power_driver):
+            common_args.extend(("--driver-type", power_driver))
+        common_args.extend(('-h', power_address))
+        if is_power_parameter_set(power_user):
+            common_args.extend(("-u", power_user))
+        common_args.extend(('-p', power_pass))
+        return common_args
+
     def _issue_ipmi_command(
             self, power_change, power_address=None, power_user=None,
             power_pass=None, power_driver=None, power_off_mode=None,
@@ -295,13 +339,8 @@ class IPMIPowerDriver(PowerDriver):
         # Arguments in common between chassis config and power control. See
         # https://launchpad.net/bugs/1053391 for details of modifying the
         # command for power_driver and power_user.
-        common_args = []
-        if is_power_parameter_set(power_driver):
-            common_args.extend(("--driver-type", power_driver))
-        common_args.extend(('-h', power_address))
-        if is_power_parameter_set(power_user):
-            common_args.extend(("-u", power_user))
-        common_args.extend(('-p', power_pass))
+        common_args = self._get_common_args(
+            power_address, power_user, power_pass, power_driver)
 
         # Update the power commands with common args.
         ipmipower_command.extend(common_args)
@@ -338,3 +377,45 @@ class IPMIPowerDriver(PowerDriver):
 
     def power_query(self, system_id, context):
         return self._issue_ipmi_command('query', **context)
+
+    def get_query_group(self, context):
+        """Nodes sharing credentials and driver are queried together.
+
+        Nodes only known by MAC address, and addresses that `ipmipower`
+        would read as a list or range of hosts, are queried on their own.
+        """
+        power_address = context.get('power_address')
+        if not is_power_parameter_set(power_address):
+            return None
+        elif any(char in power_address for char in ":,[]"):
+            return None
+        else:
+            return (
+                context.get('power_driver'), context.get('power_user'),
+                context.get('power_pass'))
+
+    def power_query_group(self, contexts):
+        """Query the power state of many nodes with one `ipmipower`."""
+        system_ids = {}
+        for system_id, context in contexts.items():
+            system_ids.setdefault(context['power_address'], []).append(
+                system_id)
+        # All contexts share the same credentials and driver.
+        context = next(iter(contexts.values()))
+        command = ['ipmipower', '-W', 'opensesspriv']
+        command.extend(self._get_common_args(
+            ','.join(sorted(system_ids)), context.get('power_user'),
+            context.get('power_pass'), context.get('power_driver')))
+        command.append('--stat')
+        env = shell.get_env_with_locale()
+        # ipmipower exits non-zero if any host fails, and reports per-host
+        # errors to stdout, so only its output is checked.
+        process = Popen(tuple(command), stdout=PIPE, stderr=PIPE, env=env)
+        stdout, _ = process.communicate()
+        results = parse_ipmipower_stat(stdout.decode("utf-8"))
+        return {
+            system_id: results[power_address]
+            for power_address, group in system_ids.items()
+            if power_address in results
+            for system_id in group
+        }
@@ -7,7 +7,11 @@ __all__ = [
     'RedfishPowerDriver',
     ]
 
-from base64 import b64encode
+from base64 import (
+    b64decode,
+    b64encode,
+)
+from datetime import timedelta
 from http import HTTPStatus
 from io import BytesIO
 import json
@@ -15,6 +19,7 @@ from os.path import (
     basename,
     join,
 )
+from urllib.parse import urljoin
 
 from provisioningserver.drivers import (
     make_ip_extractor,
@@ -26,12 +31,19 @@ from provisioningserver.drivers.power import (
     PowerDriver,
 )
 from provisioningserver.utils.twisted import asynchronous
+from provisioningserver.utils.webclient import get_connection_pool
 from twisted.internet import reactor
 from twisted.internet._sslverify import (
     ClientTLSOptions,
     OpenSSLCertificateOptions,
 )
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import (
+    Deferred,
+    inlineCallbacks,
+    succeed,
+)
+from twisted.internet.protocol import Protocol
+from twisted.python.failure import Failure
 from twisted.web.client import (
     Agent,
     BrowserLikePolicyForHTTPS,
@@ -47,6 +59,8 @@ REDFISH_POWER_CONTROL_ENDPOINT = (
 
 REDFISH_SYSTEMS_ENDPOINT = b"redfish/v1/Systems/"
 
+REDFISH_SESSIONS_ENDPOINT = b"redfish/v1/SessionService/Sessions/"
+
 
 class WebClientContextFactory(BrowserLikePolicyForHTTPS):
 
@@ -59,8 +73,181 @@ class WebClientContextFactory(BrowserLikePolicyForHTTPS):
         return opts
 
 
+class DiscardBody(Protocol):
+    """Throw away a response body, firing `finished` once it is done."""
+
+    def __init__(self, finished):
+        self.finished = finished
+
+    def connectionLost(self, reason):
+        self.finished.callback(None)
+
+
+def discard_body(response):
+    """Read and throw away the body of `response`.
+
+    A persistent connection only goes back to the pool once the body of its
+    response has been delivered.
+
+    :return: A `Deferred` that fires once the body has been read.
+    """
+    finished = Deferred()
+    response.deliverBody(DiscardBody(finished))
+    return finished
+
+
+def read_body_producer(producer):
+    """Read all of the body from `producer`, so it can be sent again.
+
+    :return: A `Deferred` firing with the body, as bytes.
+    """
+    body = BytesIO()
+    d = producer.startProducing(body)
+    d.addCallback(lambda _: body.getvalue())
+    return d
+
+
+class RedfishSessions:
+    """Redfish session tokens, shared between requests to the same service.
+
+    Rather than sending Basic credentials with every request, a session is
+    created through the service's SessionService and its X-Auth-Token is
+    used until it is `max_age` seconds old. Services that refuse to create
+    a session are sent Basic credentials, and are not asked again for
+    `retry_unsupported` seconds.
+    """
+
+    # Renew sessions well within the default SessionTimeout of 30 minutes.
+    max_age = timedelta(minutes=10).total_seconds()
+    retry_unsupported = timedelta(hours=1).total_seconds()
+
+    def __init__(self, clock=reactor):
+        super(RedfishSessions, self).__init__()
+        self.clock = clock
+        # (service root, authorization) -> (token, location, created). The
+        # location is the absolute URI of the session.
+        self.sessions = {}
+        # service root -> when a session was refused.
+        self.unsupported = {}
+        # (service root, authorization) -> [Deferred, ...] awaiting login.
+        self.pending = {}
+
+    def authorize(self, agent, uri, headers):
+        """Return `headers` to use when requesting `uri`.
+
+        :return: A `Deferred` firing with `headers`, or with a copy that
+            carries a session token in place of Basic credentials.
+        """
+        authorization = headers.getRawHeaders(b"Authorization", [b""])[0]
+        if b"redfish/v1" not in uri or not authorization.startswith(
+                b"Basic "):
+            return succeed(headers)
+        root = uri[:uri.index(b"redfish/v1")]
+        now = self.clock.seconds()
+        refused = self.unsupported.get(root)
+        if refused is not None and now - refused < self.retry_unsupported:
+            return succeed(headers)
+        key = root, authorization
+        session = self.sessions.get(key)
+        if session is not None:
+            token, location, created = session
+            if now - created < self.max_age:
+                return succeed(self._session_headers(headers, token))
+            del self.sessions[key]
+            self._logout(agent, headers, token, location)
+
+        waiting = Deferred()
+        waiting.addCallback(self._authorized, headers)
+        if key in self.pending:
+            self.pending[key].append(waiting)
+        else:
+            self.pending[key] = [waiting]
+            d = self._login(agent, root, authorization)
+            d.addCallback(self._logged_in, key)
+            d.addBoth(self._release, key)
+        return waiting
+
+    def discard(self, token):
+        """Forget the session using `token`, e.g. when it has expired."""
+        for key, session in list(self.sessions.items()):
+            if session[0] == token:
+                del self.sessions[key]
+
+    def _session_headers(self, headers, token):
+        headers = headers.copy()
+        headers.removeHeader(b"Authorization")
+        headers.setRawHeaders(b"X-Auth-Token", [token])
+        return headers
+
+    def _authorized(self, token, headers):
+        if token is None:
+            return headers
+        else:
+            return self._session_headers(headers, token)
+
+    def _login(self, agent, root, authorization):
+        creds = b64decode(authorization[len(b"Basic "):]).decode("utf-8")
+        user, password = creds.split(":", 1)
+        payload = FileBodyProducer(BytesIO(json.dumps({
+            "UserName": user,
+            "Password": password,
+        }).encode("utf-8")))
+        headers = Headers({
+            b"User-Agent": [b"MAAS"],
+            b"Content-Type": [b"application/json; charset=utf-8"],
+        })
+        return agent.request(
+            b"POST", root + REDFISH_SESSIONS_ENDPOINT, headers=headers,
+            bodyProducer=payload)
+
+    def _logged_in(self, response, key):
+        root, _ = key
+        tokens = None
+        if response.code < HTTPStatus.BAD_REQUEST:
+            tokens = response.headers.getRawHeaders(b"X-Auth-Token")
+        if tokens:
+            token = tokens[0]
+            location = response.headers.getRawHeaders(b"Location", [None])[0]
+            if location is not None:
+                # Services normally return a path relative to their root.
+                location = urljoin(root, location)
+            self.sessions[key] = token, location, self.clock.seconds()
+        else:
+            token = None
+            self.unsupported[root] = self.clock.seconds()
+        # Wait for the body so that the connection is back in the pool
+        # before the request that needed the session is made.
+        d = discard_body(response)
+        d.addCallback(lambda _: token)
+        return d
+
+    def _release(self, result, key):
+        # Pass the token, or the failure, on to everything waiting for it.
+        for waiting in self.pending.pop(key):
+            if isinstance(result, Failure):
+                waiting.errback(result)
+            else:
+                waiting.callback(result)
+
+    def _logout(self, agent, headers, token, location):
+        # Delete the expired session so the service does not have to keep
+        # it around until it times out. This is best effort only.
+        if location is None:
+            return
+        d = agent.request(
+            b"DELETE", location, headers=self._session_headers(
+                headers, token))
+        d.addCallbacks(discard_body, lambda failure: None)
+
+
+redfish_sessions = RedfishSessions()
+
+
 class RedfishPowerDriverBase(PowerDriver):
 
+    # Authenticate with Redfish sessions where the service supports them.
+    use_sessions = True
+
     def get_url(self, context):
         """Return url for the pod."""
         url = context.get('power_address')
@@ -83,10 +270,51 @@ class RedfishPowerDriverBase(PowerDriver):
 
     @asynchronous
     def redfish_request(self, method, uri, headers=None, bodyProducer=None):
-        """Send the redfish request and return the response."""
-        agent = Agent(reactor, contextFactory=WebClientContextFactory())
-        d = agent.request(
-            method, uri, headers=headers, bodyProducer=bodyProducer)
+        """Send the redfish request and return the response.
+
+        Requests share the rack's persistent connection pool, which also
+        limits the number of concurrent requests made to each BMC.
+        """
+        pool = get_connection_pool()
+        return pool.run(
+            uri, self._redfish_request, pool, method, uri, headers,
+            bodyProducer)
+
+    def _redfish_request(self, pool, method, uri, headers, bodyProducer):
+        agent = Agent(
+            reactor, contextFactory=WebClientContextFactory(), pool=pool)
+
+        def authorize_and_send(body, retry):
+            d = redfish_sessions.authorize(agent, uri, headers)
+            d.addCallback(send_request, body, retry)
+            return d
+
+        def send_request(request_headers, body, retry):
+            if body is None:
+                producer = bodyProducer
+            else:
+                producer = FileBodyProducer(BytesIO(body))
+            d = agent.request(
+                method, uri, headers=request_headers, bodyProducer=producer)
+            d.addCallback(check_authorized, request_headers, body, retry)
+            return d
+
+        def check_authorized(response, request_headers, body, retry):
+            tokens = []
+            if request_headers is not None:
+                tokens = request_headers.getRawHeaders(b"X-Auth-Token", [])
+            if (response.code != int(HTTPStatus.UNAUTHORIZED) or
+                    len(tokens) == 0):
+                return render_response(response)
+            # The session expired before it was due to be renewed.
+            for token in tokens:
+                redfish_sessions.discard(token)
+            if not retry:
+                return render_response(response)
+            # Try once more, with a new session or Basic credentials.
+            d = discard_body(response)
+            d.addCallback(lambda _: authorize_and_send(body, retry=False))
+            return d
 
         def render_response(response):
             """Render the HTTPS response received."""
@@ -112,6 +340,7 @@ class RedfishPowerDriverBase(PowerDriver):
 
             # Error out if the response has a status code of 400 or above.
             if response.code >= int(HTTPStatus.BAD_REQUEST):
+                discard_body(response)
                 raise PowerActionError(
                     "Redfish request failed with response status code:"
                     " %s." % response.code)
@@ -122,8 +351,16 @@ class RedfishPowerDriverBase(PowerDriver):
             d.addCallback(cb_attach_headers, headers=response.headers)
             return d
 
-        d.addCallback(render_response)
-        return d
+        if not self.use_sessions or headers is None:
+            return send_request(headers, None, retry=False)
+        elif bodyProducer is None:
+            return authorize_and_send(None, retry=True)
+        else:
+            # Keep the body, to send it again should the session have
+            # expired.
+            d = read_body_producer(bodyProducer)
+            d.addCallback(authorize_and_send, retry=True)
+            return d
 
 
 class RedfishPowerDriver(RedfishPowerDriverBase):
@@ -22,6 +22,7 @@ from maastesting.testcase import MAASTestCase
 from provisioningserver.drivers.power import (
     ipmi as ipmi_module,
     PowerAuthError,
+    PowerConnError,
     PowerError,
 )
 from provisioningserver.drivers.power.ipmi import (
@@ -31,6 +32,7 @@ from provisioningserver.drivers.power.ipmi import (
     IPMI_CONFIG_WITH_BOOT_TYPE,
     IPMI_ERRORS,
     IPMIPowerDriver,
+    parse_ipmipower_stat,
 )
 from provisioningserver.utils.shell import (
     get_env_with_locale,
@@ -364,3 +366,88 @@ class TestIPMIPowerDriver(MAASTestCase):
                     IPMI_BOOT_TYPE.EFI]))
         self.assertThat(tmpfile.flush, MockCalledOnceWith())
         self.assertThat(tmpfile.__exit__, MockCalledOnceWith(None, None, None))
+
+
+class TestParseIPMIPowerStat(MAASTestCase):
+    """Tests for `parse_ipmipower_stat`."""
+
+    def test__parses_states(self):
+        self.assertThat(
+            parse_ipmipower_stat("10.0.0.1: on\n10.0.0.2: off\n"),
+            Equals({"10.0.0.1": "on", "10.0.0.2": "off"}))
+
+    def test__parses_errors(self):
+        results = parse_ipmipower_stat(
+            "10.0.0.1: password invalid\n10.0.0.2: connection timeout")
+        self.assertIsInstance(results["10.0.0.1"], PowerAuthError)
+        self.assertIsInstance(results["10.0.0.2"], PowerConnError)
+
+    def test__leaves_out_output_not_understood(self):
+        self.assertThat(
+            parse_ipmipower_stat(
+                "ipmipower: internal error\n10.0.0.1: what\nnonsense"),
+            Equals({}))
+
+
+class TestIPMIPowerDriverQueryGroup(MAASTestCase):
+    """Tests for querying many nodes at once with `IPMIPowerDriver`."""
+
+    def test_get_query_group_groups_by_credentials_and_driver(self):
+        context = make_context()
+        self.assertThat(
+            IPMIPowerDriver().get_query_group(context),
+            Equals((
+                context['power_driver'], context['power_user'],
+                context['power_pass'])))
+
+    def test_get_query_group_returns_None_without_address(self):
+        context = make_context()
+        context['power_address'] = ''
+        self.assertIsNone(IPMIPowerDriver().get_query_group(context))
+
+    def test_get_query_group_returns_None_for_host_lists(self):
+        driver = IPMIPowerDriver()
+        for power_address in ("fe80::1", "host[1-2]", "host1,host2"):
+            context = dict(make_context(), power_address=power_address)
+            self.assertIsNone(driver.get_query_group(context))
+
+    def test_power_query_group_runs_one_ipmipower(self):
+        context = make_context()
+        contexts = {
+            "node1": dict(context, power_address="10.0.0.2"),
+            "node2": dict(context, power_address="10.0.0.1"),
+            "node3": dict(context, power_address="10.0.0.3"),
+            "node4": dict(context, power_address="10.0.0.3"),
+        }
+        popen_mock = self.patch(ipmi_module, 'Popen')
+        process = popen_mock.return_value
+        process.communicate.return_value = (
+            b"10.0.0.1: on\n10.0.0.2: password invalid\n"
+            b"10.0.0.3: off\n", b"")
+        process.returncode = 1
+
+        results = IPMIPowerDriver().power_query_group(contexts)
+
+        self.assertThat(popen_mock, MockCalledOnceWith(
+            make_ipmipower_command(**dict(
+                context, power_address="10.0.0.1,10.0.0.2,10.0.0.3")) + (
+                    '--stat',),
+            stdout=PIPE, stderr=PIPE, env=get_env_with_locale()))
+        self.assertThat(results["node2"], Equals("on"))
+        self.assertIsInstance(results["node1"], PowerAuthError)
+        self.assertThat(results["node3"], Equals("off"))
+        self.assertThat(results["node4"], Equals("off"))
+
+    def test_power_query_group_leaves_out_missing_hosts(self):
+        context = make_context()
+        contexts = {
+            "node1": dict(context, power_address="10.0.0.1"),
+            "node2": dict(context, power_address="10.0.0.2"),
+        }
+        popen_mock = self.patch(ipmi_module, 'Popen')
+        process = popen_mock.return_value
+        process.communicate.return_value = (b"10.0.0.1: on\n", b"")
+
+        self.assertThat(
+            IPMIPowerDriver().power_query_group(contexts),
+            Equals({"node1": "on"}))
@@ -14,6 +14,7 @@ import json
 from os.path import join
 import random
 from unittest.mock import (
+    ANY,
     call,
     Mock,
 )
@@ -28,25 +29,33 @@ from maastesting.testcase import (
     MAASTestCase,
     MAASTwistedRunTest,
 )
+from maastesting.twisted import extract_result
 from provisioningserver.drivers.power import PowerActionError
 from provisioningserver.drivers.power.redfish import (
     REDFISH_POWER_CONTROL_ENDPOINT,
     RedfishPowerDriver,
+    RedfishSessions,
     WebClientContextFactory,
 )
 import provisioningserver.drivers.power.redfish as redfish_module
+from provisioningserver.utils.webclient import PersistentConnectionPool
 from testtools import ExpectedException
+from twisted.internet import reactor
 from twisted.internet._sslverify import ClientTLSOptions
 from twisted.internet.defer import (
+    Deferred,
     fail,
     inlineCallbacks,
     succeed,
 )
+from twisted.internet.task import Clock
 from twisted.web.client import (
     FileBodyProducer,
     PartialDownloadError,
 )
 from twisted.web.http_headers import Headers
+from twisted.web.resource import Resource
+from twisted.web.server import Site
 
 
 SAMPLE_JSON_SYSTEMS = {
@@ -185,6 +194,11 @@ class TestRedfishPowerDriver(MAASTestCase):
 
     run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
 
+    def setUp(self):
+        super(TestRedfishPowerDriver, self).setUp()
+        # Sessions are tested in TestRedfishSessions.
+        self.patch(RedfishPowerDriver, 'use_sessions', False)
+
     def test_missing_packages(self):
         # there's nothing to check for, just confirm it returns []
         driver = RedfishPowerDriver()
@@ -446,3 +460,247 @@ class TestRedfishPowerDriver(MAASTestCase):
         ]
         power_state = yield driver.power_query(system_id, context)
         self.assertEquals(power_state, power_change.lower())
+
+
+def make_session_response(code=HTTPStatus.CREATED, token=b"token"):
+    response = Mock()
+    response.code = code
+    response.deliverBody.side_effect = (
+        lambda protocol: protocol.connectionLost(None))
+    response.headers = Headers()
+    if token is not None:
+        response.headers.setRawHeaders(b"X-Auth-Token", [token])
+        response.headers.setRawHeaders(
+            b"Location", [b"/redfish/v1/SessionService/Sessions/1"])
+    return response
+
+
+class TestRedfishSessions(MAASTestCase):
+
+    uri = b"https://bmc/redfish/v1/Systems/1/"
+
+    def setUp(self):
+        super(TestRedfishSessions, self).setUp()
+        self.clock = Clock()
+        self.sessions = RedfishSessions(clock=self.clock)
+        self.agent = Mock()
+        self.driver = RedfishPowerDriver()
+        self.headers = self.driver.make_auth_headers(**make_context())
+
+    def authorize(self, uri=None):
+        return extract_result(self.sessions.authorize(
+            self.agent, self.uri if uri is None else uri, self.headers))
+
+    def test_logs_in_and_uses_token(self):
+        self.agent.request.return_value = succeed(make_session_response())
+        headers = self.authorize()
+        self.assertEqual(
+            [b"token"], headers.getRawHeaders(b"X-Auth-Token"))
+        self.assertFalse(headers.hasHeader(b"Authorization"))
+        self.assertThat(self.agent.request, MockCalledOnceWith(
+            b"POST", b"https://bmc/redfish/v1/SessionService/Sessions/",
+            headers=ANY, bodyProducer=ANY))
+
+    def test_reuses_token(self):
+        self.agent.request.return_value = succeed(make_session_response())
+        self.authorize()
+        headers = self.authorize()
+        self.assertEqual(
+            [b"token"], headers.getRawHeaders(b"X-Auth-Token"))
+        self.assertEqual(1, self.agent.request.call_count)
+
+    def test_logs_in_once_for_concurrent_requests(self):
+        login = Deferred()
+        self.agent.request.return_value = login
+        first = self.sessions.authorize(self.agent, self.uri, self.headers)
+        second = self.sessions.authorize(self.agent, self.uri, self.headers)
+        login.callback(make_session_response())
+        for d in first, second:
+            self.assertEqual(
+                [b"token"],
+                extract_result(d).getRawHeaders(b"X-Auth-Token"))
+        self.assertEqual(1, self.agent.request.call_count)
+
+    def test_renews_old_sessions_and_deletes_them(self):
+        self.agent.request.side_effect = [
+            succeed(make_session_response(token=b"old")),
+            succeed(make_session_response()),
+            succeed(make_session_response(token=b"new")),
+        ]
+        self.authorize()
+        self.clock.advance(self.sessions.max_age)
+        headers = self.authorize()
+        self.assertEqual([b"new"], headers.getRawHeaders(b"X-Auth-Token"))
+        method, location = self.agent.request.call_args_list[1][0]
+        self.assertEqual(b"DELETE", method)
+        self.assertEqual(
+            b"https://bmc/redfish/v1/SessionService/Sessions/1", location)
+
+    def test_falls_back_to_basic_auth_when_unsupported(self):
+        self.agent.request.return_value = succeed(make_session_response(
+            code=HTTPStatus.METHOD_NOT_ALLOWED, token=None))
+        self.assertIs(self.headers, self.authorize())
+        self.assertIs(self.headers, self.authorize())
+        self.assertEqual(1, self.agent.request.call_count)
+
+    def test_retries_unsupported_services_later(self):
+        self.agent.request.return_value = succeed(make_session_response(
+            code=HTTPStatus.NOT_FOUND, token=None))
+        self.authorize()
+        self.clock.advance(self.sessions.retry_unsupported)
+        self.authorize()
+        self.assertEqual(2, self.agent.request.call_count)
+
+    def test_passes_login_failures_on(self):
+        self.agent.request.return_value = fail(ZeroDivisionError())
+        d = self.sessions.authorize(self.agent, self.uri, self.headers)
+        self.assertRaises(ZeroDivisionError, extract_result, d)
+        self.assertEqual({}, self.sessions.pending)
+
+    def test_discard_forgets_session(self):
+        self.agent.request.return_value = succeed(make_session_response())
+        self.authorize()
+        self.sessions.discard(b"token")
+        self.authorize()
+        self.assertEqual(2, self.agent.request.call_count)
+
+    def test_ignores_requests_without_basic_auth(self):
+        self.headers.removeHeader(b"Authorization")
+        self.assertIs(self.headers, self.authorize())
+        self.assertThat(self.agent.request, MockNotCalled())
+
+
+class FakeRedfishService(Resource):
+    """A local stand-in for a Redfish service, served over plain HTTP."""
+
+    isLeaf = True
+
+    def __init__(self, user, password, sessions=True):
+        super(FakeRedfishService, self).__init__()
+        self.basic = b"Basic " + b64encode(
+            ("%s:%s" % (user, password)).encode("utf-8"))
+        self.user, self.password = user, password
+        self.sessions_supported = sessions
+        self.sessions = set()
+        self.power_state = "Off"
+        self.authorizations = []
+
+    def authenticate(self, request):
+        token = request.getHeader(b"X-Auth-Token")
+        if token is not None and token in self.sessions:
+            self.authorizations.append("session")
+            return True
+        elif request.getHeader(b"Authorization") == self.basic:
+            self.authorizations.append("basic")
+            return True
+        else:
+            request.setResponseCode(HTTPStatus.UNAUTHORIZED)
+            return False
+
+    def render_GET(self, request):
+        if not self.authenticate(request):
+            return b""
+        if request.path == b"/redfish/v1/Systems/":
+            return json.dumps(SAMPLE_JSON_SYSTEMS).encode("utf-8")
+        system = dict(SAMPLE_JSON_SYSTEM, PowerState=self.power_state)
+        return json.dumps(system).encode("utf-8")
+
+    def render_POST(self, request):
+        body = json.loads(request.content.read().decode("utf-8"))
+        if request.path == b"/redfish/v1/SessionService/Sessions/":
+            if not self.sessions_supported:
+                request.setResponseCode(HTTPStatus.METHOD_NOT_ALLOWED)
+            elif (body["UserName"], body["Password"]) == (
+                    self.user, self.password):
+                token = factory.make_name("token").encode("ascii")
+                self.sessions.add(token)
+                request.setResponseCode(HTTPStatus.CREATED)
+                request.setHeader(b"X-Auth-Token", token)
+                request.setHeader(
+                    b"Location", b"/redfish/v1/SessionService/Sessions/1")
+            else:
+                request.setResponseCode(HTTPStatus.UNAUTHORIZED)
+        elif self.authenticate(request):
+            self.power_state = "On" if body["ResetType"] == "On" else "Off"
+            request.setResponseCode(HTTPStatus.NO_CONTENT)
+        return b""
+
+    def render_PATCH(self, request):
+        if self.authenticate(request):
+            request.setResponseCode(HTTPStatus.NO_CONTENT)
+        return b""
+
+
+class CountingSite(Site):
+    """A `Site` that counts the connections made to it."""
+
+    connections = 0
+
+    def buildProtocol(self, addr):
+        self.connections += 1
+        return super(CountingSite, self).buildProtocol(addr)
+
+
+class TestRedfishPowerDriverWithStandIn(MAASTestCase):
+    """Tests for `RedfishPowerDriver` against `FakeRedfishService`."""
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    def start_service(self, sessions=True):
+        context = make_context()
+        service = FakeRedfishService(
+            context['power_user'], context['power_pass'], sessions=sessions)
+        site = CountingSite(service)
+        port = reactor.listenTCP(0, site, interface="127.0.0.1")
+        self.addCleanup(port.stopListening)
+        pool = PersistentConnectionPool(reactor)
+        self.addCleanup(pool.closeCachedConnections)
+        self.patch(redfish_module, "get_connection_pool").return_value = pool
+        self.patch(redfish_module, "redfish_sessions", RedfishSessions())
+        context['power_address'] = (
+            "http://127.0.0.1:%d" % port.getHost().port)
+        return service, site, context
+
+    @inlineCallbacks
+    def test_power_query_reuses_connection_and_session(self):
+        service, site, context = self.start_service()
+        driver = RedfishPowerDriver()
+        for _ in range(3):
+            power_state = yield driver.power_query(
+                factory.make_name('system_id'), context)
+            self.assertEqual("off", power_state)
+        self.assertEqual(1, site.connections)
+        self.assertEqual(1, len(service.sessions))
+        self.assertEqual(["session"] * 6, service.authorizations)
+
+    @inlineCallbacks
+    def test_power_on(self):
+        service, site, context = self.start_service()
+        driver = RedfishPowerDriver()
+        yield driver.power_on(factory.make_name('system_id'), context)
+        self.assertEqual("On", service.power_state)
+        self.assertEqual(1, site.connections)
+
+    @inlineCallbacks
+    def test_logs_in_again_when_session_expires_early(self):
+        service, site, context = self.start_service()
+        driver = RedfishPowerDriver()
+        yield driver.power_query(factory.make_name('system_id'), context)
+        # The service forgets the session before it is due to be renewed.
+        service.sessions.clear()
+        # The request, and its body, are sent again with a new session.
+        yield driver.power(
+            "On", driver.get_url(context), b"1",
+            driver.make_auth_headers(**context))
+        self.assertEqual("On", service.power_state)
+        self.assertEqual(1, len(service.sessions))
+        self.assertEqual(["session"] * 3, service.authorizations)
+
+    @inlineCallbacks
+    def test_uses_basic_auth_without_session_service(self):
+        service, site, context = self.start_service(sessions=False)
+        driver = RedfishPowerDriver()
+        for _ in range(2):
+            yield driver.power_query(factory.make_name('system_id'), context)
+        self.assertEqual(1, site.connections)
+        self.assertEqual(["basic"] * 4, service.authorizations)
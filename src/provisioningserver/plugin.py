@@ -128,6 +128,13 @@ class ProvisioningServiceMaker:
         node_monitor.setName("node_monitor")
         return node_monitor
 
+    def _makePodSessionsService(self):
+        from provisioningserver.rackdservices.pod_sessions_service import (
+            PodSessionsService)
+        pod_sessions = PodSessionsService()
+        pod_sessions.setName("pod_sessions")
+        return pod_sessions
+
     def _makeRPCService(self):
         from provisioningserver.rpc.clusterservice import ClusterClientService
         rpc_service = ClusterClientService(reactor)
@@ -187,6 +194,7 @@ class ProvisioningServiceMaker:
         yield self._makeDHCPProbeService(rpc_service)
         yield self._makeLeaseSocketService(rpc_service)
         yield self._makeNodePowerMonitorService()
+        yield self._makePodSessionsService()
         yield self._makeServiceMonitorService(rpc_service)
         yield self._makeImageDownloadService(rpc_service, tftp_root)
         yield self._makeRackHTTPService(tftp_root, rpc_service)
@@ -16,6 +16,37 @@ METRICS_DEFINITIONS = [
     MetricDefinition(
         'Histogram', 'maas_tftp_file_transfer_latency',
         'Latency of TFTP file downloads', ['filename']),
+    MetricDefinition(
+        'Histogram', 'maas_boot_template_render_latency',
+        'Latency of rendering boot configuration templates', ['method']),
+    MetricDefinition(
+        'Histogram', 'maas_power_query_sweep_duration',
+        'Time taken to query the power state of all due nodes', []),
+    MetricDefinition(
+        'Gauge', 'maas_power_query_queue_depth',
+        'Number of power queries waiting or in progress', []),
+    MetricDefinition(
+        'Gauge', 'maas_power_query_overdue_nodes',
+        'Number of nodes whose power query was overdue at sweep start', []),
+    MetricDefinition(
+        'Counter', 'maas_http_pool_requests',
+        'Requests made through the shared HTTP connection pool, by whether '
+        'a cached connection was reused', ['result']),
+    MetricDefinition(
+        'Counter', 'maas_http_pool_tls_handshakes',
+        'TLS connections opened by the shared HTTP connection pool', []),
+    MetricDefinition(
+        'Counter', 'maas_boot_config_cache_requests',
+        'Boot configuration requests, by whether they were answered from '
+        'the rack cache', ['result']),
+    MetricDefinition(
+        'Counter', 'maas_boot_config_cache_saved_seconds',
+        'Region RPC latency avoided by answering boot configuration requests '
+        'from the rack cache', []),
+    MetricDefinition(
+        'Counter', 'maas_dhcpd_restarts_avoided',
+        'DHCP server configuration changes applied without restarting the '
+        'server', ['service']),
 ]
 
 
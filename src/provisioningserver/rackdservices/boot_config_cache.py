@@ -0,0 +1,160 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Short-lived cache of boot configurations obtained from the region.
+
+Firmware often requests its boot configuration several times in quick
+succession: it retries, and PXELINUX walks from the hardware UUID to the MAC
+address to the architecture default. Each request would otherwise become a
+`GetBootConfig` call, and a write to the machine in the region.
+"""
+
+__all__ = [
+    "boot_config_cache",
+    "BootConfigCache",
+]
+
+from provisioningserver.prometheus.metrics import PROMETHEUS_METRICS
+from provisioningserver.rpc.exceptions import BootConfigNoResponse
+from twisted.internet import reactor
+from twisted.internet.defer import (
+    fail,
+    maybeDeferred,
+    succeed,
+)
+
+
+def normalise_mac(mac):
+    """Return `mac` in the form PostgreSQL renders `macaddr` values."""
+    return None if mac is None else mac.lower().replace("-", ":")
+
+
+def normalise_uuid(hardware_uuid):
+    return None if hardware_uuid is None else hardware_uuid.lower()
+
+
+class BootConfigCache:
+    """Cache of `GetBootConfig` responses.
+
+    Responses are keyed by the parameters that determine them, and reused
+    for `ttl` seconds. When the region reports that no configuration exists,
+    which happens when PXELINUX asks about an unknown hardware UUID or MAC
+    address, that is remembered for `negative_ttl` seconds.
+
+    The region invalidates entries when a machine's status or boot purpose
+    changes, or when a new interface appears; see `invalidate`.
+    """
+
+    key_names = (
+        "mac", "hardware_uuid", "arch", "subarch", "local_ip",
+        "bios_boot_method")
+
+    # Long enough to cover retries and the PXELINUX search path, short
+    # enough that configuration changes made in the region apply quickly.
+    ttl = 30
+    # Kept short so that newly enlisted machines are recognised quickly
+    # even if an invalidation is missed.
+    negative_ttl = 10
+    # Discard everything rather than grow without bound.
+    max_entries = 10000
+
+    def __init__(self, clock=reactor, prometheus_metrics=PROMETHEUS_METRICS):
+        super(BootConfigCache, self).__init__()
+        self.clock = clock
+        self.prometheus_metrics = prometheus_metrics
+        self.entries = {}
+        # Incremented by each invalidation, so that responses fetched
+        # across an invalidation are not cached.
+        self.generation = 0
+
+    def make_key(self, params):
+        key = dict.fromkeys(self.key_names)
+        key.update(
+            (name, params[name]) for name in self.key_names if name in params)
+        key["mac"] = normalise_mac(key["mac"])
+        key["hardware_uuid"] = normalise_uuid(key["hardware_uuid"])
+        return tuple(key[name] for name in self.key_names)
+
+    def get(self, params, fetch):
+        """Return the boot configuration for `params`.
+
+        :param params: The arguments for `GetBootConfig`.
+        :param fetch: A callable that takes `params` and fetches the boot
+            configuration from the region, returning a `Deferred`.
+        :return: A `Deferred` firing with a new copy of the response, or
+            failing with `BootConfigNoResponse`.
+        """
+        key = self.make_key(params)
+        now = self.clock.seconds()
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires, config, latency = entry
+            if expires > now:
+                self._record("hit" if config is not None else "negative_hit")
+                self.prometheus_metrics.update(
+                    'maas_boot_config_cache_saved_seconds', 'inc',
+                    value=latency)
+                if config is None:
+                    return fail(BootConfigNoResponse())
+                else:
+                    return succeed(dict(config))
+            else:
+                del self.entries[key]
+        self._record("miss")
+        d = maybeDeferred(fetch, params)
+        d.addCallbacks(
+            self._fetched, self._fetchFailed,
+            callbackArgs=(key, now, self.generation),
+            errbackArgs=(key, now, self.generation))
+        return d
+
+    def _record(self, result):
+        self.prometheus_metrics.update(
+            'maas_boot_config_cache_requests', 'inc',
+            labels={'result': result})
+
+    def _store(self, key, config, started, generation, ttl):
+        if generation != self.generation:
+            # Invalidated while being fetched; it may already be stale.
+            return
+        if len(self.entries) >= self.max_entries:
+            self.entries.clear()
+        now = self.clock.seconds()
+        self.entries[key] = (now + ttl, config, now - started)
+
+    def _fetched(self, config, key, started, generation):
+        self._store(key, dict(config), started, generation, self.ttl)
+        return config
+
+    def _fetchFailed(self, failure, key, started, generation):
+        if failure.check(BootConfigNoResponse):
+            self._store(key, None, started, generation, self.negative_ttl)
+        return failure
+
+    def invalidate(self, macs=(), hardware_uuid=None):
+        """Discard entries for any of `macs` or for `hardware_uuid`.
+
+        Entries for requests that carried neither, i.e. architecture
+        defaults used by unknown machines, are also discarded.
+        """
+        macs = {normalise_mac(mac) for mac in macs}
+        hardware_uuid = normalise_uuid(hardware_uuid)
+        self.generation += 1
+        self.entries = {
+            key: entry for key, entry in self.entries.items()
+            if not self._matches(key, macs, hardware_uuid)
+        }
+
+    def _matches(self, key, macs, hardware_uuid):
+        mac, uuid = key[0], key[1]
+        if mac is None and uuid is None:
+            return True
+        return mac in macs or (uuid is not None and uuid == hardware_uuid)
+
+    def clear(self):
+        """Discard all entries."""
+        self.generation += 1
+        self.entries.clear()
+
+
+boot_config_cache = BootConfigCache()
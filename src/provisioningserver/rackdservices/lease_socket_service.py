@@ -7,14 +7,20 @@ __all__ = [
     "LeaseSocketService",
     ]
 
-from collections import deque
+from collections import (
+    deque,
+    OrderedDict,
+)
 import json
 import os
 
 from provisioningserver.logger import get_maas_logger
 from provisioningserver.path import get_data_path
 from provisioningserver.rpc.exceptions import NoConnectionsAvailable
-from provisioningserver.rpc.region import UpdateLease
+from provisioningserver.rpc.region import (
+    UpdateLease,
+    UpdateLeases,
+)
 from provisioningserver.utils.twisted import (
     pause,
     retries,
@@ -24,8 +30,12 @@ from twisted.internet import (
     reactor,
     task,
 )
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import (
+    inlineCallbacks,
+    returnValue,
+)
 from twisted.internet.protocol import DatagramProtocol
+from twisted.protocols.amp import UnhandledCommand
 
 
 maaslog = get_maas_logger("lease_socket_service")
@@ -36,17 +46,41 @@ def get_socket_path():
     return os.path.join(get_data_path("/var/lib/maas"), "dhcpd.sock")
 
 
+def squash_notifications(notifications):
+    """Drop notifications that are superseded by a later notification.
+
+    The region only keeps the latest lease for each MAC address and address
+    family, so of several notifications for the same MAC address and family
+    only the last one needs to be sent. The notifications that are kept stay
+    in the order they were received.
+    """
+    squashed = OrderedDict()
+    for notification in notifications:
+        key = (notification.get("mac"), notification.get("ip_family"))
+        squashed.pop(key, None)
+        squashed[key] = notification
+    return list(squashed.values())
+
+
 class LeaseSocketService(Service, DatagramProtocol):
     """Service for recieving lease information over MAAS dhcpd.sock."""
 
     # None, or a Deferred that will fire when the processor exits.
     done = None
 
+    # The most notifications sent to the region in one `UpdateLeases` call.
+    batch_size = 200
+
+    # Seconds the oldest queued notification waits for others to be batched
+    # with it before the queue is sent to the region regardless of its size.
+    batch_interval = 0.5
+
     def __init__(self, client_service, reactor):
         self.client_service = client_service
         self.reactor = reactor
         self.address = get_socket_path()
         self.notifications = deque()
+        self.batchStarted = None
         self.processor = task.LoopingCall(
             self.processNotifications, clock=self.reactor)
 
@@ -89,35 +123,66 @@ class LeaseSocketService(Service, DatagramProtocol):
         # call will handle sending the notification to the region. This ensures
         # that even if the connection is lost to the region that the queued
         # notifications will still be sent.
+        if len(self.notifications) == 0:
+            self.batchStarted = self.reactor.seconds()
         self.notifications.append(notification)
 
     def processNotifications(self, clock=reactor):
-        """Process all notifications."""
-        def gen_notifications(notifications):
+        """Process all notifications.
+
+        Notifications are held until a full batch is queued or the oldest
+        has waited `batch_interval` seconds, and are then sent to the region
+        in batches of at most `batch_size`.
+        """
+        if len(self.notifications) == 0:
+            return None
+        waited = self.reactor.seconds() - self.batchStarted
+        if (len(self.notifications) < self.batch_size and
+                waited < self.batch_interval):
+            return None
+
+        def gen_batches(notifications):
             while len(notifications) != 0:
-                yield notifications.popleft()
+                count = min(self.batch_size, len(notifications))
+                yield [notifications.popleft() for _ in range(count)]
         return task.coiterate(
-            self.processNotification(notification, clock=clock)
-            for notification in gen_notifications(self.notifications))
+            self.processBatch(squash_notifications(batch), clock=clock)
+            for batch in gen_batches(self.notifications))
 
     @inlineCallbacks
-    def processNotification(self, notification, clock=reactor):
-        """Send a notification to the region."""
-        client = None
+    def getClient(self, clock=reactor):
+        """Return a client to the region, or `None` if there is none."""
         for elapsed, remaining, wait in retries(30, 10, clock):
             try:
                 client = yield self.client_service.getClientNow()
-                break
+                returnValue(client)
             except NoConnectionsAvailable:
-                yield pause(wait, self.clock)
-        else:
-            maaslog.error(
-                "Can't send DHCP lease information, no RPC "
-                "connection to region.")
-            return
+                yield pause(wait, clock)
+        maaslog.error(
+            "Can't send DHCP lease information, no RPC "
+            "connection to region.")
+        returnValue(None)
 
+    @inlineCallbacks
+    def processBatch(self, notifications, clock=reactor):
+        """Send a batch of notifications to the region."""
+        client = yield self.getClient(clock)
+        if client is None:
+            return
+        try:
+            yield client(
+                UpdateLeases, cluster_uuid=client.localIdent,
+                updates=notifications)
+        except UnhandledCommand:
+            # The region has not been upgraded to support the batched call,
+            # so send the notifications one at a time.
+            for notification in notifications:
+                yield self.sendNotification(client, notification)
+
+    def sendNotification(self, client, notification):
+        """Send a notification to the region with `UpdateLease`."""
         # Notification contains all the required data except for the cluster
         # UUID. Add that into the notification and send the information to
         # the region for processing.
         notification["cluster_uuid"] = client.localIdent
-        yield client(UpdateLease, **notification)
+        return client(UpdateLease, **notification)
@@ -1,46 +1,296 @@
-# Copyright 2014-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2014-2019 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Service to periodically query the power state on this cluster's nodes."""
 
 
 __all__ = [
-    "NodePowerMonitorService"
+    "NodePowerMonitorService",
+    "PowerQueryScheduler",
 ]
 
 from datetime import timedelta
 
+from provisioningserver.drivers.power.registry import PowerDriverRegistry
 from provisioningserver.logger import (
     get_maas_logger,
     LegacyLogger,
 )
+from provisioningserver.prometheus.metrics import PROMETHEUS_METRICS
 from provisioningserver.rpc import getRegionClient
 from provisioningserver.rpc.exceptions import (
     NoConnectionsAvailable,
     NoSuchCluster,
 )
-from provisioningserver.rpc.power import query_all_nodes
+from provisioningserver.rpc.power import (
+    group_power_queries,
+    power_action_registry,
+    query_node,
+    query_node_group,
+    report_node_power_state,
+)
 from provisioningserver.rpc.region import ListNodePowerParameters
 from twisted.application.internet import TimerService
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet import reactor
+from twisted.internet.defer import (
+    DeferredList,
+    DeferredSemaphore,
+    fail,
+    inlineCallbacks,
+    succeed,
+)
 from twisted.internet.error import ConnectionDone
+from twisted.python.failure import Failure
 
 
 maaslog = get_maas_logger("power_monitor_service")
 log = LegacyLogger()
 
 
+class ScheduledNode:
+    """The power query schedule for a single node."""
+
+    def __init__(self, node, now):
+        self.node = node
+        # When the node should next be queried.
+        self.due = now
+        # When the node's power state was last seen to change, if ever.
+        self.changed = None
+        # How many queries in a row have failed.
+        self.failures = 0
+        # When the region last listed this node.
+        self.last_seen = now
+
+    def recently_changed(self, now, window):
+        return self.changed is not None and now - self.changed < window
+
+
+class PowerQueryScheduler:
+    """Schedule power queries for the nodes on this rack controller.
+
+    Each node has a next-due time. Nodes that cannot be queried back off
+    exponentially, and nodes whose power state changed recently are queried
+    ahead of the rest and re-checked sooner. Concurrency is limited per
+    power type: every IPMI query runs a subprocess, whereas Redfish
+    queries are comparatively cheap HTTP requests. Due nodes whose power
+    driver can query many at once are queried in groups, each taking up
+    one query's worth of concurrency.
+    """
+
+    # How many queries of each power type may run at once. Power types not
+    # listed here are limited to `default_concurrency`.
+    concurrency = {
+        "ipmi": 10,
+        "redfish": 25,
+    }
+    default_concurrency = 5
+
+    # How often the region hands out each node for querying.
+    query_interval = timedelta(minutes=5).total_seconds()
+
+    # Nodes whose power state changed within `recent_change_window` are
+    # queried again every `recent_change_interval`.
+    recent_change_window = timedelta(minutes=5).total_seconds()
+    recent_change_interval = timedelta(seconds=30).total_seconds()
+
+    # The longest a node whose queries are failing will be left alone.
+    max_backoff = timedelta(hours=1).total_seconds()
+
+    # The region lists each node that this rack should query about every
+    # `query_interval`. Nodes it has not listed for longer than this are
+    # not queried, since they may have been deleted, moved to another rack
+    # controller, or had their power parameters changed.
+    stale_after = timedelta(minutes=5).total_seconds()
+
+    # Nodes not listed by the region for this long are forgotten.
+    forget_after = timedelta(minutes=30).total_seconds()
+
+    def __init__(self, clock=reactor, prometheus_metrics=PROMETHEUS_METRICS):
+        super(PowerQueryScheduler, self).__init__()
+        self.clock = clock
+        self.prometheus_metrics = prometheus_metrics
+        self.nodes = {}
+        self.semaphores = {}
+
+    def update(self, nodes):
+        """Record power parameters for `nodes` listed by the region.
+
+        The region lists a node when it is due to be queried, so listed
+        nodes are due now unless they are backing off after failures. A
+        power state that differs from the last one seen here means that
+        something else changed it, e.g. a power action.
+        """
+        now = self.clock.seconds()
+        for node in nodes:
+            if node['power_type'] not in PowerDriverRegistry:
+                continue
+            scheduled = self.nodes.get(node['system_id'])
+            if scheduled is None:
+                self.nodes[node['system_id']] = ScheduledNode(node, now)
+                continue
+            if scheduled.node['power_state'] != node['power_state']:
+                scheduled.changed = now
+                scheduled.failures = 0
+            if scheduled.failures == 0:
+                scheduled.due = min(scheduled.due, now)
+            scheduled.node = node
+            scheduled.last_seen = now
+
+    def get_due(self, now):
+        """Return the nodes due for querying, highest priority first.
+
+        Nodes the region has not listed recently are never due.
+        """
+        due = [
+            scheduled for scheduled in self.nodes.values()
+            if scheduled.due <= now and
+            now - scheduled.last_seen < self.stale_after
+        ]
+        due.sort(key=lambda scheduled: (
+            not scheduled.recently_changed(now, self.recent_change_window),
+            scheduled.due))
+        return due
+
+    def get_semaphore(self, power_type):
+        semaphore = self.semaphores.get(power_type)
+        if semaphore is None:
+            tokens = self.concurrency.get(
+                power_type, self.default_concurrency)
+            semaphore = self.semaphores[power_type] = DeferredSemaphore(
+                tokens=tokens)
+        return semaphore
+
+    def run(self):
+        """Query every node that is due.
+
+        :return: A `Deferred` that fires once all due nodes have been
+            queried, successfully or not.
+        """
+        start = self.clock.seconds()
+        self.nodes = {
+            system_id: scheduled
+            for system_id, scheduled in self.nodes.items()
+            if start - scheduled.last_seen < self.forget_after
+        }
+        due = self.get_due(start)
+        overdue = sum(
+            1 for scheduled in due
+            if start - scheduled.due > self.query_interval)
+        self.prometheus_metrics.update(
+            'maas_power_query_queue_depth', 'set', value=len(due))
+        self.prometheus_metrics.update(
+            'maas_power_query_overdue_nodes', 'set', value=overdue)
+        groups = {
+            node['system_id']: group
+            for group in group_power_queries(
+                [scheduled.node for scheduled in due])
+            for node in group
+        }
+        queries = []
+        for scheduled in due:
+            group = groups.get(scheduled.node['system_id'])
+            if group is None:
+                queries.append(
+                    self.get_semaphore(scheduled.node['power_type']).run(
+                        self.query, scheduled))
+            elif group[0] is scheduled.node:
+                # Query the group in place of its highest priority node.
+                queries.append(self.query_group([
+                    self.nodes[node['system_id']] for node in group]))
+        d = DeferredList(queries, consumeErrors=True)
+        d.addCallback(self._record_sweep, start)
+        return d
+
+    def query(self, scheduled):
+        """Query `scheduled` and work out when it is next due."""
+        node = scheduled.node
+        d = query_node(node, self.clock)
+        if node['system_id'] in power_action_registry:
+            # The query was skipped, but a power action is in progress so
+            # the power state is about to change; check back soon.
+            now = self.clock.seconds()
+            scheduled.changed = now
+            scheduled.due = now + self.recent_change_interval
+        else:
+            d.addCallback(self._queried, scheduled)
+        d.addBoth(self._dequeued)
+        return d
+
+    def query_group(self, group):
+        """Query the nodes `group` at once, and work out when each is due.
+
+        Nodes the group query could not tell about are queried on their
+        own afterwards.
+        """
+        semaphore = self.get_semaphore(group[0].node['power_type'])
+        d = semaphore.run(
+            query_node_group, [scheduled.node for scheduled in group])
+        # Outside of the semaphore, since nodes queried on their own
+        # afterwards need it too.
+        d.addCallback(self._group_queried, group, semaphore)
+        return d
+
+    def _group_queried(self, results, group, semaphore):
+        queries = []
+        for scheduled in group:
+            result = results.get(scheduled.node['system_id'])
+            if result is None:
+                queries.append(semaphore.run(self.query, scheduled))
+                continue
+            elif isinstance(result, Failure):
+                d = report_node_power_state(fail(result), scheduled.node)
+            else:
+                d = report_node_power_state(succeed(result), scheduled.node)
+            d.addCallback(self._queried, scheduled)
+            d.addBoth(self._dequeued)
+            queries.append(d)
+        return DeferredList(queries, consumeErrors=True)
+
+    def _queried(self, power_state, scheduled):
+        # `query_node` and `report_node_power_state` log and swallow
+        # failures, firing with None.
+        now = self.clock.seconds()
+        if power_state is None:
+            scheduled.failures += 1
+            scheduled.due = now + min(
+                self.query_interval * 2 ** scheduled.failures,
+                self.max_backoff)
+            # The failure has been reported to the region as an error.
+            scheduled.node['power_state'] = 'error'
+        else:
+            if scheduled.node['power_state'] != power_state:
+                scheduled.changed = now
+            scheduled.failures = 0
+            scheduled.node['power_state'] = power_state
+            if scheduled.recently_changed(now, self.recent_change_window):
+                scheduled.due = now + self.recent_change_interval
+            else:
+                scheduled.due = now + self.query_interval
+        return power_state
+
+    def _dequeued(self, result):
+        self.prometheus_metrics.update('maas_power_query_queue_depth', 'dec')
+        return result
+
+    def _record_sweep(self, results, start):
+        self.prometheus_metrics.update(
+            'maas_power_query_sweep_duration', 'observe',
+            value=self.clock.seconds() - start)
+        return results
+
+
 class NodePowerMonitorService(TimerService, object):
     """Service to monitor the power status of all nodes in this cluster."""
 
     check_interval = timedelta(seconds=15).total_seconds()
-    max_nodes_at_once = 5
 
     def __init__(self, clock=None):
         # Call self.query_nodes() every self.check_interval.
         super(NodePowerMonitorService, self).__init__(
             self.check_interval, self.try_query_nodes)
         self.clock = clock
+        self.scheduler = PowerQueryScheduler(
+            clock=reactor if clock is None else clock)
 
     def try_query_nodes(self):
         """Attempt to query nodes' power states.
@@ -61,17 +311,17 @@ class NodePowerMonitorService(TimerService, object):
     @inlineCallbacks
     def query_nodes(self, client):
         # Get the nodes' power parameters from the region. Keep getting more
-        # power parameters until the region returns an empty list.
+        # power parameters until the region returns an empty list, then
+        # query everything that is due in one go.
         while True:
             response = yield client(
                 ListNodePowerParameters, uuid=client.localIdent)
             power_parameters = response['nodes']
             if len(power_parameters) > 0:
-                yield query_all_nodes(
-                    power_parameters, max_concurrency=self.max_nodes_at_once,
-                    clock=self.clock)
+                self.scheduler.update(power_parameters)
             else:
                 break
+        yield self.scheduler.run()
 
     def query_nodes_failed(self, failure, localIdent):
         if failure.check(NoSuchCluster):
@@ -0,0 +1,25 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Service to log out of the pod sessions kept by the rack controller."""
+
+__all__ = [
+    "PodSessionsService",
+]
+
+from provisioningserver.drivers.pod.virsh import virsh_sessions
+from twisted.application.service import Service
+from twisted.internet.threads import deferToThread
+
+
+class PodSessionsService(Service):
+    """Log out of the sessions pod drivers keep open between uses.
+
+    Sessions left idle are logged out of as they are used; this logs out
+    of those that remain when the rack controller stops.
+    """
+
+    def stopService(self):
+        super(PodSessionsService, self).stopService()
+        # Logging out waits on each session's console.
+        return deferToThread(virsh_sessions.close)
@@ -0,0 +1,173 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `provisioningserver.rackdservices.boot_config_cache`."""
+
+__all__ = []
+
+from unittest.mock import (
+    call,
+    Mock,
+)
+
+from maastesting.factory import factory
+from maastesting.matchers import MockCallsMatch
+from maastesting.testcase import MAASTestCase
+from maastesting.twisted import extract_result
+from provisioningserver.rackdservices.boot_config_cache import BootConfigCache
+from provisioningserver.rpc.exceptions import BootConfigNoResponse
+from twisted.internet.defer import (
+    Deferred,
+    fail,
+    succeed,
+)
+from twisted.internet.task import Clock
+
+
+def make_params(**kwargs):
+    params = {
+        "system_id": factory.make_name("system_id"),
+        "local_ip": factory.make_ipv4_address(),
+        "remote_ip": factory.make_ipv4_address(),
+        "arch": "amd64",
+        "subarch": "generic",
+        "mac": factory.make_mac_address(),
+        "hardware_uuid": factory.make_UUID(),
+        "bios_boot_method": "pxe",
+    }
+    params.update(kwargs)
+    return params
+
+
+class TestBootConfigCache(MAASTestCase):
+
+    def make_cache(self):
+        return BootConfigCache(clock=Clock(), prometheus_metrics=Mock())
+
+    def make_fetch(self, config=None):
+        if config is None:
+            config = {"purpose": factory.make_name("purpose")}
+        return Mock(side_effect=lambda params: succeed(dict(config)))
+
+    def test_fetches_on_miss(self):
+        cache = self.make_cache()
+        params = make_params()
+        fetch = self.make_fetch({"purpose": "local"})
+        self.assertEqual(
+            {"purpose": "local"}, extract_result(cache.get(params, fetch)))
+        self.assertThat(fetch, MockCallsMatch(call(params)))
+
+    def test_reuses_response_for_same_key(self):
+        cache = self.make_cache()
+        params = make_params()
+        fetch = self.make_fetch()
+        first = extract_result(cache.get(params, fetch))
+        # The remote IP address is not part of the key, and the MAC address
+        # is compared the way PostgreSQL renders it.
+        again = dict(
+            params, remote_ip=factory.make_ipv4_address(),
+            mac=params["mac"].upper().replace(":", "-"))
+        second = extract_result(cache.get(again, fetch))
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+        self.assertEqual(1, fetch.call_count)
+
+    def test_fetches_for_different_key(self):
+        cache = self.make_cache()
+        params = make_params()
+        fetch = self.make_fetch()
+        cache.get(params, fetch)
+        cache.get(dict(params, bios_boot_method="uefi"), fetch)
+        self.assertEqual(2, fetch.call_count)
+
+    def test_fetches_again_after_ttl(self):
+        cache = self.make_cache()
+        params = make_params()
+        fetch = self.make_fetch()
+        cache.get(params, fetch)
+        cache.clock.advance(cache.ttl)
+        cache.get(params, fetch)
+        self.assertEqual(2, fetch.call_count)
+
+    def test_caches_no_response_for_negative_ttl(self):
+        cache = self.make_cache()
+        params = make_params()
+        fetch = Mock(side_effect=lambda params: fail(BootConfigNoResponse()))
+        for _ in range(2):
+            d = cache.get(params, fetch)
+            self.assertRaises(BootConfigNoResponse, extract_result, d)
+        self.assertEqual(1, fetch.call_count)
+        cache.clock.advance(cache.negative_ttl)
+        self.assertRaises(
+            BootConfigNoResponse, extract_result, cache.get(params, fetch))
+        self.assertEqual(2, fetch.call_count)
+
+    def test_does_not_cache_other_failures(self):
+        cache = self.make_cache()
+        params = make_params()
+        fetch = Mock(side_effect=lambda params: fail(ZeroDivisionError()))
+        for _ in range(2):
+            d = cache.get(params, fetch)
+            self.assertRaises(ZeroDivisionError, extract_result, d)
+        self.assertEqual(2, fetch.call_count)
+
+    def test_records_metrics(self):
+        cache = self.make_cache()
+        params = make_params()
+        response = Deferred()
+        cache.get(params, lambda params: response)
+        cache.clock.advance(0.5)
+        response.callback({})
+        cache.get(params, self.make_fetch())
+        self.assertThat(cache.prometheus_metrics.update, MockCallsMatch(
+            call('maas_boot_config_cache_requests', 'inc',
+                 labels={'result': 'miss'}),
+            call('maas_boot_config_cache_requests', 'inc',
+                 labels={'result': 'hit'}),
+            call('maas_boot_config_cache_saved_seconds', 'inc', value=0.5)))
+
+    def test_invalidate_by_mac(self):
+        cache = self.make_cache()
+        params, other = make_params(), make_params()
+        fetch = self.make_fetch()
+        cache.get(params, fetch)
+        cache.get(other, fetch)
+        cache.invalidate([params["mac"].upper()])
+        cache.get(params, fetch)
+        cache.get(other, fetch)
+        self.assertEqual(3, fetch.call_count)
+
+    def test_invalidate_by_hardware_uuid(self):
+        cache = self.make_cache()
+        params = make_params(mac=None)
+        fetch = self.make_fetch()
+        cache.get(params, fetch)
+        cache.invalidate([], params["hardware_uuid"])
+        cache.get(params, fetch)
+        self.assertEqual(2, fetch.call_count)
+
+    def test_invalidate_discards_architecture_defaults(self):
+        cache = self.make_cache()
+        params = make_params(mac=None, hardware_uuid=None)
+        fetch = self.make_fetch()
+        cache.get(params, fetch)
+        cache.invalidate([factory.make_mac_address()])
+        cache.get(params, fetch)
+        self.assertEqual(2, fetch.call_count)
+
+    def test_does_not_cache_response_fetched_across_invalidation(self):
+        cache = self.make_cache()
+        params = make_params()
+        response = Deferred()
+        cache.get(params, lambda params: response)
+        cache.invalidate([params["mac"]])
+        response.callback({})
+        self.assertEqual({}, cache.entries)
+
+    def test_clears_when_full(self):
+        cache = self.make_cache()
+        cache.max_entries = 2
+        fetch = self.make_fetch()
+        for _ in range(3):
+            cache.get(make_params(), fetch)
+        self.assertEqual(1, len(cache.entries))
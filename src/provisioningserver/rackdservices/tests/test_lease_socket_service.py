@@ -15,7 +15,10 @@ from unittest.mock import (
 )
 
 from maastesting.factory import factory
-from maastesting.matchers import MockCalledOnceWith
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockNotCalled,
+)
 from maastesting.testcase import (
     MAASTestCase,
     MAASTwistedRunTest,
@@ -23,9 +26,13 @@ from maastesting.testcase import (
 from provisioningserver.rackdservices import lease_socket_service
 from provisioningserver.rackdservices.lease_socket_service import (
     LeaseSocketService,
+    squash_notifications,
 )
 from provisioningserver.rpc import getRegionClient
-from provisioningserver.rpc.region import UpdateLease
+from provisioningserver.rpc.region import (
+    UpdateLease,
+    UpdateLeases,
+)
 from provisioningserver.rpc.testing import MockLiveClusterToRegionRPCFixture
 from provisioningserver.utils.twisted import (
     DeferredValue,
@@ -42,6 +49,7 @@ from twisted.internet import (
     reactor,
 )
 from twisted.internet.protocol import DatagramProtocol
+from twisted.internet.task import Clock
 from twisted.internet.threads import deferToThread
 
 
@@ -128,50 +136,19 @@ class TestLeaseSocketService(MAASTestCase):
         self.assertEquals([packet], list(service.notifications))
 
     @defer.inlineCallbacks
-    def test_processNotification_gets_called_with_notification(self):
+    def test_processBatch_gets_called_with_notifications(self):
         socket_path = self.patch_socket_path()
         service = LeaseSocketService(
             sentinel.service, reactor)
+        received = []
         dv = DeferredValue()
 
-        # Mock processNotifcation to catch the call.
-        def mock_processNotification(*args, **kwargs):
-            dv.set(args)
-        self.patch(service, "processNotification", mock_processNotification)
-
-        # Start the service and stop it at the end of the test.
-        service.startService()
-        self.addCleanup(service.stopService)
-
-        # Create test payload to send.
-        packet = {
-            "test": factory.make_name("test")
-        }
-
-        # Send notification to the socket and wait for notification.
-        yield deferToThread(self.send_notification, socket_path, packet)
-        yield dv.get(timeout=10)
-
-        # Packet should be the argument passed to processNotifcation
-        self.assertEquals((packet,), dv.value)
-
-    @defer.inlineCallbacks
-    def test_processNotification_gets_called_multiple_times(self):
-        socket_path = self.patch_socket_path()
-        service = LeaseSocketService(
-            sentinel.service, reactor)
-        dvs = [
-            DeferredValue(),
-            DeferredValue(),
-        ]
-
-        # Mock processNotifcation to catch the call.
-        def mock_processNotification(*args, **kwargs):
-            for dv in dvs:
-                if not dv.isSet:
-                    dv.set(args)
-                    break
-        self.patch(service, "processNotification", mock_processNotification)
+        # Mock processBatch to catch the calls.
+        def mock_processBatch(notifications, **kwargs):
+            received.extend(notifications)
+            if len(received) == 2:
+                dv.set(received)
+        self.patch(service, "processBatch", mock_processBatch)
 
         # Start the service and stop it at the end of the test.
         service.startService()
@@ -188,16 +165,92 @@ class TestLeaseSocketService(MAASTestCase):
         # Send notifications to the socket and wait for notifications.
         yield deferToThread(self.send_notification, socket_path, packet1)
         yield deferToThread(self.send_notification, socket_path, packet2)
-        yield dvs[0].get(timeout=10)
-        yield dvs[1].get(timeout=10)
+        yield dv.get(timeout=10)
+
+        # Packets should be passed to processBatch in order.
+        self.assertEquals([packet1, packet2], dv.value)
+
+    def make_packet(self, action="commit", mac=None, ip_family="ipv4"):
+        if mac is None:
+            mac = factory.make_mac_address()
+        return {
+            "action": action,
+            "mac": mac,
+            "ip_family": ip_family,
+            "ip": factory.make_ipv4_address(),
+            "timestamp": int(time.time()),
+            "lease_time": 30,
+            "hostname": factory.make_name("host"),
+        }
 
-        # Packet should be the argument passed to processNotification in
-        # order.
-        self.assertEquals((packet1,), dvs[0].value)
-        self.assertEquals((packet2,), dvs[1].value)
+    def make_service_with_clock(self):
+        self.patch_socket_path()
+        clock = Clock()
+        service = LeaseSocketService(sentinel.service, clock)
+        processBatch = self.patch(service, "processBatch")
+        processBatch.return_value = defer.succeed(None)
+        return service, clock
+
+    def test_processNotifications_waits_for_batch_interval(self):
+        service, clock = self.make_service_with_clock()
+        packet = self.make_packet()
+        service.datagramReceived(json.dumps(packet).encode("utf-8"), None)
+        service.processNotifications(clock=clock)
+        self.assertThat(service.processBatch, MockNotCalled())
+        clock.advance(service.batch_interval)
+        service.processNotifications(clock=clock)
+        self.assertThat(
+            service.processBatch, MockCalledOnceWith([packet], clock=clock))
+
+    def test_processNotifications_sends_full_batches_immediately(self):
+        service, clock = self.make_service_with_clock()
+        service.batch_size = 2
+        packets = [self.make_packet() for _ in range(3)]
+        for packet in packets:
+            service.datagramReceived(
+                json.dumps(packet).encode("utf-8"), None)
+        service.processNotifications(clock=clock)
+        self.assertEqual(
+            [((packets[:2],), {"clock": clock}),
+             ((packets[2:],), {"clock": clock})],
+            service.processBatch.call_args_list)
+
+    def test_squash_notifications_keeps_last_for_mac_and_family(self):
+        mac = factory.make_mac_address()
+        commit = self.make_packet(mac=mac)
+        other = self.make_packet()
+        ipv6 = self.make_packet(mac=mac, ip_family="ipv6")
+        expiry = self.make_packet(action="expiry", mac=mac)
+        self.assertEqual(
+            [other, ipv6, expiry],
+            squash_notifications([commit, other, ipv6, expiry]))
 
     @defer.inlineCallbacks
-    def test_processNotification_send_to_region(self):
+    def test_processBatch_sends_to_region(self):
+        fixture = self.useFixture(MockLiveClusterToRegionRPCFixture())
+        protocol, connecting = fixture.makeEventLoop(UpdateLeases)
+        self.addCleanup((yield connecting))
+
+        client = getRegionClient()
+        rpc_service = MagicMock()
+        rpc_service.getClientNow.return_value = defer.succeed(client)
+        service = LeaseSocketService(
+            rpc_service, reactor)
+
+        # Notifications to region.
+        packets = [self.make_packet(), self.make_packet(action="expiry")]
+        packets[1]["lease_time"] = None
+        packets[1]["hostname"] = None
+        yield service.processBatch(packets, clock=reactor)
+        self.assertThat(
+            protocol.UpdateLeases,
+            MockCalledOnceWith(
+                protocol,
+                cluster_uuid=client.localIdent,
+                updates=packets))
+
+    @defer.inlineCallbacks
+    def test_processBatch_falls_back_to_UpdateLease(self):
         protocol, connecting = self.patch_rpc_UpdateLease()
         self.addCleanup((yield connecting))
 
@@ -208,16 +261,8 @@ class TestLeaseSocketService(MAASTestCase):
             rpc_service, reactor)
 
         # Notification to region.
-        packet = {
-            "action": "commit",
-            "mac": factory.make_mac_address(),
-            "ip_family": "ipv4",
-            "ip": factory.make_ipv4_address(),
-            "timestamp": int(time.time()),
-            "lease_time": 30,
-            "hostname": factory.make_name("host"),
-        }
-        yield service.processNotification(packet, clock=reactor)
+        packet = self.make_packet()
+        yield service.processBatch([packet], clock=reactor)
         self.assertThat(
             protocol.UpdateLease,
             MockCalledOnceWith(
@@ -8,13 +8,18 @@ __all__ = []
 
 from unittest.mock import (
     ANY,
+    call,
     Mock,
     sentinel,
 )
 
 from fixtures import FakeLogger
 from maastesting.factory import factory
-from maastesting.matchers import MockCalledOnceWith
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockCallsMatch,
+    MockNotCalled,
+)
 from maastesting.testcase import (
     MAASTestCase,
     MAASTwistedRunTest,
@@ -34,11 +39,13 @@ from provisioningserver.rpc import (
 from provisioningserver.rpc.testing import MockClusterToRegionRPCFixture
 from testtools.matchers import MatchesStructure
 from twisted.internet.defer import (
+    Deferred,
     fail,
     succeed,
 )
 from twisted.internet.error import ConnectionDone
 from twisted.internet.task import Clock
+from twisted.python.failure import Failure
 
 
 class TestNodePowerMonitorService(MAASTestCase):
@@ -73,9 +80,8 @@ class TestNodePowerMonitorService(MAASTestCase):
             proto_region.ListNodePowerParameters,
             MockCalledOnceWith(ANY, uuid=client.localIdent))
 
-    def test_query_nodes_calls_query_all_nodes(self):
+    def test_query_nodes_schedules_and_runs_queries(self):
         service = self.make_monitor_service()
-        service.max_nodes_at_once = sentinel.max_nodes_at_once
 
         example_power_parameters = {
             "system_id": factory.make_UUID(),
@@ -93,18 +99,16 @@ class TestNodePowerMonitorService(MAASTestCase):
             succeed({"nodes": []}),
         ]
 
-        query_all_nodes = self.patch(npms, "query_all_nodes")
+        update = self.patch(service.scheduler, "update")
+        run = self.patch(service.scheduler, "run")
+        run.return_value = succeed(None)
 
         d = service.query_nodes(getRegionClient())
         io.flush()
 
         self.assertEqual(None, extract_result(d))
-        self.assertThat(
-            query_all_nodes,
-            MockCalledOnceWith(
-                [example_power_parameters],
-                max_concurrency=sentinel.max_nodes_at_once,
-                clock=service.clock))
+        self.assertThat(update, MockCalledOnceWith([example_power_parameters]))
+        self.assertThat(run, MockCalledOnceWith())
 
     def test_query_nodes_copes_with_NoSuchCluster(self):
         service = self.make_monitor_service()
@@ -156,3 +160,257 @@ class TestNodePowerMonitorService(MAASTestCase):
             "Failed to query nodes' power status: "
             "Such a shame I can't divide by zero",
             maaslog.output)
+
+
+class TestPowerQueryScheduler(MAASTestCase):
+
+    def setUp(self):
+        super(TestPowerQueryScheduler, self).setUp()
+        self.clock = Clock()
+        self.metrics = Mock()
+        self.scheduler = npms.PowerQueryScheduler(
+            clock=self.clock, prometheus_metrics=self.metrics)
+        self.query_node = self.patch(npms, "query_node")
+        self.query_node.side_effect = (
+            lambda node, clock: succeed(node['power_state']))
+
+    def make_node(self, power_type='ipmi', power_state='on'):
+        return {
+            "system_id": factory.make_name("system_id"),
+            "hostname": factory.make_hostname(),
+            "power_state": power_state,
+            "power_type": power_type,
+            "context": {},
+        }
+
+    def test_update_ignores_unqueryable_power_types(self):
+        self.scheduler.update([self.make_node(power_type='manual')])
+        self.assertEqual({}, self.scheduler.nodes)
+
+    def test_run_queries_due_nodes(self):
+        nodes = [self.make_node() for _ in range(3)]
+        self.scheduler.update(nodes)
+        extract_result(self.scheduler.run())
+        self.assertThat(self.query_node, MockCallsMatch(*(
+            call(node, self.clock) for node in nodes)))
+
+    def test_run_does_not_query_nodes_that_are_not_due(self):
+        node = self.make_node()
+        self.scheduler.update([node])
+        extract_result(self.scheduler.run())
+        self.query_node.reset_mock()
+        extract_result(self.scheduler.run())
+        self.assertThat(self.query_node, MockNotCalled())
+
+    def test_listing_by_region_makes_node_due(self):
+        node = self.make_node()
+        self.scheduler.update([node])
+        extract_result(self.scheduler.run())
+        self.query_node.reset_mock()
+        self.clock.advance(self.scheduler.query_interval / 2)
+        self.scheduler.update([node])
+        extract_result(self.scheduler.run())
+        self.assertThat(self.query_node, MockCalledOnceWith(node, self.clock))
+
+    def test_failing_node_backs_off_exponentially(self):
+        node = self.make_node()
+        self.query_node.side_effect = lambda node, clock: succeed(None)
+        self.scheduler.update([node])
+        scheduled = self.scheduler.nodes[node['system_id']]
+        interval = self.scheduler.query_interval
+        for failures in range(1, 4):
+            now = self.clock.seconds()
+            extract_result(self.scheduler.run())
+            self.assertEqual(failures, scheduled.failures)
+            self.assertEqual(
+                now + interval * 2 ** failures, scheduled.due)
+            self.clock.advance(interval * 2 ** failures)
+            self.scheduler.update([dict(node, power_state='error')])
+
+    def test_backoff_is_capped(self):
+        node = self.make_node()
+        self.query_node.side_effect = lambda node, clock: succeed(None)
+        self.scheduler.update([node])
+        scheduled = self.scheduler.nodes[node['system_id']]
+        scheduled.failures = 20
+        extract_result(self.scheduler.run())
+        self.assertEqual(self.scheduler.max_backoff, scheduled.due)
+
+    def test_backing_off_node_is_not_made_due_by_region(self):
+        node = self.make_node()
+        self.query_node.side_effect = lambda node, clock: succeed(None)
+        self.scheduler.update([node])
+        extract_result(self.scheduler.run())
+        self.query_node.reset_mock()
+        self.clock.advance(self.scheduler.query_interval)
+        self.scheduler.update([dict(node, power_state='error')])
+        extract_result(self.scheduler.run())
+        self.assertThat(self.query_node, MockNotCalled())
+
+    def test_success_resets_failures(self):
+        node = self.make_node()
+        self.scheduler.update([node])
+        scheduled = self.scheduler.nodes[node['system_id']]
+        scheduled.failures = 3
+        extract_result(self.scheduler.run())
+        self.assertEqual(0, scheduled.failures)
+
+    def test_changed_node_is_rechecked_sooner(self):
+        node = self.make_node(power_state='off')
+        self.query_node.side_effect = lambda node, clock: succeed('on')
+        self.scheduler.update([node])
+        scheduled = self.scheduler.nodes[node['system_id']]
+        extract_result(self.scheduler.run())
+        self.assertEqual(0, scheduled.changed)
+        self.assertEqual(
+            self.scheduler.recent_change_interval, scheduled.due)
+
+    def test_node_changed_elsewhere_is_marked_changed(self):
+        node = self.make_node(power_state='off')
+        self.scheduler.update([node])
+        self.clock.advance(10)
+        self.scheduler.update([dict(node, power_state='on')])
+        scheduled = self.scheduler.nodes[node['system_id']]
+        self.assertEqual(10, scheduled.changed)
+
+    def test_recently_changed_nodes_are_queried_first(self):
+        nodes = [self.make_node() for _ in range(3)]
+        self.scheduler.update(nodes)
+        self.scheduler.nodes[nodes[2]['system_id']].changed = 0
+        extract_result(self.scheduler.run())
+        self.assertEqual(
+            nodes[2], self.query_node.call_args_list[0][0][0])
+
+    def test_power_action_in_progress_rechecks_soon(self):
+        node = self.make_node()
+        self.patch(npms, "power_action_registry", {node['system_id']: None})
+        self.scheduler.update([node])
+        scheduled = self.scheduler.nodes[node['system_id']]
+        extract_result(self.scheduler.run())
+        self.assertEqual(0, scheduled.failures)
+        self.assertEqual(
+            self.scheduler.recent_change_interval, scheduled.due)
+
+    def test_concurrency_is_limited_per_power_type(self):
+        self.scheduler.concurrency = {"ipmi": 2}
+        self.scheduler.default_concurrency = 1
+        self.query_node.side_effect = lambda node, clock: Deferred()
+        ipmi_nodes = [self.make_node() for _ in range(3)]
+        redfish_nodes = [self.make_node('redfish') for _ in range(2)]
+        self.scheduler.update(ipmi_nodes + redfish_nodes)
+        self.scheduler.run()
+        self.assertThat(self.query_node, MockCallsMatch(
+            call(ipmi_nodes[0], self.clock),
+            call(ipmi_nodes[1], self.clock),
+            call(redfish_nodes[0], self.clock)))
+
+    def make_grouped_nodes(self, count):
+        nodes = [self.make_node() for _ in range(count)]
+        for node in nodes:
+            node['context'] = {
+                'power_address': factory.make_ipv4_address(),
+                'power_user': 'maas', 'power_pass': 'secret',
+                'power_driver': 'LAN_2_0'}
+        return nodes
+
+    def patch_group_query(self, results):
+        query_node_group = self.patch(npms, "query_node_group")
+        query_node_group.return_value = succeed(results)
+        report_node_power_state = self.patch(npms, "report_node_power_state")
+        report_node_power_state.side_effect = (
+            lambda d, node: d.addErrback(lambda failure: None))
+        return query_node_group
+
+    def test_run_queries_due_nodes_in_groups(self):
+        nodes = self.make_grouped_nodes(3)
+        query_node_group = self.patch_group_query({
+            node['system_id']: 'off' for node in nodes})
+        self.scheduler.update(nodes)
+        extract_result(self.scheduler.run())
+        self.assertThat(query_node_group, MockCalledOnceWith(nodes))
+        self.assertThat(self.query_node, MockNotCalled())
+        for node in nodes:
+            scheduled = self.scheduler.nodes[node['system_id']]
+            self.assertEqual('off', scheduled.node['power_state'])
+            self.assertEqual(0, scheduled.changed)
+            self.assertEqual(
+                self.scheduler.recent_change_interval, scheduled.due)
+
+    def test_run_queries_nodes_left_out_of_group_on_their_own(self):
+        nodes = self.make_grouped_nodes(3)
+        self.patch_group_query({nodes[0]['system_id']: 'on'})
+        self.scheduler.update(nodes)
+        extract_result(self.scheduler.run())
+        self.assertThat(self.query_node, MockCallsMatch(
+            call(nodes[1], self.clock), call(nodes[2], self.clock)))
+
+    def test_run_backs_off_nodes_that_fail_in_group(self):
+        nodes = self.make_grouped_nodes(2)
+        self.patch_group_query({
+            node['system_id']: Failure(ZeroDivisionError())
+            for node in nodes})
+        self.scheduler.update(nodes)
+        extract_result(self.scheduler.run())
+        self.assertThat(self.query_node, MockNotCalled())
+        for node in nodes:
+            scheduled = self.scheduler.nodes[node['system_id']]
+            self.assertEqual(1, scheduled.failures)
+            self.assertEqual('error', scheduled.node['power_state'])
+
+    def test_group_query_takes_one_query_of_concurrency(self):
+        self.scheduler.concurrency = {"ipmi": 2}
+        self.query_node.side_effect = lambda node, clock: Deferred()
+        nodes = self.make_grouped_nodes(3)
+        query_node_group = self.patch_group_query({})
+        query_node_group.return_value = Deferred()
+        single_nodes = [self.make_node() for _ in range(2)]
+        self.scheduler.update(nodes + single_nodes)
+        self.scheduler.run()
+        self.assertThat(query_node_group, MockCalledOnceWith(nodes))
+        self.assertThat(self.query_node, MockCalledOnceWith(
+            single_nodes[0], self.clock))
+
+    def test_does_not_query_nodes_not_listed_recently_by_region(self):
+        node = self.make_node(power_state='off')
+        self.query_node.side_effect = lambda node, clock: succeed('on')
+        self.scheduler.update([node])
+        extract_result(self.scheduler.run())
+        self.query_node.reset_mock()
+        # The node changed recently so it would be re-checked soon, but the
+        # region has stopped listing it.
+        self.clock.advance(self.scheduler.stale_after)
+        extract_result(self.scheduler.run())
+        self.assertThat(self.query_node, MockNotCalled())
+        self.assertIn(node['system_id'], self.scheduler.nodes)
+
+    def test_queries_stale_node_once_listed_again(self):
+        node = self.make_node()
+        self.scheduler.update([node])
+        extract_result(self.scheduler.run())
+        self.query_node.reset_mock()
+        self.clock.advance(self.scheduler.stale_after)
+        self.scheduler.update([node])
+        extract_result(self.scheduler.run())
+        self.assertThat(self.query_node, MockCalledOnceWith(node, self.clock))
+
+    def test_forgets_nodes_not_listed_by_region(self):
+        node = self.make_node()
+        self.scheduler.update([node])
+        self.clock.advance(self.scheduler.forget_after)
+        extract_result(self.scheduler.run())
+        self.assertEqual({}, self.scheduler.nodes)
+        self.assertThat(self.query_node, MockNotCalled())
+
+    def test_run_records_metrics(self):
+        nodes = [self.make_node() for _ in range(2)]
+        self.scheduler.update(nodes)
+        self.scheduler.nodes[nodes[0]['system_id']].due = (
+            -self.scheduler.query_interval - 1)
+        extract_result(self.scheduler.run())
+        self.assertThat(self.metrics.update, MockCallsMatch(
+            call('maas_power_query_queue_depth', 'set', value=2),
+            call('maas_power_query_overdue_nodes', 'set', value=1),
+            call('maas_power_query_queue_depth', 'dec'),
+            call('maas_power_query_queue_depth', 'dec'),
+            call(
+                'maas_power_query_sweep_duration', 'observe', value=0)))
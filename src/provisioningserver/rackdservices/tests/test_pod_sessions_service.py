@@ -0,0 +1,42 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for
+:py:module:`~provisioningserver.rackdservices.pod_sessions_service`."""
+
+__all__ = []
+
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockNotCalled,
+)
+from maastesting.testcase import (
+    MAASTestCase,
+    MAASTwistedRunTest,
+)
+from provisioningserver.drivers.pod import virsh
+from provisioningserver.rackdservices.pod_sessions_service import (
+    PodSessionsService,
+)
+from twisted.internet.defer import inlineCallbacks
+
+
+class TestPodSessionsService(MAASTestCase):
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    def test_startService_does_not_close_sessions(self):
+        close = self.patch(virsh.virsh_sessions, "close")
+        service = PodSessionsService()
+        service.startService()
+        self.assertTrue(service.running)
+        self.assertThat(close, MockNotCalled())
+
+    @inlineCallbacks
+    def test_stopService_closes_virsh_sessions(self):
+        close = self.patch(virsh.virsh_sessions, "close")
+        service = PodSessionsService()
+        service.startService()
+        yield service.stopService()
+        self.assertFalse(service.running)
+        self.assertThat(close, MockCalledOnceWith())
@@ -29,7 +29,10 @@ from maastesting.testcase import (
     MAASTestCase,
     MAASTwistedRunTest,
 )
-from maastesting.twisted import TwistedLoggerFixture
+from maastesting.twisted import (
+    extract_result,
+    TwistedLoggerFixture,
+)
 from netaddr import IPNetwork
 from netaddr.ip import (
     IPV4_LINK_LOCAL,
@@ -44,6 +47,10 @@ from provisioningserver.events import EVENT_TYPES
 from provisioningserver.prometheus.metrics import METRICS_DEFINITIONS
 from provisioningserver.prometheus.utils import create_metrics
 from provisioningserver.rackdservices import tftp as tftp_module
+from provisioningserver.rackdservices.boot_config_cache import (
+    boot_config_cache,
+    BootConfigCache,
+)
 from provisioningserver.rackdservices.tftp import (
     get_boot_image,
     log_request,
@@ -653,6 +660,36 @@ class TestTFTPBackend(MAASTestCase):
         self.assertThat(method.get_reader, MockCalledOnceWith(
             backend, kernel_params=fake_kernel_params, **params_with_ip))
 
+    @inlineCallbacks
+    def test_get_boot_method_reader_records_render_latency(self):
+        fake_kernel_params = make_kernel_parameters(
+            purpose="local", label="local")
+        fake_params = fake_kernel_params._asdict()
+        del fake_params["label"]
+
+        client = Mock()
+        client.localIdent = factory.make_name("system_id")
+        client.return_value = succeed(fake_params)
+        client_service = Mock()
+        client_service.getClientNow.return_value = succeed(client)
+        prometheus_metrics = create_metrics(
+            METRICS_DEFINITIONS,
+            registry=prometheus_client.CollectorRegistry())
+        backend = TFTPBackend(
+            self.make_dir(), client_service,
+            prometheus_metrics=prometheus_metrics)
+        method = PXEBootMethod()
+        self.patch(method, "get_reader").return_value = BytesReader(b"")
+
+        params_with_ip = dict(fake_params)
+        params_with_ip['remote_ip'] = factory.make_ipv4_address()
+        reader = yield backend.get_boot_method_reader(method, params_with_ip)
+        self.addCleanup(reader.finish)
+        metrics = prometheus_metrics.generate_latest().decode('ascii')
+        self.assertIn(
+            'maas_boot_template_render_latency_count{method="pxe"} 1.0',
+            metrics)
+
     @inlineCallbacks
     def test_get_boot_method_reader_returns_rendered_params_for_local(self):
         # Fake configuration parameters, as discovered from the file path.
@@ -853,6 +890,31 @@ class TestTFTPBackend(MAASTestCase):
             backend.fetcher, MockCalledOnceWith(
                 client, GetBootConfig, **params_okay))
 
+    def test_get_kernel_params_uses_cache(self):
+        params = {
+            name.decode("ascii"): factory.make_name("value")
+            for name, _ in GetBootConfig.arguments
+        }
+        client = Mock()
+        client.localIdent = params["system_id"]
+        client_service = Mock()
+        client_service.getClientNow.return_value = succeed(client)
+
+        cache = BootConfigCache(clock=Clock(), prometheus_metrics=Mock())
+        backend = TFTPBackend(self.make_dir(), client_service, cache)
+        kernel_params = make_kernel_parameters()
+        backend.fetcher = Mock(return_value=succeed(kernel_params._asdict()))
+        backend.get_boot_image = lambda params, client, remote_ip: params
+
+        first = extract_result(backend.get_kernel_params(params))
+        second = extract_result(backend.get_kernel_params(params))
+
+        self.assertThat(
+            backend.fetcher, MockCalledOnceWith(
+                client, GetBootConfig, **params))
+        self.assertEqual(kernel_params, first)
+        self.assertEqual(kernel_params, second)
+
 
 class TestTFTPService(MAASTestCase):
 
@@ -872,6 +934,7 @@ class TestTFTPService(MAASTestCase):
             resource_root=example_root, client_service=example_client_service,
             port=example_port)
         tftp_service.updateServers()
+        self.assertIs(boot_config_cache, tftp_service.backend.cache)
         # The "tftp" service is a multi-service containing UDP servers for
         # each interface defined by get_all_interface_addresses().
         self.assertIsInstance(tftp_service, MultiService)
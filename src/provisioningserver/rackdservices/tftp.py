@@ -29,6 +29,9 @@ from provisioningserver.logger import (
     LegacyLogger,
 )
 from provisioningserver.prometheus.metrics import PROMETHEUS_METRICS
+from provisioningserver.rackdservices.boot_config_cache import (
+    boot_config_cache,
+)
 from provisioningserver.rpc.boot_images import list_boot_images
 from provisioningserver.rpc.exceptions import BootConfigNoResponse
 from provisioningserver.rpc.region import (
@@ -157,10 +160,13 @@ class TFTPBackend(FilesystemSynchronousBackend):
     fetch files at many similar paths which must not be passed on.
     """
 
-    def __init__(self, base_path, client_service):
+    def __init__(
+            self, base_path, client_service, cache=None,
+            prometheus_metrics=PROMETHEUS_METRICS):
         """
         :param base_path: The root directory for this TFTP server.
         :param client_service: The RPC client service for the rack controller.
+        :param cache: An optional `BootConfigCache` for boot configurations.
         """
         if not isinstance(base_path, FilePath):
             base_path = FilePath(base_path)
@@ -169,6 +175,8 @@ class TFTPBackend(FilesystemSynchronousBackend):
         self.client_to_remote = {}
         self.client_service = client_service
         self.fetcher = RPCFetcher()
+        self.cache = cache
+        self.prometheus_metrics = prometheus_metrics
 
     def _get_new_client_for_remote(self, remote_ip):
         """Return a new client for the `remote_ip`.
@@ -295,7 +303,12 @@ class TFTPBackend(FilesystemSynchronousBackend):
 
         def fetch(client, params):
             params["system_id"] = client.localIdent
-            d = self.fetcher(client, GetBootConfig, **params)
+            if self.cache is None:
+                d = self.fetcher(client, GetBootConfig, **params)
+            else:
+                d = self.cache.get(
+                    params, lambda params: self.fetcher(
+                        client, GetBootConfig, **params))
             d.addCallback(self.get_boot_image, client, params['remote_ip'])
             d.addCallback(lambda data: KernelParameters(**data))
             return d
@@ -313,8 +326,14 @@ class TFTPBackend(FilesystemSynchronousBackend):
             path requested.
         """
         def generate(kernel_params):
-            return boot_method.get_reader(
+            start_time = time()
+            reader = boot_method.get_reader(
                 self, kernel_params=kernel_params, **params)
+            self.prometheus_metrics.update(
+                'maas_boot_template_render_latency', 'observe',
+                labels={'method': boot_method.name},
+                value=time() - start_time)
+            return reader
 
         return self.get_kernel_params(params).addCallback(generate)
 
@@ -487,7 +506,8 @@ class TFTPService(MultiService, object):
         :param client_service: The RPC client service for the rack controller.
         """
         super(TFTPService, self).__init__()
-        self.backend = TFTPBackend(resource_root, client_service)
+        self.backend = TFTPBackend(
+            resource_root, client_service, boot_config_cache)
         self.port = port
         # Establish a periodic call to self.updateServers() every 45
         # seconds, so that this service eventually converges on truth.
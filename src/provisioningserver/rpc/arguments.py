@@ -6,6 +6,8 @@
 __all__ = [
     "Bytes",
     "Choice",
+    "ChunkedBytes",
+    "CompressedBoxes",
     "IPAddress",
     "IPNetwork",
     "ParsedURL",
@@ -13,7 +15,9 @@ __all__ = [
 ]
 
 import collections
+import itertools
 import json
+import struct
 import urllib.parse
 import zlib
 
@@ -167,6 +171,88 @@ class CompressedAmpList(AmpList):
         return fromStringProto(zlib.decompress(inString), proto)
 
 
+class ChunkedBytes(amp.Argument):
+    """Encode a byte string of any length on the wire.
+
+    AMP limits each value to :py:data:`~twisted.protocols.amp.MAX_VALUE_LENGTH`
+    bytes, so longer strings are split into chunks. The first chunk is sent
+    under the argument's own name, and the rest under ``name.1``, ``name.2``,
+    and so on.
+    """
+
+    def toBox(self, name, strings, objects, proto):
+        value = self.retrieve(
+            objects, amp._wireNameToPythonIdentifier(name), proto)
+        if self.optional and value is None:
+            return
+        value = self.toStringProto(value, proto)
+        size = amp.MAX_VALUE_LENGTH
+        strings[name] = value[:size]
+        for index, offset in enumerate(range(size, len(value), size), 1):
+            strings[b"%s.%d" % (name, index)] = value[offset:offset + size]
+
+    def fromBox(self, name, strings, objects, proto):
+        attr = amp._wireNameToPythonIdentifier(name)
+        value = strings.get(name)
+        if value is None:
+            if self.optional:
+                objects[attr] = None
+                return
+            raise KeyError(name)
+        chunks = [value]
+        for index in itertools.count(1):
+            chunk = strings.get(b"%s.%d" % (name, index))
+            if chunk is None:
+                break
+            chunks.append(chunk)
+        objects[attr] = self.fromStringProto(b"".join(chunks), proto)
+
+    def toString(self, inObject):
+        if not isinstance(inObject, bytes):
+            raise TypeError("Not a byte string: %r" % (inObject,))
+        return inObject
+
+    def fromString(self, inString):
+        return inString
+
+
+class CompressedBoxes(ChunkedBytes):
+    """Encode a list of AMP boxes on the wire, compressed with zlib.
+
+    Unlike in a box sent by itself, keys and values in these boxes are not
+    limited in length, and the list is chunked as for `ChunkedBytes`.
+    """
+
+    def toString(self, inObject):
+        packed = []
+        for box in inObject:
+            for key, value in box.items():
+                packed.append(struct.pack("!I", len(key)))
+                packed.append(key)
+                packed.append(struct.pack("!I", len(value)))
+                packed.append(value)
+            packed.append(struct.pack("!I", 0))
+        return zlib.compress(b"".join(packed))
+
+    def fromString(self, inString):
+        data = zlib.decompress(inString)
+        boxes, box, offset = [], amp.AmpBox(), 0
+        while offset < len(data):
+            length, = struct.unpack_from("!I", data, offset)
+            offset += 4
+            if length == 0:
+                boxes.append(box)
+                box = amp.AmpBox()
+                continue
+            key = data[offset:offset + length]
+            offset += length
+            length, = struct.unpack_from("!I", data, offset)
+            offset += 4
+            box[key] = data[offset:offset + length]
+            offset += length
+        return boxes
+
+
 class IPAddress(amp.Argument):
     """Encode a `netaddr.IPAddress` object on the wire."""
 
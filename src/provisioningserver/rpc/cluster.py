@@ -18,6 +18,7 @@ __all__ = [
     "DescribeNOSTypes",
     "GetPreseedData",
     "Identify",
+    "InvalidateBootConfig",
     "ListBootImages",
     "ListOperatingSystems",
     "ListSupportedArchitectures",
@@ -27,6 +28,8 @@ __all__ = [
     "PowerOn",
     "PowerQuery",
     "ScanNetworks",
+    "UpdateDHCPv4Hosts",
+    "UpdateDHCPv6Hosts",
     "ValidateDHCPv4Config",
     "ValidateDHCPv4Config_V2",
     "ValidateDHCPv6Config",
@@ -440,6 +443,47 @@ class _ConfigureDHCP_V2(amp.Command):
     errors = {exceptions.CannotConfigureDHCP: b"CannotConfigureDHCP"}
 
 
+class _UpdateDHCPHosts(amp.Command):
+    """Update only the hosts of a configured DHCP server.
+
+    The rest of the configuration is kept as it was when the configuration
+    with the given `fingerprint` was applied. If the DHCP server was since
+    configured differently, or not at all, `CannotConfigureDHCP` is raised
+    and the full configuration must be sent instead.
+
+    :since: 2.6
+    """
+    arguments = [
+        (b"omapi_key", amp.Unicode()),
+        (b"fingerprint", amp.Unicode()),
+        (b"remove", CompressedAmpList([
+            (b"mac", amp.Unicode()),
+            ])),
+        (b"add", CompressedAmpList([
+            (b"host", amp.Unicode()),
+            (b"mac", amp.Unicode()),
+            (b"ip", amp.Unicode()),
+            (b"dhcp_snippets", AmpList([
+                (b"name", amp.Unicode()),
+                (b"description", amp.Unicode(optional=True)),
+                (b"value", amp.Unicode()),
+                ], optional=True)),
+            ])),
+        (b"modify", CompressedAmpList([
+            (b"host", amp.Unicode()),
+            (b"mac", amp.Unicode()),
+            (b"ip", amp.Unicode()),
+            (b"dhcp_snippets", AmpList([
+                (b"name", amp.Unicode()),
+                (b"description", amp.Unicode(optional=True)),
+                (b"value", amp.Unicode()),
+                ], optional=True)),
+            ])),
+        ]
+    response = []
+    errors = {exceptions.CannotConfigureDHCP: b"CannotConfigureDHCP"}
+
+
 class _ValidateDHCPConfig(_ConfigureDHCP):
     """Validate the configure the DHCPv4 server.
 
@@ -484,6 +528,13 @@ class ConfigureDHCPv4_V2(_ConfigureDHCP_V2):
     """
 
 
+class UpdateDHCPv4Hosts(_UpdateDHCPHosts):
+    """Update the hosts of the DHCPv4 server.
+
+    :since: 2.6
+    """
+
+
 class ValidateDHCPv4Config(_ValidateDHCPConfig):
     """Validate the configure the DHCPv4 server.
 
@@ -512,6 +563,13 @@ class ConfigureDHCPv6_V2(_ConfigureDHCP_V2):
     """
 
 
+class UpdateDHCPv6Hosts(_UpdateDHCPHosts):
+    """Update the hosts of the DHCPv6 server.
+
+    :since: 2.6
+    """
+
+
 class ValidateDHCPv6Config(_ValidateDHCPConfig):
     """Configure the DHCPv6 server.
 
@@ -768,3 +826,19 @@ class DisableAndShutoffRackd(amp.Command):
         exceptions.CannotDisableAndShutoffRackd: (
             b"CannotDisableAndShutoffRackd"),
     }
+
+
+class InvalidateBootConfig(amp.Command):
+    """Discard cached boot configurations for a machine.
+
+    Cached configurations for requests that identified neither a MAC address
+    nor a hardware UUID are also discarded.
+
+    :since: 2.6
+    """
+    arguments = [
+        (b"macs", amp.ListOf(amp.Unicode())),
+        (b"hardware_uuid", amp.Unicode(optional=True)),
+    ]
+    response = []
+    errors = []
@@ -46,6 +46,9 @@ from provisioningserver.logger import (
     LegacyLogger,
 )
 from provisioningserver.path import get_data_path
+from provisioningserver.rackdservices.boot_config_cache import (
+    boot_config_cache,
+)
 from provisioningserver.refresh import (
     get_sys_info,
     refresh,
@@ -318,6 +321,16 @@ class Cluster(RPCProtocol):
         """
         return {"running": is_import_boot_images_running()}
 
+    @cluster.InvalidateBootConfig.responder
+    def invalidate_boot_config(self, macs, hardware_uuid=None):
+        """invalidate_boot_config()
+
+        Implementation of
+        :py:class:`~provisioningserver.rpc.cluster.InvalidateBootConfig`.
+        """
+        boot_config_cache.invalidate(macs, hardware_uuid)
+        return {}
+
     @cluster.DescribePowerTypes.responder
     def describe_power_types(self):
         """describe_power_types()
@@ -482,6 +495,24 @@ class Cluster(RPCProtocol):
 
         return d
 
+    @cluster.UpdateDHCPv4Hosts.responder
+    def update_dhcpv4_hosts(
+            self, omapi_key, fingerprint, remove, add, modify):
+        server = dhcp.DHCPv4Server(omapi_key)
+        d = concurrency.dhcpv4.run(
+            deferWithTimeout, DHCP_TIMEOUT,
+            dhcp.configure_hosts, server, fingerprint, remove, add, modify)
+        d.addCallback(lambda _: {})
+
+        # Catch the cancelled error, which means the work timed out.
+        def _timeoutEb(failure):
+            failure.trap(CancelledError)
+            log.err(failure, "DHCPv4 hosts update timed out")
+            raise CannotConfigureDHCP("timed out") from failure.value
+        d.addErrback(_timeoutEb)
+
+        return d
+
     @cluster.ValidateDHCPv4Config.responder
     def validate_dhcpv4_config(
             self, omapi_key, failover_peers, shared_networks,
@@ -544,6 +575,24 @@ class Cluster(RPCProtocol):
 
         return d
 
+    @cluster.UpdateDHCPv6Hosts.responder
+    def update_dhcpv6_hosts(
+            self, omapi_key, fingerprint, remove, add, modify):
+        server = dhcp.DHCPv6Server(omapi_key)
+        d = concurrency.dhcpv6.run(
+            deferWithTimeout, DHCP_TIMEOUT,
+            dhcp.configure_hosts, server, fingerprint, remove, add, modify)
+        d.addCallback(lambda _: {})
+
+        # Catch the cancelled error, which means the work timed out.
+        def _timeoutEb(failure):
+            failure.trap(CancelledError)
+            log.err(failure, "DHCPv6 hosts update timed out")
+            raise CannotConfigureDHCP("timed out") from failure.value
+        d.addErrback(_timeoutEb)
+
+        return d
+
     @cluster.ValidateDHCPv6Config.responder
     def validate_dhcpv6_config(
             self, omapi_key, failover_peers, shared_networks,
@@ -589,6 +638,10 @@ class Cluster(RPCProtocol):
 
         Implementation of
         :py:class:`~provisioningserver.rpc.cluster.EvaluateTag`.
+
+        Region controllers now evaluate tags themselves. This remains so
+        that regions not yet upgraded can still populate tags through an
+        upgraded rack controller during a staged upgrade.
         """
         # It's got to run in a thread because it does blocking IO.
         d = deferToThread(
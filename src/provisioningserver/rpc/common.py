@@ -5,6 +5,8 @@
 
 __all__ = [
     "Authenticate",
+    "CallBatch",
+    "CallBatcher",
     "Client",
     "Identify",
     "RPCProtocol",
@@ -14,6 +16,7 @@ from os import getpid
 from socket import gethostname
 
 from provisioningserver.logger import LegacyLogger
+from provisioningserver.rpc.arguments import CompressedBoxes
 from provisioningserver.rpc.interfaces import (
     IConnection,
     IConnectionToRegion,
@@ -22,7 +25,12 @@ from provisioningserver.utils.twisted import (
     asynchronous,
     deferWithTimeout,
 )
-from twisted.internet.defer import Deferred
+from twisted.internet.defer import (
+    Deferred,
+    DeferredList,
+    maybeDeferred,
+    succeed,
+)
 from twisted.protocols import amp
 from twisted.python.failure import Failure
 
@@ -90,6 +98,134 @@ class Ping(amp.Command):
     errors = []
 
 
+class CallBatch(amp.Command):
+    """Call several commands at once.
+
+    Each call is a box of the command's arguments, with the command's name
+    under ``_command``. The calls are dispatched one after another, in order,
+    and one answer is returned for each call: either a box of the command's
+    response, or a box with ``_error_code`` and ``_error_description``.
+
+    :since: 2.6
+    """
+
+    arguments = [
+        (b"calls", CompressedBoxes()),
+    ]
+    response = [
+        (b"results", CompressedBoxes()),
+    ]
+    errors = {
+        # Regions and racks from before 2.6 do not know this command.
+        amp.UnhandledCommand: amp.UNHANDLED_ERROR_CODE,
+    }
+
+
+class CallBatcher:
+    """Pipeline calls to batchable commands over a connection.
+
+    A call is sent straight away when there is no batch in flight. Calls made
+    while a batch is in flight are queued, then sent together in a single
+    `CallBatch` once it has been answered. Quiet connections see no added
+    latency, while busy connections need one round-trip per batch instead of
+    one per call. Calls are dispatched by the remote side in the order they
+    were made.
+
+    Commands opt in to batching with a true `batchable` attribute. Only
+    commands whose callers do not depend on the timing of each individual
+    call, like sending an event, should do so.
+
+    :ivar supported: Whether the remote side understands `CallBatch`. If it
+        does not, calls are sent one by one as before.
+    """
+
+    # The maximum number of calls to send in one batch.
+    max_calls = 200
+
+    def __init__(self, protocol):
+        super(CallBatcher, self).__init__()
+        self.protocol = protocol
+        self.supported = True
+        self._queue = []
+        self._in_flight = False
+
+    def call(self, cmd, **kwargs):
+        """Call `cmd` with `kwargs`, as part of a batch if possible.
+
+        :return: A `Deferred` that fires with the result of this call alone.
+        """
+        if not self.supported:
+            return self.protocol.callRemote(cmd, **kwargs)
+        # Serialise now so that bad arguments are reported to the caller.
+        box = cmd.makeArguments(dict(kwargs), self.protocol)
+        box[amp.COMMAND] = cmd.commandName
+        d = Deferred()
+        self._queue.append((cmd, kwargs, box, d))
+        if not self._in_flight:
+            self.flush()
+        return d
+
+    def flush(self):
+        """Send the queued calls."""
+        calls = self._queue[:self.max_calls]
+        del self._queue[:self.max_calls]
+        if len(calls) == 0:
+            self._in_flight = False
+            return
+        self._in_flight = True
+        if len(calls) == 1 or not self.supported:
+            d = self._callEach(calls)
+        else:
+            d = maybeDeferred(
+                self.protocol.callRemote, CallBatch,
+                calls=[box for _, _, box, _ in calls])
+            d.addCallbacks(
+                self._batchAnswered, self._batchFailed,
+                callbackArgs=(calls,), errbackArgs=(calls,))
+        d.addErrback(log.err, "Failed to send batched RPC calls.")
+        d.addBoth(lambda _: self.flush())
+
+    def _callEach(self, calls):
+        results = []
+        for cmd, kwargs, _, d in calls:
+            result = maybeDeferred(self.protocol.callRemote, cmd, **kwargs)
+            results.append(result.addBoth(self._resolve, d))
+        return DeferredList(results)
+
+    def _batchAnswered(self, response, calls):
+        for (cmd, _, _, d), result in zip(calls, response["results"]):
+            if amp.ERROR_CODE in result:
+                error_type = cmd.reverseErrors.get(
+                    result[amp.ERROR_CODE], amp.UnknownRemoteError)
+                description = result[amp.ERROR_DESCRIPTION].decode(
+                    "utf-8", "replace")
+                self._resolve(Failure(error_type(description)), d)
+            else:
+                try:
+                    result = cmd.parseResponse(result, self.protocol)
+                except Exception:
+                    result = Failure()
+                self._resolve(result, d)
+
+    def _batchFailed(self, failure, calls):
+        if failure.check(amp.UnhandledCommand):
+            # The remote side does not understand `CallBatch`.
+            self.supported = False
+            return self._callEach(calls)
+        else:
+            for _, _, _, d in calls:
+                self._resolve(failure, d)
+
+    @staticmethod
+    def _resolve(result, d):
+        # The caller may have given up waiting, e.g. after a timeout.
+        if not d.called:
+            if isinstance(result, Failure):
+                d.errback(result)
+            else:
+                d.callback(result)
+
+
 class Client:
     """Wrapper around an :class:`amp.AMP` instance.
 
@@ -169,11 +305,15 @@ class Client:
         timeout = kwargs.pop('_timeout', undefined)
         if timeout is undefined:
             timeout = 120  # 2 minutes
+        if getattr(cmd, "batchable", False) and isinstance(
+                self._conn, RPCProtocol):
+            callRemote = self._conn.batcher.call
+        else:
+            callRemote = self._conn.callRemote
         if timeout is None or timeout <= 0:
-            return self._conn.callRemote(cmd, **kwargs)
+            return callRemote(cmd, **kwargs)
         else:
-            return deferWithTimeout(
-                timeout, self._conn.callRemote, cmd, **kwargs)
+            return deferWithTimeout(timeout, callRemote, cmd, **kwargs)
 
     @asynchronous
     def getHostCertificate(self):
@@ -234,12 +374,14 @@ class RPCProtocol(amp.AMP, object):
         been called, i.e. this protocol is now connected.
     :ivar onConnectionLost: A `Deferred` that fires when `connectionLost` has
         been called, i.e. this protocol is no longer connected.
+    :ivar batcher: A `CallBatcher` for calls to batchable commands.
     """
 
     def __init__(self):
         super(RPCProtocol, self).__init__()
         self.onConnectionMade = Deferred()
         self.onConnectionLost = Deferred()
+        self.batcher = CallBatcher(self)
 
     def connectionMade(self):
         super(RPCProtocol, self).connectionMade()
@@ -333,3 +475,35 @@ class RPCProtocol(amp.AMP, object):
         :py:class:`~provisioningserver.rpc.common.Ping`.
         """
         return {}
+
+    @CallBatch.responder
+    def callBatch(self, calls):
+        """callBatch(calls)
+
+        Implementation of
+        :py:class:`~provisioningserver.rpc.common.CallBatch`.
+        """
+        results = []
+
+        def answered(box):
+            results.append(box)
+
+        def failed(failure):
+            error = failure.value
+            description = error.description
+            if isinstance(description, str):
+                description = description.encode("utf-8", "replace")
+            results.append({
+                amp.ERROR_CODE: error.errorCode,
+                amp.ERROR_DESCRIPTION: description,
+            })
+
+        def dispatch(_, box):
+            d = self.dispatchCommand(amp.AmpBox(box))
+            return d.addCallbacks(answered, failed)
+
+        # Dispatch one after another to preserve the order of the calls.
+        d = succeed(None)
+        for box in calls:
+            d.addCallback(dispatch, box)
+        return d.addCallback(lambda _: {"results": results})
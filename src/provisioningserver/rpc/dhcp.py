@@ -5,6 +5,7 @@
 
 __all__ = [
     "configure",
+    "configure_hosts",
     "DHCPv4Server",
     "DHCPv6Server",
     "downgrade_shared_networks",
@@ -12,6 +13,9 @@ __all__ = [
 ]
 
 from collections import namedtuple
+from hashlib import sha256
+from itertools import chain
+import json
 from operator import itemgetter
 import os
 import re
@@ -28,6 +32,7 @@ from provisioningserver.logger import (
     get_maas_logger,
     LegacyLogger,
 )
+from provisioningserver.prometheus.metrics import PROMETHEUS_METRICS
 from provisioningserver.rpc.exceptions import (
     CannotConfigureDHCP,
     CannotCreateHostMap,
@@ -53,6 +58,7 @@ from provisioningserver.utils.twisted import (
     synchronous,
 )
 from twisted.internet.defer import (
+    fail,
     inlineCallbacks,
     maybeDeferred,
 )
@@ -140,6 +146,30 @@ class DHCPState(DHCPStateBase):
                 remove.append(host)
         return remove, add, modify
 
+    def fingerprint(self):
+        """Return a fingerprint of this state.
+
+        Two states with the same configuration have the same fingerprint,
+        whether they were built on the region or on the rack controller.
+        Optional fields that are unset are left out, as they do not cross
+        the RPC boundary.
+        """
+        def strip_unset(value):
+            if isinstance(value, dict):
+                return {
+                    key: strip_unset(item)
+                    for key, item in value.items()
+                    if item is not None
+                }
+            elif isinstance(value, (list, tuple)):
+                return [strip_unset(item) for item in value]
+            else:
+                return value
+
+        state = json.dumps(
+            strip_unset(self._asdict()), sort_keys=True, default=str)
+        return sha256(state.encode("utf-8")).hexdigest()
+
     def get_config(self, server):
         """Return the configuration for `server`."""
         dhcpd_config = get_config(
@@ -422,6 +452,10 @@ def configure(
                             server, "restart",
                             service_monitor.restartService,
                             server.dhcp_service)
+                    else:
+                        PROMETHEUS_METRICS.update(
+                            'maas_dhcpd_restarts_avoided', 'inc',
+                            labels={'service': server.dhcp_service})
                 else:
                     log.debug(
                         "Usage of OMAPI skipped; {name} service was started "
@@ -432,6 +466,54 @@ def configure(
         _current_server_state[server.dhcp_service] = new_state
 
 
+@asynchronous
+def configure_hosts(server, fingerprint, remove, add, modify):
+    """Update only the hosts of the DHCPv6/DHCPv4 server.
+
+    The rest of the configuration is taken from the current state, which must
+    match `fingerprint`. The hosts are then applied with `configure`, which
+    uses the OMAPI rather than restarting the server whenever it can.
+
+    This method is not safe to call concurrently. The clusterserver ensures
+    that this method is not called concurrently.
+
+    :param server: A `DHCPServer` instance.
+    :param fingerprint: The fingerprint of the state that the changes are
+        relative to.
+    :param remove: List of dicts with the MAC addresses of hosts to remove.
+    :param add: List of dicts with host parameters of hosts to add.
+    :param modify: List of dicts with host parameters of hosts to update.
+    :raise CannotConfigureDHCP: When the current state is unknown or does not
+        match `fingerprint`.
+    """
+    current_state = _current_server_state.get(server.dhcp_service, None)
+    if current_state is None:
+        return fail(CannotConfigureDHCP(
+            "%s server state is unknown; full configuration required." % (
+                server.descriptive_name)))
+    elif (current_state.omapi_key != server.omapi_key or
+            current_state.fingerprint() != fingerprint):
+        return fail(CannotConfigureDHCP(
+            "%s server state has changed; full configuration required." % (
+                server.descriptive_name)))
+
+    hosts = dict(current_state.hosts)
+    for host in remove:
+        hosts.pop(host["mac"], None)
+    for host in chain(add, modify):
+        hosts[host["mac"]] = host
+    log.debug(
+        "Updating hosts for {name} service; {count} changed.",
+        name=server.descriptive_name,
+        count=len(remove) + len(add) + len(modify))
+    return configure(
+        server, current_state.failover_peers, current_state.shared_networks,
+        list(hosts.values()), [
+            {"name": name}
+            for name in current_state.interfaces
+        ], current_state.global_dhcp_snippets)
+
+
 def _parse_dhcpd_errors(error_str):
     """Parse the output of dhcpd -t -cf <file> into a list of dictionaries
 
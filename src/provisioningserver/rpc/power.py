@@ -9,6 +9,7 @@ __all__ = [
     "maybe_change_power_state",
 ]
 
+from collections import OrderedDict
 from datetime import timedelta
 from functools import partial
 import sys
@@ -16,6 +17,7 @@ import sys
 from provisioningserver.drivers.power import (
     get_error_message,
     PowerError,
+    PowerFatalError,
 )
 from provisioningserver.drivers.power.registry import PowerDriverRegistry
 from provisioningserver.events import (
@@ -45,13 +47,12 @@ from provisioningserver.utils.twisted import (
 from twisted.internet import reactor
 from twisted.internet.defer import (
     CancelledError,
-    DeferredList,
-    DeferredSemaphore,
     inlineCallbacks,
     returnValue,
     succeed,
 )
 from twisted.internet.task import deferLater
+from twisted.python.failure import Failure
 
 
 maaslog = get_maas_logger("power")
@@ -446,23 +447,70 @@ def query_node(node, clock):
         d = get_power_state(
             node['system_id'], node['hostname'], node['power_type'],
             node['context'], clock=clock)
-        d = report_power_state(d, node['system_id'], node['hostname'])
-        d.addCallbacks(
-            partial(maaslog_report_success, node),
-            partial(maaslog_report_failure, node))
-        return d
+        return report_node_power_state(d, node)
+
 
+def report_node_power_state(d, node):
+    """Report and log the result of querying the given node."""
+    d = report_power_state(d, node['system_id'], node['hostname'])
+    d.addCallbacks(
+        partial(maaslog_report_success, node),
+        partial(maaslog_report_failure, node))
+    return d
 
-def query_all_nodes(nodes, max_concurrency=5, clock=reactor):
-    """Queries the given nodes for their power state.
 
-    Nodes' states are reported back to the region.
+def group_power_queries(nodes):
+    """Group together nodes whose power can be queried at once.
 
-    :return: A deferred, which fires once all nodes have been queried,
-        successfully or not.
+    Nodes are grouped by power type and by the power driver's
+    `get_query_group` key, in groups no bigger than its `query_group_size`.
+
+    :return: A list of groups, each of two or more nodes.
+    """
+    groups = OrderedDict()
+    for node in nodes:
+        if node['system_id'] in power_action_registry:
+            continue
+        power_driver = PowerDriverRegistry[node['power_type']]
+        key = power_driver.get_query_group(node['context'])
+        if key is not None:
+            groups.setdefault((node['power_type'], key), []).append(node)
+    chunks = []
+    for (power_type, _), group in groups.items():
+        size = PowerDriverRegistry[power_type].query_group_size
+        chunks.extend(
+            group[start:start + size]
+            for start in range(0, len(group), size))
+    return [chunk for chunk in chunks if len(chunk) > 1]
+
+
+def query_node_group(nodes):
+    """Query the power state of a group from `group_power_queries`.
+
+    :return: A deferred firing with a dict mapping `Node.system_id` to the
+        node's power state, or to a `Failure` for nodes whose BMC refused
+        the query outright. Nodes the group query could not tell about are
+        left out.
     """
-    semaphore = DeferredSemaphore(tokens=max_concurrency)
-    queries = (
-        semaphore.run(query_node, node, clock)
-        for node in nodes if node['power_type'] in PowerDriverRegistry)
-    return DeferredList(queries, consumeErrors=True)
+    power_driver = PowerDriverRegistry[nodes[0]['power_type']]
+    if len(power_driver.detect_missing_packages()) > 0:
+        # Nodes queried on their own report the missing packages.
+        return succeed({})
+
+    def cb_results(results):
+        states = {}
+        for system_id, result in results.items():
+            if isinstance(result, PowerFatalError):
+                states[system_id] = Failure(result)
+            elif result in ("on", "off", "unknown"):
+                states[system_id] = result
+        return states
+
+    def eb_results(failure):
+        log.err(failure, "Failed to query the power state of %d nodes." % (
+            len(nodes)))
+        return {}
+
+    d = power_driver.query_group({
+        node['system_id']: node['context'] for node in nodes})
+    return d.addCallbacks(cb_results, eb_results)
@@ -33,12 +33,14 @@ __all__ = [
     "SendEventMACAddress",
     "UpdateInterfaces",
     "UpdateLastImageSync",
+    "UpdateLeases",
     "UpdateNodePowerState",
 ]
 
 from provisioningserver.rpc.arguments import (
     AmpList,
     Bytes,
+    CompressedAmpList,
     ParsedURL,
     StructureAsJSON,
 )
@@ -314,6 +316,7 @@ class UpdateNodePowerState(amp.Command):
         (b"power_state", amp.Unicode()),
     ]
     response = []
+    batchable = True
     errors = {NoSuchNode: b"NoSuchNode"}
 
 
@@ -344,6 +347,7 @@ class SendEvent(amp.Command):
         (b"description", amp.Unicode()),
     ]
     response = []
+    batchable = True
     errors = {
         # In practice, neither NoSuchNode nor NoSuchEventType will be returned
         # by the region controller as of MAAS 1.9 because the region no longer
@@ -365,6 +369,7 @@ class SendEventMACAddress(amp.Command):
         (b"description", amp.Unicode()),
     ]
     response = []
+    batchable = True
     errors = {
         # In practice, neither NoSuchNode nor NoSuchEventType will be returned
         # by the region controller as of MAAS 1.9 because the region no longer
@@ -386,6 +391,7 @@ class SendEventIPAddress(amp.Command):
         (b"description", amp.Unicode()),
     ]
     response = []
+    batchable = True
     errors = {
         NoSuchNode: b"NoSuchNode",
         NoSuchEventType: b"NoSuchEventType"
@@ -550,6 +556,32 @@ class UpdateLease(amp.Command):
         (b"hostname", amp.Unicode(optional=True)),
     ]
     response = []
+    batchable = True
+    errors = {
+        NoSuchCluster: b"NoSuchCluster",
+    }
+
+
+class UpdateLeases(amp.Command):
+    """Report a batch of DHCP lease updates from a cluster controller.
+
+    Each update carries the same fields as `UpdateLease`. The updates are
+    processed in order in a single transaction.
+
+    :since: 2.6
+    """
+    arguments = [
+        (b"cluster_uuid", amp.Unicode()),
+        (b"updates", CompressedAmpList(
+            [(b"action", amp.Unicode()),
+             (b"mac", amp.Unicode()),
+             (b"ip_family", amp.Unicode()),
+             (b"ip", amp.Unicode()),
+             (b"timestamp", amp.Integer()),
+             (b"lease_time", amp.Integer(optional=True)),
+             (b"hostname", amp.Unicode(optional=True))])),
+    ]
+    response = []
     errors = {
         NoSuchCluster: b"NoSuchCluster",
     }
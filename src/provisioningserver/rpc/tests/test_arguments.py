@@ -160,6 +160,53 @@ class TestCompressedAmpList(MAASTestCase):
             LessThan(2 ** 16))
 
 
+class TestChunkedBytes(MAASTestCase):
+
+    def round_trip(self, argument, value):
+        strings = amp.AmpBox()
+        argument.toBox(b"thing", strings, {"thing": value}, None)
+        objects = {}
+        argument.fromBox(b"thing", strings, objects, None)
+        return strings, objects["thing"]
+
+    def test_round_trip(self):
+        example = factory.make_bytes()
+        strings, decoded = self.round_trip(arguments.ChunkedBytes(), example)
+        self.assertThat(strings, Equals({b"thing": example}))
+        self.assertThat(decoded, Equals(example))
+
+    def test_round_trip_in_chunks(self):
+        example = factory.make_bytes(amp.MAX_VALUE_LENGTH * 2 + 1)
+        strings, decoded = self.round_trip(arguments.ChunkedBytes(), example)
+        self.assertThat(
+            sorted(strings), Equals([b"thing", b"thing.1", b"thing.2"]))
+        self.assertThat(decoded, Equals(example))
+
+    def test_round_trip_when_optional(self):
+        strings, decoded = self.round_trip(
+            arguments.ChunkedBytes(optional=True), None)
+        self.assertThat(strings, Equals({}))
+        self.assertThat(decoded, Equals(None))
+
+    def test_error_when_input_is_not_a_byte_string(self):
+        with ExpectedException(TypeError, "^Not a byte string: <.*"):
+            arguments.ChunkedBytes().toString(object())
+
+
+class TestCompressedBoxes(MAASTestCase):
+
+    def test_round_trip(self):
+        argument = arguments.CompressedBoxes()
+        example = [
+            amp.AmpBox({b"_command": b"Echo", b"value": factory.make_bytes()}),
+            amp.AmpBox(),
+            amp.AmpBox({b"big": factory.make_bytes(amp.MAX_VALUE_LENGTH + 1)}),
+        ]
+        encoded = argument.toString(example)
+        self.assertThat(encoded, IsInstance(bytes))
+        self.assertThat(argument.fromString(encoded), Equals(example))
+
+
 class TestIPAddress(MAASTestCase):
 
     argument = arguments.IPAddress()
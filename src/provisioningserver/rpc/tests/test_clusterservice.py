@@ -423,6 +423,30 @@ class TestClusterProtocol_IsImportBootImagesRunning(MAASTestCase):
         self.assertEqual({"running": True}, response)
 
 
+class TestClusterProtocol_InvalidateBootConfig(MAASTestCase):
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    def test_invalidate_boot_config_is_registered(self):
+        protocol = Cluster()
+        responder = protocol.locateResponder(
+            cluster.InvalidateBootConfig.commandName)
+        self.assertIsNotNone(responder)
+
+    @inlineCallbacks
+    def test_invalidate_boot_config_invalidates_cache(self):
+        invalidate = self.patch(
+            clusterservice.boot_config_cache, "invalidate")
+        mac = factory.make_mac_address()
+        hardware_uuid = factory.make_UUID()
+        response = yield call_responder(
+            Cluster(), cluster.InvalidateBootConfig, {
+                "macs": [mac], "hardware_uuid": hardware_uuid})
+        self.assertEqual({}, response)
+        self.assertThat(
+            invalidate, MockCalledOnceWith([mac], hardware_uuid))
+
+
 class TestClusterProtocol_DescribePowerTypes(MAASTestCase):
 
     run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
@@ -2434,6 +2458,85 @@ class TestClusterProtocol_ConfigureDHCP(MAASTestCase):
                 })
 
 
+class TestClusterProtocol_UpdateDHCPHosts(MAASTestCase):
+
+    scenarios = (
+        ("DHCPv4", {
+            "dhcp_server": (dhcp, "DHCPv4Server"),
+            "command": cluster.UpdateDHCPv4Hosts,
+            "concurrency_lock": concurrency.dhcpv4,
+        }),
+        ("DHCPv6", {
+            "dhcp_server": (dhcp, "DHCPv6Server"),
+            "command": cluster.UpdateDHCPv6Hosts,
+            "concurrency_lock": concurrency.dhcpv6,
+        }),
+    )
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    def test__is_registered(self):
+        self.assertIsNotNone(
+            Cluster().locateResponder(self.command.commandName))
+
+    @inlineCallbacks
+    def test__executes_configure_hosts(self):
+        DHCPServer = self.patch_autospec(*self.dhcp_server)
+        configure_hosts = self.patch_autospec(dhcp, "configure_hosts")
+
+        omapi_key = factory.make_name('key')
+        fingerprint = factory.make_name('fingerprint')
+        remove = [{"mac": factory.make_mac_address()}]
+        add = [make_host()]
+        modify = [make_host()]
+
+        yield call_responder(Cluster(), self.command, {
+            'omapi_key': omapi_key,
+            'fingerprint': fingerprint,
+            'remove': remove,
+            'add': add,
+            'modify': modify,
+            })
+
+        self.assertThat(DHCPServer, MockCalledOnceWith(omapi_key))
+        self.assertThat(configure_hosts, MockCalledOnceWith(
+            DHCPServer.return_value, fingerprint, remove, add, modify))
+
+    @inlineCallbacks
+    def test__limits_concurrency(self):
+        self.patch_autospec(*self.dhcp_server)
+
+        def check_dhcp_locked(server, fingerprint, remove, add, modify):
+            self.assertTrue(self.concurrency_lock.locked)
+
+        self.patch(dhcp, "configure_hosts", check_dhcp_locked)
+
+        self.assertFalse(self.concurrency_lock.locked)
+        yield call_responder(Cluster(), self.command, {
+            'omapi_key': factory.make_name('key'),
+            'fingerprint': factory.make_name('fingerprint'),
+            'remove': [],
+            'add': [],
+            'modify': [],
+            })
+        self.assertFalse(self.concurrency_lock.locked)
+
+    @inlineCallbacks
+    def test__propagates_CannotConfigureDHCP(self):
+        configure_hosts = self.patch_autospec(dhcp, "configure_hosts")
+        configure_hosts.side_effect = (
+            exceptions.CannotConfigureDHCP("Deliberate failure"))
+
+        with ExpectedException(exceptions.CannotConfigureDHCP):
+            yield call_responder(Cluster(), self.command, {
+                'omapi_key': factory.make_name('key'),
+                'fingerprint': factory.make_name('fingerprint'),
+                'remove': [],
+                'add': [],
+                'modify': [],
+                })
+
+
 class TestClusterProtocol_ValidateDHCP(MAASTestCase):
 
     scenarios = (
@@ -22,6 +22,7 @@ from maastesting.twisted import (
     TwistedLoggerFixture,
 )
 from provisioningserver.rpc import common
+from provisioningserver.rpc.interfaces import IConnection
 from provisioningserver.rpc.testing.doubles import (
     DummyConnection,
     FakeConnection,
@@ -35,9 +36,54 @@ from testtools.matchers import (
     Not,
 )
 from twisted.internet.defer import Deferred
+from twisted.internet.error import ConnectionDone
 from twisted.internet.protocol import connectionDone
 from twisted.protocols import amp
+from twisted.test import iosim
 from twisted.test.proto_helpers import StringTransport
+from zope.interface import implementer
+
+
+class EchoError(Exception):
+    """Raised by `EchoProtocol` when asked to echo "error"."""
+
+
+class Echo(amp.Command):
+
+    arguments = [(b"value", amp.Unicode())]
+    response = [(b"value", amp.Unicode())]
+    errors = {EchoError: b"EchoError"}
+    batchable = True
+
+
+@implementer(IConnection)
+class EchoProtocol(common.RPCProtocol):
+    """Echoes values back, recording the commands it dispatches."""
+
+    ident = "echo"
+
+    def __init__(self):
+        super(EchoProtocol, self).__init__()
+        self.commands = []
+
+    def dispatchCommand(self, box):
+        self.commands.append(box[amp.COMMAND])
+        return super(EchoProtocol, self).dispatchCommand(box)
+
+    @Echo.responder
+    def echo(self, value):
+        if value == "error":
+            raise EchoError(value)
+        return {"value": value}
+
+
+class EchoProtocolWithoutBatches(EchoProtocol):
+    """Behaves like a peer from before `CallBatch` was introduced."""
+
+    def locateResponder(self, name):
+        if name == common.CallBatch.commandName:
+            return None
+        return super(EchoProtocolWithoutBatches, self).locateResponder(name)
 
 
 class TestClient(MAASTestCase):
@@ -129,6 +175,15 @@ class TestClient(MAASTestCase):
                 timeout, conn.callRemote, sentinel.command,
                 foo=sentinel.foo, bar=sentinel.bar))
 
+    def test_call_sends_batchable_commands_through_batcher(self):
+        conn = EchoProtocol()
+        client = common.Client(conn)
+        self.patch_autospec(conn.batcher, "call")
+        conn.batcher.call.return_value = sentinel.response
+        response = client(Echo, _timeout=None, value="a")
+        self.assertThat(response, Is(sentinel.response))
+        self.assertThat(conn.batcher.call, MockCalledOnceWith(Echo, value="a"))
+
     def test_call_with_keyword_arguments_raises_useful_error(self):
         conn = DummyConnection()
         client = common.Client(conn)
@@ -281,6 +336,69 @@ class TestRPCProtocol_UnhandledErrorsWhenHandlingCommands(MAASTestCase):
         self.assertThat(observed_boxes_sent, Equals(expected_boxes_sent))
 
 
+class TestCallBatcher(MAASTestCase):
+
+    def connect(self, server):
+        client = EchoProtocol()
+        pump = iosim.connect(
+            server, iosim.makeFakeServer(server),
+            client, iosim.makeFakeClient(client), debug=False)
+        return client, pump
+
+    def test__sends_a_lone_call_by_itself(self):
+        server = EchoProtocol()
+        client, pump = self.connect(server)
+        d = client.batcher.call(Echo, value="a")
+        pump.flush()
+        self.assertThat(extract_result(d), Equals({"value": "a"}))
+        self.assertThat(server.commands, Equals([b"Echo"]))
+
+    def test__batches_calls_made_while_a_call_is_in_flight(self):
+        server = EchoProtocol()
+        client, pump = self.connect(server)
+        values = ["a", "b", "c", "d"]
+        ds = [client.batcher.call(Echo, value=value) for value in values]
+        pump.flush()
+        self.assertThat(
+            [extract_result(d) for d in ds],
+            Equals([{"value": value} for value in values]))
+        self.assertThat(server.commands, Equals([
+            b"Echo", b"CallBatch", b"Echo", b"Echo", b"Echo"]))
+
+    def test__resolves_errors_for_each_call(self):
+        server = EchoProtocol()
+        client, pump = self.connect(server)
+        ds = [
+            client.batcher.call(Echo, value=value)
+            for value in ("a", "b", "error", "c")
+        ]
+        pump.flush()
+        self.assertThat(extract_result(ds[1]), Equals({"value": "b"}))
+        self.assertRaises(EchoError, extract_result, ds[2])
+        self.assertThat(extract_result(ds[3]), Equals({"value": "c"}))
+
+    def test__falls_back_when_batches_are_not_supported(self):
+        server = EchoProtocolWithoutBatches()
+        client, pump = self.connect(server)
+        values = ["a", "b", "c"]
+        ds = [client.batcher.call(Echo, value=value) for value in values]
+        pump.flush()
+        self.assertThat(
+            [extract_result(d) for d in ds],
+            Equals([{"value": value} for value in values]))
+        self.assertThat(client.batcher.supported, Is(False))
+        self.assertThat(server.commands, Equals([
+            b"Echo", b"CallBatch", b"Echo", b"Echo"]))
+
+    def test__fails_queued_calls_when_connection_is_lost(self):
+        server = EchoProtocol()
+        client, pump = self.connect(server)
+        ds = [client.batcher.call(Echo, value=value) for value in "abc"]
+        client.connectionLost(connectionDone)
+        for d in ds:
+            self.assertRaises(ConnectionDone, extract_result, d)
+
+
 class TestMakeCommandRef(MAASTestCase):
     """Tests for `common.make_command_ref`."""
 
@@ -48,7 +48,10 @@ from provisioningserver.utils.service_monitor import (
 from provisioningserver.utils.shell import ExternalProcessError
 from testtools import ExpectedException
 from testtools.matchers import MatchesStructure
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import (
+    inlineCallbacks,
+    succeed,
+)
 
 
 class TestDHCPState(MAASTestCase):
@@ -275,6 +278,37 @@ class TestDHCPState(MAASTestCase):
             ([removed_host], [added_host], [modified_host]),
             new_state.host_diff(state))
 
+    def test_fingerprint_same_for_same_state(self):
+        args = self.make_args()
+        state = dhcp.DHCPState(*args)
+        other_state = dhcp.DHCPState(*copy.deepcopy(args))
+        self.assertEqual(state.fingerprint(), other_state.fingerprint())
+
+    def test_fingerprint_ignores_unset_optional_fields(self):
+        (omapi_key, failover_peers, shared_networks, hosts, interfaces,
+         global_dhcp_snippets) = self.make_args()
+        del shared_networks[0]["mtu"]
+        state = dhcp.DHCPState(
+            omapi_key, failover_peers, shared_networks, hosts, interfaces,
+            global_dhcp_snippets)
+        shared_networks = copy.deepcopy(shared_networks)
+        shared_networks[0]["mtu"] = None
+        other_state = dhcp.DHCPState(
+            omapi_key, failover_peers, shared_networks, hosts, interfaces,
+            global_dhcp_snippets)
+        self.assertEqual(state.fingerprint(), other_state.fingerprint())
+
+    def test_fingerprint_differs_when_hosts_different(self):
+        (omapi_key, failover_peers, shared_networks, hosts, interfaces,
+         global_dhcp_snippets) = self.make_args()
+        state = dhcp.DHCPState(
+            omapi_key, failover_peers, shared_networks, hosts, interfaces,
+            global_dhcp_snippets)
+        other_state = dhcp.DHCPState(
+            omapi_key, failover_peers, shared_networks, hosts + [make_host()],
+            interfaces, global_dhcp_snippets)
+        self.assertNotEqual(state.fingerprint(), other_state.fingerprint())
+
     def test_get_config_returns_config_and_calls_with_params(self):
         mock_get_config = self.patch_autospec(dhcp, 'get_config')
         mock_get_config.return_value = sentinel.config
@@ -644,6 +678,7 @@ class TestConfigureDHCP(MAASTestCase):
     @inlineCallbacks
     def test__writes_config_and_calls_ensure_when_nothing_changed(self):
         write_file = self.patch_sudo_write_file()
+        metrics = self.patch(dhcp, "PROMETHEUS_METRICS")
         restart_service = self.patch_restartService()
         ensure_service = self.patch_ensureService()
 
@@ -689,6 +724,8 @@ class TestConfigureDHCP(MAASTestCase):
             restart_service, MockNotCalled())
         self.assertThat(
             ensure_service, MockCalledOnceWith(self.server.dhcp_service))
+        # No restart was needed, so none was avoided.
+        self.assertThat(metrics.update, MockNotCalled())
         self.assertEquals(
             dhcp._current_server_state[self.server.dhcp_service],
             dhcp.DHCPState(
@@ -762,6 +799,7 @@ class TestConfigureDHCP(MAASTestCase):
     @inlineCallbacks
     def test__writes_config_and_uses_omapi_to_update_hosts(self):
         write_file = self.patch_sudo_write_file()
+        metrics = self.patch(dhcp, "PROMETHEUS_METRICS")
         get_service_state = self.patch_getServiceState()
         get_service_state.return_value = ServiceState(
             SERVICE_STATE.ON, "running")
@@ -828,6 +866,9 @@ class TestConfigureDHCP(MAASTestCase):
             update_hosts,
             MockCalledOnceWith(
                 ANY, [removed_host], [added_host], [modified_host]))
+        self.assertThat(metrics.update, MockCalledOnceWith(
+            'maas_dhcpd_restarts_avoided', 'inc',
+            labels={'service': self.server.dhcp_service}))
         self.assertEquals(
             dhcp._current_server_state[self.server.dhcp_service],
             dhcp.DHCPState(
@@ -1014,6 +1055,75 @@ class TestConfigureDHCP(MAASTestCase):
             "DHCP is on strike today", logger.output)
 
 
+class TestConfigureHosts(MAASTestCase):
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    scenarios = (
+        ("DHCPv4", {"server": dhcp.DHCPv4Server}),
+        ("DHCPv6", {"server": dhcp.DHCPv6Server}),
+    )
+
+    def setUp(self):
+        super(TestConfigureHosts, self).setUp()
+        # The dhcp server states are global so we clean them after each test.
+        self.addCleanup(dhcp._current_server_state.clear)
+
+    def make_state(self, omapi_key, hosts):
+        failover_peers = make_failover_peer_config()
+        shared_network = make_shared_network()
+        [shared_network] = fix_shared_networks_failover(
+            [shared_network], [failover_peers])
+        state = dhcp.DHCPState(
+            omapi_key, [failover_peers], [shared_network], hosts,
+            [make_interface()], make_global_dhcp_snippets())
+        dhcp._current_server_state[self.server.dhcp_service] = state
+        return state
+
+    @inlineCallbacks
+    def test__raises_CannotConfigureDHCP_when_state_unknown(self):
+        configure = self.patch_autospec(dhcp, "configure")
+        server = self.server(factory.make_name('omapi_key'))
+        with ExpectedException(exceptions.CannotConfigureDHCP):
+            yield dhcp.configure_hosts(
+                server, factory.make_name("fingerprint"), [], [], [])
+        self.assertThat(configure, MockNotCalled())
+
+    @inlineCallbacks
+    def test__raises_CannotConfigureDHCP_when_fingerprint_differs(self):
+        configure = self.patch_autospec(dhcp, "configure")
+        omapi_key = factory.make_name('omapi_key')
+        self.make_state(omapi_key, [make_host()])
+        server = self.server(omapi_key)
+        with ExpectedException(exceptions.CannotConfigureDHCP):
+            yield dhcp.configure_hosts(
+                server, factory.make_name("fingerprint"), [], [], [])
+        self.assertThat(configure, MockNotCalled())
+
+    @inlineCallbacks
+    def test__configures_current_state_with_changed_hosts(self):
+        configure = self.patch_autospec(dhcp, "configure")
+        configure.return_value = succeed(None)
+        omapi_key = factory.make_name('omapi_key')
+        hosts = [make_host(dhcp_snippets=[]) for _ in range(3)]
+        state = self.make_state(omapi_key, hosts)
+        removed_host = hosts[0]
+        modified_host = dict(hosts[1], ip=factory.make_ip_address())
+        added_host = make_host(dhcp_snippets=[])
+        server = self.server(omapi_key)
+        yield dhcp.configure_hosts(
+            server, state.fingerprint(), [{"mac": removed_host["mac"]}],
+            [added_host], [modified_host])
+        self.assertThat(configure, MockCalledOnceWith(
+            server, state.failover_peers, state.shared_networks, ANY, [
+                {"name": name}
+                for name in state.interfaces
+            ], state.global_dhcp_snippets))
+        [_, _, _, configured_hosts, _, _], _ = configure.call_args
+        self.assertItemsEqual(
+            [modified_host, hosts[2], added_host], configured_hosts)
+
+
 class TestValidateDHCP(MAASTestCase):
 
     scenarios = (
@@ -35,6 +35,7 @@ from maastesting.twisted import (
 from provisioningserver.drivers.power import (
     DEFAULT_WAITING_POLICY,
     get_error_message as get_driver_error_message,
+    PowerAuthError,
     PowerError,
 )
 from provisioningserver.drivers.power.registry import PowerDriverRegistry
@@ -54,7 +55,6 @@ from testtools.deferredruntest import assert_fails_with
 from testtools.matchers import (
     Equals,
     IsInstance,
-    Not,
 )
 from twisted.internet import reactor
 from twisted.internet.defer import (
@@ -988,194 +988,205 @@ class TestPowerQueryAsync(MAASTestCase):
             'system_id': system_id,
         }
 
-    def make_nodes(self, count=3):
-        nodes = [self.make_node() for _ in range(count)]
-        # Sanity check that these nodes are something that can emerge
-        # from a call to ListNodePowerParameters.
-        region.ListNodePowerParameters.makeResponse({"nodes": nodes}, None)
+    def make_ipmi_nodes(self, count=3):
+        """Make nodes which can be queried together by the IPMI driver."""
+        context = {
+            'power_driver': 'LAN_2_0',
+            'power_user': factory.make_name('power_user'),
+            'power_pass': factory.make_name('power_pass'),
+        }
+        nodes = [self.make_node(power_type='ipmi') for _ in range(count)]
+        for node in nodes:
+            node['power_state'] = random.choice(['on', 'off'])
+            node['context'] = dict(
+                context, power_address=factory.make_ipv4_address())
         return nodes
 
-    def pick_alternate_state(self, state):
-        return random.choice([
-            value for value in ['on', 'off', 'unknown', 'error']
-            if value != state])
+    def patch_query_group(self, result):
+        power_driver = PowerDriverRegistry['ipmi']
+        self.patch(power_driver, 'detect_missing_packages').return_value = []
+        query_group = self.patch(power_driver, 'query_group')
+        query_group.return_value = result
+        return query_group
 
     @inlineCallbacks
-    def test_query_all_nodes_gets_and_reports_power_state(self):
-        nodes = self.make_nodes()
-
-        # Report back that all nodes' power states are as recorded.
-        power_states = [node['power_state'] for node in nodes]
-        queries = list(map(succeed, power_states))
+    def test_query_node_gets_and_reports_power_state(self):
+        node = self.make_node()
+        query = succeed(node['power_state'])
         get_power_state = self.patch(power, 'get_power_state')
-        get_power_state.side_effect = queries
+        get_power_state.return_value = query
         report_power_state = self.patch(power, 'report_power_state')
         report_power_state.side_effect = lambda d, sid, hn: d
 
-        yield power.query_all_nodes(nodes)
-        self.assertThat(get_power_state, MockCallsMatch(*(
-            call(
-                node['system_id'], node['hostname'],
-                node['power_type'], node['context'],
-                clock=reactor)
-            for node in nodes
-        )))
-        self.assertThat(report_power_state, MockCallsMatch(*(
-            call(query, node['system_id'], node['hostname'])
-            for query, node in zip(queries, nodes)
-        )))
+        power_state = yield power.query_node(node, reactor)
+        self.assertEqual(node['power_state'], power_state)
+        self.assertThat(get_power_state, MockCalledOnceWith(
+            node['system_id'], node['hostname'],
+            node['power_type'], node['context'], clock=reactor))
+        self.assertThat(report_power_state, MockCalledOnceWith(
+            query, node['system_id'], node['hostname']))
 
     @inlineCallbacks
-    def test_query_all_nodes_skips_nodes_in_action_registry(self):
-        nodes = self.make_nodes()
-
-        # First node is in the registry.
-        power.power_action_registry[nodes[0]['system_id']] = sentinel.action
-
-        # Report back power state of nodes' not in registry.
-        power_states = [node['power_state'] for node in nodes[1:]]
+    def test_query_node_skips_node_in_action_registry(self):
+        node = self.make_node()
+        power.power_action_registry[node['system_id']] = sentinel.action
+        self.addCleanup(power.power_action_registry.pop, node['system_id'])
         get_power_state = self.patch(power, 'get_power_state')
-        get_power_state.side_effect = map(succeed, power_states)
         suppress_reporting(self)
 
-        yield power.query_all_nodes(nodes)
-        self.assertThat(get_power_state, MockCallsMatch(*(
-            call(
-                node['system_id'], node['hostname'],
-                node['power_type'], node['context'],
-                clock=reactor)
-            for node in nodes[1:]
-        )))
-        self.assertThat(
-            get_power_state, Not(MockCalledWith(
-                nodes[0]['system_id'], nodes[0]['hostname'],
-                nodes[0]['power_type'], nodes[0]['context'],
-                clock=reactor)))
+        power_state = yield power.query_node(node, reactor)
+        self.assertIsNone(power_state)
+        self.assertThat(get_power_state, MockNotCalled())
 
     @inlineCallbacks
-    def test_query_all_nodes_only_queries_queryable_power_types(self):
-        nodes = self.make_nodes()
-        # nodes are all queryable, so add one that isn't:
-        nodes.append(self.make_node(power_type='manual'))
+    def test_query_node_group_queries_group_at_once(self):
+        nodes = self.make_ipmi_nodes()
+        query_group = self.patch_query_group(succeed({
+            node['system_id']: node['power_state'] for node in nodes}))
+
+        results = yield power.query_node_group(nodes)
+        self.assertThat(query_group, MockCalledOnceWith({
+            node['system_id']: node['context'] for node in nodes}))
+        self.assertEqual(
+            {node['system_id']: node['power_state'] for node in nodes},
+            results)
 
-        # Report back that all nodes' power states are as recorded.
-        power_states = [node['power_state'] for node in nodes]
-        get_power_state = self.patch(power, 'get_power_state')
-        get_power_state.side_effect = map(succeed, power_states)
-        suppress_reporting(self)
+    @inlineCallbacks
+    def test_query_node_group_leaves_out_nodes_it_cannot_tell_about(self):
+        nodes = self.make_ipmi_nodes()
+        self.patch_query_group(succeed({
+            nodes[0]['system_id']: nodes[0]['power_state'],
+            nodes[1]['system_id']: PowerError("unknown"),
+        }))
+
+        results = yield power.query_node_group(nodes)
+        self.assertEqual(
+            {nodes[0]['system_id']: nodes[0]['power_state']}, results)
+
+    @inlineCallbacks
+    def test_query_node_group_returns_nothing_when_group_query_fails(self):
+        nodes = self.make_ipmi_nodes(2)
+        self.patch_query_group(fail(ZeroDivisionError()))
 
-        yield power.query_all_nodes(nodes)
-        self.assertThat(get_power_state, MockCallsMatch(*(
-            call(
-                node['system_id'], node['hostname'],
-                node['power_type'], node['context'],
-                clock=reactor)
-            for node in nodes
-            if node['power_type'] in PowerDriverRegistry
-        )))
+        with TwistedLoggerFixture():
+            results = yield power.query_node_group(nodes)
+        self.assertEqual({}, results)
 
     @inlineCallbacks
-    def test_query_all_nodes_swallows_PowerActionFail(self):
-        node1, node2 = self.make_nodes(2)
-        new_state_2 = self.pick_alternate_state(node2['power_state'])
+    def test_query_node_group_returns_fatal_errors_as_failures(self):
+        nodes = self.make_ipmi_nodes(2)
+        error = PowerAuthError(factory.make_name("error"))
+        self.patch_query_group(succeed({
+            nodes[0]['system_id']: error,
+            nodes[1]['system_id']: nodes[1]['power_state'],
+        }))
+
+        results = yield power.query_node_group(nodes)
+        self.assertThat(results[nodes[0]['system_id']], IsInstance(Failure))
+        self.assertIs(error, results[nodes[0]['system_id']].value)
+        self.assertEqual(
+            nodes[1]['power_state'], results[nodes[1]['system_id']])
+
+    @inlineCallbacks
+    def test_query_node_group_leaves_it_to_nodes_without_packages(self):
+        nodes = self.make_ipmi_nodes(2)
+        query_group = self.patch_query_group(succeed({}))
+        self.patch(
+            PowerDriverRegistry['ipmi'],
+            'detect_missing_packages').return_value = ['freeipmi-tools']
+
+        results = yield power.query_node_group(nodes)
+        self.assertEqual({}, results)
+        self.assertThat(query_group, MockNotCalled())
+
+    def test_group_power_queries_groups_by_query_group(self):
+        nodes = self.make_ipmi_nodes(3)
+        other = self.make_ipmi_nodes(2)
+        for node in other:
+            node['context']['power_user'] = factory.make_name('power_user')
+        # Lone nodes are not grouped.
+        lone = self.make_ipmi_nodes(1)
+        self.assertEqual(
+            [nodes, other], power.group_power_queries(nodes + other + lone))
+
+    def test_group_power_queries_limits_group_size(self):
+        self.patch(PowerDriverRegistry['ipmi'], 'query_group_size', 2)
+        nodes = self.make_ipmi_nodes(5)
+        self.assertEqual(
+            [nodes[0:2], nodes[2:4]], power.group_power_queries(nodes))
+
+    def test_group_power_queries_skips_nodes_in_action_registry(self):
+        nodes = self.make_ipmi_nodes(3)
+        power.power_action_registry[nodes[0]['system_id']] = sentinel.action
+        self.addCleanup(
+            power.power_action_registry.pop, nodes[0]['system_id'])
+        self.assertEqual([nodes[1:]], power.group_power_queries(nodes))
+
+    @inlineCallbacks
+    def test_query_node_swallows_PowerActionFail(self):
+        node = self.make_node()
         get_power_state = self.patch(power, 'get_power_state')
         error_msg = factory.make_name("error")
-        get_power_state.side_effect = [
-            fail(exceptions.PowerActionFail(error_msg)),
-            succeed(new_state_2),
-        ]
+        get_power_state.return_value = fail(
+            exceptions.PowerActionFail(error_msg))
         suppress_reporting(self)
 
         with FakeLogger("maas.power", level=logging.DEBUG) as maaslog:
-            yield power.query_all_nodes([node1, node2])
+            power_state = yield power.query_node(node, reactor)
 
+        self.assertIsNone(power_state)
         self.assertDocTestMatches(
-            """\
-            hostname-...: Could not query power state: %s.
-            hostname-...: Power state has changed from ... to ...
-            """ % error_msg,
+            "%s: Could not query power state: %s." % (
+                node['hostname'], error_msg),
             maaslog.output)
 
     @inlineCallbacks
-    def test_query_all_nodes_swallows_PowerError(self):
-        node1, node2 = self.make_nodes(2)
-        new_state_2 = self.pick_alternate_state(node2['power_state'])
+    def test_query_node_swallows_PowerError(self):
+        node = self.make_node()
         get_power_state = self.patch(power, 'get_power_state')
         error_msg = factory.make_name("error")
-        get_power_state.side_effect = [
-            fail(PowerError(error_msg)),
-            succeed(new_state_2),
-        ]
+        get_power_state.return_value = fail(PowerError(error_msg))
         suppress_reporting(self)
 
         with FakeLogger("maas.power", level=logging.DEBUG) as maaslog:
-            yield power.query_all_nodes([node1, node2])
+            power_state = yield power.query_node(node, reactor)
 
+        self.assertIsNone(power_state)
         self.assertDocTestMatches(
-            """\
-            %s: Could not query power state: %s.
-            %s: Power state has changed from %s to %s.
-            """ % (node1['hostname'], error_msg,
-                   node2['hostname'], node2['power_state'], new_state_2),
+            "%s: Could not query power state: %s." % (
+                node['hostname'], error_msg),
             maaslog.output)
 
     @inlineCallbacks
-    def test_query_all_nodes_swallows_NoSuchNode(self):
-        node1, node2 = self.make_nodes(2)
-        new_state_2 = self.pick_alternate_state(node2['power_state'])
+    def test_query_node_swallows_NoSuchNode(self):
+        node = self.make_node()
         get_power_state = self.patch(power, 'get_power_state')
-        get_power_state.side_effect = [
-            fail(exceptions.NoSuchNode()),
-            succeed(new_state_2),
-        ]
+        get_power_state.return_value = fail(exceptions.NoSuchNode())
         suppress_reporting(self)
 
         with FakeLogger("maas.power", level=logging.DEBUG) as maaslog:
-            yield power.query_all_nodes([node1, node2])
+            power_state = yield power.query_node(node, reactor)
 
-        self.assertDocTestMatches(
-            """\
-            hostname-...: Power state has changed from ... to ...
-            """,
-            maaslog.output)
+        self.assertIsNone(power_state)
+        self.assertEqual("", maaslog.output)
 
     @inlineCallbacks
-    def test_query_all_nodes_swallows_Exception(self):
-        node1, node2 = self.make_nodes(2)
+    def test_query_node_swallows_Exception(self):
+        node = self.make_node()
         error_message = factory.make_name("error")
         error_type = factory.make_exception_type()
-        new_state_2 = self.pick_alternate_state(node2['power_state'])
         get_power_state = self.patch(power, 'get_power_state')
-        get_power_state.side_effect = [
-            fail(error_type(error_message)),
-            succeed(new_state_2),
-        ]
+        get_power_state.return_value = fail(error_type(error_message))
         suppress_reporting(self)
 
         maaslog = FakeLogger("maas.power", level=logging.DEBUG)
         twistlog = TwistedLoggerFixture()
 
         with maaslog, twistlog:
-            yield power.query_all_nodes([node1, node2])
+            power_state = yield power.query_node(node, reactor)
 
+        self.assertIsNone(power_state)
         self.assertDocTestMatches(
-            """\
-            hostname-...: Failed to refresh power state: %s
-            hostname-...: Power state has changed from ... to ...
-            """ % error_message,
+            "%s: Failed to refresh power state: %s" % (
+                node['hostname'], error_message),
             maaslog.output)
-
-    @inlineCallbacks
-    def test_query_all_nodes_returns_deferredlist_of_number_of_nodes(self):
-        node1, node2 = self.make_nodes(2)
-        get_power_state = self.patch(power, 'get_power_state')
-        get_power_state.side_effect = [
-            succeed(node1['power_state']),
-            succeed(node2['power_state']),
-        ]
-        suppress_reporting(self)
-
-        results = yield power.query_all_nodes([node1, node2])
-        self.assertEqual(
-            [(True, node1['power_state']), (True, node2['power_state'])],
-            results)
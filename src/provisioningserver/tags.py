@@ -4,15 +4,20 @@
 """Cluster-side evaluation of tags."""
 
 __all__ = [
+    'evaluate_tags_for_nodes',
     'merge_details',
     'merge_details_cleanly',
     'process_node_tags',
     ]
 
 from collections import OrderedDict
-from functools import partial
+from functools import (
+    lru_cache,
+    partial,
+)
 import http.client
 import json
+import random
 import urllib.error
 import urllib.parse
 import urllib.request
@@ -38,6 +43,11 @@ maaslog = get_maas_logger("tag_processing")
 # face of it, appears excessive.
 DEFAULT_BATCH_SIZE = 100
 
+# The number of merged details documents kept by `parsed_details_cache` in
+# each process. A parsed lshw document takes several times the memory of
+# its XML, so this is deliberately modest.
+PARSED_DETAILS_CACHE_SIZE = 500
+
 
 def process_response(response):
     """All responses should be httplib.OK.
@@ -315,3 +325,103 @@ def process_node_tags(
     process_all(
         client, rack_id, tag_name, tag_definition, system_ids, xpath,
         batch_size=batch_size)
+
+
+class ParsedDetailsCache:
+    """A bounded cache of merged details documents, keyed by system ID.
+
+    Each document is stored with the fingerprint of the details it was
+    merged from, and is only returned for that same fingerprint; a node's
+    document is therefore invalidated as soon as its details change. When
+    full, a random document is evicted: unlike LRU, this keeps some of the
+    documents around when every node is evaluated in turn.
+    """
+
+    def __init__(self, size=PARSED_DETAILS_CACHE_SIZE):
+        self.size = size
+        self.documents = {}
+
+    def __len__(self):
+        return len(self.documents)
+
+    def get(self, system_id, fingerprint):
+        """Return the document for `system_id`, or `None`."""
+        entry = self.documents.get(system_id)
+        if entry is not None and entry[0] == fingerprint:
+            return entry[1]
+        else:
+            return None
+
+    def set(self, system_id, fingerprint, document):
+        """Store the document merged from the details of `system_id`."""
+        if system_id not in self.documents:
+            if self.size <= 0:
+                return
+            elif len(self.documents) >= self.size:
+                del self.documents[random.choice(list(self.documents))]
+        self.documents[system_id] = fingerprint, document
+
+
+# Merged details documents for the nodes evaluated in this process.
+parsed_details_cache = ParsedDetailsCache()
+
+
+@lru_cache(maxsize=256)
+def compile_tag_definition(definition, nsmap):
+    """Compile the XPath expression `definition`.
+
+    :param nsmap: The namespaces to compile `definition` with, as a tuple of
+        ``(prefix, uri)`` pairs.
+    :return: An `etree.XPath`, or `None` if `definition` is invalid.
+    """
+    try:
+        return etree.XPath(definition, namespaces=dict(nsmap))
+    except etree.XPathSyntaxError as error:
+        maaslog.warning("Invalid expression '%s': %s", definition, error)
+        return None
+
+
+def evaluate_tags_for_nodes(
+        definitions, nsmap, nodes, cache=parsed_details_cache):
+    """Evaluate many tag definitions against the details of many nodes.
+
+    Each definition is compiled once, and each node's details are merged at
+    most once, after which every definition is evaluated against the merged
+    document in one pass. This is a plain function of plain arguments so
+    that it can be run in a process pool.
+
+    :param definitions: A sequence of XPath expressions.
+    :param nsmap: The namespaces to compile `definitions` with, as a tuple of
+        ``(prefix, uri)`` pairs.
+    :param nodes: An iterable of ``(system_id, fingerprint, details)``
+        tuples, where `details` is as accepted by `merge_details`, or `None`
+        if the merged document is expected to be in `cache` already.
+    :param cache: A `ParsedDetailsCache`, or `None`.
+    :return: A ``(matches, missing)`` tuple. `matches` maps the system ID of
+        each node evaluated to a list of the indexes in `definitions` of the
+        expressions that matched it. `missing` lists the system IDs given
+        without details that were not in `cache`.
+    """
+    xpaths = [
+        (index, compile_tag_definition(definition, nsmap))
+        for index, definition in enumerate(definitions)
+    ]
+    xpaths = [
+        (index, xpath) for index, xpath in xpaths
+        if xpath is not None
+    ]
+    matches, missing = {}, []
+    for system_id, fingerprint, details in nodes:
+        doc = None if cache is None else cache.get(system_id, fingerprint)
+        if doc is None:
+            if details is None:
+                missing.append(system_id)
+                continue
+            doc = merge_details(details)
+            if cache is not None:
+                cache.set(system_id, fingerprint, doc)
+        matches[system_id] = [
+            index for index, xpath in xpaths
+            if try_match_xpath(xpath, doc, logger=maaslog)
+        ]
+    return matches, missing
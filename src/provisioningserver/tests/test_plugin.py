@@ -38,6 +38,9 @@ from provisioningserver.rackdservices.networks_monitoring_service import (
 from provisioningserver.rackdservices.node_power_monitor_service import (
     NodePowerMonitorService,
 )
+from provisioningserver.rackdservices.pod_sessions_service import (
+    PodSessionsService,
+)
 from provisioningserver.rackdservices.service_monitor_service import (
     ServiceMonitorService,
 )
@@ -107,7 +110,7 @@ class TestProvisioningServiceMaker(MAASTestCase):
             "dhcp_probe", "networks_monitor", "image_download",
             "lease_socket_service", "node_monitor", "external",
             "rpc", "rpc-ping", "http", "http_service", "tftp",
-            "service_monitor",
+            "service_monitor", "pod_sessions",
         ]
         self.assertThat(service.namedServices, KeysEqual(*expected_services))
         self.assertEqual(
@@ -133,7 +136,7 @@ class TestProvisioningServiceMaker(MAASTestCase):
             "dhcp_probe", "networks_monitor", "image_download",
             "lease_socket_service", "node_monitor", "external",
             "rpc", "rpc-ping", "http", "http_service", "tftp",
-            "service_monitor",
+            "service_monitor", "pod_sessions",
         ]
         self.assertThat(service.namedServices, KeysEqual(*expected_services))
         self.assertEqual(
@@ -183,6 +186,13 @@ class TestProvisioningServiceMaker(MAASTestCase):
         node_monitor = service.getServiceNamed("node_monitor")
         self.assertIsInstance(node_monitor, NodePowerMonitorService)
 
+    def test_pod_sessions_service(self):
+        options = Options()
+        service_maker = ProvisioningServiceMaker("Harry", "Hill")
+        service = service_maker.makeService(options, clock=None)
+        pod_sessions = service.getServiceNamed("pod_sessions")
+        self.assertIsInstance(pod_sessions, PodSessionsService)
+
     def test_networks_monitor_service(self):
         options = Options()
         service_maker = ProvisioningServiceMaker("Spike", "Milligan")
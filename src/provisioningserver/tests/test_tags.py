@@ -614,3 +614,76 @@ class TestTagUpdating(MAASTestCase):
                 tag_url, as_json=True, op='update_nodes',
                 rack_controller=rack_id, definition=tag_definition,
                 add=['system-id1'], remove=['system-id2']))
+
+
+class TestParsedDetailsCache(MAASTestCase):
+
+    def test__returns_document_for_same_fingerprint_only(self):
+        cache = tags.ParsedDetailsCache()
+        cache.set("s1", "fp1", sentinel.document)
+        self.assertIs(sentinel.document, cache.get("s1", "fp1"))
+        self.assertIsNone(cache.get("s1", "fp2"))
+        self.assertIsNone(cache.get("s2", "fp1"))
+
+    def test__replaces_document_for_node(self):
+        cache = tags.ParsedDetailsCache(size=1)
+        cache.set("s1", "fp1", sentinel.document1)
+        cache.set("s1", "fp2", sentinel.document2)
+        self.assertIs(sentinel.document2, cache.get("s1", "fp2"))
+        self.assertEqual(1, len(cache))
+
+    def test__evicts_document_when_full(self):
+        cache = tags.ParsedDetailsCache(size=2)
+        for system_id in ("s1", "s2", "s3"):
+            cache.set(system_id, "fp", sentinel.document)
+        self.assertEqual(2, len(cache))
+        self.assertIsNotNone(cache.get("s3", "fp"))
+
+    def test__stores_nothing_when_size_is_zero(self):
+        cache = tags.ParsedDetailsCache(size=0)
+        cache.set("s1", "fp", sentinel.document)
+        self.assertEqual(0, len(cache))
+
+
+class TestEvaluateTagsForNodes(MAASTestCase):
+
+    nsmap = (("lldp", "lldp"), ("lshw", "lshw"))
+
+    def test__evaluates_all_definitions_against_each_node(self):
+        matches, missing = tags.evaluate_tags_for_nodes(
+            ["/foo", "//lldp:bar", "/baz"], self.nsmap, [
+                ("s1", "fp", {"lshw": b"<foo/>", "lldp": b"<bar/>"}),
+                ("s2", "fp", {"lshw": b"<baz/>", "lldp": None}),
+            ], cache=None)
+        self.assertEqual({"s1": [0, 1], "s2": [2]}, matches)
+        self.assertEqual([], missing)
+
+    def test__uses_cached_documents(self):
+        cache = tags.ParsedDetailsCache()
+        merge_details = self.patch(tags, "merge_details")
+        details = {"lshw": b"<foo/>"}
+        merge_details.side_effect = lambda details: etree.ElementTree(
+            etree.fromstring(details["lshw"]))
+        tags.evaluate_tags_for_nodes(
+            ["/foo"], self.nsmap, [("s1", "fp", details)], cache=cache)
+        matches, missing = tags.evaluate_tags_for_nodes(
+            ["/foo"], self.nsmap, [("s1", "fp", None)], cache=cache)
+        self.assertEqual({"s1": [0]}, matches)
+        self.assertEqual([], missing)
+        self.assertThat(merge_details, MockCalledOnceWith(details))
+
+    def test__reports_nodes_missing_from_cache(self):
+        matches, missing = tags.evaluate_tags_for_nodes(
+            ["/foo"], self.nsmap, [("s1", "fp", None)],
+            cache=tags.ParsedDetailsCache())
+        self.assertEqual({}, matches)
+        self.assertEqual(["s1"], missing)
+
+    def test__ignores_invalid_definitions(self):
+        tags.compile_tag_definition.cache_clear()
+        with FakeLogger("maas") as logger:
+            matches, _ = tags.evaluate_tags_for_nodes(
+                ["/foo[", "/foo"], self.nsmap,
+                [("s1", "fp", {"lshw": b"<foo/>"})], cache=None)
+        self.assertEqual({"s1": [1]}, matches)
+        self.assertIn("Invalid expression '/foo['", logger.output)
@@ -13,6 +13,7 @@ from collections import namedtuple
 from datetime import datetime
 import json
 import os
+import socket
 import stat
 import struct
 import subprocess
@@ -62,6 +63,12 @@ ARPPacket = namedtuple('ARPPacket', (
 
 SIZEOF_ARP_PACKET = 28
 
+# Definitions used to decode ARP bindings in batches, straight from the
+# captured Ethernet frames.
+ARP_BINDING_FIELDS = struct.Struct('!HHBBH6s4s6s4s')
+NULL_MAC = b'\x00' * 6
+NULL_IP = b'\x00' * 4
+
 
 class ARP_OPERATION:
     """Enumeration to represent ARP operation types."""
@@ -291,6 +298,90 @@ def update_and_print_bindings(bindings, arp, out=sys.stdout):
             out.flush()
 
 
+def decode_arp_bindings(packets):
+    """Decodes the (MAC, IP) bindings found in a batch of captured packets.
+
+    This is equivalent to creating an `Ethernet` and an `ARP` for each packet
+    and calling `ARP.bindings()`, but decodes only the fields needed, and
+    leaves the addresses as bytes.
+
+    :param packets: list of (time, packet) tuples, as returned by
+        `PCAP.read_batch()`.
+    :return: list of (vid, ip, mac, time) tuples, where `ip` and `mac` are
+        the bytes found in the packet.
+    """
+    unpack = ARP_BINDING_FIELDS.unpack_from
+    bindings = []
+    for time, packet in packets:
+        ethertype = packet[12:14]
+        if ethertype == ETHERTYPE.VLAN:
+            # The VLAN is the lower 12 bits; the upper 4 bits are for QoS.
+            vid = bytes_to_int(packet[14:16]) & 0xFFF
+            ethertype = packet[16:18]
+            offset = 18
+        else:
+            vid = None
+            offset = 14
+        if ethertype != ETHERTYPE.ARP:
+            continue
+        if len(packet) < offset + SIZEOF_ARP_PACKET:
+            continue
+        (hardware_type, protocol, hardware_length, protocol_length, operation,
+         sender_mac, sender_ip, target_mac, target_ip) = unpack(packet, offset)
+        # See `ARP.is_valid()`.
+        if (hardware_type != 1 or protocol != 0x800 or
+                hardware_length != 6 or protocol_length != 4):
+            continue
+        if operation == 1 or operation == 2:
+            if sender_ip != NULL_IP and sender_mac != NULL_MAC:
+                bindings.append((vid, sender_ip, sender_mac, time))
+        if operation == 2:
+            if target_ip != NULL_IP and target_mac != NULL_MAC:
+                bindings.append((vid, target_ip, target_mac, time))
+    return bindings
+
+
+def update_bindings_and_get_events(bindings, observed):
+    """Update the specified bindings dictionary with a batch of bindings, and
+    return a list of the resulting events.
+
+    This is the batch equivalent of `update_bindings_and_get_event`, and
+    emits the same events. The bindings dictionary is keyed on (vid, ip),
+    and holds a [mac, time] list for each binding, where the IP and MAC
+    addresses are kept as bytes. They are only formatted when an event is
+    emitted, so that repeated bindings cost no more than a lookup.
+
+    :param observed: list of (vid, ip, mac, time) tuples, as returned by
+        `decode_arp_bindings()`.
+    """
+    events = []
+    for vid, ip, mac, time in observed:
+        binding = bindings.get((vid, ip))
+        if binding is None:
+            bindings[(vid, ip)] = [mac, time]
+            events.append(dict(
+                ip=socket.inet_ntoa(ip), mac=_format_mac(mac), time=time,
+                event="NEW", vid=vid))
+        elif binding[0] != mac:
+            previous_mac = binding[0]
+            binding[0] = mac
+            binding[1] = time
+            events.append(dict(
+                ip=socket.inet_ntoa(ip), mac=_format_mac(mac), time=time,
+                event="MOVED", previous_mac=_format_mac(previous_mac),
+                vid=vid))
+        elif time - binding[1] >= SEEN_AGAIN_THRESHOLD:
+            binding[1] = time
+            events.append(dict(
+                ip=socket.inet_ntoa(ip), mac=_format_mac(mac), time=time,
+                event="REFRESHED", vid=vid))
+    return events
+
+
+def _format_mac(mac):
+    return format_eui(EUI(bytes_to_int(mac)))
+
+
 def observe_arp_packets(
         verbose=False, bindings=False, input=sys.stdin.buffer,
         output=sys.stdout):
@@ -314,6 +405,20 @@ def observe_arp_packets(
             # Not an Ethernet interface. Need to exit here, because our
             # assumptions about the link layer header won't be correct.
             return 4
+        if bindings is not None and not verbose:
+            # Only the bindings are needed, so decode packets in batches,
+            # and write all the resulting events at once.
+            while True:
+                try:
+                    packets = pcap.read_batch()
+                except EOFError:
+                    return None
+                events = update_bindings_and_get_events(
+                    bindings, decode_arp_bindings(packets))
+                if len(events) > 0:
+                    output.write("".join(
+                        "%s\n" % json.dumps(event) for event in events))
+                    output.flush()
         for header, packet in pcap:
             ethernet = Ethernet(packet, time=header.timestamp_seconds)
             if not ethernet.is_valid():
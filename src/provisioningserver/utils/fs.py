@@ -9,6 +9,7 @@ __all__ = [
     'atomic_symlink',
     'atomic_write',
     'FileLock',
+    'get_file_version',
     'get_library_script_path',
     'incremental_write',
     'NamedLock',
@@ -385,6 +386,20 @@ def read_text_file(path, encoding='utf-8'):
         return infile.read()
 
 
+def get_file_version(path):
+    """Return the mtime and size of `path`, or None if it cannot be read.
+
+    While the version of a file, or of a directory, is unchanged, its
+    content is assumed to be unchanged too.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    else:
+        return stat.st_mtime_ns, stat.st_size
+
+
 def write_text_file(path, text, encoding='utf-8'):
     """Write the given unicode text to the given file path.
 
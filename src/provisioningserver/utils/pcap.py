@@ -20,6 +20,10 @@ import sys
 PCAP_NATIVE_BYTE_ORDER_MAGIC_NUMBER = 0xa1b2c3d4
 PCAP_HEADER_SIZE = 24
 PCAP_PACKET_HEADER_SIZE = 16
+PCAP_PACKET_HEADER = struct.Struct('IIII')
+
+# The most to read from the stream at once when reading in batches.
+PCAP_BATCH_READ_SIZE = 65536
 
 PCAPHeader = namedtuple('PCAPHeader', (
     'magic_number',
@@ -64,6 +68,7 @@ class PCAP:
        """
         super().__init__()
         self.stream = stream
+        self._buffer = b''
         global_header_bytes = stream.read(PCAP_HEADER_SIZE)
         if len(global_header_bytes) == 0:
             raise EOFError("No PCAP output found.")
@@ -113,6 +118,44 @@ class PCAP:
             raise PCAPError("Unexpected end of PCAP stream: invalid packet.")
         return pcap_packet_header, packet
 
+    def read_batch(self, size=PCAP_BATCH_READ_SIZE):
+        """Reads all the packets available in the PCAP stream.
+
+        Reads at most `size` bytes, returning as soon as any data is
+        available, and parses every complete packet found. Bytes of an
+        incomplete packet are kept for the next call. This avoids two reads
+        and a header object per packet when traffic is heavy.
+
+        This must not be mixed with calls to `read()`.
+
+        :returns: a list of (timestamp_seconds, packet) tuples, which is
+            empty if only part of a packet was available.
+        :raise EOFError: If the stream has ended after the last packet.
+        :raise PCAPError: If the stream ended part way through a packet.
+        """
+        read = getattr(self.stream, "read1", self.stream.read)
+        data = read(size)
+        if len(data) == 0:
+            if len(self._buffer) == 0:
+                raise EOFError("End of PCAP stream.")
+            else:
+                raise PCAPError(
+                    "Unexpected end of PCAP stream: invalid packet.")
+        buffer = self._buffer + data if self._buffer else data
+        unpack_header = PCAP_PACKET_HEADER.unpack_from
+        end = len(buffer)
+        offset = 0
+        packets = []
+        while offset + PCAP_PACKET_HEADER_SIZE <= end:
+            seconds, _, captured, _ = unpack_header(buffer, offset)
+            start = offset + PCAP_PACKET_HEADER_SIZE
+            if start + captured > end:
+                break
+            packets.append((seconds, buffer[start:start + captured]))
+            offset = start + captured
+        self._buffer = buffer[offset:]
+        return packets
+
     def __iter__(self):
         """Iterate this PCAP stream.
 
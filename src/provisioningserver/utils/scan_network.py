@@ -29,6 +29,11 @@ from provisioningserver.utils.shell import (
     get_env_with_locale,
     has_command_available,
 )
+from provisioningserver.utils.sweep import (
+    DEFAULT_RATE,
+    SLOW_RATE,
+    sweep_scan,
+)
 
 
 PingParameters = namedtuple('PingParameters', ('interface', 'ip'))
@@ -53,23 +58,39 @@ def add_arguments(parser):
         If no arguments are provided, checks all IPv4 addresses on all
         configured CIDRs on each interface.
 
-        If nmap is not installed, this command could take a very long time if
-        there are a large amount of hosts connected directly to any attached
-        networks.
+        By default, each address is sent an ARP request (or an ICMP echo, if
+        --icmp is specified) from a raw socket, with all interfaces swept
+        concurrently at a limited rate. This requires the CAP_NET_RAW
+        capability; without it, nmap is used if installed, otherwise ping.
+        Scanning with ping could take a very long time if there are a large
+        amount of hosts connected directly to any attached networks.
 
         This command only considers IPv4 CIDRs. (IPv6 CIDRs are excluded.)
         """)
     parser.add_argument(
         '-s', '--slow', action='store_true', required=False,
-        help='Scan slower. Only applies to nmap scans; ping is slow already.')
+        help='Scan slower. Only applies to sweeps and nmap scans; ping is '
+             'slow already.')
     parser.add_argument(
         '-t', '--threads', required=False, type=int,
         help='Number of concurrent threads to spawn during a scan. '
              'Default is to spawn four times the number of CPUs when using '
-             'ping, or one times the number of CPUs when using nmap.')
+             'ping, or one times the number of CPUs when using nmap. '
+             'Ignored by sweeps, which send from a single thread.')
     parser.add_argument(
         '-p', '--ping', action='store_true', required=False,
-        help='Scan using ping. (Default is to scan with nmap, if installed.)')
+        help='Scan using ping. (Default is to sweep using raw sockets.)')
+    parser.add_argument(
+        '-n', '--nmap', action='store_true', required=False,
+        help='Scan using nmap, if installed. (Default is to sweep using raw '
+             'sockets.)')
+    parser.add_argument(
+        '-i', '--icmp', action='store_true', required=False,
+        help='Sweep using ICMP echo requests rather than ARP requests.')
+    parser.add_argument(
+        '-r', '--rate', required=False, type=int,
+        help='Maximum number of packets per second to send during a sweep. '
+             'Default is %d, or %d with --slow.' % (DEFAULT_RATE, SLOW_RATE))
     parser.add_argument(
         'interface', type=str, nargs='?',
         help="Ethernet interface to ping from. Optional if all interfaces are "
@@ -389,18 +410,58 @@ def adjust_scanning_parameters(
     return ifname_to_scan
 
 
-def scan_networks(args, to_scan, stderr, stdout):
+def get_sweep_rate(args) -> int:
+    """Returns the maximum packets per second to send during a sweep."""
+    if args.rate is not None:
+        return args.rate
+    elif args.slow:
+        return SLOW_RATE
+    else:
+        return DEFAULT_RATE
+
+
+def scan_networks(args, to_scan, stderr, stdout, interfaces=None):
     """Interprets the specified `args` and `to_scan` dict to perform the scan.
 
     Uses the specified `stdout` and `stderr` for output.
+
+    :param interfaces: the output of `get_all_interfaces_definition()`, used
+        to choose the source address of each ARP request in a sweep.
     """
     # Start the clock. (We want to measure how long the scan takes.)
     clock = time.monotonic()
-    # The user must explicitly opt out of using `nmap` by selecting --ping,
-    # unless `nmap` is not installed.
+    # The user must explicitly opt out of sweeping by selecting --ping or
+    # --nmap. Sweeping falls back to `nmap` (if installed) or `ping` if a raw
+    # socket cannot be opened.
+    sweeper = None
+    if not args.ping and not args.nmap:
+        rate = get_sweep_rate(args)
+        try:
+            sweeper = sweep_scan(
+                to_scan, {} if interfaces is None else interfaces,
+                icmp=args.icmp, rate=rate)
+        except OSError as error:
+            stderr.write("Cannot sweep (%s); falling back.\n" % error)
+            stderr.flush()
     use_nmap = has_command_available('nmap')
     use_ping = args.ping
-    if use_nmap and not use_ping:
+    if sweeper is not None:
+        tool = 'sweep'
+        # As with a ping scan, a sweep reports on each host.
+        count = 0
+        hosts = 0
+        for event in sweeper:
+            count += 1
+            if event['result'] is True:
+                hosts += 1
+            write_event(event, stdout)
+        clock_diff = time.monotonic() - clock
+        if count > 0:
+            stderr.write(
+                "Swept %d hosts (%d up) in %d second(s).\n" % (
+                    count, hosts, clock_diff))
+            stderr.flush()
+    elif use_nmap and not use_ping:
         tool = 'nmap'
         scanner = nmap_scan(to_scan, slow=args.slow, threads=args.threads)
         count = 0
@@ -466,7 +527,8 @@ def run(args, stdout=sys.stdout, stderr=sys.stderr):
         # user if they requested to scan a CIDR that doesn't exist.
         warn_about_missing_cidrs(ifname_to_scan, cidrs, interfaces, stderr)
 
-    result = scan_networks(args, to_scan, stderr, stdout)
+    result = scan_networks(
+        args, to_scan, stderr, stdout, interfaces=interfaces)
     if result['count'] == 0:
         stderr.write("Requested network(s) not available to scan: %s\n" % (
             ", ".join(cidrs) if len(cidrs) > 0 else ifname_to_scan))
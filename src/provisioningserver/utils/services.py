@@ -84,11 +84,15 @@ class JSONPerLineProtocol(ProcessProtocol):
 
     This expects that a UTF-8 locale is used, i.e. that text written to stdout
     and stderr by the spawned process uses the UTF-8 character set.
+
+    All the objects parsed from a single read are passed to the callback in
+    one list, so that a busy process results in fewer, larger reports.
     """
 
     def __init__(self, callback):
         super().__init__()
         self._callback = callback
+        self._objects = None
         self.done = Deferred()
 
     def connectionMade(self):
@@ -98,8 +102,15 @@ class JSONPerLineProtocol(ProcessProtocol):
 
     def outReceived(self, data):
         lines, self._outbuf = self.splitLines(self._outbuf + data)
-        for line in lines:
-            self.outLineReceived(line)
+        self._objects = []
+        try:
+            for line in lines:
+                self.outLineReceived(line)
+            objects = self._objects
+        finally:
+            self._objects = None
+        if len(objects) != 0:
+            self._callback(objects)
 
     def errReceived(self, data):
         lines, self._errbuf = self.splitLines(self._errbuf + data)
@@ -130,7 +141,10 @@ class JSONPerLineProtocol(ProcessProtocol):
             self.objectReceived(obj)
 
     def objectReceived(self, obj):
-        self._callback([obj])
+        if self._objects is None:
+            self._callback([obj])
+        else:
+            self._objects.append(obj)
 
     def errLineReceived(self, line):
         line = line.decode("utf-8")
@@ -940,6 +954,19 @@ class BeaconingSocketProtocol(DatagramProtocol):
             self.beaconReceived(beacon_json)
 
 
+def _queue_observation(queue, key, observation):
+    """Queue `observation` under `key`, merging it with a previous one.
+
+    The merged observation moves to the end of `queue`, so that the queue
+    stays in the order in which observations were last seen.
+    """
+    previous = queue.pop(key, None)
+    observation = dict(observation, count=observation.get('count', 1))
+    if previous is not None:
+        observation['count'] += previous['count']
+    queue[key] = observation
+
+
 class NetworksMonitoringLock(NamedLock):
     """Host scoped lock to ensure only one network monitoring service runs."""
 
@@ -958,6 +985,10 @@ class NetworksMonitoringService(MultiService, metaclass=ABCMeta):
 
     interval = timedelta(seconds=30).total_seconds()
 
+    # Observations of neighbours and mDNS entries are queued, de-duplicated,
+    # and reported in batches at this interval.
+    report_interval = timedelta(seconds=5).total_seconds()
+
     def __init__(
             self, clock=None, enable_monitoring=True, enable_beaconing=True):
         # Order is very important here. First we set the clock to the passed-in
@@ -978,6 +1009,9 @@ class NetworksMonitoringService(MultiService, metaclass=ABCMeta):
         self._monitoring_state = {}
         self._monitoring_mdns = False
         self._locked = False
+        # Observations waiting to be reported, in the order last seen.
+        self._neighbours = OrderedDict()
+        self._mdns_entries = OrderedDict()
         # Use a named filesystem lock to prevent more than one monitoring
         # service running on each host machine. This service attempts to
         # acquire this lock on each loop, and then it holds the lock until the
@@ -989,6 +1023,12 @@ class NetworksMonitoringService(MultiService, metaclass=ABCMeta):
         self.interface_monitor.setName("updateInterfaces")
         self.interface_monitor.clock = self.clock
         self.interface_monitor.setServiceParent(self)
+        # Set up child service to report queued observations.
+        self.report_flusher = TimerService(
+            self.report_interval, self.flushReports)
+        self.report_flusher.setName("flushReports")
+        self.report_flusher.clock = self.clock
+        self.report_flusher.setServiceParent(self)
         self.beaconing_protocol = None
 
     @inlineCallbacks
@@ -1046,6 +1086,51 @@ class NetworksMonitoringService(MultiService, metaclass=ABCMeta):
         This MUST be overridden in subclasses.
         """
 
+    def queueNeighbours(self, neighbours):
+        """Queue observed neighbours to be reported in the next batch.
+
+        Repeated observations of the same binding are merged; the latest
+        observation is kept, along with a count of how often it was seen.
+        """
+        for neighbour in neighbours:
+            key = (
+                neighbour['interface'], neighbour.get('vid', None),
+                neighbour['ip'], neighbour['mac'])
+            _queue_observation(self._neighbours, key, neighbour)
+
+    def queueMDNSEntries(self, mdns):
+        """Queue observed mDNS entries to be reported in the next batch.
+
+        Repeated observations of the same entry are merged, as for
+        `queueNeighbours`.
+        """
+        for entry in mdns:
+            key = (entry['interface'], entry['hostname'], entry['address'])
+            _queue_observation(self._mdns_entries, key, entry)
+
+    @inlineCallbacks
+    def flushReports(self):
+        """Report the queued neighbours and mDNS entries, catching and
+        logging errors.
+
+        Observations that could not be reported are dropped; they will be
+        reported again when next observed.
+        """
+        neighbours = list(self._neighbours.values())
+        mdns = list(self._mdns_entries.values())
+        self._neighbours.clear()
+        self._mdns_entries.clear()
+        if len(neighbours) > 0:
+            try:
+                yield maybeDeferred(self.reportNeighbours, neighbours)
+            except BaseException as e:
+                log.err(None, "Failed to report neighbours: %s" % e)
+        if len(mdns) > 0:
+            try:
+                yield maybeDeferred(self.reportMDNSEntries, mdns)
+            except BaseException as e:
+                log.err(None, "Failed to report mDNS entries: %s" % e)
+
     def reportBeacons(self, beacons):
         """Receives a report of an observed beacon packet."""
         for beacon in beacons:
@@ -1166,7 +1251,7 @@ class NetworksMonitoringService(MultiService, metaclass=ABCMeta):
 
     def _startNeighbourDiscovery(self, ifname):
         """"Start neighbour discovery service on the specified interface."""
-        service = NeighbourDiscoveryService(ifname, self.reportNeighbours)
+        service = NeighbourDiscoveryService(ifname, self.queueNeighbours)
         service.clock = self.clock
         service.setName("neighbour_discovery:" + ifname)
         service.setServiceParent(self)
@@ -1185,7 +1270,7 @@ class NetworksMonitoringService(MultiService, metaclass=ABCMeta):
         except KeyError:
             # This is an expected exception. (The call inside the `try`
             # is only necessary to ensure the service doesn't exist.)
-            service = MDNSResolverService(self.reportMDNSEntries)
+            service = MDNSResolverService(self.queueMDNSEntries)
             service.clock = self.clock
             service.setName("mdns_resolver")
             service.setServiceParent(self)
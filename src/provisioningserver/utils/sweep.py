@@ -0,0 +1,492 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Sweep attached networks with ARP requests or ICMP echoes.
+
+Every probe is sent from a single process, using one raw socket per
+interface, and replies are collected in the same event loop. Sending is
+paced both overall and per interface, so that large ranges can be swept
+quickly without flooding any one link.
+"""
+
+__all__ = [
+    "NetworkSweep",
+    "open_probers",
+    "sweep_scan",
+]
+
+from collections import (
+    deque,
+    namedtuple,
+)
+import heapq
+import os
+import selectors
+import socket
+import struct
+import time
+
+from netaddr import (
+    EUI,
+    IPAddress,
+    IPNetwork,
+)
+from provisioningserver.utils.ethernet import ETHERTYPE
+from provisioningserver.utils.network import (
+    bytes_to_int,
+    format_eui,
+)
+
+
+# Overall and per-interface sending rates, in packets per second.
+DEFAULT_RATE = 2000
+DEFAULT_INTERFACE_RATE = 500
+
+# The rate used for a slow sweep. This matches the rate used by `nmap` when
+# it is asked to scan slowly.
+SLOW_RATE = 9
+
+# Each address is probed this many times, this many seconds apart, before
+# it is reported as not responding.
+DEFAULT_ATTEMPTS = 2
+DEFAULT_TIMEOUT = 1.0
+
+# Protocol number for ARP frames, for use with AF_PACKET sockets.
+ETH_P_ARP = 0x0806
+
+# Not all Python versions define this.
+SO_BINDTODEVICE = getattr(socket, "SO_BINDTODEVICE", 25)
+
+# An Ethernet header followed by an ARP request or reply for IPv4.
+ARP_FRAME = '!6s6s2sHHBBH6s4s6s4s'
+ARP_FRAME_LEN = struct.calcsize(ARP_FRAME)
+
+ICMP_ECHO_HEADER = '!BBHHH'
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+# This reads: http://maas.io/ (the same payload `ping` is asked to send.)
+ICMP_ECHO_PAYLOAD = b'http://maas.io/ '
+
+BROADCAST_MAC = b'\xff' * 6
+
+
+Reply = namedtuple('Reply', ('ip', 'mac'))
+
+
+def icmp_checksum(data: bytes) -> int:
+    """Return the Internet checksum (RFC 1071) of `data`."""
+    if len(data) % 2 == 1:
+        data += b'\x00'
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def make_arp_request(src_mac: bytes, src_ip: int, target_ip: int) -> bytes:
+    """Return an Ethernet frame asking who has `target_ip`."""
+    return struct.pack(
+        ARP_FRAME, BROADCAST_MAC, src_mac, ETHERTYPE.ARP,
+        1, 0x0800, 6, 4, 1,
+        src_mac, IPAddress(src_ip).packed,
+        b'\x00' * 6, IPAddress(target_ip).packed)
+
+
+def parse_arp_reply(frame: bytes):
+    """Return a `Reply` if `frame` is an ARP reply, otherwise `None`."""
+    if len(frame) < ARP_FRAME_LEN:
+        return None
+    (_, _, ethertype, _, protocol, _, _, operation,
+     sender_mac, sender_ip, _, _) = struct.unpack(
+        ARP_FRAME, frame[:ARP_FRAME_LEN])
+    if ethertype != ETHERTYPE.ARP or protocol != 0x0800 or operation != 2:
+        return None
+    return Reply(
+        bytes_to_int(sender_ip), format_eui(EUI(bytes_to_int(sender_mac))))
+
+
+def make_icmp_echo(identifier: int, sequence: int) -> bytes:
+    """Return an ICMP echo request."""
+    header = struct.pack(
+        ICMP_ECHO_HEADER, ICMP_ECHO_REQUEST, 0, 0, identifier, sequence)
+    checksum = icmp_checksum(header + ICMP_ECHO_PAYLOAD)
+    header = struct.pack(
+        ICMP_ECHO_HEADER, ICMP_ECHO_REQUEST, 0, checksum, identifier,
+        sequence)
+    return header + ICMP_ECHO_PAYLOAD
+
+
+def parse_icmp_echo_reply(packet: bytes, identifier: int):
+    """Return a `Reply` if `packet` answers one of our echo requests.
+
+    :param packet: An IPv4 packet, as read from a raw ICMP socket.
+    """
+    if len(packet) < 20:
+        return None
+    ihl = (packet[0] & 0xf) * 4
+    if len(packet) < ihl + 8:
+        return None
+    icmp_type, _, _, reply_identifier, _ = struct.unpack(
+        ICMP_ECHO_HEADER, packet[ihl:ihl + 8])
+    if icmp_type != ICMP_ECHO_REPLY or reply_identifier != identifier:
+        return None
+    return Reply(bytes_to_int(packet[12:16]), None)
+
+
+class ARPProber:
+    """Sends ARP requests from, and reads ARP replies on, an interface."""
+
+    scan_type = "arp"
+
+    def __init__(self, ifname: str, links: list):
+        """
+        :param ifname: The interface to send requests from.
+        :param links: The IPv4 addresses on the interface, as CIDRs. The
+            sender address of each request is one on the same network as
+            the target, or 0.0.0.0 (an ARP probe) if there is none.
+        """
+        self.ifname = ifname
+        self.networks = [IPNetwork(link) for link in links]
+        self.sock = socket.socket(
+            socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ARP))
+        try:
+            self.sock.setblocking(False)
+            self.sock.bind((ifname, ETH_P_ARP))
+            self.mac = self.sock.getsockname()[4]
+        except:
+            self.sock.close()
+            raise
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def getSourceAddress(self, ip: int) -> int:
+        for network in self.networks:
+            if ip in network:
+                return int(network.ip)
+        return 0
+
+    def send(self, ip: int):
+        self.sock.send(
+            make_arp_request(self.mac, self.getSourceAddress(ip), ip))
+
+    def receive(self):
+        """Return the replies waiting on the socket."""
+        replies = []
+        while True:
+            try:
+                frame = self.sock.recv(2048)
+            except BlockingIOError:
+                return replies
+            reply = parse_arp_reply(frame)
+            if reply is not None:
+                replies.append(reply)
+
+    def close(self):
+        self.sock.close()
+
+
+class ICMPProber:
+    """Sends ICMP echo requests from, and reads replies on, an interface."""
+
+    scan_type = "icmp"
+
+    def __init__(self, ifname: str, links: list=None):
+        self.ifname = ifname
+        self.identifier = os.getpid() & 0xffff
+        self.sequence = 0
+        self.sock = socket.socket(
+            socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        try:
+            self.sock.setblocking(False)
+            self.sock.setsockopt(
+                socket.SOL_SOCKET, SO_BINDTODEVICE, ifname.encode("utf-8"))
+        except:
+            self.sock.close()
+            raise
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def send(self, ip: int):
+        self.sequence = (self.sequence + 1) & 0xffff
+        self.sock.sendto(
+            make_icmp_echo(self.identifier, self.sequence),
+            (str(IPAddress(ip)), 0))
+
+    def receive(self):
+        """Return the replies waiting on the socket."""
+        replies = []
+        while True:
+            try:
+                packet = self.sock.recv(2048)
+            except BlockingIOError:
+                return replies
+            reply = parse_icmp_echo_reply(packet, self.identifier)
+            if reply is not None:
+                replies.append(reply)
+
+    def close(self):
+        self.sock.close()
+
+
+class RateLimiter:
+    """A token bucket allowing `rate` events per second."""
+
+    def __init__(self, rate: float, clock=time.monotonic):
+        self.rate = rate
+        self.clock = clock
+        # Allow short bursts of up to a tenth of a second's worth.
+        self.capacity = max(1.0, rate / 10)
+        self.tokens = self.capacity
+        self.updated = clock()
+
+    def delay(self) -> float:
+        """Return the seconds to wait before the next event is allowed."""
+        now = self.clock()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # Allow for rounding errors, which could otherwise lead to a delay
+        # too short to register on the clock.
+        if self.tokens >= 1 - 1e-6:
+            return 0.0
+        else:
+            return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+
+class InterfaceSweep:
+    """The state of a sweep on a single interface."""
+
+    def __init__(self, prober, targets, rate, clock):
+        self.prober = prober
+        self.targets = targets
+        self.exhausted = False
+        self.limiter = RateLimiter(rate, clock)
+        # Addresses awaiting a reply, mapped to the attempts made.
+        self.pending = {}
+        # A heap of (time, ip) for the next attempt or the final time-out.
+        self.deadlines = []
+
+    @property
+    def finished(self):
+        return self.exhausted and not self.pending
+
+
+class NetworkSweep:
+    """Sweeps networks on several interfaces in a single event loop.
+
+    Results are streamed: an event is yielded as soon as an address replies,
+    and once its attempts are exhausted for an address that does not.
+    """
+
+    def __init__(
+            self, probers: dict, to_scan: dict, rate=DEFAULT_RATE,
+            interface_rate=DEFAULT_INTERFACE_RATE, attempts=DEFAULT_ATTEMPTS,
+            timeout=DEFAULT_TIMEOUT, clock=time.monotonic,
+            selector_factory=selectors.DefaultSelector):
+        """
+        :param probers: dict of {<interface-name>: <prober>}.
+        :param to_scan: dict of {<interface-name>: <iterable-of-ips>}, where
+            each IP is an integer.
+        """
+        self.interfaces = [
+            InterfaceSweep(
+                probers[ifname], iter(to_scan[ifname]),
+                min(rate, interface_rate), clock)
+            for ifname in sorted(probers)
+        ]
+        self.limiter = RateLimiter(rate, clock)
+        self.attempts = attempts
+        self.timeout = timeout
+        self.clock = clock
+        self.selector_factory = selector_factory
+
+    def makeEvent(self, iface, ip, result, mac=None):
+        event = {
+            "scan_type": iface.prober.scan_type,
+            "interface": iface.prober.ifname,
+            "ip": str(IPAddress(ip)),
+            "result": result,
+        }
+        if mac is not None:
+            event["mac"] = mac
+        return event
+
+    def nextTarget(self, iface, now):
+        """Return the next address to probe on `iface`, or `None`.
+
+        Addresses due another attempt come before those not yet probed.
+        """
+        deadlines = iface.deadlines
+        while deadlines and deadlines[0][0] <= now:
+            ip = deadlines[0][1]
+            if ip not in iface.pending:
+                # Answered since; discard.
+                heapq.heappop(deadlines)
+            elif iface.pending[ip] < self.attempts:
+                heapq.heappop(deadlines)
+                return ip
+            else:
+                # Timed out; left for `expire`.
+                break
+        while not iface.exhausted:
+            ip = next(iface.targets, None)
+            if ip is None:
+                iface.exhausted = True
+            elif ip not in iface.pending:
+                iface.pending[ip] = 0
+                return ip
+        return None
+
+    def send(self, iface, ip, now):
+        iface.pending[ip] += 1
+        try:
+            iface.prober.send(ip)
+        except OSError:
+            # The address is reported as not responding once it times out.
+            pass
+        heapq.heappush(iface.deadlines, (now + self.timeout, ip))
+
+    def expire(self, iface, now):
+        """Yield events for addresses whose attempts are exhausted."""
+        deadlines = iface.deadlines
+        while deadlines and deadlines[0][0] <= now:
+            ip = deadlines[0][1]
+            if ip not in iface.pending:
+                heapq.heappop(deadlines)
+            elif iface.pending[ip] >= self.attempts:
+                heapq.heappop(deadlines)
+                del iface.pending[ip]
+                yield self.makeEvent(iface, ip, False)
+            else:
+                break
+
+    def getWait(self, iface, now):
+        """Return the seconds until `iface` next needs attention."""
+        wait = self.timeout
+        if not iface.exhausted:
+            wait = max(self.limiter.delay(), iface.limiter.delay())
+        if iface.deadlines:
+            wait = min(wait, iface.deadlines[0][0] - now)
+        return max(0.0, wait)
+
+    def run(self):
+        """Run the sweep, yielding an event for each address."""
+        selector = self.selector_factory()
+        active = deque(self.interfaces)
+        for iface in active:
+            selector.register(iface.prober, selectors.EVENT_READ, iface)
+        try:
+            while active:
+                # Send as many probes as the rate limits allow, taking each
+                # interface in turn so that none is starved.
+                now = self.clock()
+                sending = True
+                while sending:
+                    sending = False
+                    for iface in active:
+                        if self.limiter.delay() > 0:
+                            break
+                        if iface.limiter.delay() > 0:
+                            continue
+                        ip = self.nextTarget(iface, now)
+                        if ip is not None:
+                            self.send(iface, ip, now)
+                            self.limiter.consume()
+                            iface.limiter.consume()
+                            sending = True
+                active.rotate(-1)
+                # Collect replies, waiting only until the next probe or
+                # time-out is due.
+                wait = min(self.getWait(iface, now) for iface in active)
+                for key, _ in selector.select(wait):
+                    iface = key.data
+                    for reply in iface.prober.receive():
+                        if iface.pending.pop(reply.ip, None) is not None:
+                            yield self.makeEvent(
+                                iface, reply.ip, True, reply.mac)
+                now = self.clock()
+                for iface in list(active):
+                    yield from self.expire(iface, now)
+                    if iface.finished:
+                        active.remove(iface)
+                        selector.unregister(iface.prober)
+        finally:
+            selector.close()
+
+
+def yield_ipv4_addresses(cidrs):
+    """Yield each host address in the IPv4 `cidrs`, as integers."""
+    seen = set()
+    for cidr in cidrs:
+        ipnetwork = IPNetwork(cidr)
+        if ipnetwork.version == 4:
+            for ip in ipnetwork.iter_hosts():
+                ip = int(ip)
+                if ip not in seen:
+                    seen.add(ip)
+                    yield ip
+
+
+def open_probers(to_scan: dict, interfaces: dict, icmp=False) -> dict:
+    """Open a prober for each interface with anything to scan.
+
+    :param to_scan: dict of {<interface-name>: <list-of-cidr-strings>}.
+    :param interfaces: the output of `get_all_interfaces_definition()`.
+    :raise OSError: if a raw socket cannot be opened, e.g. because this
+        process lacks the CAP_NET_RAW capability.
+    """
+    prober_class = ICMPProber if icmp else ARPProber
+    probers = {}
+    try:
+        for ifname, cidrs in to_scan.items():
+            if any(IPNetwork(cidr).version == 4 for cidr in cidrs):
+                links = [
+                    link['address']
+                    for link in interfaces.get(ifname, {}).get('links', [])
+                    if IPNetwork(link['address']).version == 4
+                ]
+                probers[ifname] = prober_class(ifname, links)
+    except:
+        for prober in probers.values():
+            prober.close()
+        raise
+    return probers
+
+
+def sweep_scan(
+        to_scan: dict, interfaces: dict, icmp=False, rate=DEFAULT_RATE,
+        interface_rate=DEFAULT_INTERFACE_RATE):
+    """Sweeps the specified networks with ARP requests or ICMP echoes.
+
+    The `to_scan` dictionary must be in the format:
+
+        {<interface_name>: <iterable-of-cidr-strings>, ...}
+
+    The raw sockets are opened before this returns, so that a failure to do
+    so can be handled by the caller; the sweep itself runs as the returned
+    iterator of events is consumed.
+
+    :raise OSError: if a raw socket cannot be opened.
+    """
+    to_scan = {ifname: list(cidrs) for ifname, cidrs in to_scan.items()}
+    probers = open_probers(to_scan, interfaces, icmp=icmp)
+    sweep = NetworkSweep(
+        probers, {
+            ifname: yield_ipv4_addresses(to_scan[ifname])
+            for ifname in probers
+        }, rate=rate, interface_rate=interface_rate)
+
+    def run():
+        try:
+            yield from sweep.run()
+        finally:
+            for prober in probers.values():
+                prober.close()
+
+    return run()
@@ -27,16 +27,22 @@ from provisioningserver.utils.arp import (
     add_arguments,
     ARP,
     ARP_OPERATION,
+    decode_arp_bindings,
+    observe_arp_packets,
     run,
     SEEN_AGAIN_THRESHOLD,
     update_and_print_bindings,
     update_bindings_and_get_event,
+    update_bindings_and_get_events,
 )
+from provisioningserver.utils.ethernet import Ethernet
 from provisioningserver.utils.network import (
+    bytes_to_int,
     format_eui,
     hex_str_to_bytes,
     ipv4_to_bytes,
 )
+from provisioningserver.utils.pcap import PCAP
 from provisioningserver.utils.script import ActionScriptError
 from testtools.matchers import (
     Equals,
@@ -419,6 +425,138 @@ test_input = (
 )
 
 
+def make_ethernet_frame(payload, ethertype='0806', vid=None):
+    frame = hex_str_to_bytes('ffffffffffff 000102030405')
+    if vid is not None:
+        frame += hex_str_to_bytes('8100') + (0x2000 | vid).to_bytes(2, 'big')
+    return frame + hex_str_to_bytes(ethertype) + payload
+
+
+class TestDecodeARPBindings(MAASTestCase):
+
+    def test__returns_sender_for_request(self):
+        frame = make_ethernet_frame(make_arp_packet(
+            '192.168.0.1', '01:02:03:04:05:06', '192.168.0.2'))
+        self.assertThat(decode_arp_bindings([(7, frame)]), Equals([
+            (None, ipv4_to_bytes('192.168.0.1'),
+             hex_str_to_bytes('01:02:03:04:05:06'), 7),
+        ]))
+
+    def test__returns_sender_and_target_for_reply(self):
+        frame = make_ethernet_frame(make_arp_packet(
+            '192.168.0.1', '01:02:03:04:05:06',
+            '192.168.0.2', '02:03:04:05:06:07', op=ARP_OPERATION.REPLY))
+        self.assertThat(decode_arp_bindings([(7, frame)]), Equals([
+            (None, ipv4_to_bytes('192.168.0.1'),
+             hex_str_to_bytes('01:02:03:04:05:06'), 7),
+            (None, ipv4_to_bytes('192.168.0.2'),
+             hex_str_to_bytes('02:03:04:05:06:07'), 7),
+        ]))
+
+    def test__returns_vid(self):
+        frame = make_ethernet_frame(make_arp_packet(
+            '192.168.0.1', '01:02:03:04:05:06', '192.168.0.2'), vid=42)
+        self.assertThat(decode_arp_bindings([(7, frame)]), Equals([
+            (42, ipv4_to_bytes('192.168.0.1'),
+             hex_str_to_bytes('01:02:03:04:05:06'), 7),
+        ]))
+
+    def test__skips_null_addresses(self):
+        frames = [
+            make_ethernet_frame(make_arp_packet(
+                '0.0.0.0', '01:02:03:04:05:06', '192.168.0.2')),
+            make_ethernet_frame(make_arp_packet(
+                '192.168.0.1', '00:00:00:00:00:00', '192.168.0.2')),
+        ]
+        self.assertThat(
+            decode_arp_bindings([(7, frame) for frame in frames]),
+            Equals([]))
+
+    def test__skips_invalid_and_non_arp_packets(self):
+        arp_packet = make_arp_packet(
+            '192.168.0.1', '01:02:03:04:05:06', '192.168.0.2')
+        frames = [
+            make_ethernet_frame(arp_packet, ethertype='0800'),
+            make_ethernet_frame(arp_packet[:-1]),
+            make_ethernet_frame(make_arp_packet(
+                '192.168.0.1', '01:02:03:04:05:06', '192.168.0.2',
+                hardware_type='0x0002')),
+            b'',
+        ]
+        self.assertThat(
+            decode_arp_bindings([(7, frame) for frame in frames]),
+            Equals([]))
+
+    def test__matches_ARP_bindings(self):
+        bindings = []
+        for _, packet in PCAP(io.BytesIO(test_input)):
+            ethernet = Ethernet(packet)
+            arp = ARP(ethernet.payload, vid=ethernet.vid)
+            bindings.extend(arp.bindings())
+        self.assertThat(
+            [(IPAddress(bytes_to_int(ip)), EUI(bytes_to_int(mac)))
+             for _, ip, mac, _ in decode_arp_bindings(
+                 PCAP(io.BytesIO(test_input)).read_batch())],
+            Equals(bindings))
+
+
+class TestUpdateBindingsAndGetEvents(MAASTestCase):
+
+    def test__emits_events_as_bindings_change(self):
+        bindings = {}
+        ip = ipv4_to_bytes("192.168.0.1")
+        mac1 = hex_str_to_bytes("00:01:02:03:04:05")
+        mac2 = hex_str_to_bytes("02:03:04:05:06:07")
+        events = update_bindings_and_get_events(bindings, [
+            (None, ip, mac1, 0),
+            (None, ip, mac1, 1),
+            (None, ip, mac2, 2),
+            (None, ip, mac2, SEEN_AGAIN_THRESHOLD + 1),
+            (None, ip, mac2, SEEN_AGAIN_THRESHOLD + 2),
+        ])
+        self.assertThat(bindings, Equals({
+            (None, ip): [mac2, SEEN_AGAIN_THRESHOLD + 2],
+        }))
+        self.assertThat(events, Equals([
+            dict(
+                event="NEW", ip="192.168.0.1", mac="00:01:02:03:04:05",
+                time=0, vid=None),
+            dict(
+                event="MOVED", ip="192.168.0.1", mac="02:03:04:05:06:07",
+                previous_mac="00:01:02:03:04:05", time=2, vid=None),
+            dict(
+                event="REFRESHED", ip="192.168.0.1",
+                mac="02:03:04:05:06:07", time=SEEN_AGAIN_THRESHOLD + 2,
+                vid=None),
+        ]))
+
+    def test__tracks_bindings_per_vid(self):
+        bindings = {}
+        ip = ipv4_to_bytes("192.168.0.1")
+        mac = hex_str_to_bytes("00:01:02:03:04:05")
+        events = update_bindings_and_get_events(
+            bindings, [(None, ip, mac, 0), (4095, ip, mac, 0)])
+        self.assertThat(
+            [(event["event"], event["vid"]) for event in events],
+            Equals([("NEW", None), ("NEW", 4095)]))
+
+
+class TestObserveARPPackets(MAASTestCase):
+
+    def test__writes_same_events_as_for_each_packet(self):
+        expected = io.StringIO()
+        bindings = {}
+        for header, packet in PCAP(io.BytesIO(test_input)):
+            ethernet = Ethernet(packet, time=header.timestamp_seconds)
+            arp = ARP(
+                ethernet.payload, vid=ethernet.vid, time=ethernet.time)
+            update_and_print_bindings(bindings, arp, expected)
+        output = io.StringIO()
+        observe_arp_packets(
+            bindings=True, input=io.BytesIO(test_input), output=output)
+        self.assertThat(output.getvalue(), Equals(expected.getvalue()))
+
+
 class TestObserveARPCommand(MAASTestCase):
     """Tests for `maas-rack observe-arp`."""
 
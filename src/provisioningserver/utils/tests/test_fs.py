@@ -50,6 +50,7 @@ from provisioningserver.utils.fs import (
     atomic_symlink,
     atomic_write,
     FileLock,
+    get_file_version,
     get_library_script_path,
     get_maas_common_command,
     incremental_write,
@@ -750,6 +751,24 @@ class TestReadTextFile(MAASTestCase):
                 encoding='utf-16'))
 
 
+class TestGetFileVersion(MAASTestCase):
+
+    def test_returns_mtime_and_size(self):
+        path = self.make_file(contents=b"content")
+        st = os.stat(path)
+        self.assertEqual((st.st_mtime_ns, 7), get_file_version(path))
+
+    def test_changes_when_file_is_modified(self):
+        path = self.make_file(contents=b"content")
+        version = get_file_version(path)
+        age_file(path, 10)
+        self.assertNotEqual(version, get_file_version(path))
+
+    def test_returns_None_for_missing_file(self):
+        path = os.path.join(self.make_dir(), factory.make_name("missing"))
+        self.assertIsNone(get_file_version(path))
+
+
 class TestWriteTextFile(MAASTestCase):
 
     def test_creates_file(self):
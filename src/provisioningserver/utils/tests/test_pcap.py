@@ -13,7 +13,10 @@ from provisioningserver.utils.pcap import (
     PCAPError,
 )
 from testtools import ExpectedException
-from testtools.matchers import Equals
+from testtools.matchers import (
+    Equals,
+    HasLength,
+)
 
 # Created with:
 # $ sudo tcpdump -i eth0 -U --immediate-mode -s 64 -n -c 2 -w - arp \
@@ -121,3 +124,42 @@ class TestPCAP(MAASTestCase):
                 PCAPError,
                 "Unexpected end of PCAP stream: invalid packet."):
             pcap.read()
+
+    def test__read_batch_returns_all_available_packets(self):
+        stream = io.BytesIO(TESTDATA)
+        pcap = PCAP(stream)
+        packets = pcap.read_batch()
+        self.assertThat(
+            [seconds for seconds, _ in packets],
+            Equals([1467058714, 1467058715]))
+        stream = io.BytesIO(TESTDATA)
+        pcap = PCAP(stream)
+        self.assertThat(
+            [packet for _, packet in packets],
+            Equals([pcap.read()[1], pcap.read()[1]]))
+
+    def test__read_batch_keeps_partial_packets_for_next_read(self):
+        stream = io.BytesIO(TESTDATA)
+        pcap = PCAP(stream)
+        # The first packet and part of the second.
+        self.assertThat(pcap.read_batch(100), HasLength(1))
+        # Only part of the second packet is available.
+        self.assertThat(pcap.read_batch(10), Equals([]))
+        # The rest of the second packet.
+        self.assertThat(pcap.read_batch(), HasLength(1))
+
+    def test__read_batch_raises_EOFError_for_end_of_stream(self):
+        stream = io.BytesIO(TESTDATA)
+        pcap = PCAP(stream)
+        pcap.read_batch()
+        with ExpectedException(EOFError, "End of PCAP stream."):
+            pcap.read_batch()
+
+    def test__read_batch_raises_PCAPError_for_invalid_packet(self):
+        stream = io.BytesIO(TESTDATA_INVALID_PACKET)
+        pcap = PCAP(stream)
+        self.assertThat(pcap.read_batch(), Equals([]))
+        with ExpectedException(
+                PCAPError,
+                "Unexpected end of PCAP stream: invalid packet."):
+            pcap.read_batch()
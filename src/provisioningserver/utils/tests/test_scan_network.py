@@ -7,6 +7,7 @@ __all__ = []
 
 from argparse import ArgumentParser
 import io
+import json
 import os
 import random
 import subprocess
@@ -38,6 +39,10 @@ from provisioningserver.utils.scan_network import (
 )
 from provisioningserver.utils.script import ActionScriptError
 from provisioningserver.utils.shell import get_env_with_locale
+from provisioningserver.utils.sweep import (
+    DEFAULT_RATE,
+    SLOW_RATE,
+)
 from testtools import ExpectedException
 from testtools.matchers import (
     AfterPreprocessing,
@@ -93,13 +98,21 @@ class TestScanNetworkCommand(MAASTestCase):
         self.run_command('--ping', '--threads', '37', '--slow')
         self.assertThat(self.scan_networks_mock, MockCalledOnceWith(
             ArgumentsMatching(threads=37, slow=True, ping=True),
-            ANY, ANY, ANY))
+            ANY, ANY, ANY, interfaces=ANY))
+
+    def test__interprets_sweep_arguments(self):
+        self.run_command('--nmap', '--icmp', '--rate', '100')
+        self.assertThat(self.scan_networks_mock, MockCalledOnceWith(
+            ArgumentsMatching(nmap=True, icmp=True, rate=100),
+            ANY, ANY, ANY, interfaces=ANY))
 
     def test__default_arguments(self):
         self.run_command()
         self.assertThat(self.scan_networks_mock, MockCalledOnceWith(
-            ArgumentsMatching(threads=None, slow=False, ping=False),
-            ANY, ANY, ANY))
+            ArgumentsMatching(
+                threads=None, slow=False, ping=False, nmap=False,
+                icmp=False, rate=None),
+            ANY, ANY, ANY, interfaces=TEST_INTERFACES))
 
     def test__scans_all_interface_cidrs_when_zero_parameters_passed(self):
         self.run_command()
@@ -108,14 +121,14 @@ class TestScanNetworkCommand(MAASTestCase):
                 'eth0': MatchesCIDRs(),
                 'eth1': MatchesCIDRs('192.168.0.0/24'),
                 'eth2': MatchesCIDRs('192.168.2.0/24', '192.168.3.0/24')
-            }, ANY, ANY))
+            }, ANY, ANY, interfaces=ANY))
 
     def test__scans_all_cidrs_on_single_interface_when_ifname_passed(self):
         self.run_command('eth2')
         self.assertThat(self.scan_networks_mock, MockCalledOnceWith(
             ANY, {
                 'eth2': MatchesCIDRs('192.168.2.0/24', '192.168.3.0/24')
-            }, ANY, ANY))
+            }, ANY, ANY, interfaces=ANY))
 
     def test__finds_correct_interface_if_passed_in_cidr_matches(self):
         self.run_command('192.168.2.0/24')
@@ -124,14 +137,14 @@ class TestScanNetworkCommand(MAASTestCase):
                 'eth0': MatchesCIDRs(),
                 'eth1': MatchesCIDRs(),
                 'eth2': MatchesCIDRs('192.168.2.0/24')
-            }, ANY, ANY))
+            }, ANY, ANY, interfaces=ANY))
 
     def test__scans_specific_interface_cidr(self):
         self.run_command('eth2', '192.168.3.0/24')
         self.assertThat(self.scan_networks_mock, MockCalledOnceWith(
             ANY, {
                 'eth2': MatchesCIDRs('192.168.3.0/24')
-            }, ANY, ANY))
+            }, ANY, ANY, interfaces=ANY))
 
     def test__scans_cidr_subset(self):
         self.run_command('192.168.3.0/28')
@@ -140,7 +153,7 @@ class TestScanNetworkCommand(MAASTestCase):
                 'eth0': MatchesCIDRs(),
                 'eth1': MatchesCIDRs(),
                 'eth2': MatchesCIDRs('192.168.3.0/28')
-            }, ANY, ANY))
+            }, ANY, ANY, interfaces=ANY))
 
     def test__rejects_ipv6_cidr(self):
         expected_error = ".*Not a valid IPv4 CIDR:.*"
@@ -215,7 +228,7 @@ class TestScanNetworkCommandEndToEnd(MAASTestCase):
         self.has_command_available_mock.return_value = True
         cidr = '%s/32' % ip
         slow = random.choice([True, False])
-        args = ['--threads', '1', 'eth0', cidr]
+        args = ['--nmap', '--threads', '1', 'eth0', cidr]
         if slow is True:
             args.append('--slow')
         self.run_command(*args)
@@ -233,7 +246,7 @@ class TestScanNetworkCommandEndToEnd(MAASTestCase):
         self.has_command_available_mock.return_value = True
         cidr = '%s/32' % ip
         slow = random.choice([True, False])
-        args = ['eth0', cidr]
+        args = ['--nmap', 'eth0', cidr]
         if slow is True:
             args.append('--slow')
         self.run_command(*args)
@@ -251,13 +264,53 @@ class TestScanNetworkCommandEndToEnd(MAASTestCase):
         self.has_command_available_mock.return_value = True
         cidr = '%s/32' % ip
         slow = random.choice([True, False])
-        args = ['eth0', cidr]
+        args = ['--nmap', 'eth0', cidr]
         if slow is True:
             args.append('--slow')
         self.run_command(*args)
         self.assertThat(self.error_output.getvalue(), DocTestMatches(
             "...scan...completed...second..."))
 
+    def test__runs_sweep_by_default(self):
+        sweep_scan = self.patch(scan_network_module, 'sweep_scan')
+        event = {
+            "scan_type": "arp", "interface": "eth1", "ip": "192.168.0.2",
+            "result": True, "mac": "00:01:02:03:04:05",
+        }
+        sweep_scan.return_value = iter([event])
+        self.run_command('eth1', '192.168.0.0/30')
+        self.assertThat(sweep_scan, MockCalledOnceWith(
+            {'eth1': ['192.168.0.0/30']}, TEST_INTERFACES,
+            icmp=False, rate=DEFAULT_RATE))
+        self.assertThat(self.popen.call_count, Equals(0))
+        self.assertThat(self.output.getvalue(), Equals(
+            json.dumps(event) + '\n'))
+        self.assertThat(self.error_output.getvalue(), DocTestMatches(
+            "...Swept 1 hosts (1 up)...second..."))
+
+    def test__runs_slow_sweep(self):
+        sweep_scan = self.patch(scan_network_module, 'sweep_scan')
+        sweep_scan.return_value = iter([])
+        self.run_command('--slow', '--icmp', 'eth1')
+        self.assertThat(sweep_scan, MockCalledOnceWith(
+            ANY, TEST_INTERFACES, icmp=True, rate=SLOW_RATE))
+
+    def test__falls_back_to_nmap_if_sweep_not_permitted(self):
+        sweep_scan = self.patch(scan_network_module, 'sweep_scan')
+        sweep_scan.side_effect = PermissionError("Operation not permitted")
+        self.has_command_available_mock.return_value = True
+        ip = factory.make_ip_address(ipv6=False)
+        self.run_command('eth0', '%s/32' % ip)
+        self.assertThat(self.error_output.getvalue(), DocTestMatches(
+            "...Cannot sweep (Operation not permitted); falling back.\n"
+            "...scan...completed...second..."))
+        self.assertThat(self.popen, MockCalledOnceWith(
+            get_nmap_arguments(NmapParameters(
+                interface='eth0', cidr='%s/32' % ip, slow=False)),
+            stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL, env=get_env_with_locale(),
+            preexec_fn=os.setsid))
+
     def test__prints_error_for_missing_cidr(self):
         self.run_command('8.8.8.0/24')
         self.assertThat(self.error_output.getvalue(), DocTestMatches(
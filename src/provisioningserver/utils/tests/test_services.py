@@ -123,6 +123,74 @@ class TestNetworksMonitoringService(MAASTestCase):
             Equals(service.interval))
         self.assertThat(service.interface_monitor.call, Equals(
             (service.updateInterfaces, (), {})))
+        self.assertThat(
+            service.report_flusher.step, Equals(service.report_interval))
+        self.assertThat(service.report_flusher.call, Equals(
+            (service.flushReports, (), {})))
+
+    def test_queueNeighbours_merges_repeated_observations(self):
+        service = self.makeService()
+        first = {'interface': 'eth0', 'ip': '10.0.0.1', 'mac': '1', 'time': 1}
+        other = {'interface': 'eth0', 'ip': '10.0.0.2', 'mac': '2', 'time': 2}
+        again = dict(first, time=3)
+        service.queueNeighbours([first, other])
+        service.queueNeighbours([again])
+        self.assertThat(list(service._neighbours.values()), Equals([
+            dict(other, count=1),
+            dict(again, count=2),
+        ]))
+
+    def test_queueNeighbours_keeps_bindings_separate(self):
+        service = self.makeService()
+        first = {'interface': 'eth0', 'ip': '10.0.0.1', 'mac': '1', 'time': 1}
+        moved = dict(first, mac='2', time=2)
+        tagged = dict(first, vid=100)
+        service.queueNeighbours([first, moved, tagged])
+        self.assertThat(service._neighbours, HasLength(3))
+
+    def test_queueMDNSEntries_merges_repeated_observations(self):
+        service = self.makeService()
+        entry = {
+            'interface': 'eth0', 'hostname': 'host', 'address': '10.0.0.1'}
+        service.queueMDNSEntries([entry, entry, entry])
+        self.assertThat(
+            list(service._mdns_entries.values()),
+            Equals([dict(entry, count=3)]))
+
+    @inlineCallbacks
+    def test_flushReports_reports_and_clears_queues(self):
+        service = self.makeService()
+        reportNeighbours = self.patch(service, "reportNeighbours")
+        reportMDNSEntries = self.patch(service, "reportMDNSEntries")
+        neighbour = {
+            'interface': 'eth0', 'ip': '10.0.0.1', 'mac': '1', 'time': 1}
+        entry = {
+            'interface': 'eth0', 'hostname': 'host', 'address': '10.0.0.1'}
+        service.queueNeighbours([neighbour])
+        service.queueMDNSEntries([entry])
+        yield service.flushReports()
+        self.assertThat(
+            reportNeighbours, MockCalledOnceWith([dict(neighbour, count=1)]))
+        self.assertThat(
+            reportMDNSEntries, MockCalledOnceWith([dict(entry, count=1)]))
+        reportNeighbours.reset_mock()
+        reportMDNSEntries.reset_mock()
+        yield service.flushReports()
+        self.assertThat(reportNeighbours, MockNotCalled())
+        self.assertThat(reportMDNSEntries, MockNotCalled())
+
+    @inlineCallbacks
+    def test_flushReports_logs_errors(self):
+        service = self.makeService()
+        reportNeighbours = self.patch(service, "reportNeighbours")
+        reportNeighbours.side_effect = Exception(factory.make_string())
+        service.queueNeighbours([{
+            'interface': 'eth0', 'ip': '10.0.0.1', 'mac': '1', 'time': 1}])
+        with TwistedLoggerFixture() as logger:
+            yield service.flushReports()
+        self.assertThat(logger.output, DocTestMatches(
+            "Failed to report neighbours..."))
+        self.assertThat(service._neighbours, HasLength(0))
 
     @inlineCallbacks
     def test_get_all_interfaces_definition_is_called_in_thread(self):
@@ -346,6 +414,16 @@ class TestJSONPerLineProtocol(MAASTestCase):
         proto.outReceived(b"{}\n")
         self.expectThat(callback, MockCallsMatch(call([{}]), call([{}])))
 
+    def test__passes_objects_from_each_read_in_one_batch(self):
+        callback = Mock()
+        proto = JSONPerLineProtocol(callback=callback)
+        proto.connectionMade()
+        proto.outReceived(b'{"a": 1}\n{"b": 2}\n{"c"')
+        self.expectThat(callback, MockCallsMatch(call([{"a": 1}, {"b": 2}])))
+        proto.outReceived(b': 3}\n')
+        self.expectThat(callback, MockCallsMatch(
+            call([{"a": 1}, {"b": 2}]), call([{"c": 3}])))
+
     def test__logs_non_json_output(self):
         callback = Mock()
         proto = JSONPerLineProtocol(callback=callback)
@@ -409,6 +487,15 @@ class TestProtocolForObserveARP(MAASTestCase):
         self.expectThat(
             callback, MockCallsMatch(call([{"interface": ifname}])))
 
+    def test_adds_interface_to_each_object_in_batch(self):
+        callback = Mock()
+        ifname = factory.make_name('eth')
+        proto = ProtocolForObserveARP(ifname, callback=callback)
+        proto.makeConnection(Mock(pid=None))
+        proto.outReceived(b"{}\n{}\n")
+        self.expectThat(callback, MockCallsMatch(call(
+            [{"interface": ifname}, {"interface": ifname}])))
+
 
 class TestProtocolForObserveBeacons(MAASTestCase):
     """Tests for `ProtocolForObserveBeacons`."""
@@ -0,0 +1,305 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for ``provisioningserver.utils.sweep``."""
+
+__all__ = []
+
+import struct
+
+from maastesting.matchers import MockCalledOnceWith
+from maastesting.testcase import MAASTestCase
+from netaddr import IPAddress
+from provisioningserver.utils import sweep as sweep_module
+from provisioningserver.utils.sweep import (
+    ARP_FRAME,
+    ARPProber,
+    icmp_checksum,
+    ICMP_ECHO_PAYLOAD,
+    ICMPProber,
+    make_arp_request,
+    make_icmp_echo,
+    NetworkSweep,
+    open_probers,
+    parse_arp_reply,
+    parse_icmp_echo_reply,
+    RateLimiter,
+    Reply,
+    yield_ipv4_addresses,
+)
+from testtools.matchers import (
+    Equals,
+    HasLength,
+    Is,
+)
+
+
+def ip(address):
+    return int(IPAddress(address))
+
+
+MAC = b'\x00\x01\x02\x03\x04\x05'
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeProber:
+    """Replies at once to probes for the addresses that are `up`."""
+
+    scan_type = "arp"
+
+    def __init__(self, ifname, clock, up=()):
+        self.ifname = ifname
+        self.clock = clock
+        self.up = up
+        self.sent = []
+        self.replies = []
+
+    def fileno(self):
+        return -1
+
+    def send(self, target):
+        self.sent.append((self.clock(), target))
+        if target in self.up:
+            self.replies.append(Reply(target, "00:01:02:03:04:05"))
+
+    def receive(self):
+        replies, self.replies = self.replies, []
+        return replies
+
+    def close(self):
+        pass
+
+
+class FakeKey:
+
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeSelector:
+    """Advances the clock instead of waiting."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.registered = []
+
+    def register(self, fileobj, events, data):
+        self.registered.append(data)
+
+    def unregister(self, fileobj):
+        self.registered = [
+            data for data in self.registered if data.prober is not fileobj]
+
+    def select(self, timeout):
+        ready = [
+            (FakeKey(data), None) for data in self.registered
+            if data.prober.replies
+        ]
+        if len(ready) == 0:
+            self.clock.now += timeout
+        return ready
+
+    def close(self):
+        pass
+
+
+class TestICMPChecksum(MAASTestCase):
+
+    def test__computes_internet_checksum(self):
+        self.assertThat(
+            icmp_checksum(b'\x08\x00\x00\x00\x00\x01\x00\x01'),
+            Equals(0xf7fd))
+
+    def test__pads_odd_length(self):
+        self.assertThat(
+            icmp_checksum(b'\x08\x00\x00\x00\x00\x01\x00'),
+            Equals(icmp_checksum(b'\x08\x00\x00\x00\x00\x01\x00\x00')))
+
+    def test__checksum_of_echo_is_zero(self):
+        self.assertThat(icmp_checksum(make_icmp_echo(1234, 1)), Equals(0))
+
+
+class TestARPFrames(MAASTestCase):
+
+    def test__make_arp_request(self):
+        frame = make_arp_request(MAC, ip('10.0.0.1'), ip('10.0.0.2'))
+        fields = struct.unpack(ARP_FRAME, frame)
+        self.assertThat(fields, Equals((
+            b'\xff' * 6, MAC, b'\x08\x06', 1, 0x0800, 6, 4, 1,
+            MAC, b'\x0a\x00\x00\x01', b'\x00' * 6, b'\x0a\x00\x00\x02')))
+
+    def test__parse_arp_reply(self):
+        frame = struct.pack(
+            ARP_FRAME, MAC, b'\x00\x0a\x0b\x0c\x0d\x0e', b'\x08\x06',
+            1, 0x0800, 6, 4, 2,
+            b'\x00\x0a\x0b\x0c\x0d\x0e', b'\x0a\x00\x00\x02',
+            MAC, b'\x0a\x00\x00\x01')
+        self.assertThat(
+            parse_arp_reply(frame),
+            Equals(Reply(ip('10.0.0.2'), '00:0a:0b:0c:0d:0e')))
+
+    def test__parse_arp_reply_ignores_requests(self):
+        frame = make_arp_request(MAC, ip('10.0.0.1'), ip('10.0.0.2'))
+        self.assertThat(parse_arp_reply(frame), Is(None))
+
+    def test__parse_arp_reply_ignores_short_frames(self):
+        self.assertThat(parse_arp_reply(b'\x00' * 20), Is(None))
+
+
+class TestICMPEcho(MAASTestCase):
+
+    def make_ip_header(self, source):
+        return (
+            b'\x45' + b'\x00' * 11 + IPAddress(source).packed +
+            b'\x0a\x00\x00\x01')
+
+    def test__make_icmp_echo(self):
+        packet = make_icmp_echo(1234, 7)
+        icmp_type, _, _, identifier, sequence = struct.unpack(
+            '!BBHHH', packet[:8])
+        self.assertThat(
+            (icmp_type, identifier, sequence), Equals((8, 1234, 7)))
+        self.assertThat(packet[8:], Equals(ICMP_ECHO_PAYLOAD))
+
+    def test__parse_icmp_echo_reply(self):
+        packet = self.make_ip_header('10.0.0.2') + struct.pack(
+            '!BBHHH', 0, 0, 0, 1234, 1)
+        self.assertThat(
+            parse_icmp_echo_reply(packet, 1234),
+            Equals(Reply(ip('10.0.0.2'), None)))
+
+    def test__parse_icmp_echo_reply_ignores_other_identifiers(self):
+        packet = self.make_ip_header('10.0.0.2') + struct.pack(
+            '!BBHHH', 0, 0, 0, 4321, 1)
+        self.assertThat(parse_icmp_echo_reply(packet, 1234), Is(None))
+
+    def test__parse_icmp_echo_reply_ignores_other_types(self):
+        packet = self.make_ip_header('10.0.0.2') + struct.pack(
+            '!BBHHH', 3, 1, 0, 1234, 1)
+        self.assertThat(parse_icmp_echo_reply(packet, 1234), Is(None))
+
+
+class TestRateLimiter(MAASTestCase):
+
+    def test__allows_burst_then_delays(self):
+        clock = FakeClock()
+        limiter = RateLimiter(100, clock)
+        for _ in range(10):
+            self.assertThat(limiter.delay(), Equals(0))
+            limiter.consume()
+        self.assertThat(limiter.delay(), Equals(0.01))
+        clock.now += 0.01
+        self.assertThat(limiter.delay(), Equals(0))
+
+    def test__allows_at_least_one(self):
+        limiter = RateLimiter(1, FakeClock())
+        self.assertThat(limiter.delay(), Equals(0))
+        limiter.consume()
+        self.assertThat(limiter.delay(), Equals(1))
+
+
+class TestNetworkSweep(MAASTestCase):
+
+    def make_sweep(self, probers, to_scan, **kwargs):
+        clock = FakeClock()
+        for prober in probers.values():
+            prober.clock = clock
+        sweep = NetworkSweep(
+            probers, to_scan, clock=clock,
+            selector_factory=lambda: FakeSelector(clock), **kwargs)
+        return sweep, clock
+
+    def test__reports_each_address_once(self):
+        eth0 = FakeProber('eth0', None, up=[ip('10.0.0.2')])
+        sweep, _ = self.make_sweep(
+            {'eth0': eth0}, {'eth0': [ip('10.0.0.1'), ip('10.0.0.2')]})
+        events = list(sweep.run())
+        self.assertThat(events, Equals([
+            {
+                "scan_type": "arp", "interface": "eth0", "ip": "10.0.0.2",
+                "result": True, "mac": "00:01:02:03:04:05",
+            },
+            {
+                "scan_type": "arp", "interface": "eth0", "ip": "10.0.0.1",
+                "result": False,
+            },
+        ]))
+
+    def test__retries_unanswered_addresses(self):
+        eth0 = FakeProber('eth0', None)
+        sweep, _ = self.make_sweep(
+            {'eth0': eth0}, {'eth0': [ip('10.0.0.1')]},
+            attempts=3, timeout=0.5)
+        list(sweep.run())
+        self.assertThat(eth0.sent, Equals([
+            (0.0, ip('10.0.0.1')),
+            (0.5, ip('10.0.0.1')),
+            (1.0, ip('10.0.0.1')),
+        ]))
+
+    def test__paces_each_interface(self):
+        eth0 = FakeProber('eth0', None, up=range(ip('10.0.0.0'), 2 ** 32))
+        eth1 = FakeProber('eth1', None, up=range(ip('10.1.0.0'), 2 ** 32))
+        sweep, _ = self.make_sweep(
+            {'eth0': eth0, 'eth1': eth1}, {
+                'eth0': range(ip('10.0.0.1'), ip('10.0.0.201')),
+                'eth1': range(ip('10.1.0.1'), ip('10.1.0.201')),
+            }, rate=200, interface_rate=100)
+        events = list(sweep.run())
+        self.assertThat(events, HasLength(400))
+        # Each interface is limited to 100 packets per second, after an
+        # initial burst of 10.
+        for prober in (eth0, eth1):
+            self.assertGreaterEqual(prober.sent[-1][0], 1.89)
+            self.assertLess(prober.sent[-1][0], 1.91)
+
+
+class TestYieldIPv4Addresses(MAASTestCase):
+
+    def test__yields_unique_ipv4_hosts(self):
+        self.assertThat(
+            list(yield_ipv4_addresses([
+                '10.0.0.0/30', '10.0.0.1/32', '2001:db8::/126'])),
+            Equals([ip('10.0.0.1'), ip('10.0.0.2')]))
+
+
+class TestOpenProbers(MAASTestCase):
+
+    def test__opens_probers_for_interfaces_with_ipv4_targets(self):
+        prober = self.patch(sweep_module, 'ARPProber')
+        interfaces = {
+            'eth0': {'links': [
+                {'address': '10.0.0.1/24'}, {'address': '2001:db8::1/64'}]},
+            'eth1': {'links': []},
+        }
+        probers = open_probers(
+            {'eth0': ['10.0.0.0/24'], 'eth1': ['2001:db8::/64']}, interfaces)
+        self.assertThat(probers, Equals({'eth0': prober.return_value}))
+        self.assertThat(prober, MockCalledOnceWith('eth0', ['10.0.0.1/24']))
+
+    def test__opens_icmp_probers(self):
+        prober = self.patch(sweep_module, 'ICMPProber')
+        probers = open_probers({'eth0': ['10.0.0.0/24']}, {}, icmp=True)
+        self.assertThat(probers, Equals({'eth0': prober.return_value}))
+
+    def test__closes_probers_on_failure(self):
+        opened = self.patch(sweep_module, 'ARPProber')
+        failed = PermissionError()
+        opened.side_effect = [opened.return_value, failed]
+        error = self.assertRaises(
+            PermissionError, open_probers,
+            {'eth0': ['10.0.0.0/24'], 'eth1': ['10.1.0.0/24']}, {})
+        self.assertThat(error, Is(failed))
+        self.assertThat(opened.return_value.close, MockCalledOnceWith())
+
+    def test__prober_classes_match_scan_types(self):
+        self.assertThat(ARPProber.scan_type, Equals("arp"))
+        self.assertThat(ICMPProber.scan_type, Equals("icmp"))
@@ -0,0 +1,110 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `provisioningserver.utils.webclient`."""
+
+__all__ = []
+
+from unittest.mock import (
+    call,
+    Mock,
+)
+
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockCallsMatch,
+    MockNotCalled,
+)
+from maastesting.testcase import MAASTestCase
+from maastesting.twisted import extract_result
+from provisioningserver.utils import webclient
+from provisioningserver.utils.webclient import (
+    get_connection_pool,
+    PersistentConnectionPool,
+)
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
+
+
+class TestPersistentConnectionPool(MAASTestCase):
+
+    def make_pool(self):
+        metrics = Mock()
+        pool = PersistentConnectionPool(Clock(), prometheus_metrics=metrics)
+        return pool, metrics
+
+    def test_is_persistent(self):
+        pool, _ = self.make_pool()
+        self.assertTrue(pool.persistent)
+
+    def test_getConnection_records_miss(self):
+        pool, metrics = self.make_pool()
+        endpoint = Mock()
+        endpoint.connect.return_value = Deferred()
+        pool.getConnection(("http-v1", b"http", b"bmc", 80), endpoint)
+        self.assertThat(metrics.update, MockCalledOnceWith(
+            'maas_http_pool_requests', 'inc', labels={'result': 'miss'}))
+
+    def test_getConnection_records_hit(self):
+        pool, metrics = self.make_pool()
+        key = ("http-v1", b"http", b"bmc", 80)
+        connection = Mock(state="QUIESCENT")
+        pool._connections[key] = [connection]
+        pool._timeouts[connection] = Mock()
+        endpoint = Mock()
+        pool.getConnection(key, endpoint)
+        self.assertThat(metrics.update, MockCalledOnceWith(
+            'maas_http_pool_requests', 'inc', labels={'result': 'hit'}))
+        self.assertThat(endpoint.connect, MockNotCalled())
+
+    def test_newConnection_counts_tls_handshakes(self):
+        pool, metrics = self.make_pool()
+        endpoint = Mock()
+        endpoint.connect.return_value = Deferred()
+        pool._newConnection(("http-v1", b"https", b"bmc", 443), endpoint)
+        self.assertThat(metrics.update, MockCalledOnceWith(
+            'maas_http_pool_tls_handshakes', 'inc'))
+
+    def test_newConnection_does_not_count_plain_http(self):
+        pool, metrics = self.make_pool()
+        endpoint = Mock()
+        endpoint.connect.return_value = Deferred()
+        pool._newConnection(("http-v1", b"http", b"bmc", 80), endpoint)
+        self.assertThat(metrics.update, MockNotCalled())
+
+    def test_run_limits_requests_per_host(self):
+        pool, _ = self.make_pool()
+        pool.maxRequestsPerHost = 2
+        requests = [Deferred() for _ in range(3)]
+        func = Mock(side_effect=requests)
+        for _ in range(3):
+            pool.run(b"https://bmc/redfish/v1/", func)
+        pool.run(b"https://other/redfish/v1/", Mock())
+        self.assertEqual(2, func.call_count)
+        requests[0].callback(None)
+        self.assertEqual(3, func.call_count)
+
+    def test_run_returns_result(self):
+        pool, _ = self.make_pool()
+        d = pool.run(b"http://bmc/", lambda a, b: a + b, 1, b=2)
+        self.assertEqual(3, extract_result(d))
+
+    def test_run_forgets_unused_host_limits(self):
+        pool, _ = self.make_pool()
+        request = Deferred()
+        pool.run(b"https://bmc/redfish/v1/", lambda: request)
+        self.assertEqual([(b"https", b"bmc", 443)], list(pool._hostLimits))
+        request.callback(None)
+        self.assertEqual({}, pool._hostLimits)
+
+
+class TestGetConnectionPool(MAASTestCase):
+
+    def test_returns_the_same_pool(self):
+        self.patch(webclient, "_pool", None)
+        reactor = self.patch(webclient, "reactor")
+        pool = get_connection_pool()
+        self.assertIsInstance(pool, PersistentConnectionPool)
+        self.assertIs(pool, get_connection_pool())
+        self.assertThat(reactor.addSystemEventTrigger, MockCallsMatch(
+            call("before", "shutdown", pool.closeCachedConnections)))
@@ -0,0 +1,114 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Shared HTTP connection pool for talking to BMCs and other appliances.
+
+Power drivers that speak HTTP(S) query the same hosts over and over again;
+sharing one keep-alive connection pool across them saves a TCP connection,
+and usually a TLS handshake, for almost every request.
+"""
+
+__all__ = [
+    "get_connection_pool",
+    "PersistentConnectionPool",
+]
+
+from provisioningserver.prometheus.metrics import PROMETHEUS_METRICS
+from twisted.internet import reactor
+from twisted.internet.defer import DeferredSemaphore
+from twisted.web.client import (
+    HTTPConnectionPool,
+    URI,
+)
+
+
+class PersistentConnectionPool(HTTPConnectionPool):
+    """A keep-alive `HTTPConnectionPool` with per-host request limits.
+
+    Idle connections are closed after `cachedConnectionTimeout` seconds, and
+    no more than `maxRequestsPerHost` requests made through `run` are in
+    flight to any one host at a time, so that a busy rack cannot swamp a
+    single BMC.
+    """
+
+    # Keep idle connections around for slightly longer than the interval
+    # at which the power monitor service queries each node.
+    cachedConnectionTimeout = 330
+    maxPersistentPerHost = 2
+    maxRequestsPerHost = 4
+
+    def __init__(
+            self, reactor, persistent=True,
+            prometheus_metrics=PROMETHEUS_METRICS):
+        super(PersistentConnectionPool, self).__init__(
+            reactor, persistent=persistent)
+        self.prometheus_metrics = prometheus_metrics
+        self._hostLimits = {}
+
+    def getConnection(self, key, endpoint):
+        """See `HTTPConnectionPool.getConnection`.
+
+        Record whether a cached connection was reused.
+        """
+        connections = self._connections.get(key)
+        reused = any(
+            connection.state == "QUIESCENT"
+            for connection in connections or ())
+        self.prometheus_metrics.update(
+            'maas_http_pool_requests', 'inc',
+            labels={'result': 'hit' if reused else 'miss'})
+        return super(PersistentConnectionPool, self).getConnection(
+            key, endpoint)
+
+    def _newConnection(self, key, endpoint):
+        """See `HTTPConnectionPool._newConnection`.
+
+        Count the TLS handshakes that new connections imply.
+        """
+        # Agent uses ("http-v1", scheme, host, port) as its key.
+        if key[1] == b"https":
+            self.prometheus_metrics.update(
+                'maas_http_pool_tls_handshakes', 'inc')
+        return super(PersistentConnectionPool, self)._newConnection(
+            key, endpoint)
+
+    def run(self, uri, func, *args, **kwargs):
+        """Call `func` once a request slot to the host of `uri` is free.
+
+        :param uri: The URI, as a byte string, that `func` will request.
+        :return: A `Deferred` firing with the result of `func`.
+        """
+        parsed = URI.fromBytes(uri)
+        key = parsed.scheme, parsed.host, parsed.port
+        limit = self._hostLimits.get(key)
+        if limit is None:
+            limit = self._hostLimits[key] = DeferredSemaphore(
+                self.maxRequestsPerHost)
+        d = limit.run(func, *args, **kwargs)
+        d.addBoth(self._releaseHostLimit, key, limit)
+        return d
+
+    def _releaseHostLimit(self, result, key, limit):
+        # Forget the limit once it is no longer in use so that hosts we no
+        # longer talk to do not accumulate.
+        if limit.tokens == limit.limit and not limit.waiting:
+            if self._hostLimits.get(key) is limit:
+                del self._hostLimits[key]
+        return result
+
+
+_pool = None
+
+
+def get_connection_pool():
+    """Return the process-wide `PersistentConnectionPool`.
+
+    The pool is created on first use, and its cached connections are closed
+    when the reactor shuts down.
+    """
+    global _pool
+    if _pool is None:
+        _pool = PersistentConnectionPool(reactor)
+        reactor.addSystemEventTrigger(
+            "before", "shutdown", _pool.closeCachedConnections)
+    return _pool